@@ -6,9 +6,30 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import collections
+import itertools
+import json
+import multiprocessing.pool
+import threading
+
+import ga4gh.bamIndex as bamIndex
 import ga4gh.datamodel as datamodel
+import ga4gh.datamodel.reads as reads
 import ga4gh.exceptions as exceptions
 import ga4gh.protocol as protocol
+import ga4gh.timing as timing
+
+
+REFERENCE_BASES_CHUNK_SIZE = 64 * 1024
+"""
+The number of bases fetched at a time when streaming reference bases.
+"""
+
+COVERAGE_SEGMENT_MIN_LENGTH = 1024 * 1024
+"""
+The smallest region whose read coverage is computed on a thread of the
+region search pool, rather than together with its neighbours.
+"""
 
 
 def _parseIntegerArgument(args, key, defaultValue):
@@ -81,6 +102,15 @@ class IntervalIterator(object):
         """
         return obj
 
+    def _getObjectStart(self, obj):
+        """
+        Returns the start of the specified object passed back by
+        iteration. Only the objects returned are extracted, so those
+        skipped when picking up an iteration and the one read ahead to
+        make page tokens need not be converted to protocol objects.
+        """
+        return self._getStart(obj)
+
     def _initialiseIteration(self):
         """
         Starts a new iteration.
@@ -93,7 +123,7 @@ class IntervalIterator(object):
             self._nextObject = next(self._searchIterator, None)
             self._searchAnchor = self._request.start
             self._distanceFromAnchor = 0
-            firstObjectStart = self._getStart(self._currentObject)
+            firstObjectStart = self._getObjectStart(self._currentObject)
             if firstObjectStart > self._request.start:
                 self._searchAnchor = firstObjectStart
 
@@ -121,12 +151,12 @@ class IntervalIterator(object):
             # Now, we are past this initial set of intervals.
             # First, we need to skip forward over the intervals where
             # start < searchAnchor, as we've seen these already.
-            while self._getStart(obj) < searchAnchor:
+            while self._getObjectStart(obj) < searchAnchor:
                 obj = next(self._searchIterator)
             # Now, we skip over objectsToSkip objects such that
             # start == searchAnchor
             for _ in range(objectsToSkip):
-                if self._getStart(obj) != searchAnchor:
+                if self._getObjectStart(obj) != searchAnchor:
                     raise exceptions.BadPageTokenException
                 obj = next(self._searchIterator)
         self._currentObject = obj
@@ -140,7 +170,7 @@ class IntervalIterator(object):
             raise StopIteration()
         nextPageToken = None
         if self._nextObject is not None:
-            start = self._getStart(self._nextObject)
+            start = self._getObjectStart(self._nextObject)
             # If start > the search anchor, move the search anchor. Otherwise,
             # increment the distance from the anchor.
             if start > self._searchAnchor:
@@ -163,22 +193,26 @@ class ReadsIntervalIterator(IntervalIterator):
     """
     An interval iterator for reads
     """
-    def __init__(self, request, parentContainer, reference):
+    def __init__(self, request, parentContainer, reference, tags=None):
         self._reference = reference
+        self._tags = tags
         super(ReadsIntervalIterator, self).__init__(request, parentContainer)
 
     def _search(self, start, end):
-        return self._parentContainer.getReadAlignments(
+        return self._parentContainer.getRawReadAlignments(
             self._reference, start, end)
 
+    def _extractProtocolObject(self, rawReadAlignment):
+        return self._parentContainer.convertRawReadAlignment(
+            rawReadAlignment, self._tags)
+
+    def _getObjectStart(self, rawReadAlignment):
+        return self._parentContainer.getRawReadAlignmentStart(
+            rawReadAlignment)
+
     @classmethod
     def _getStart(cls, readAlignment):
-        if readAlignment.alignment.position.position == 0:
-            # unmapped read with mapped mate; see SAM standard 2.4.1
-            return readAlignment.next_mate_position.position
-        else:
-            # usual case
-            return readAlignment.alignment.position.position
+        return reads.getReadAlignmentStart(readAlignment)
 
     @classmethod
     def _getEnd(cls, readAlignment):
@@ -193,10 +227,16 @@ class VariantsIntervalIterator(IntervalIterator):
     """
 
     def _search(self, start, end):
-        return self._parentContainer.getVariants(
+        # The pysam records of the variants have the same start as the
+        # converted variants, so only the variants returned are converted.
+        return self._parentContainer.getRawVariants(
             self._request.reference_name, start, end,
             self._request.call_set_ids)
 
+    def _extractProtocolObject(self, rawVariant):
+        return self._parentContainer.convertRawVariant(
+            rawVariant, self._request.call_set_ids)
+
     @classmethod
     def _getStart(cls, variant):
         return variant.start
@@ -206,6 +246,80 @@ class VariantsIntervalIterator(IntervalIterator):
         return variant.end
 
 
+class VariantRegionsIterator(object):
+    """
+    Implements generator logic for searches over a list of regions of a
+    variant set. Returns an iterator over (variant, pageToken) pairs for
+    the variants in each region in turn. The regions are searched
+    concurrently on a thread pool, each by a VariantsIntervalIterator
+    reading its own file handles. Page tokens consist of the index of a
+    region, followed by the page token within that region if the
+    iteration does not start at its beginning.
+    """
+    def __init__(self, request, regionRequests, variantSet, threadPool,
+                 numThreads):
+        self._regionRequests = regionRequests
+        self._variantSet = variantSet
+        self._threadPool = threadPool
+        self._numThreads = numThreads
+        # No region needs to return more variants than fit in a page.
+        self._limit = request.page_size
+        firstRegionIndex = 0
+        firstPageToken = ""
+        if request.page_token:
+            tokens = request.page_token.split(":", 1)
+            firstRegionIndex = _parsePageToken(tokens[0], 1)[0]
+            if not 0 <= firstRegionIndex < len(regionRequests):
+                raise exceptions.BadPageTokenException()
+            if len(tokens) > 1:
+                firstPageToken = tokens[1]
+        self._searches = collections.deque()
+        self._nextRegionIndex = firstRegionIndex
+        self._submitSearch(firstPageToken)
+        self._regionIndex = None
+        self._regionVariants = iter([])
+
+    def _searchRegion(self, regionIndex, pageToken):
+        regionRequest = self._regionRequests[regionIndex]
+        regionRequest.page_token = pageToken
+        with datamodel.PrivateFileHandles():
+            return list(itertools.islice(
+                VariantsIntervalIterator(regionRequest, self._variantSet),
+                self._limit))
+
+    def _submitSearch(self, pageToken=""):
+        regionIndex = self._nextRegionIndex
+        self._searches.append((regionIndex, self._threadPool.apply_async(
+            self._searchRegion, (regionIndex, pageToken))))
+        self._nextRegionIndex += 1
+
+    def next(self):
+        """
+        Returns the next (variant, nextPageToken) pair.
+        """
+        pair = next(self._regionVariants, None)
+        while pair is None:
+            # Keep the pool busy with the regions that follow.
+            while (len(self._searches) < self._numThreads and
+                    self._nextRegionIndex < len(self._regionRequests)):
+                self._submitSearch()
+            if len(self._searches) == 0:
+                raise StopIteration()
+            self._regionIndex, search = self._searches.popleft()
+            self._regionVariants = iter(search.get())
+            pair = next(self._regionVariants, None)
+        variant, regionPageToken = pair
+        nextPageToken = None
+        if regionPageToken is not None:
+            nextPageToken = "{}:{}".format(self._regionIndex, regionPageToken)
+        elif self._regionIndex + 1 < len(self._regionRequests):
+            nextPageToken = "{}".format(self._regionIndex + 1)
+        return variant, nextPageToken
+
+    def __iter__(self):
+        return self
+
+
 class VariantAnnotationsIntervalIterator(IntervalIterator):
     """
     An interval iterator for annotations
@@ -313,6 +427,12 @@ class Backend(object):
         self._responseValidation = False
         self._defaultPageSize = 100
         self._maxResponseLength = 2**20  # 1 MiB
+        self._maxRegions = 1000
+        self._regionSearchThreads = 4
+        self._regionSearchPool = None
+        self._regionSearchPoolLock = threading.Lock()
+        self._maxBatchGetIds = 1000
+        self._maxCoverageBins = 10000
         self._dataRepository = dataRepository
 
     def getDataRepository(self):
@@ -346,6 +466,40 @@ class Backend(object):
         """
         self._maxResponseLength = maxResponseLength
 
+    def setRegionSearchThreads(self, regionSearchThreads):
+        """
+        Sets the number of threads on which the regions of a region
+        batch search are searched concurrently.
+        """
+        self._regionSearchThreads = regionSearchThreads
+
+    def setMaxRegions(self, maxRegions):
+        """
+        Sets the maximum number of regions in a region batch search.
+        """
+        self._maxRegions = maxRegions
+
+    def setMaxBatchGetIds(self, maxBatchGetIds):
+        """
+        Sets the maximum number of IDs in a batch get request.
+        """
+        self._maxBatchGetIds = maxBatchGetIds
+
+    def setMaxCoverageBins(self, maxCoverageBins):
+        """
+        Sets the maximum number of bins in a read coverage request.
+        """
+        self._maxCoverageBins = maxCoverageBins
+
+    def _getRegionSearchPool(self):
+        # The pool is created on first use, so that it is not inherited
+        # by processes forked from the one that configured the backend.
+        with self._regionSearchPoolLock:
+            if self._regionSearchPool is None:
+                self._regionSearchPool = multiprocessing.pool.ThreadPool(
+                    self._regionSearchThreads)
+        return self._regionSearchPool
+
     def startProfile(self):
         """
         Profiling hook. Called at the start of the runSearchRequest method
@@ -576,10 +730,20 @@ class Backend(object):
             request, variantSet.getNumVariantAnnotationSets(),
             variantSet.getVariantAnnotationSetByIndex)
 
-    def readsGenerator(self, request):
+    def readsGenerator(self, request, tags=None):
         """
         Returns a generator over the (read, nextPageToken) pairs defined
-        by the specified request
+        by the specified request. If tags is not None, only the listed
+        tags are included in the info of the reads.
+        """
+        container, reference = self._getReadsContainer(request)
+        return ReadsIntervalIterator(request, container, reference, tags)
+
+    def _getReadsContainer(self, request):
+        """
+        Returns the read group or read group set holding the reads of the
+        read group IDs in the specified SearchReadsRequest, and the
+        reference of the request.
         """
         if not request.reference_id:
             raise exceptions.UnmappedReadsNotSupported()
@@ -587,11 +751,11 @@ class Backend(object):
             raise exceptions.BadRequestException(
                 "At least one readGroupId must be specified")
         elif len(request.read_group_ids) == 1:
-            return self._readsGeneratorSingle(request)
+            return self._getReadsContainerSingle(request)
         else:
-            return self._readsGeneratorMultiple(request)
+            return self._getReadsContainerMultiple(request)
 
-    def _readsGeneratorSingle(self, request):
+    def _getReadsContainerSingle(self, request):
         compoundId = datamodel.ReadGroupCompoundId.parse(
             request.read_group_ids[0])
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
@@ -602,11 +766,9 @@ class Backend(object):
                     readGroupSet.getId())
         reference = referenceSet.getReference(request.reference_id)
         readGroup = readGroupSet.getReadGroup(compoundId.read_group_id)
-        intervalIterator = ReadsIntervalIterator(
-            request, readGroup, reference)
-        return intervalIterator
+        return readGroup, reference
 
-    def _readsGeneratorMultiple(self, request):
+    def _getReadsContainerMultiple(self, request):
         compoundId = datamodel.ReadGroupCompoundId.parse(
             request.read_group_ids[0])
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
@@ -621,9 +783,7 @@ class Backend(object):
             raise exceptions.BadRequestException(
                 "If multiple readGroupIds are specified, "
                 "they must be all of the readGroupIds in a ReadGroup")
-        intervalIterator = ReadsIntervalIterator(
-            request, readGroupSet, reference)
-        return intervalIterator
+        return readGroupSet, reference
 
     def variantsGenerator(self, request):
         """
@@ -652,10 +812,11 @@ class Backend(object):
             request, variantAnnotationSet)
         return intervalIterator
 
-    def featuresGenerator(self, request):
+    def featuresGenerator(self, request, includeDescendants=False):
         """
         Returns a generator over the (features, nextPageToken) pairs
-        defined by the (JSON string) request.
+        defined by the (JSON string) request. If includeDescendants is
+        True, each matching feature is followed by all its descendants.
         """
         compoundId = None
         parentId = None
@@ -690,7 +851,8 @@ class Backend(object):
         return featureSet.getFeatures(
             request.reference_name, request.start, request.end,
             request.page_token, request.page_size,
-            request.feature_types, parentId)
+            request.feature_types, parentId,
+            includeDescendants=includeDescendants)
 
     def callSetsGenerator(self, request):
         """
@@ -737,8 +899,14 @@ class Backend(object):
         Runs a get request by converting the specified datamodel
         object into its protocol representation.
         """
+        timer = timing.getRequestTimer()
+        timer.switchPhase(timing.CONVERT)
         protocolElement = obj.toProtocolElement()
+        timer.switchPhase(timing.SERIALISE)
         jsonString = protocol.toJson(protocolElement)
+        timer.switchPhase(None)
+        timer.addObjects(1)
+        timer.addBytes(len(jsonString))
         return jsonString
 
     def runSearchRequest(
@@ -753,10 +921,24 @@ class Backend(object):
         any point using the nextPageToken attribute of the request object.
         """
         self.startProfile()
+        timer = timing.getRequestTimer()
+        timer.switchPhase(timing.PARSE)
         try:
             request = protocol.fromJson(requestStr, requestClass)
         except protocol.json_format.ParseError:
             raise exceptions.InvalidJsonException(requestStr)
+        responseString = self._runSearchRequest(
+            request, responseClass, objectGenerator)
+        self.endProfile()
+        return responseString
+
+    def _runSearchRequest(self, request, responseClass, objectGenerator):
+        """
+        Runs the specified parsed search request, returning a JSON string
+        representation of an instance of the specified responseClass
+        filled using the specified object generator.
+        """
+        timer = timing.getRequestTimer()
         # TODO How do we detect when the page size is not set?
         if not request.page_size:
             request.page_size = self._defaultPageSize
@@ -765,18 +947,87 @@ class Backend(object):
         responseBuilder = protocol.SearchResponseBuilder(
             responseClass, request.page_size, self._maxResponseLength)
         nextPageToken = None
-        for obj, nextPageToken in objectGenerator(request):
+        numObjects = 0
+        # Creating the generator resolves the IDs in the request; the
+        # datamodel switches to the CONVERT phase itself while turning
+        # storage records into protocol objects, so the time spent in
+        # the loop below is split between FETCH, CONVERT and BUILD.
+        timer.switchPhase(timing.RESOLVE)
+        objects = objectGenerator(request)
+        timer.switchPhase(timing.FETCH)
+        for obj, nextPageToken in objects:
+            timer.switchPhase(timing.BUILD)
             responseBuilder.addValue(obj)
+            numObjects += 1
             if responseBuilder.isFull():
                 break
+            timer.switchPhase(timing.FETCH)
+        timer.switchPhase(timing.SERIALISE)
         responseBuilder.setNextPageToken(nextPageToken)
         responseString = responseBuilder.getSerializedResponse()
+        timer.switchPhase(None)
+        timer.addObjects(numObjects)
+        timer.addBytes(len(responseString))
+        return responseString
+
+    def runBatchGetRequest(
+            self, requestStr, compoundIdClass, responseClass, getContainer,
+            getObjects):
+        """
+        Runs the specified batch get request. The request is a string
+        containing a JSON object whose "ids" field is a list of IDs of
+        the specified compoundIdClass. We return a string representation
+        of an instance of the specified responseClass in JSON format,
+        holding the objects with these IDs in the same order. The IDs
+        are grouped by the container holding them, which is returned by
+        getContainer(compoundId), and the objects in each container are
+        looked up together by calling getObjects(container, compoundIds),
+        which must return the corresponding protocol objects in order.
+        """
+        self.startProfile()
+        timer = timing.getRequestTimer()
+        timer.switchPhase(timing.PARSE)
+        try:
+            ids = json.loads(requestStr)["ids"]
+        except (ValueError, KeyError, TypeError):
+            raise exceptions.InvalidJsonException(requestStr)
+        if not isinstance(ids, list) or len(ids) == 0:
+            raise exceptions.BadIdsException(
+                "a non-empty list of IDs is required")
+        if len(ids) > self._maxBatchGetIds:
+            raise exceptions.BadIdsException(
+                "at most {} IDs may be requested at once".format(
+                    self._maxBatchGetIds))
+        timer.switchPhase(timing.RESOLVE)
+        compoundIds = [compoundIdClass.parse(id_) for id_ in ids]
+        groups = collections.OrderedDict()
+        for index, compoundId in enumerate(compoundIds):
+            container = getContainer(compoundId)
+            group = groups.setdefault(container.getId(), (container, []))
+            group[1].append(index)
+        timer.switchPhase(timing.FETCH)
+        objects = [None] * len(compoundIds)
+        for container, indexes in groups.values():
+            containerObjects = getObjects(
+                container, [compoundIds[index] for index in indexes])
+            for index, obj in zip(indexes, containerObjects):
+                objects[index] = obj
+        timer.switchPhase(timing.BUILD)
+        response = responseClass()
+        getattr(response, protocol.getValueListName(responseClass)).extend(
+            objects)
+        timer.switchPhase(timing.SERIALISE)
+        responseString = protocol.toJson(response)
+        timer.switchPhase(None)
+        timer.addObjects(len(objects))
+        timer.addBytes(len(responseString))
         self.endProfile()
         return responseString
 
-    def runListReferenceBases(self, id_, requestArgs):
+    def _getReferenceBasesWindow(self, id_, requestArgs):
         """
-        Runs a listReferenceBases request for the specified ID and
+        Returns the reference with the specified ID and the start and
+        end of the bases requested by the specified listReferenceBases
         request arguments.
         """
         compoundId = datamodel.ReferenceCompoundId.parse(id_)
@@ -787,6 +1038,38 @@ class Backend(object):
         end = _parseIntegerArgument(requestArgs, 'end', reference.getLength())
         if end == 0:  # assume meant "get all"
             end = reference.getLength()
+        return reference, start, end
+
+    def getReferenceBasesWindow(self, id_, requestArgs):
+        """
+        Returns the reference with the specified ID and the start and
+        end of the bases requested by the specified listReferenceBases
+        request arguments, for streaming with generateReferenceBases.
+        Page tokens are not used when streaming.
+        """
+        reference, start, end = self._getReferenceBasesWindow(
+            id_, requestArgs)
+        reference.checkQueryRange(start, end)
+        return reference, start, end
+
+    def generateReferenceBases(self, reference, start, end):
+        """
+        Returns an iterator over the bases of the specified reference
+        from start to end, as consecutive strings of at most
+        REFERENCE_BASES_CHUNK_SIZE bases. Unlike runListReferenceBases,
+        the number of bases is not limited by the maximum response
+        length.
+        """
+        return reference.generateBases(
+            start, end, REFERENCE_BASES_CHUNK_SIZE)
+
+    def runListReferenceBases(self, id_, requestArgs):
+        """
+        Runs a listReferenceBases request for the specified ID and
+        request arguments.
+        """
+        reference, start, end = self._getReferenceBasesWindow(
+            id_, requestArgs)
         if 'pageToken' in requestArgs:
             pageTokenStr = requestArgs['pageToken']
             if pageTokenStr != "":
@@ -797,15 +1080,22 @@ class Backend(object):
         if start + chunkSize < end:
             end = start + chunkSize
             nextPageToken = str(start + chunkSize)
+        timer = timing.getRequestTimer()
+        timer.switchPhase(timing.FETCH)
         sequence = reference.getBases(start, end)
 
         # build response
+        timer.switchPhase(timing.BUILD)
         response = protocol.ListReferenceBasesResponse()
         response.offset = start
         response.sequence = sequence
         if nextPageToken is not None:
             response.next_page_token = nextPageToken
-        return protocol.toJson(response)
+        timer.switchPhase(timing.SERIALISE)
+        jsonString = protocol.toJson(response)
+        timer.switchPhase(None)
+        timer.addBytes(len(jsonString))
+        return jsonString
 
     # Get requests.
 
@@ -934,6 +1224,54 @@ class Backend(object):
         variantAnnotationSet = variantSet.getVariantAnnotationSet(id_)
         return self.runGetRequest(variantAnnotationSet)
 
+    # Batch get requests.
+
+    def _getVariantSetForCompoundId(self, compoundId):
+        dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
+        return dataset.getVariantSet(compoundId.variant_set_id)
+
+    def runBatchGetCallSets(self, request):
+        """
+        Returns the callsets with the IDs listed in the specified
+        batch get request.
+        """
+        return self.runBatchGetRequest(
+            request, datamodel.CallSetCompoundId,
+            protocol.SearchCallSetsResponse,
+            self._getVariantSetForCompoundId,
+            lambda variantSet, compoundIds: [
+                variantSet.getCallSet(str(compoundId)).toProtocolElement()
+                for compoundId in compoundIds])
+
+    def runBatchGetVariants(self, request):
+        """
+        Returns the variants with the IDs listed in the specified
+        batch get request. The variants in each variant set are read
+        with one fetch per cluster of nearby positions.
+        """
+        return self.runBatchGetRequest(
+            request, datamodel.VariantCompoundId,
+            protocol.SearchVariantsResponse,
+            self._getVariantSetForCompoundId,
+            lambda variantSet, compoundIds: variantSet.getVariantsByIds(
+                compoundIds))
+
+    def runBatchGetFeatures(self, request):
+        """
+        Returns the features with the IDs listed in the specified
+        batch get request. The features in each feature set are read
+        with a single query.
+        """
+        def getFeatureSet(compoundId):
+            dataset = self.getDataRepository().getDataset(
+                compoundId.dataset_id)
+            return dataset.getFeatureSet(compoundId.feature_set_id)
+        return self.runBatchGetRequest(
+            request, datamodel.FeatureCompoundId,
+            protocol.SearchFeaturesResponse, getFeatureSet,
+            lambda featureSet, compoundIds: featureSet.getFeaturesByIds(
+                compoundIds))
+
     # Search requests.
 
     def runSearchReadGroupSets(self, request):
@@ -966,11 +1304,279 @@ class Backend(object):
     def runSearchReads(self, request):
         """
         Runs the specified SearchReadsRequest.
+
+        The request may also set "tags" to a list of SAM tag names, in
+        which case only those tags are decoded and included in the info
+        of each read; an empty list leaves the info of every read empty.
+        All tags are included by default.
         """
-        return self.runSearchRequest(
-            request, protocol.SearchReadsRequest,
-            protocol.SearchReadsResponse,
-            self.readsGenerator)
+        self.startProfile()
+        timer = timing.getRequestTimer()
+        timer.switchPhase(timing.PARSE)
+        try:
+            jsonDict = json.loads(request)
+            tags = jsonDict.pop("tags", None)
+            searchRequest = protocol.fromJson(
+                json.dumps(jsonDict), protocol.SearchReadsRequest)
+        except (ValueError, AttributeError, protocol.json_format.ParseError):
+            raise exceptions.InvalidJsonException(request)
+        if tags is not None:
+            # SAM tag names are two ASCII characters, which pysam takes as
+            # bytes.
+            try:
+                if not isinstance(tags, list) or not all(
+                        len(tag) == 2 for tag in tags):
+                    raise ValueError()
+                tags = [tag.encode("ascii") for tag in tags]
+            except (TypeError, AttributeError, ValueError):
+                raise exceptions.InvalidJsonException(request)
+        responseString = self._runSearchRequest(
+            searchRequest, protocol.SearchReadsResponse,
+            lambda parsedRequest: self.readsGenerator(parsedRequest, tags))
+        self.endProfile()
+        return responseString
+
+    def runReadsCoverage(self, requestStr):
+        """
+        Runs the specified read coverage request, which is a
+        SearchReadsRequest with a binSize field giving the width of the
+        bins that the region from start to end is split into, and an
+        optional exact field. The response holds the number of mapped
+        reads starting in each bin in readCounts, and the mean depth of
+        the aligned bases over each bin in meanDepths. The reads are not
+        converted, and larger regions are split between the threads of
+        the region search pool. For bins at least as wide as the windows
+        of the BAI linear index, the read counts are instead estimated
+        from the index when possible, unless exact is true; the response
+        then has estimated set and no meanDepths.
+        """
+        self.startProfile()
+        timer = timing.getRequestTimer()
+        timer.switchPhase(timing.PARSE)
+        try:
+            jsonDict = json.loads(requestStr)
+            binSize = jsonDict.pop("binSize")
+            exact = jsonDict.pop("exact", False)
+            request = protocol.fromJson(
+                json.dumps(jsonDict), protocol.SearchReadsRequest)
+        except (ValueError, KeyError, TypeError, AttributeError,
+                protocol.json_format.ParseError):
+            raise exceptions.InvalidJsonException(requestStr)
+        if type(binSize) not in (int, long) or binSize <= 0:
+            raise exceptions.BadCoverageRequestException(
+                "binSize must be a positive integer")
+        if not isinstance(exact, bool):
+            raise exceptions.BadCoverageRequestException(
+                "exact must be a boolean")
+        timer.switchPhase(timing.RESOLVE)
+        container, reference = self._getReadsContainer(request)
+        start = request.start
+        end = request.end
+        if end == 0:
+            end = reference.getLength()
+        if start < 0 or start >= end:
+            raise exceptions.ReferenceRangeErrorException(
+                reference.getId(), start, end)
+        numBins = (end - start + binSize - 1) // binSize
+        if numBins > self._maxCoverageBins:
+            raise exceptions.BadCoverageRequestException(
+                "at most {} bins may be requested at once".format(
+                    self._maxCoverageBins))
+        timer.switchPhase(timing.FETCH)
+        readCounts = None
+        if not exact and binSize >= bamIndex.LINEAR_INDEX_WINDOW:
+            readCounts = container.estimateReadCounts(
+                reference, start, end, binSize)
+        response = collections.OrderedDict([
+            ("referenceId", reference.getId()),
+            ("start", start),
+            ("end", end),
+            ("binSize", binSize),
+            ("estimated", readCounts is not None),
+        ])
+        if readCounts is not None:
+            response["readCounts"] = [int(round(x)) for x in readCounts]
+        else:
+            readCounts, baseCounts = self._getCoverage(
+                container, reference, start, end, binSize)
+            response["readCounts"] = readCounts
+            response["meanDepths"] = [
+                baseCount / (min(end, binStart + binSize) - binStart)
+                for baseCount, binStart in zip(
+                    baseCounts, xrange(start, end, binSize))]
+        timer.switchPhase(timing.SERIALISE)
+        responseString = json.dumps(response)
+        timer.switchPhase(None)
+        timer.addObjects(numBins)
+        timer.addBytes(len(responseString))
+        self.endProfile()
+        return responseString
+
+    def _getCoverage(self, container, reference, start, end, binSize):
+        """
+        Returns the read and aligned base counts of the specified bins of
+        the specified read group or read group set. Regions longer than
+        COVERAGE_SEGMENT_MIN_LENGTH are split into segments of whole
+        bins, each read on a thread of the region search pool with its
+        own file handles.
+        """
+        binsPerSegment = max(
+            (end - start) // self._regionSearchThreads,
+            COVERAGE_SEGMENT_MIN_LENGTH) // binSize + 1
+        segmentLength = binsPerSegment * binSize
+        if segmentLength >= end - start:
+            return container.getCoverage(reference, start, end, binSize)
+
+        def segmentCoverage(segmentStart):
+            with datamodel.PrivateFileHandles():
+                return container.getCoverage(
+                    reference, segmentStart,
+                    min(end, segmentStart + segmentLength), binSize)
+        segments = self._getRegionSearchPool().map(
+            segmentCoverage, range(start, end, segmentLength))
+        readCounts = []
+        baseCounts = []
+        for segmentReadCounts, segmentBaseCounts in segments:
+            readCounts.extend(segmentReadCounts)
+            baseCounts.extend(segmentBaseCounts)
+        return readCounts, baseCounts
+
+    def runReadsSummary(self, requestStr):
+        """
+        Runs the specified read summary request, a JSON object with
+        readGroupSetId, referenceName, start, end and binSize fields.
+        The response holds the number of mapped reads starting in each
+        bin in readCounts, and the mean and maximum depths of their
+        aligned bases over each bin in meanDepths and maxDepths, read
+        from the summary tiles of the read group set.
+        """
+        def getSummaryTiles(readGroupSetId):
+            compoundId = datamodel.ReadGroupSetCompoundId.parse(
+                readGroupSetId)
+            dataset = self.getDataRepository().getDataset(
+                compoundId.dataset_id)
+            return dataset.getReadGroupSet(readGroupSetId).getSummaryTiles()
+
+        def buildFields(tiles, referenceName, level, firstBin, endBin):
+            binSize = tiles.getBinSize(level)
+            length = tiles.getReferenceLength(referenceName)
+            baseCounts = tiles.getBins(
+                referenceName, level, "baseCount", firstBin, endBin)
+            meanDepths = [
+                baseCount / (min(length, binStart + binSize) - binStart)
+                for baseCount, binStart in zip(
+                    baseCounts, xrange(firstBin * binSize, length, binSize))]
+            return [
+                ("readCounts", tiles.getBins(
+                    referenceName, level, "readCount", firstBin,
+                    endBin).tolist()),
+                ("meanDepths", meanDepths),
+                ("maxDepths", tiles.getBins(
+                    referenceName, level, "maxDepth", firstBin,
+                    endBin).tolist()),
+            ]
+        return self._runSummary(
+            requestStr, "readGroupSetId", getSummaryTiles, buildFields)
+
+    def runVariantsSummary(self, requestStr):
+        """
+        Runs the specified variant summary request, a JSON object with
+        variantSetId, referenceName, start, end and binSize fields. The
+        response holds the number of variants starting in each bin in
+        variantCounts, read from the summary tiles of the variant set.
+        """
+        def getSummaryTiles(variantSetId):
+            compoundId = datamodel.VariantSetCompoundId.parse(variantSetId)
+            dataset = self.getDataRepository().getDataset(
+                compoundId.dataset_id)
+            return dataset.getVariantSet(variantSetId).getSummaryTiles()
+
+        def buildFields(tiles, referenceName, level, firstBin, endBin):
+            return [
+                ("variantCounts", tiles.getBins(
+                    referenceName, level, "variantCount", firstBin,
+                    endBin).tolist()),
+            ]
+        return self._runSummary(
+            requestStr, "variantSetId", getSummaryTiles, buildFields)
+
+    def _runSummary(self, requestStr, idField, getSummaryTiles, buildFields):
+        """
+        Runs the specified summary request for the object whose ID is in
+        the specified field, using the specified functions to find its
+        SummaryTiles and build the response fields from them. The bins
+        are those of the coarsest stored level no wider than the
+        requested binSize, or of a coarser one if there would be more
+        than the maximum number of coverage bins; the start and end of
+        the response are those of the returned bins, and its binSize
+        their width. Finding a bin is a constant time lookup.
+        """
+        self.startProfile()
+        timer = timing.getRequestTimer()
+        timer.switchPhase(timing.PARSE)
+        try:
+            jsonDict = json.loads(requestStr)
+            objectId = jsonDict.pop(idField)
+            referenceName = jsonDict.pop("referenceName")
+            binSize = jsonDict.pop("binSize")
+            start = jsonDict.pop("start", 0)
+            end = jsonDict.pop("end", 0)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            raise exceptions.InvalidJsonException(requestStr)
+        if len(jsonDict) > 0:
+            raise exceptions.BadSummaryRequestException(
+                "unknown fields {}".format(", ".join(sorted(jsonDict))))
+        for name, value in [("binSize", binSize), ("start", start),
+                            ("end", end)]:
+            if type(value) not in (int, long) or value < 0:
+                raise exceptions.BadSummaryRequestException(
+                    "{} must be a non-negative integer".format(name))
+        if binSize == 0:
+            raise exceptions.BadSummaryRequestException(
+                "binSize must be a positive integer")
+        if not isinstance(objectId, basestring) or not isinstance(
+                referenceName, basestring):
+            raise exceptions.BadSummaryRequestException(
+                "{} and referenceName must be strings".format(idField))
+        timer.switchPhase(timing.RESOLVE)
+        tiles = getSummaryTiles(objectId)
+        if tiles is None:
+            raise exceptions.SummaryTilesNotFoundException(objectId)
+        try:
+            length = tiles.getReferenceLength(referenceName)
+        except KeyError:
+            raise exceptions.ReferenceNameNotFoundException(referenceName)
+        if end == 0 or end > length:
+            end = length
+        if start >= end:
+            raise exceptions.ReferenceRangeErrorException(
+                referenceName, start, end)
+        level = tiles.getLevel(binSize)
+        while True:
+            levelBinSize = tiles.getBinSize(level)
+            firstBin = start // levelBinSize
+            endBin = (end + levelBinSize - 1) // levelBinSize
+            if (endBin - firstBin <= self._maxCoverageBins or
+                    level + 1 == tiles.getNumLevels()):
+                break
+            level += 1
+        timer.switchPhase(timing.FETCH)
+        fields = buildFields(tiles, referenceName, level, firstBin, endBin)
+        timer.switchPhase(timing.BUILD)
+        response = collections.OrderedDict([
+            ("referenceName", referenceName),
+            ("start", firstBin * levelBinSize),
+            ("end", min(length, endBin * levelBinSize)),
+            ("binSize", levelBinSize),
+        ])
+        response.update(fields)
+        timer.switchPhase(timing.SERIALISE)
+        responseString = json.dumps(response)
+        timer.switchPhase(None)
+        timer.addObjects(endBin - firstBin)
+        timer.addBytes(len(responseString))
+        self.endProfile()
+        return responseString
 
     def runSearchReferenceSets(self, request):
         """
@@ -1017,6 +1623,64 @@ class Backend(object):
             protocol.SearchVariantsResponse,
             self.variantsGenerator)
 
+    def runSearchVariantRegions(self, requestStr):
+        """
+        Runs the specified region batch search, which is a
+        SearchVariantsRequest in which the referenceName, start and end
+        fields are replaced by a list of regions, each an object with
+        those fields. The variants in each region are returned in the
+        order of the regions, in a SearchVariantsResponse.
+        """
+        self.startProfile()
+        timer = timing.getRequestTimer()
+        timer.switchPhase(timing.PARSE)
+        try:
+            jsonDict = json.loads(requestStr)
+            regions = jsonDict.pop("regions")
+        except (ValueError, KeyError, TypeError, AttributeError):
+            raise exceptions.InvalidJsonException(requestStr)
+        if not isinstance(regions, list) or len(regions) == 0:
+            raise exceptions.BadRegionsException(
+                "a non-empty list of regions is required")
+        if len(regions) > self._maxRegions:
+            raise exceptions.BadRegionsException(
+                "at most {} regions may be searched at once".format(
+                    self._maxRegions))
+        try:
+            request = protocol.fromJson(
+                json.dumps(jsonDict), protocol.SearchVariantsRequest)
+        except protocol.json_format.ParseError:
+            raise exceptions.InvalidJsonException(requestStr)
+        regionFields = set(["referenceName", "start", "end"])
+        regionRequests = []
+        for region in regions:
+            if not isinstance(region, dict) or not regionFields.issuperset(
+                    region.keys()) or "referenceName" not in region:
+                raise exceptions.BadRegionsException(json.dumps(region))
+            regionDict = dict(jsonDict)
+            regionDict.update(region)
+            regionDict["pageToken"] = ""
+            try:
+                regionRequests.append(protocol.fromJson(
+                    json.dumps(regionDict), protocol.SearchVariantsRequest))
+            except protocol.json_format.ParseError:
+                raise exceptions.BadRegionsException(json.dumps(region))
+
+        def variantRegionsGenerator(request):
+            compoundId = datamodel.VariantSetCompoundId.parse(
+                request.variant_set_id)
+            dataset = self.getDataRepository().getDataset(
+                compoundId.dataset_id)
+            variantSet = dataset.getVariantSet(compoundId.variant_set_id)
+            return VariantRegionsIterator(
+                request, regionRequests, variantSet,
+                self._getRegionSearchPool(), self._regionSearchThreads)
+        responseString = self._runSearchRequest(
+            request, protocol.SearchVariantsResponse,
+            variantRegionsGenerator)
+        self.endProfile()
+        return responseString
+
     def runSearchVariantAnnotations(self, request):
         """
         Runs the specified SearchVariantAnnotationsRequest.
@@ -1059,10 +1723,29 @@ class Backend(object):
         Returns a SearchFeaturesResponse for the specified
         SearchFeaturesRequest object.
 
+        The request may also set "includeDescendants" to true, in which
+        case each matching feature is followed by its whole subtree of
+        descendants (in depth first order), so that a gene model can be
+        fetched with a single search for the gene.
+
         :param request: JSON string representing searchFeaturesRequest
         :return: JSON string representing searchFeatureResponse
         """
-        return self.runSearchRequest(
-            request, protocol.SearchFeaturesRequest,
-            protocol.SearchFeaturesResponse,
-            self.featuresGenerator)
+        self.startProfile()
+        timer = timing.getRequestTimer()
+        timer.switchPhase(timing.PARSE)
+        try:
+            jsonDict = json.loads(request)
+            includeDescendants = jsonDict.pop("includeDescendants", False)
+            searchRequest = protocol.fromJson(
+                json.dumps(jsonDict), protocol.SearchFeaturesRequest)
+        except (ValueError, AttributeError, protocol.json_format.ParseError):
+            raise exceptions.InvalidJsonException(request)
+        if not isinstance(includeDescendants, bool):
+            raise exceptions.InvalidJsonException(request)
+        responseString = self._runSearchRequest(
+            searchRequest, protocol.SearchFeaturesResponse,
+            lambda parsedRequest: self.featuresGenerator(
+                parsedRequest, includeDescendants))
+        self.endProfile()
+        return responseString
@@ -0,0 +1,238 @@
+"""
+Reader for the BAI indexes of BAM files.
+
+A BAI index holds, for each reference, the BGZF virtual offsets of the
+reads in each bin of the binning scheme, a linear index giving the
+offset of the first read overlapping each 16KiB window, and a pseudo-bin
+with the offsets of the first and last reads and the numbers of mapped
+and unmapped reads. The reads between the offsets of successive windows
+take up space in the BAM file roughly in proportion to their number, so
+the number of reads in any region can be estimated from the index
+alone, without decoding the reads.
+
+See: https://samtools.github.io/hts-specs/SAMv1.pdf (section 5.2)
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import struct
+
+BAI_MAGIC = b"BAI\1"
+
+# The width of the windows of the linear index.
+LINEAR_INDEX_WINDOW = 2 ** 14
+
+# The largest compressed or uncompressed size of a BGZF block.
+BGZF_MAX_BLOCK_SIZE = 2 ** 16
+
+# The bin holding the read counts and offsets of a reference.
+PSEUDO_BIN = 37450
+
+_int32 = struct.Struct(b"<i")
+_uint32 = struct.Struct(b"<I")
+
+
+class BamIndexException(Exception):
+    """
+    Exception associated with BAI index data.
+    """
+    def __init__(self, message, fileName=None):
+        if fileName is not None:
+            message = "{}: {}".format(fileName, message)
+        super(BamIndexException, self).__init__(message)
+
+
+class _ReferenceIndex(object):
+    """
+    The linear index of a reference and the contents of its pseudo-bin.
+    The counts and offsets are None if the index has no pseudo-bin for
+    a reference with reads.
+    """
+    def __init__(self, linearIndex):
+        self.linearIndex = linearIndex
+        self.beginOffset = None
+        self.endOffset = None
+        self.numMappedReads = None
+        self.numUnmappedReads = None
+
+
+def _unpackUint64s(data, offset, count):
+    return struct.unpack_from(b"<{}Q".format(count), data, offset)
+
+
+def _getFilePositions(virtualOffsets):
+    """
+    Returns the approximate positions in the compressed BAM file of the
+    specified BGZF virtual offsets. A virtual offset holds the position
+    of a BGZF block in its upper 48 bits and the offset within the
+    uncompressed block in its lower 16, so the bytes of each block are
+    placed linearly over its compressed size. That size is taken to be
+    the distance to the next block position among the offsets, up to
+    the largest size of a block, and the mean of those of the other
+    blocks for the last block.
+    """
+    blockPositions = sorted(set(
+        virtualOffset >> 16 for virtualOffset in virtualOffsets))
+    blockSizes = {}
+    for blockPosition, nextBlockPosition in zip(
+            blockPositions, blockPositions[1:]):
+        blockSizes[blockPosition] = min(
+            nextBlockPosition - blockPosition, BGZF_MAX_BLOCK_SIZE)
+    if len(blockSizes) > 0:
+        lastBlockSize = sum(blockSizes.values()) / len(blockSizes)
+    else:
+        lastBlockSize = BGZF_MAX_BLOCK_SIZE
+    blockSizes[blockPositions[-1]] = lastBlockSize
+    positions = []
+    for virtualOffset in virtualOffsets:
+        blockPosition = virtualOffset >> 16
+        positions.append(
+            blockPosition + blockSizes[blockPosition] *
+            (virtualOffset & 0xffff) / BGZF_MAX_BLOCK_SIZE)
+    return positions
+
+
+class BamIndex(object):
+    """
+    The BAI index of a BAM file, which is read into memory in full.
+    """
+    def __init__(self, fileName):
+        self._fileName = fileName
+        with open(fileName, "rb") as indexFile:
+            data = indexFile.read()
+        try:
+            self._references = self._parse(data)
+        except struct.error:
+            raise BamIndexException("Truncated BAI index", fileName)
+
+    def _parse(self, data):
+        if data[:4] != BAI_MAGIC:
+            raise BamIndexException("Not a BAI index", self._fileName)
+        offset = 4
+        numReferences = _int32.unpack_from(data, offset)[0]
+        offset += 4
+        references = []
+        for _ in range(numReferences):
+            numBins = _int32.unpack_from(data, offset)[0]
+            offset += 4
+            pseudoBin = None
+            for _ in range(numBins):
+                binNumber = _uint32.unpack_from(data, offset)[0]
+                numChunks = _int32.unpack_from(data, offset + 4)[0]
+                offset += 8
+                if binNumber == PSEUDO_BIN and numChunks == 2:
+                    pseudoBin = _unpackUint64s(data, offset, 4)
+                offset += 16 * numChunks
+            numWindows = _int32.unpack_from(data, offset)[0]
+            offset += 4
+            linearIndex = _unpackUint64s(data, offset, numWindows)
+            offset += 8 * numWindows
+            reference = _ReferenceIndex(linearIndex)
+            if numBins == 0:
+                # No reads are placed on the reference.
+                reference.numMappedReads = 0
+                reference.numUnmappedReads = 0
+            elif pseudoBin is not None:
+                (reference.beginOffset, reference.endOffset,
+                    reference.numMappedReads,
+                    reference.numUnmappedReads) = pseudoBin
+            references.append(reference)
+        return references
+
+    def getNumReferences(self):
+        """
+        Returns the number of references in this index.
+        """
+        return len(self._references)
+
+    def getReadCounts(self, referenceIndex):
+        """
+        Returns the numbers of mapped and unmapped reads placed on the
+        reference with the specified index in the BAM header, which are
+        None if the index does not record them.
+        """
+        reference = self._references[referenceIndex]
+        return reference.numMappedReads, reference.numUnmappedReads
+
+    def getUnplacedReadsOffset(self):
+        """
+        Returns the virtual offset in the BAM file following the last
+        read placed on any reference, from which the reads not placed on
+        a reference run to the end of a coordinate sorted file, or None
+        if the index does not record it.
+        """
+        endOffsets = []
+        for reference in self._references:
+            if reference.numMappedReads is None:
+                return None
+            if reference.endOffset is not None:
+                endOffsets.append(reference.endOffset)
+        if len(endOffsets) == 0:
+            return None
+        return max(endOffsets)
+
+    def _getWindowSizes(self, reference):
+        """
+        Returns the approximate number of compressed bytes taken up by the
+        reads starting in each window of the linear index of the specified
+        reference, as the distance between the file positions (see
+        _getFilePositions) of its virtual offset and that of the next
+        window. Windows that no read overlaps have an offset of 0 in the
+        index, and are given that of the window that follows.
+        """
+        offsets = [reference.endOffset] * (len(reference.linearIndex) + 1)
+        nextOffset = reference.endOffset
+        for window in range(len(reference.linearIndex) - 1, -1, -1):
+            virtualOffset = reference.linearIndex[window]
+            if virtualOffset != 0:
+                nextOffset = min(nextOffset, virtualOffset)
+            offsets[window] = nextOffset
+        positions = _getFilePositions(offsets)
+        return [
+            positions[window + 1] - positions[window]
+            for window in range(len(reference.linearIndex))]
+
+    def estimateReadCounts(
+            self, referenceIndex, referenceLength, start, end, binSize):
+        """
+        Returns estimates of the number of mapped reads starting in each
+        bin of the specified size from start to end on the reference with
+        the specified index and length, or None if the index does not
+        record the number of reads on the reference. The mapped reads on
+        the reference are shared between the windows of the linear index
+        in proportion to the size of their records (see _getWindowSizes),
+        and the estimate for each window between the bins it overlaps.
+        Estimates are only meaningful for bins of at least several windows.
+        """
+        reference = self._references[referenceIndex]
+        if reference.numMappedReads is None:
+            return None
+        numBins = (end - start + binSize - 1) // binSize
+        counts = [0.0] * numBins
+        if reference.numMappedReads == 0:
+            return counts
+        windowSizes = self._getWindowSizes(reference)
+        totalSize = sum(windowSizes)
+        if totalSize == 0:
+            return counts
+        readsPerByte = reference.numMappedReads / totalSize
+        firstWindow = start // LINEAR_INDEX_WINDOW
+        lastWindow = min(
+            len(windowSizes), (end - 1) // LINEAR_INDEX_WINDOW + 1)
+        for window in range(firstWindow, lastWindow):
+            windowCount = windowSizes[window] * readsPerByte
+            if windowCount == 0:
+                continue
+            windowStart = window * LINEAR_INDEX_WINDOW
+            windowEnd = min(referenceLength, windowStart + LINEAR_INDEX_WINDOW)
+            windowWidth = windowEnd - windowStart
+            windowStart = max(start, windowStart)
+            windowEnd = min(end, windowEnd)
+            while windowStart < windowEnd:
+                binIndex = (windowStart - start) // binSize
+                overlapEnd = min(windowEnd, start + (binIndex + 1) * binSize)
+                counts[binIndex] += (
+                    windowCount * (overlapEnd - windowStart) / windowWidth)
+                windowStart = overlapEnd
+        return counts
@@ -20,6 +20,7 @@ import unittest.loader
 import unittest.suite
 import urlparse
 
+import pysam
 import requests
 
 import ga4gh
@@ -38,6 +39,10 @@ import ga4gh.datamodel.sequenceAnnotations as sequenceAnnotations
 import ga4gh.datamodel.datasets as datasets
 import ga4gh.datamodel.ontologies as ontologies
 import ga4gh.datamodel.bio_metadata as biodata
+import ga4gh.twoBit as twoBit
+import ga4gh.gff3Db as gff3Db
+import ga4gh.gff3Parser as gff3Parser
+import ga4gh.summaryTiles as summaryTiles
 
 
 # the maximum value of a long type in avro = 2**63 - 1
@@ -1788,8 +1793,12 @@ class RepoManager(object):
                                      self._args.relativePath)
         if name is None:
             name = getNameFromPath(self._args.filePath)
-        referenceSet = references.HtslibReferenceSet(name)
-        referenceSet.populateFromFile(filePath)
+        if references.isTwoBitFile(filePath):
+            referenceSet = references.TwoBitReferenceSet(name)
+        else:
+            referenceSet = references.HtslibReferenceSet(name)
+        referenceSet.populateFromFile(
+            filePath, numProcesses=self._args.numProcesses)
         referenceSet.setDescription(self._args.description)
         referenceSet.setNcbiTaxonId(self._args.ncbiTaxonId)
         referenceSet.setIsDerived(self._args.isDerived)
@@ -1815,6 +1824,7 @@ class RepoManager(object):
         if parsed.scheme in ['http', 'ftp']:
             if indexFile is None:
                 raise exceptions.MissingIndexException(dataUrl)
+            self._checkLocalSummaryTiles()
         else:
             if indexFile is None:
                 indexFile = dataUrl + ".bai"
@@ -1826,6 +1836,11 @@ class RepoManager(object):
             name = getNameFromPath(dataUrl)
         readGroupSet = reads.HtslibReadGroupSet(dataset, name)
         readGroupSet.populateFromFile(dataUrl, indexFile)
+        if parsed.scheme not in ['http', 'ftp']:
+            # Reading a remote BAM file in full would take too long, so
+            # its read groups are left without stats.
+            readGroupSet.computeReadGroupStats(
+                numProcesses=self._args.numProcesses)
         referenceSetName = self._args.referenceSetName
         if referenceSetName is None:
             # Try to find a reference set name from the BAM header.
@@ -1833,6 +1848,40 @@ class RepoManager(object):
         referenceSet = self._repo.getReferenceSetByName(referenceSetName)
         readGroupSet.setReferenceSet(referenceSet)
         self._updateRepo(self._repo.insertReadGroupSet, readGroupSet)
+        if self._args.summaryTiles:
+            self._writeSummaryTiles(readGroupSet)
+
+    def _checkLocalSummaryTiles(self):
+        """
+        Raises a RepoManagerException if summary tiles were requested for
+        remote data files, next to which they cannot be written.
+        """
+        if self._args.summaryTiles:
+            raise exceptions.RepoManagerException(
+                "Summary tiles can only be written for local data files")
+
+    def _checkLocalDataUrl(self, dataUrl):
+        """
+        Raises a RepoManagerException if the specified data file is
+        remote, so that summary tiles cannot be written next to it.
+        """
+        if urlparse.urlparse(dataUrl).scheme in ['http', 'ftp']:
+            raise exceptions.RepoManagerException(
+                "Summary tiles can only be written for local data files")
+
+    def _writeSummaryTiles(self, container):
+        """
+        Writes the summary tiles of the specified read group set or
+        variant set next to its data files. This is done after the set
+        has been added to the repo, so that a failed add never replaces
+        the tiles of a data file that is already being served.
+        """
+        try:
+            container.writeSummaryTiles(
+                baseBinSize=self._args.summaryBinSize)
+        except (summaryTiles.SummaryTilesException, IOError,
+                OSError) as exception:
+            raise exceptions.RepoManagerException(str(exception))
 
     def addVariantSet(self):
         """
@@ -1866,6 +1915,8 @@ class RepoManager(object):
         if parsed.scheme not in ['http', 'ftp']:
             dataUrls = map(lambda url: self._getFilePath(
                 url, self._args.relativePath), dataUrls)
+        else:
+            self._checkLocalSummaryTiles()
         # Now, get the index files for the data files that we've now obtained.
         indexFiles = self._args.indexFiles
         if indexFiles is None:
@@ -1920,6 +1971,74 @@ class RepoManager(object):
             for annotationSet in annotationSets:
                 self._repo.insertVariantAnnotationSet(annotationSet)
         self._updateRepo(updateRepo)
+        if self._args.summaryTiles:
+            self._writeSummaryTiles(variantSet)
+
+    def summariseReadGroupSet(self):
+        """
+        Writes the summary tiles of a readGroupSet next to its BAM file,
+        replacing any that are there.
+        """
+        self._openRepo()
+        dataset = self._repo.getDatasetByName(self._args.datasetName)
+        readGroupSet = dataset.getReadGroupSetByName(
+            self._args.readGroupSetName)
+        self._checkLocalDataUrl(readGroupSet.getDataUrl())
+        self._writeSummaryTiles(readGroupSet)
+
+    def summariseVariantSet(self):
+        """
+        Writes the summary tiles of a variantSet next to its first VCF
+        file, replacing any that are there.
+        """
+        self._openRepo()
+        dataset = self._repo.getDatasetByName(self._args.datasetName)
+        variantSet = dataset.getVariantSetByName(self._args.variantSetName)
+        for dataUrl, _ in variantSet.getDataUrlIndexPairs():
+            self._checkLocalDataUrl(dataUrl)
+        self._writeSummaryTiles(variantSet)
+
+    def packReferenceSet(self):
+        """
+        Writes the bases of a referenceSet to a 2bit file, and changes
+        the referenceSet to read them from it.
+        """
+        self._openRepo()
+        referenceSet = self._repo.getReferenceSetByName(
+            self._args.referenceSetName)
+        dataUrl = referenceSet.getDataUrl()
+        if references.isTwoBitFile(dataUrl):
+            raise exceptions.RepoManagerException(
+                "ReferenceSet '{}' is already stored in 2bit file '{}'".format(
+                    referenceSet.getLocalId(), dataUrl))
+        outputFile = self._args.outputFile
+        if outputFile is None:
+            outputFile = dataUrl
+            for extension in [".gz", ".fasta", ".fa"]:
+                if outputFile.endswith(extension):
+                    outputFile = outputFile[:-len(extension)]
+            outputFile += references.TWO_BIT_EXTENSION
+        elif not references.isTwoBitFile(outputFile):
+            raise exceptions.RepoManagerException(
+                "The 2bit file name must end with '{}'".format(
+                    references.TWO_BIT_EXTENSION))
+        outputFile = self._getFilePath(outputFile, self._args.relativePath)
+        fastaFile = referenceSet.getFastaFile()
+        try:
+            twoBit.writeTwoBitFile(fastaFile, outputFile)
+        except twoBit.TwoBitException as exception:
+            raise exceptions.RepoManagerException(str(exception))
+        twoBitFile = twoBit.TwoBitFile(outputFile)
+        try:
+            packed = zip(twoBitFile.references, twoBitFile.lengths)
+        finally:
+            twoBitFile.close()
+        if packed != zip(fastaFile.references, fastaFile.lengths):
+            raise exceptions.RepoManagerException(
+                "The references in '{}' do not match those in '{}'".format(
+                    outputFile, dataUrl))
+        self._updateRepo(
+            self._repo.updateReferenceSetDataUrl, referenceSet, outputFile)
 
     def removeReferenceSet(self):
         """
@@ -1969,6 +2088,20 @@ class RepoManager(object):
             self._updateRepo(self._repo.removeDataset, dataset)
         self._confirmDelete("Dataset", dataset.getLocalId(), func)
 
+    def _indexGff3File(self, filePath):
+        """
+        Writes the tabix index and the sidecar database of the specified
+        sorted, BGZF compressed GFF3 file, if they do not exist.
+        """
+        try:
+            if not os.path.exists(filePath + ".tbi"):
+                pysam.tabix_index(filePath, preset="gff")
+            sidecarPath = sequenceAnnotations.getSidecarPath(filePath)
+            if not os.path.exists(sidecarPath):
+                gff3Db.writeGff3Sidecar(filePath, sidecarPath)
+        except (gff3Parser.GFF3Exception, IOError, OSError) as exception:
+            raise exceptions.RepoManagerException(str(exception))
+
     def addFeatureSet(self):
         """
         Adds a new feature set into this repo
@@ -1978,8 +2111,13 @@ class RepoManager(object):
         filePath = self._getFilePath(self._args.filePath,
                                      self._args.relativePath)
         name = getNameFromPath(self._args.filePath)
-        featureSet = sequenceAnnotations.Gff3DbFeatureSet(
-            dataset, name)
+        if sequenceAnnotations.isTabixGff3File(filePath):
+            self._indexGff3File(filePath)
+            featureSet = sequenceAnnotations.TabixGff3FeatureSet(
+                dataset, name)
+        else:
+            featureSet = sequenceAnnotations.Gff3DbFeatureSet(
+                dataset, name)
         referenceSetName = self._args.referenceSetName
         if referenceSetName is None:
             raise exceptions.RepoManagerException(
@@ -2008,6 +2146,22 @@ class RepoManager(object):
             self._updateRepo(self._repo.removeFeatureSet, featureSet)
         self._confirmDelete("FeatureSet", featureSet.getLocalId(), func)
 
+    def indexFeatureSet(self):
+        """
+        Adds the indexes used by feature searches to the database of a
+        feature set, and warns about any search that still scans the
+        whole table.
+        """
+        self._openRepo()
+        dataset = self._repo.getDatasetByName(self._args.datasetName)
+        featureSet = dataset.getFeatureSetByName(self._args.featureSetName)
+        unindexedQueries = featureSet.createIndexes()
+        if len(unindexedQueries) > 0:
+            print(
+                "Warning: the {} queries on '{}' do not use an index".format(
+                    ", ".join(unindexedQueries), featureSet.getDataUrl()),
+                file=sys.stderr)
+
     def addBioSample(self):
         """
         Adds a new biosample into this repo
@@ -2079,6 +2233,22 @@ class RepoManager(object):
             "-f", "--force", action='store_true',
             default=False, help="do not prompt for confirmation")
 
+    @classmethod
+    def addSummaryTilesOptions(cls, subparser, objectType):
+        subparser.add_argument(
+            "-s", "--summaryTiles", action='store_true', default=False,
+            help="Write summary tiles of the {} next to its data files, "
+            "which are served by the summary endpoints".format(objectType))
+        cls.addSummaryBinSizeOption(subparser)
+
+    @classmethod
+    def addSummaryBinSizeOption(cls, subparser):
+        subparser.add_argument(
+            "--summaryBinSize", type=int,
+            default=summaryTiles.DEFAULT_BASE_BIN_SIZE,
+            help="The width in bases of the finest summary tiles "
+            "(default: %(default)s)")
+
     @classmethod
     def addRelativePathOption(cls, subparser):
         subparser.add_argument(
@@ -2238,6 +2408,24 @@ class RepoManager(object):
         addReferenceSetParser.add_argument(
             "--sourceUri", default=None,
             help="The source URI")
+        addReferenceSetParser.add_argument(
+            "--numProcesses", default=None, type=int,
+            help="The number of processes used to compute the MD5 "
+            "checksums of the references (default: one per CPU)")
+
+        packReferenceSetParser = addSubparser(
+            subparsers, "pack-referenceset",
+            "Store the bases of a reference set in a 2bit file")
+        packReferenceSetParser.set_defaults(runner="packReferenceSet")
+        cls.addRepoArgument(packReferenceSetParser)
+        packReferenceSetParser.add_argument(
+            "referenceSetName",
+            help="the name of the reference set")
+        packReferenceSetParser.add_argument(
+            "-o", "--outputFile", default=None,
+            help="The path of the 2bit file to write (default: the path "
+            "of the FASTA file with a .2bit extension)")
+        cls.addRelativePathOption(packReferenceSetParser)
 
         removeReferenceSetParser = addSubparser(
             subparsers, "remove-referenceset",
@@ -2270,6 +2458,12 @@ class RepoManager(object):
                 "be automatically inferred by appending '.bai' to the "
                 "file name. If the dataFile is a remote URL the path to "
                 "a local file containing the BAM index must be provided"))
+        addReadGroupSetParser.add_argument(
+            "--numProcesses", default=None, type=int,
+            help="The number of processes used to count the reads and "
+            "bases of each read group of a local BAM file "
+            "(default: one per CPU)")
+        cls.addSummaryTilesOptions(addReadGroupSetParser, objectType)
 
         addOntologyParser = addSubparser(
             subparsers, "add-ontology",
@@ -2303,6 +2497,17 @@ class RepoManager(object):
         cls.addReadGroupSetNameArgument(removeReadGroupSetParser)
         cls.addForceOption(removeReadGroupSetParser)
 
+        summariseReadGroupSetParser = addSubparser(
+            subparsers, "summarise-readgroupset",
+            "Write the summary tiles of a read group set in the repo, "
+            "replacing any it has")
+        summariseReadGroupSetParser.set_defaults(
+            runner="summariseReadGroupSet")
+        cls.addRepoArgument(summariseReadGroupSetParser)
+        cls.addDatasetNameArgument(summariseReadGroupSetParser)
+        cls.addReadGroupSetNameArgument(summariseReadGroupSetParser)
+        cls.addSummaryBinSizeOption(summariseReadGroupSetParser)
+
         objectType = "VariantSet"
         addVariantSetParser = addSubparser(
             subparsers, "add-variantset",
@@ -2337,6 +2542,7 @@ class RepoManager(object):
             help=(
                 "If the supplied VCF file contains annotations, create the "
                 "corresponding VariantAnnotationSet."))
+        cls.addSummaryTilesOptions(addVariantSetParser, objectType)
 
         removeVariantSetParser = addSubparser(
             subparsers, "remove-variantset",
@@ -2347,6 +2553,16 @@ class RepoManager(object):
         cls.addVariantSetNameArgument(removeVariantSetParser)
         cls.addForceOption(removeVariantSetParser)
 
+        summariseVariantSetParser = addSubparser(
+            subparsers, "summarise-variantset",
+            "Write the summary tiles of a variant set in the repo, "
+            "replacing any it has")
+        summariseVariantSetParser.set_defaults(runner="summariseVariantSet")
+        cls.addRepoArgument(summariseVariantSetParser)
+        cls.addDatasetNameArgument(summariseVariantSetParser)
+        cls.addVariantSetNameArgument(summariseVariantSetParser)
+        cls.addSummaryBinSizeOption(summariseVariantSetParser)
+
         addFeatureSetParser = addSubparser(
             subparsers, "add-featureset", "Add a feature set to the data repo")
         addFeatureSetParser.set_defaults(runner="addFeatureSet")
@@ -2356,7 +2572,9 @@ class RepoManager(object):
         cls.addFilePathArgument(
             addFeatureSetParser,
             "The path to the converted SQLite database containing Feature "
-            "data")
+            "data, or to a sorted, bgzipped GFF3 file (.gff3.gz), which is "
+            "served through its tabix index and a sidecar database, both "
+            "written next to it if they do not exist")
         cls.addReferenceSetNameOption(addFeatureSetParser, "feature set")
         cls.addSequenceOntologyNameOption(addFeatureSetParser, "feature set")
 
@@ -2369,6 +2587,15 @@ class RepoManager(object):
         cls.addFeatureSetNameArgument(removeFeatureSetParser)
         cls.addForceOption(removeFeatureSetParser)
 
+        indexFeatureSetParser = addSubparser(
+            subparsers, "index-featureset",
+            "Add the indexes used by feature searches to the database of "
+            "a feature set")
+        indexFeatureSetParser.set_defaults(runner="indexFeatureSet")
+        cls.addRepoArgument(indexFeatureSetParser)
+        cls.addDatasetNameArgument(indexFeatureSetParser)
+        cls.addFeatureSetNameArgument(indexFeatureSetParser)
+
         addBioSampleParser = addSubparser(
             subparsers, "add-biosample", "Add a BioSample to the dataset")
         addBioSampleParser.set_defaults(runner="addBioSample")
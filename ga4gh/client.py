@@ -90,6 +90,36 @@ class AbstractClient(object):
             request.page_token = response.next_page_token
         return "".join(basesList)
 
+    def _runReferenceBasesStreamRequest(self, id_, start, end):
+        """
+        Requests the bases of the specified reference from start to end
+        as unformatted text, and returns an iterator over the chunks of
+        bases received.
+        """
+        raise NotImplemented()
+
+    def generateReferenceBases(self, id_, start=0, end=None):
+        """
+        Returns an iterator over the bases from the server in the form
+        of consecutive strings. Unlike listReferenceBases, the bases are
+        streamed in a single response rather than requested page by
+        page, and are never held in memory all at once.
+        """
+        for chunk in self._runReferenceBasesStreamRequest(id_, start, end):
+            self._protocolBytesReceived += len(chunk)
+            yield chunk
+
+    def writeReferenceBases(self, id_, outputFile, start=0, end=None):
+        """
+        Writes the bases from the server to the specified file object as
+        they are received, and returns the number of bases written.
+        """
+        numBases = 0
+        for chunk in self.generateReferenceBases(id_, start, end):
+            outputFile.write(chunk)
+            numBases += len(chunk)
+        return numBases
+
     def _runGetRequest(self, objectName, protocolResponseClass, id_):
         """
         Requests an object from the server and returns the object of
@@ -617,6 +647,7 @@ class HttpClient(AbstractClient):
         self._urlPrefix = urlPrefix
         self._authenticationKey = authenticationKey
         self._session = requests.Session()
+        self._streamChunkSize = 64 * 1024
         self._setupHttpSession()
         requestsLog = logging.getLogger("requests.packages.urllib3")
         requestsLog.setLevel(logLevel)
@@ -676,6 +707,19 @@ class HttpClient(AbstractClient):
         return self._deserializeResponse(
             response.text, protocol.ListReferenceBasesResponse)
 
+    def _runReferenceBasesStreamRequest(self, id_, start, end):
+        urlSuffix = "references/{id}/bases".format(id=id_)
+        url = posixpath.join(self._urlPrefix, urlSuffix)
+        params = self._getHttpParameters()
+        params['start'] = start
+        if end is not None:
+            params['end'] = end
+        response = self._session.get(
+            url, params=params, headers={"Accept": "text/plain"},
+            stream=True)
+        self._checkResponseStatus(response)
+        return response.iter_content(self._streamChunkSize)
+
 
 class LocalClient(AbstractClient):
 
@@ -740,3 +784,11 @@ class LocalClient(AbstractClient):
         responseJson = self._backend.runListReferenceBases(id_, requestArgs)
         return self._deserializeResponse(
             responseJson, protocol.ListReferenceBasesResponse)
+
+    def _runReferenceBasesStreamRequest(self, id_, start, end):
+        requestArgs = {'start': start}
+        if end is not None:
+            requestArgs['end'] = end
+        reference, start, end = self._backend.getReferenceBasesWindow(
+            id_, requestArgs)
+        return self._backend.generateReferenceBases(reference, start, end)
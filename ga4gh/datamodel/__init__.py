@@ -9,6 +9,7 @@ from __future__ import unicode_literals
 import json
 import base64
 import collections
+import threading
 
 import ga4gh.exceptions as exceptions
 
@@ -27,6 +28,9 @@ class PysamFileHandleCache(object):
         self._memoTable = dict()
         # Initialize the value even if it will be set up by the config
         self._maxCacheSize = 50
+        self._numHits = 0
+        self._numMisses = 0
+        self._numEvictions = 0
 
     def setMaxCacheSize(self, size):
         """
@@ -67,6 +71,19 @@ class PysamFileHandleCache(object):
         """
         return self._memoTable.keys()
 
+    def getStatistics(self):
+        """
+        Returns a dictionary describing the occupancy of the cache and
+        the number of hits, misses and evictions since it was created.
+        """
+        return {
+            "size": len(self._memoTable),
+            "maxSize": self._maxCacheSize,
+            "hits": self._numHits,
+            "misses": self._numMisses,
+            "evictions": self._numEvictions,
+        }
+
     def getFileHandle(self, dataFile, openMethod):
         """
         Returns handle associated to the filename. If the file is
@@ -77,8 +94,10 @@ class PysamFileHandleCache(object):
         if dataFile in self._memoTable:
             handle = self._memoTable[dataFile]
             self._update(dataFile, handle)
+            self._numHits += 1
             return handle
         else:
+            self._numMisses += 1
             try:
                 handle = openMethod(dataFile)
             except ValueError:
@@ -89,12 +108,38 @@ class PysamFileHandleCache(object):
             if len(self._memoTable) > self._maxCacheSize:
                 dataFile = self._removeLru()
                 del self._memoTable[dataFile]
+                self._numEvictions += 1
             return handle
 
 
 # LRU cache of open file handles
 fileHandleCache = PysamFileHandleCache()
 
+# The private file handles of the current thread, if any
+_threadFileHandles = threading.local()
+
+
+class PrivateFileHandles(object):
+    """
+    Context manager within which the files opened in the current thread
+    by PysamDatamodelMixin.getFileHandle are private to the thread,
+    rather than shared through the file handle cache, and are closed on
+    exit. pysam file handles cannot be used by two threads at once, so
+    this allows files to be read safely by worker threads.
+    """
+    def __init__(self):
+        self._handles = {}
+
+    def __enter__(self):
+        _threadFileHandles.handles = self._handles
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        del _threadFileHandles.handles
+        for handle in self._handles.values():
+            handle.close()
+        self._handles.clear()
+
 
 class CompoundId(object):
     """
@@ -573,4 +618,12 @@ class PysamDatamodelMixin(object):
         return attr
 
     def getFileHandle(self, dataFile):
-        return fileHandleCache.getFileHandle(dataFile, self.openFile)
+        handles = getattr(_threadFileHandles, "handles", None)
+        if handles is None:
+            return fileHandleCache.getFileHandle(dataFile, self.openFile)
+        if dataFile not in handles:
+            try:
+                handles[dataFile] = self.openFile(dataFile)
+            except ValueError:
+                raise exceptions.FileOpenFailedException(dataFile)
+        return handles[dataFile]
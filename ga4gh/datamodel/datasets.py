@@ -301,7 +301,8 @@ class SimulatedDataset(Dataset):
             self, localId, referenceSet, randomSeed=0,
             numVariantSets=1, numCalls=1, variantDensity=0.5,
             numReadGroupSets=1, numReadGroupsPerReadGroupSet=1,
-            numAlignments=1, numFeatureSets=1):
+            numAlignments=1, numFeatureSets=1, numFeatures=10,
+            spreadOnReference=False):
         super(SimulatedDataset, self).__init__(localId)
         self._description = "Simulated dataset {}".format(localId)
         # TODO create a simulated Ontology
@@ -335,7 +336,8 @@ class SimulatedDataset(Dataset):
             seed = randomSeed + i
             readGroupSet = reads.SimulatedReadGroupSet(
                 self, localId, referenceSet, seed,
-                numReadGroupsPerReadGroupSet, numAlignments)
+                numReadGroupsPerReadGroupSet, numAlignments,
+                spreadOnReference)
             for rg in readGroupSet.getReadGroups():
                 bioSample = biodata.BioSample(
                     self, rg.getLocalId())
@@ -351,6 +353,6 @@ class SimulatedDataset(Dataset):
             localId = "simFs{}".format(i)
             seed = randomSeed + i
             featureSet = sequenceAnnotations.SimulatedFeatureSet(
-                self, localId, seed)
+                self, localId, seed, numFeatures, spreadOnReference)
             featureSet.setReferenceSet(referenceSet)
             self.addFeatureSet(featureSet)
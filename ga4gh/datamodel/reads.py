@@ -6,18 +6,50 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import array
 import datetime
+import heapq
 import json
+import multiprocessing
 import os.path
 import random
 
 import pysam
 
+import ga4gh.bamIndex as bamIndex
 import ga4gh.datamodel as datamodel
 import ga4gh.datamodel.references as references
 import ga4gh.exceptions as exceptions
 import ga4gh.protocol as protocol
 import ga4gh.pb as pb
+import ga4gh.summaryTiles as summaryTiles
+import ga4gh.timing as timing
+
+PARALLEL_STATS_MIN_READS = 1000000
+"""
+The stats of the read groups of BAM files with fewer reads than this are
+counted in the calling process, as starting a process pool would take
+longer.
+"""
+
+
+def _encodeArrayTagValue(value):
+    """
+    Returns the values of the specified array of a B type tag separated
+    by commas, as in the SAM text format.
+    """
+    return b",".join(map(str, value))
+
+
+# The functions converting the values of SAM tags of each type returned by
+# pysam to the strings in the info of a ReadAlignment. The values of
+# character, string and hex tags are strings already, and are used as is.
+_tagValueEncoders = {
+    int: str,
+    long: str,
+    float: str,
+    array.array: _encodeArrayTagValue,
+}
 
 
 def parseMalformedBamHeader(headerDict):
@@ -94,15 +126,145 @@ class SamFlags(object):
         return flagAttr | flag
 
 
+def getReadAlignmentStart(gaAlignment):
+    """
+    Returns the position at which the specified GA4GH ReadAlignment is
+    placed on the reference, as used to page through read searches.
+    """
+    if gaAlignment.alignment.position.position == 0:
+        # unmapped read with mapped mate; see SAM standard 2.4.1
+        return gaAlignment.next_mate_position.position
+    else:
+        # usual case
+        return gaAlignment.alignment.position.position
+
+
+def _sweepDepths(events, limit, depth, position, binSize, maxDepths):
+    """
+    Pops the (position, change in depth) events before limit from the
+    specified heap, raising the maximum depth of each bin covered while
+    the depth is constant, starting from the specified depth and
+    position. Returns the depth and position after the last event.
+    """
+    while len(events) > 0 and events[0][0] < limit:
+        eventPosition, change = heapq.heappop(events)
+        if depth > 0 and eventPosition > position:
+            for binIndex in range(
+                    position // binSize, (eventPosition - 1) // binSize + 1):
+                if maxDepths[binIndex] < depth:
+                    maxDepths[binIndex] = depth
+        depth += change
+        position = eventPosition
+    return depth, position
+
+
+def _countReadGroupStats(samFile, referenceName, unplacedReadsOffset):
+    """
+    Returns a dictionary mapping the value of the RG tag of the reads
+    placed on the specified reference, or of those not placed on any
+    reference if it is None, to a list of their numbers of aligned and
+    unaligned reads and of bases. Reads without an RG tag are counted
+    under None. The unplaced reads are read from the specified virtual
+    offset to the end of the file, or by scanning the whole file if it
+    is None.
+    """
+    if referenceName is not None:
+        reads = samFile.fetch(referenceName.encode())
+    else:
+        if unplacedReadsOffset is not None:
+            samFile.seek(unplacedReadsOffset)
+        reads = samFile.fetch(until_eof=True)
+    counts = {}
+    for read in reads:
+        if referenceName is None and read.reference_id >= 0:
+            continue
+        readGroupId = None
+        if read.has_tag(b'RG'):
+            readGroupId = read.get_tag(b'RG')
+        readGroupCounts = counts.get(readGroupId)
+        if readGroupCounts is None:
+            readGroupCounts = counts[readGroupId] = [0, 0, 0]
+        if read.is_unmapped:
+            readGroupCounts[1] += 1
+        else:
+            readGroupCounts[0] += 1
+        readGroupCounts[2] += read.query_length
+    return counts
+
+
+def _countReadGroupStatsInProcess(args):
+    """
+    Process pool entry point for _countReadGroupStats, which opens its
+    own handle on the BAM file.
+    """
+    dataUrl, indexFile, referenceName, unplacedReadsOffset = args
+    samFile = pysam.AlignmentFile(dataUrl, filepath_index=indexFile)
+    try:
+        return _countReadGroupStats(
+            samFile, referenceName, unplacedReadsOffset)
+    finally:
+        samFile.close()
+
+
+class RawReadAlignmentsMixin(object):
+    """
+    Mixin class providing the raw records of read alignments, from which
+    searches find the reads of a page before converting only those to
+    GA4GH ReadAlignments. By default the records are the converted
+    ReadAlignments themselves.
+    """
+    def getRawReadAlignments(self, reference, start=None, end=None):
+        """
+        Returns an iterator over the raw records of the specified reads.
+        """
+        return self.getReadAlignments(reference, start, end)
+
+    def convertRawReadAlignment(self, rawReadAlignment, tags=None):
+        """
+        Returns the GA4GH ReadAlignment for the specified raw record,
+        with only the specified tags in its info if tags is not None.
+        """
+        if tags is not None:
+            for key in list(rawReadAlignment.info):
+                if key not in tags:
+                    del rawReadAlignment.info[key]
+        return rawReadAlignment
+
+    def getRawReadAlignmentStart(self, rawReadAlignment):
+        """
+        Returns the position of the specified raw record, as given by
+        getReadAlignmentStart for its ReadAlignment.
+        """
+        return getReadAlignmentStart(rawReadAlignment)
+
+    def getCoverage(self, reference, start, end, binSize):
+        """
+        Returns the number of mapped reads starting in each bin of the
+        specified size from start to end, and the number of their bases
+        aligned to each bin.
+        """
+        raise exceptions.NotImplementedException(
+            "Read coverage is not supported for {}".format(self.getId()))
+
+    def estimateReadCounts(self, reference, start, end, binSize):
+        """
+        Returns estimates of the number of mapped reads starting in each
+        bin of the specified size from start to end, or None if they
+        cannot be estimated without reading the reads.
+        """
+        return None
+
+
 class AlignmentDataMixin(datamodel.PysamDatamodelMixin):
     """
     Mixin class that provides methods for getting read alignments
-    from bam files
+    from bam files. The raw records of the reads are (read, readGroupSet,
+    readGroupId) tuples holding the pysam record.
     """
-    def _getReadAlignments(
+    def _getRawReadAlignments(
             self, reference, start, end, readGroupSet, readGroup):
         """
-        Returns an iterator over the specified reads
+        Returns an iterator over the raw records of the specified reads
         """
         # TODO If reference is None, return against all references,
         # including unmapped reads.
@@ -112,29 +274,96 @@ class AlignmentDataMixin(datamodel.PysamDatamodelMixin):
         start, end = self.sanitizeAlignmentFileFetch(start, end)
         readAlignments = samFile.fetch(referenceName, start, end)
         for readAlignment in readAlignments:
-            tags = dict(readAlignment.tags)
+            # Only the RG tag is read here, rather than decoding them all.
+            hasReadGroupTag = readAlignment.has_tag(b'RG')
             if readGroup is None:
-                if 'RG' in tags:
-                    alignmentReadGroupLocalId = tags['RG']
+                if hasReadGroupTag:
+                    alignmentReadGroupLocalId = readAlignment.get_tag(b'RG')
                     readGroupCompoundId = datamodel.ReadGroupCompoundId(
                         readGroupSet.getCompoundId(),
                         str(alignmentReadGroupLocalId))
-                yield self.convertReadAlignment(
-                    readAlignment, readGroupSet, str(readGroupCompoundId))
+                readGroupId = str(readGroupCompoundId)
             else:
-                if self._filterReads:
-                    if 'RG' in tags and tags['RG'] == self._localId:
-                        yield self.convertReadAlignment(
-                            readAlignment, readGroupSet,
-                            str(readGroup.getCompoundId()))
-                else:
-                    yield self.convertReadAlignment(
-                        readAlignment, readGroupSet,
-                        str(readGroup.getCompoundId()))
+                if self._filterReads and (
+                        not hasReadGroupTag or
+                        readAlignment.get_tag(b'RG') != self._localId):
+                    continue
+                readGroupId = str(readGroup.getCompoundId())
+            yield readAlignment, readGroupSet, readGroupId
+
+    def _getReadAlignments(
+            self, reference, start, end, readGroupSet, readGroup):
+        """
+        Returns an iterator over the specified reads
+        """
+        for rawReadAlignment in self._getRawReadAlignments(
+                reference, start, end, readGroupSet, readGroup):
+            yield self.convertRawReadAlignment(rawReadAlignment)
+
+    def convertRawReadAlignment(self, rawReadAlignment, tags=None):
+        """
+        Returns the GA4GH ReadAlignment for the specified raw record,
+        with only the specified tags in its info if tags is not None.
+        """
+        timer = timing.getRequestTimer()
+        previousPhase = timer.switchPhase(timing.CONVERT)
+        read, readGroupSet, readGroupId = rawReadAlignment
+        alignment = self.convertReadAlignment(
+            read, readGroupSet, readGroupId, tags)
+        timer.switchPhase(previousPhase)
+        return alignment
+
+    def getRawReadAlignmentStart(self, rawReadAlignment):
+        """
+        Returns the position of the specified raw record, as given by
+        getReadAlignmentStart for its ReadAlignment, without converting
+        it.
+        """
+        read = rawReadAlignment[0]
+        position = 0
+        if not SamFlags.isFlagSet(read.flag, SamFlags.READ_UNMAPPED):
+            position = read.reference_start
+        if position == 0:
+            if SamFlags.isFlagSet(read.flag, SamFlags.MATE_UNMAPPED):
+                return 0
+            return read.next_reference_start
+        return position
 
-    def convertReadAlignment(self, read, readGroupSet, readGroupId):
+    def _getCoverage(self, reference, start, end, binSize, readGroup):
+        """
+        Returns the coverage of the specified bins (see getCoverage) by
+        the reads of the specified read group, or by all reads if it is
+        None. Only the RG tag of each read is decoded, and the bases
+        within deletions and skipped regions are not counted as aligned.
         """
-        Convert a pysam ReadAlignment to a GA4GH ReadAlignment
+        samFile = self.getFileHandle(self._dataUrl)
+        referenceName = reference.getLocalId().encode()
+        filterReads = readGroup is not None and self._filterReads
+        numBins = (end - start + binSize - 1) // binSize
+        readCounts = [0] * numBins
+        baseCounts = [0] * numBins
+        for read in samFile.fetch(referenceName, start, end):
+            if read.is_unmapped or filterReads and (
+                    not read.has_tag(b'RG') or
+                    read.get_tag(b'RG') != self._localId):
+                continue
+            if read.reference_start >= start:
+                readCounts[(read.reference_start - start) // binSize] += 1
+            for blockStart, blockEnd in read.get_blocks():
+                blockStart = max(blockStart, start)
+                blockEnd = min(blockEnd, end)
+                while blockStart < blockEnd:
+                    binIndex = (blockStart - start) // binSize
+                    binEnd = min(blockEnd, start + (binIndex + 1) * binSize)
+                    baseCounts[binIndex] += binEnd - blockStart
+                    blockStart = binEnd
+        return readCounts, baseCounts
+
+    def convertReadAlignment(self, read, readGroupSet, readGroupId, tags=None):
+        """
+        Convert a pysam ReadAlignment to a GA4GH ReadAlignment. If tags is
+        not None, only the listed tags (as bytes) of the read are decoded
+        and copied to its info.
         """
         samFile = self.getFileHandle(self._dataUrl)
         # TODO fill out remaining fields
@@ -166,8 +395,16 @@ class AlignmentDataMixin(datamodel.PysamDatamodelMixin):
             read.flag, SamFlags.FAILED_QUALITY_CHECK)
         ret.fragment_length = read.template_length
         ret.fragment_name = read.query_name
-        for key, value in read.tags:
-            ret.info[key].values.add().string_value = str(value)
+        if tags is None:
+            readTags = read.tags
+        else:
+            readTags = [
+                (tag, read.get_tag(tag)) for tag in tags if read.has_tag(tag)]
+        for key, value in readTags:
+            encoder = _tagValueEncoders.get(type(value))
+            if encoder is not None:
+                value = encoder(value)
+            ret.info[key].values.add().string_value = value
         if SamFlags.isFlagSet(read.flag, SamFlags.MATE_UNMAPPED):
             ret.next_mate_position.Clear()
         else:
@@ -217,7 +454,8 @@ class AlignmentDataMixin(datamodel.PysamDatamodelMixin):
             raise exceptions.DataException(exception.message)
 
 
-class AbstractReadGroupSet(datamodel.DatamodelObject):
+class AbstractReadGroupSet(
+        RawReadAlignmentsMixin, datamodel.DatamodelObject):
     """
     The base class of a read group set
     """
@@ -228,6 +466,7 @@ class AbstractReadGroupSet(datamodel.DatamodelObject):
         self._readGroupIdMap = {}
         self._readGroupIds = []
         self._referenceSet = None
+        self._numBases = -1
 
     def setReferenceSet(self, referenceSet):
         """
@@ -297,6 +536,13 @@ class AbstractReadGroupSet(datamodel.DatamodelObject):
         """
         return self._numUnalignedReads
 
+    def getNumBases(self):
+        """
+        Return the number of bases in the reads of this read group set,
+        or -1 if they have not been counted
+        """
+        return self._numBases
+
     def getPrograms(self):
         """
         Returns an array of Programs used to generate this read group set
@@ -320,8 +566,16 @@ class AbstractReadGroupSet(datamodel.DatamodelObject):
         stats = protocol.ReadStats()
         stats.aligned_read_count = self._numAlignedReads
         stats.unaligned_read_count = self._numUnalignedReads
+        stats.base_count = self._numBases
         return stats
 
+    def getSummaryTiles(self):
+        """
+        Returns the SummaryTiles of this read group set, or None if they
+        have not been computed.
+        """
+        return None
+
 
 class SimulatedReadGroupSet(AbstractReadGroupSet):
     """
@@ -329,7 +583,7 @@ class SimulatedReadGroupSet(AbstractReadGroupSet):
     """
     def __init__(
             self, parentContainer, localId, referenceSet, randomSeed=1,
-            numReadGroups=1, numAlignments=2):
+            numReadGroups=1, numAlignments=2, spreadOnReference=False):
         super(SimulatedReadGroupSet, self).__init__(
             parentContainer, localId)
         self._referenceSet = referenceSet
@@ -339,7 +593,8 @@ class SimulatedReadGroupSet(AbstractReadGroupSet):
         for i in range(numReadGroups):
             localId = "rg{}".format(i)
             readGroup = SimulatedReadGroup(
-                self, localId, randomSeed + i, numAlignments)
+                self, localId, randomSeed + i, numAlignments,
+                spreadOnReference)
             self.addReadGroup(readGroup)
 
     def getPrograms(self):
@@ -366,6 +621,11 @@ class HtslibReadGroupSet(AlignmentDataMixin, AbstractReadGroupSet):
         # Used when we populate from a file. Not defined when we populate
         # from the DB.
         self._bamHeaderReferenceSetName = None
+        # Read on first use by estimateReadCounts.
+        self._bamIndex = None
+        self._bamIndexLoaded = False
+        self._summaryTiles = None
+        self._summaryTilesLoaded = False
 
     def getReadAlignments(self, reference, start=None, end=None):
         """
@@ -373,6 +633,133 @@ class HtslibReadGroupSet(AlignmentDataMixin, AbstractReadGroupSet):
         """
         return self._getReadAlignments(reference, start, end, self, None)
 
+    def getRawReadAlignments(self, reference, start=None, end=None):
+        """
+        Returns an iterator over the raw records of the specified reads
+        """
+        return self._getRawReadAlignments(reference, start, end, self, None)
+
+    def getCoverage(self, reference, start, end, binSize):
+        """
+        Returns the number of mapped reads starting in each bin of the
+        specified size from start to end, and the number of their bases
+        aligned to each bin.
+        """
+        return self._getCoverage(reference, start, end, binSize, None)
+
+    def getBamIndex(self):
+        """
+        Returns the BamIndex of the BAM file of this ReadGroupSet, or None
+        if its index is not in the BAI format.
+        """
+        if not self._bamIndexLoaded:
+            try:
+                self._bamIndex = bamIndex.BamIndex(self._indexFile)
+            except (IOError, bamIndex.BamIndexException):
+                self._bamIndex = None
+            self._bamIndexLoaded = True
+        return self._bamIndex
+
+    def estimateReadCounts(self, reference, start, end, binSize):
+        """
+        Returns estimates of the number of mapped reads starting in each
+        bin of the specified size from start to end, computed from the
+        BAI index of the BAM file without reading the reads, or None if
+        the index does not hold the statistics needed.
+        """
+        index = self.getBamIndex()
+        if index is None:
+            return None
+        samFile = self.getFileHandle(self._dataUrl)
+        referenceIndex = samFile.gettid(reference.getLocalId().encode())
+        if referenceIndex < 0:
+            return [0.0] * ((end - start + binSize - 1) // binSize)
+        return index.estimateReadCounts(
+            referenceIndex, samFile.lengths[referenceIndex], start, end,
+            binSize)
+
+    def getSummaryTiles(self):
+        """
+        Returns the SummaryTiles written next to the BAM file of this
+        ReadGroupSet by writeSummaryTiles, or None if there are none.
+        """
+        if not self._summaryTilesLoaded:
+            try:
+                self._summaryTiles = summaryTiles.SummaryTiles(
+                    summaryTiles.getSummaryTilesPath(self._dataUrl))
+            except (IOError, summaryTiles.SummaryTilesException):
+                self._summaryTiles = None
+            self._summaryTilesLoaded = True
+        return self._summaryTiles
+
+    def _getSummaryBins(self, referenceName, length, binSize):
+        """
+        Returns the values of summaryTiles.READ_FIELDS over the bins of
+        the specified size covering the specified reference, counting
+        the mapped reads in the same way as getCoverage. The maximum
+        depth is found by sweeping over the starts and ends of the
+        aligned blocks of the reads in order; an event is final once a
+        read starting after it has been seen, as no later block can
+        start before the read that holds it.
+        """
+        samFile = self.getFileHandle(self._dataUrl)
+        numBins = summaryTiles.getNumBins(length, binSize)
+        readCounts = array.array(b"I", [0]) * numBins
+        baseCounts = array.array(b"d", [0]) * numBins
+        maxDepths = array.array(b"I", [0]) * numBins
+        # (position, change in depth) pairs, with ends before starts at
+        # the same position.
+        events = []
+        depth = 0
+        position = 0
+        for read in samFile.fetch(referenceName.encode()):
+            if read.is_unmapped:
+                continue
+            depth, position = _sweepDepths(
+                events, read.reference_start, depth, position, binSize,
+                maxDepths)
+            if read.reference_start < length:
+                readCounts[read.reference_start // binSize] += 1
+            for blockStart, blockEnd in read.get_blocks():
+                blockEnd = min(blockEnd, length)
+                if blockStart >= blockEnd:
+                    continue
+                heapq.heappush(events, (blockStart, 1))
+                heapq.heappush(events, (blockEnd, -1))
+                while blockStart < blockEnd:
+                    binIndex = blockStart // binSize
+                    binEnd = min(blockEnd, (binIndex + 1) * binSize)
+                    baseCounts[binIndex] += binEnd - blockStart
+                    blockStart = binEnd
+        _sweepDepths(events, length + 1, depth, position, binSize, maxDepths)
+        return {
+            "readCount": readCounts,
+            "baseCount": baseCounts,
+            "maxDepth": maxDepths,
+        }
+
+    def writeSummaryTiles(
+            self, fileName=None,
+            baseBinSize=summaryTiles.DEFAULT_BASE_BIN_SIZE,
+            zoomFactor=summaryTiles.DEFAULT_ZOOM_FACTOR):
+        """
+        Writes the read counts, aligned base counts and maximum depths of
+        every reference in the BAM file of this ReadGroupSet to a summary
+        tile file of the specified name, which defaults to the one read
+        by getSummaryTiles.
+        """
+        if fileName is None:
+            fileName = summaryTiles.getSummaryTilesPath(self._dataUrl)
+        samFile = self.getFileHandle(self._dataUrl)
+        references = (
+            (referenceName, length,
+                self._getSummaryBins(referenceName, length, baseBinSize))
+            for referenceName, length in zip(
+                samFile.references, samFile.lengths))
+        summaryTiles.writeSummaryTiles(
+            fileName, summaryTiles.READ_FIELDS, references, baseBinSize,
+            zoomFactor)
+
     def getBamHeaderReferenceSetName(self):
         """
         Returns the ReferenceSet name using in the BAM header.
@@ -394,6 +781,7 @@ class HtslibReadGroupSet(AlignmentDataMixin, AbstractReadGroupSet):
         stats = protocol.fromJson(row[b'stats'], protocol.ReadStats)
         self._numAlignedReads = stats.aligned_read_count
         self._numUnalignedReads = stats.unaligned_read_count
+        self._numBases = stats.base_count
 
     def populateFromFile(self, dataUrl, indexFile=None):
         """
@@ -430,6 +818,81 @@ class HtslibReadGroupSet(AlignmentDataMixin, AbstractReadGroupSet):
         self._numAlignedReads = samFile.mapped
         self._numUnalignedReads = samFile.unmapped
 
+    def computeReadGroupStats(self, numProcesses=None):
+        """
+        Counts the aligned and unaligned reads and the bases of each
+        ReadGroup of this set, and of the set as a whole, in one pass
+        over the BAM file. The reads placed on each reference and those
+        placed on none are counted separately, across a pool of the
+        specified number of processes (by default, one per CPU) for
+        large files. Reads whose RG tag names no ReadGroup in the header
+        are only counted in the stats of the set.
+        """
+        samFile = self.getFileHandle(self._dataUrl)
+        index = self.getBamIndex()
+        # The (referenceName, unplacedReadsOffset) units of work and their
+        # expected numbers of reads, which are unknown without the index.
+        units = []
+        for referenceIndex, referenceName in enumerate(samFile.references):
+            numReads = samFile.lengths[referenceIndex]
+            if index is not None:
+                numMapped, numUnmapped = index.getReadCounts(referenceIndex)
+                if numMapped is not None:
+                    numReads = numMapped + numUnmapped
+            if numReads > 0:
+                units.append((numReads, referenceName, None))
+        if samFile.nocoordinate > 0:
+            offset = None
+            if index is not None:
+                offset = index.getUnplacedReadsOffset()
+            units.append((samFile.nocoordinate, None, offset))
+        # Count the largest units first to balance the load.
+        units.sort(key=lambda unit: -unit[0])
+        if numProcesses is None:
+            numProcesses = multiprocessing.cpu_count()
+        numProcesses = min(numProcesses, len(units))
+        numReads = samFile.mapped + samFile.unmapped
+        if numProcesses > 1 and numReads >= PARALLEL_STATS_MIN_READS:
+            pool = multiprocessing.Pool(numProcesses)
+            try:
+                unitCounts = pool.map(
+                    _countReadGroupStatsInProcess,
+                    [(self._dataUrl, self._indexFile, referenceName,
+                      unplacedReadsOffset)
+                     for _, referenceName, unplacedReadsOffset in units],
+                    chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            # The unplaced reads are read by moving the file position, so
+            # a handle of our own is used rather than the cached one.
+            samFile = self.openFile(self._dataUrl)
+            try:
+                unitCounts = [
+                    _countReadGroupStats(
+                        samFile, referenceName, unplacedReadsOffset)
+                    for _, referenceName, unplacedReadsOffset in units]
+            finally:
+                samFile.close()
+        counts = {}
+        for readGroupCounts in unitCounts:
+            for readGroupId, values in readGroupCounts.items():
+                total = counts.setdefault(readGroupId, [0, 0, 0])
+                for i, value in enumerate(values):
+                    total[i] += value
+        totals = [sum(values[i] for values in counts.values())
+                  for i in range(3)]
+        for readGroup in self.getReadGroups():
+            if readGroup.getLocalId() == self.defaultReadGroupName:
+                # The default ReadGroup holds every read in the file.
+                values = totals
+            else:
+                values = counts.get(readGroup.getLocalId(), [0, 0, 0])
+            readGroup.setStats(*values)
+        (self._numAlignedReads, self._numUnalignedReads,
+            self._numBases) = totals
+
     def checkConsistency(self, dataRepository):
         pass
         # TODO verify that the references in the BAM file exist
@@ -468,7 +931,7 @@ class HtslibReadGroupSet(AlignmentDataMixin, AbstractReadGroupSet):
         return self._indexFile
 
 
-class AbstractReadGroup(datamodel.DatamodelObject):
+class AbstractReadGroup(RawReadAlignmentsMixin, datamodel.DatamodelObject):
     """
     Class representing a ReadGroup. A ReadGroup is all the data that's
     processed the same way by the sequencer.  There are typically 1-10
@@ -484,6 +947,7 @@ class AbstractReadGroup(datamodel.DatamodelObject):
         self._creationTime = now
         self._updateTime = now
         self._bioSampleId = None
+        self._numBases = -1
 
     def toProtocolElement(self):
         """
@@ -518,7 +982,7 @@ class AbstractReadGroup(datamodel.DatamodelObject):
         stats = protocol.ReadStats()
         stats.aligned_read_count = self.getNumAlignedReads()
         stats.unaligned_read_count = self.getNumUnalignedReads()
-        # TODO base_count requires iterating through all reads
+        stats.base_count = self.getNumBases()
         return stats
 
     def getExperiment(self):
@@ -550,6 +1014,13 @@ class AbstractReadGroup(datamodel.DatamodelObject):
         """
         return self._numUnalignedReads
 
+    def getNumBases(self):
+        """
+        Return the number of bases in the reads of the read group, or -1
+        if they have not been counted
+        """
+        return self._numBases
+
     def getPrograms(self):
         """
         Returns an array of Programs used to generate this read group
@@ -629,13 +1100,25 @@ class SimulatedReadGroup(AbstractReadGroup):
     A simulated readgroup
     """
 
-    def __init__(self, parentContainer, localId, randomSeed, numAlignments=2):
+    maxReadLength = 100
+
+    def __init__(
+            self, parentContainer, localId, randomSeed, numAlignments=2,
+            spreadOnReference=False):
         super(SimulatedReadGroup, self).__init__(parentContainer, localId)
         self._randomSeed = randomSeed
         self._numAlignedReads = self._parentContainer.getNumAlignedReads()
         self._numUnalignedReads = 0
+        self._spreadOnReference = spreadOnReference
 
-    def getReadAlignments(self, referenceId=None, start=None, end=None):
+    def getReadAlignments(self, reference=None, start=None, end=None):
+        """
+        Returns an iterator over the simulated reads in this read group.
+        By default all reads are placed at position 0 and returned
+        regardless of the query range. If this read group spreads its reads
+        on the reference, they are laid out evenly along the specified
+        reference and only those overlapping the query range are generated.
+        """
         rng = random.Random(self._randomSeed)
 
         # We seed reads with sequential seeds starting from here. We hope no
@@ -643,23 +1126,43 @@ class SimulatedReadGroup(AbstractReadGroup):
         # then we'd start seeing identical reads in the two groups.)
         read_seed_start = rng.getrandbits(64)
 
-        for i in range(self.getNumAlignedReads()):
-            seed = read_seed_start + i
-            yield self._createReadAlignment(i, seed)
-
-    def _createReadAlignment(self, i, seed):
+        numReads = self.getNumAlignedReads()
+        if not self._spreadOnReference:
+            for i in range(numReads):
+                seed = read_seed_start + i
+                yield self._createReadAlignment(i, seed)
+        elif numReads > 0:
+            length = reference.getLength()
+            if start is None:
+                start = 0
+            if end is None:
+                end = length
+            # Reads are at most maxReadLength long, so we only need to look
+            # back this far to find all reads overlapping the query.
+            first = max(0, start - self.maxReadLength) * numReads // length
+            for i in xrange(first, numReads):
+                position = i * length // numReads
+                if position >= end:
+                    break
+                alignment = self._createReadAlignment(
+                    i, read_seed_start + i, reference.getLocalId(), position)
+                if position + len(alignment.aligned_sequence) > start:
+                    yield alignment
+
+    def _createReadAlignment(
+            self, i, seed, referenceName="NotImplemented", position=0):
         # TODO fill out a bit more
         rng = random.Random(seed)
         alignment = protocol.ReadAlignment()
-        alignment.fragment_length = rng.randint(10, 100)
+        alignment.fragment_length = rng.randint(10, self.maxReadLength)
         alignment.aligned_sequence = ""
-        for i in range(alignment.fragment_length):
+        for _ in range(alignment.fragment_length):
             # TODO: are these reasonable quality values?
             alignment.aligned_quality.append(rng.randint(1, 20))
             alignment.aligned_sequence += rng.choice("ACGT")
 
-        alignment.alignment.position.position = 0
-        alignment.alignment.position.reference_name = "NotImplemented"
+        alignment.alignment.position.position = position
+        alignment.alignment.position.reference_name = referenceName
         alignment.alignment.position.strand = protocol.POS_STRAND
         alignment.duplicate_fragment = False
         alignment.failed_vendor_quality_checks = False
@@ -726,8 +1229,9 @@ class HtslibReadGroup(AlignmentDataMixin, AbstractReadGroup):
         self._library = None
         self._platformUnit = None
         self._runTime = None
-        self._numAlignedReads = -1  # TODO populate with metadata
-        self._numUnalignedReads = -1  # TODO populate with metadata
+        # Counted by HtslibReadGroupSet.computeReadGroupStats.
+        self._numAlignedReads = -1
+        self._numUnalignedReads = -1
 
     def populateFromHeader(self, readGroupHeader):
         """
@@ -744,6 +1248,15 @@ class HtslibReadGroup(AlignmentDataMixin, AbstractReadGroup):
         self._platformUnit = readGroupHeader.get('PU', None)
         self._runTime = readGroupHeader.get('DT', None)
 
+    def setStats(self, numAlignedReads, numUnalignedReads, numBases):
+        """
+        Sets the numbers of aligned and unaligned reads and of bases in
+        this ReadGroup.
+        """
+        self._numAlignedReads = numAlignedReads
+        self._numUnalignedReads = numUnalignedReads
+        self._numBases = numBases
+
     def populateFromRow(self, row):
         """
         Populate the instance variables using the specified DB row.
@@ -755,6 +1268,7 @@ class HtslibReadGroup(AlignmentDataMixin, AbstractReadGroup):
         stats = protocol.fromJson(row[b'stats'], protocol.ReadStats)
         self._numAlignedReads = stats.aligned_read_count
         self._numUnalignedReads = stats.unaligned_read_count
+        self._numBases = stats.base_count
         experiment = protocol.fromJson(row[b'experiment'], protocol.Experiment)
         self._instrumentModel = experiment.instrument_model
         self._sequencingCenter = experiment.sequencing_center
@@ -770,6 +1284,34 @@ class HtslibReadGroup(AlignmentDataMixin, AbstractReadGroup):
         return self._getReadAlignments(
             reference, start, end, self._parentContainer, self)
 
+    def getRawReadAlignments(self, reference, start=None, end=None):
+        """
+        Returns an iterator over the raw records of the specified reads
+        """
+        return self._getRawReadAlignments(
+            reference, start, end, self._parentContainer, self)
+
+    def getCoverage(self, reference, start, end, binSize):
+        """
+        Returns the number of mapped reads starting in each bin of the
+        specified size from start to end, and the number of their bases
+        aligned to each bin.
+        """
+        return self._getCoverage(reference, start, end, binSize, self)
+
+    def estimateReadCounts(self, reference, start, end, binSize):
+        """
+        Returns estimates of the number of mapped reads starting in each
+        bin of the specified size from start to end, or None if they
+        cannot be estimated without reading the reads. The BAI index
+        does not separate the reads of read groups, so estimates can only
+        be made for the only read group of a ReadGroupSet.
+        """
+        if len(self._parentContainer.getReadGroups()) != 1:
+            return None
+        return self._parentContainer.estimateReadCounts(
+            reference, start, end, binSize)
+
     def getPrograms(self):
         return self._parentContainer.getPrograms()
 
@@ -6,9 +6,14 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import binascii
+import collections
 import hashlib
 import json
+import multiprocessing
+import os
 import random
+import threading
 
 import pysam
 
@@ -16,6 +21,7 @@ import ga4gh.datamodel as datamodel
 import ga4gh.protocol as protocol
 import ga4gh.pb as pb
 import ga4gh.exceptions as exceptions
+import ga4gh.twoBit as twoBit
 
 
 DEFAULT_REFERENCESET_NAME = "Default"
@@ -24,6 +30,182 @@ This is the name used for any reference set referred to in a BAM
 file that does not provide the 'AS' tag in the @SQ header.
 """
 
+MD5_CHUNK_SIZE = 64 * 1024
+"""
+The number of bases read from a FASTA file at a time when computing
+the MD5 checksum of a reference.
+"""
+
+PARALLEL_MD5_MIN_LENGTH = 64 * 1024 * 1024
+"""
+Reference sets shorter than this in total are checksummed in the
+calling process, as starting a process pool would take longer.
+"""
+
+TWO_BIT_EXTENSION = ".2bit"
+"""
+The extension of reference set data files in the 2bit format, which are
+read by TwoBitReferenceSet rather than HtslibReferenceSet.
+"""
+
+
+class BasesTileCache(object):
+    """
+    LRU cache of the bases of references, held as fixed size tiles
+    aligned to multiples of the tile size. The cache is bounded by the
+    total number of bases held.
+    """
+    def __init__(self, tileSize=16 * 1024, maxBytes=64 * 1024 * 1024):
+        self._tileSize = tileSize
+        self._maxBytes = maxBytes
+        self._tiles = collections.OrderedDict()
+        self._numBytes = 0
+        self._numHits = 0
+        self._numMisses = 0
+        self._numEvictions = 0
+        self._lock = threading.Lock()
+
+    def setMaxBytes(self, maxBytes):
+        """
+        Sets the maximum number of bases held in the cache. A value of
+        zero disables the cache.
+        """
+        if maxBytes < 0:
+            raise ValueError("The size of the cache must not be negative")
+        with self._lock:
+            self._maxBytes = maxBytes
+            self._evict()
+
+    def getTileSize(self):
+        """
+        Returns the number of bases in each tile.
+        """
+        return self._tileSize
+
+    def getStatistics(self):
+        """
+        Returns a dictionary describing the occupancy of the cache and
+        the number of tile hits, misses and evictions since it was
+        created.
+        """
+        with self._lock:
+            return {
+                "bytes": self._numBytes,
+                "maxBytes": self._maxBytes,
+                "tiles": len(self._tiles),
+                "hits": self._numHits,
+                "misses": self._numMisses,
+                "evictions": self._numEvictions,
+            }
+
+    def clear(self):
+        """
+        Removes all tiles from the cache.
+        """
+        with self._lock:
+            self._tiles.clear()
+            self._numBytes = 0
+
+    def _evict(self):
+        while self._numBytes > self._maxBytes:
+            _, tile = self._tiles.popitem(last=False)
+            self._numBytes -= len(tile)
+            self._numEvictions += 1
+
+    def getBases(self, key, length, start, end, fetch):
+        """
+        Returns the bases from start to end of the sequence of the
+        specified length identified by key. Tiles that are not in the
+        cache are read by calling fetch(start, end), once for each run
+        of consecutive missing tiles.
+        """
+        if start >= end:
+            return ""
+        if self._maxBytes == 0:
+            return fetch(start, end)
+        tileSize = self._tileSize
+        firstTile = start // tileSize
+        lastTile = (end - 1) // tileSize
+        tiles = []
+        missing = []
+        with self._lock:
+            for tileIndex in range(firstTile, lastTile + 1):
+                tile = self._tiles.pop((key, tileIndex), None)
+                if tile is None:
+                    self._numMisses += 1
+                    missing.append(tileIndex)
+                else:
+                    self._numHits += 1
+                    # Reinserting moves the tile to the most recent end.
+                    self._tiles[key, tileIndex] = tile
+                tiles.append(tile)
+        index = 0
+        while index < len(missing):
+            runStart = runEnd = missing[index]
+            index += 1
+            while index < len(missing) and missing[index] == runEnd + 1:
+                runEnd += 1
+                index += 1
+            runBases = fetch(
+                runStart * tileSize, min((runEnd + 1) * tileSize, length))
+            for tileIndex in range(runStart, runEnd + 1):
+                offset = (tileIndex - runStart) * tileSize
+                tiles[tileIndex - firstTile] = runBases[
+                    offset:offset + tileSize]
+        if len(missing) > 0:
+            with self._lock:
+                for tileIndex in missing:
+                    tile = tiles[tileIndex - firstTile]
+                    if (key, tileIndex) not in self._tiles:
+                        self._tiles[key, tileIndex] = tile
+                        self._numBytes += len(tile)
+                self._evict()
+        offset = firstTile * tileSize
+        return "".join(tiles)[start - offset:end - offset]
+
+
+# LRU cache of tiles of reference bases read from FASTA files
+basesTileCache = BasesTileCache()
+
+
+def _computeMd5Checksum(fastaFile, referenceName, length):
+    """
+    Returns the MD5 checksum of the bases of the specified reference,
+    reading them from the specified pysam FastaFile in chunks of
+    MD5_CHUNK_SIZE bases so that the whole sequence is never held in
+    memory.
+    """
+    md5 = hashlib.md5()
+    for start in xrange(0, length, MD5_CHUNK_SIZE):
+        end = min(start + MD5_CHUNK_SIZE, length)
+        md5.update(fastaFile.fetch(
+            reference=referenceName, start=start, end=end))
+    return md5.hexdigest()
+
+
+def isTwoBitFile(dataUrl):
+    """
+    Returns True if the specified reference set data file is in the 2bit
+    format.
+    """
+    return dataUrl.endswith(TWO_BIT_EXTENSION)
+
+
+def _computeMd5ChecksumInProcess(args):
+    """
+    Process pool entry point for _computeMd5Checksum, which opens its
+    own handle on the FASTA or 2bit file.
+    """
+    dataUrl, referenceName, length = args
+    if isTwoBitFile(dataUrl):
+        fastaFile = twoBit.TwoBitFile(dataUrl)
+    else:
+        fastaFile = pysam.FastaFile(dataUrl)
+    try:
+        return _computeMd5Checksum(fastaFile, referenceName, length)
+    finally:
+        fastaFile.close()
+
 
 class AbstractReferenceSet(datamodel.DatamodelObject):
     """
@@ -350,6 +532,15 @@ class AbstractReference(datamodel.DatamodelObject):
         """
         raise NotImplemented()
 
+    def generateBases(self, start, end, chunkSize):
+        """
+        Returns an iterator over the bases of this reference from start
+        (inclusive) to end (exclusive), as consecutive strings of at
+        most chunkSize bases.
+        """
+        for chunkStart in xrange(start, end, chunkSize):
+            yield self.getBases(chunkStart, min(chunkStart + chunkSize, end))
+
 ##################################################################
 #
 # Simulated references
@@ -361,7 +552,8 @@ class SimulatedReferenceSet(AbstractReferenceSet):
     """
     A simulated referenceSet
     """
-    def __init__(self, localId, randomSeed=0, numReferences=1):
+    def __init__(
+            self, localId, randomSeed=0, numReferences=1, referenceLength=200):
         super(SimulatedReferenceSet, self).__init__(localId)
         self._randomSeed = randomSeed
         self._randomGenerator = random.Random()
@@ -379,24 +571,47 @@ class SimulatedReferenceSet(AbstractReferenceSet):
             referenceSeed = self._randomGenerator.getrandbits(32)
             referenceLocalId = "srs{}".format(i)
             reference = SimulatedReference(
-                self, referenceLocalId, referenceSeed)
+                self, referenceLocalId, referenceSeed, referenceLength)
             self.addReference(reference)
 
+    def startMd5Checksums(self):
+        """
+        Starts a daemon thread computing the MD5 checksums of the
+        references. Each takes a pass over the generated bases (about
+        0.4s per 10Mb), so a server of long references starts this when
+        it is configured, and the first request needing a checksum waits
+        only for the part of the work that is left.
+        """
+        thread = threading.Thread(
+            target=self.getMd5Checksum, name="SimulatedReferenceSetMd5")
+        thread.daemon = True
+        thread.start()
+
 
 class SimulatedReference(AbstractReference):
     """
-    A simulated reference. Stores a random sequence of a given length, and
-    generates remaining attributes randomly.
+    A simulated reference. The sequence is generated lazily in fixed size
+    blocks, each derived deterministically from the random seed and the
+    block index, so that arbitrarily long references can be served without
+    materialising the full sequence in memory. Remaining attributes are
+    generated randomly.
     """
+    blockSize = 2**16
+    _baseTranslationTable = b''.join(
+        b'ACGT'[i % 4] for i in range(256))
 
     def __init__(self, parentContainer, localId, randomSeed=0, length=200):
         super(SimulatedReference, self).__init__(parentContainer, localId)
         rng = random.Random()
         rng.seed(randomSeed)
+        self._randomSeed = randomSeed
         self._length = length
-        bases = [rng.choice('ACGT') for _ in range(self._length)]
-        self._bases = ''.join(bases)
-        self._md5checksum = hashlib.md5(self._bases).hexdigest()
+        # The MD5 is calculated on demand (or by a thread started by the
+        # reference set), as this requires a pass over the entire
+        # sequence. The lock ensures that it is only calculated once.
+        self._md5checksum = None
+        self._md5Lock = threading.Lock()
+        self._md5Pid = os.getpid()
         self._isDerived = bool(rng.randint(0, 1))
         self._sourceDivergence = 0
         if self._isDerived:
@@ -408,9 +623,44 @@ class SimulatedReference(AbstractReference):
                     random.randint(1, 2**32)))
         self._sourceUri = "http://example.com/reference.fa"
 
+    def _getBlock(self, blockIndex):
+        """
+        Returns the bases in the block with the specified index.
+        """
+        blockStart = blockIndex * self.blockSize
+        blockLength = min(self.blockSize, self._length - blockStart)
+        rng = random.Random()
+        rng.seed((blockIndex << 32) + self._randomSeed)
+        randomBytes = binascii.unhexlify(
+            b'%0*x' % (2 * blockLength, rng.getrandbits(8 * blockLength)))
+        return randomBytes.translate(self._baseTranslationTable)
+
+    def getMd5Checksum(self):
+        if self._md5checksum is None:
+            if os.getpid() != self._md5Pid:
+                # A lock inherited through a fork may be held by a thread
+                # that does not exist in this process.
+                self._md5Lock = threading.Lock()
+                self._md5Pid = os.getpid()
+            with self._md5Lock:
+                if self._md5checksum is None:
+                    md5 = hashlib.md5()
+                    numBlocks = (
+                        self._length + self.blockSize - 1) // self.blockSize
+                    for blockIndex in range(numBlocks):
+                        md5.update(self._getBlock(blockIndex))
+                    self._md5checksum = md5.hexdigest()
+        return self._md5checksum
+
     def getBases(self, start, end):
         self.checkQueryRange(start, end)
-        return self._bases[start:end]
+        firstBlock = start // self.blockSize
+        lastBlock = (end - 1) // self.blockSize
+        bases = b''.join(
+            self._getBlock(blockIndex)
+            for blockIndex in range(firstBlock, lastBlock + 1))
+        offset = firstBlock * self.blockSize
+        return bases[start - offset:end - offset]
 
 ##################################################################
 #
@@ -427,21 +677,46 @@ class HtslibReferenceSet(datamodel.PysamDatamodelMixin, AbstractReferenceSet):
         super(HtslibReferenceSet, self).__init__(localId)
         self._dataUrl = None
 
-    def populateFromFile(self, dataUrl):
+    def populateFromFile(self, dataUrl, numProcesses=None):
         """
         Populates the instance variables of this ReferencSet from the
-        data URL.
+        data URL. The lengths of the references are taken from the FASTA
+        index, and their MD5 checksums are computed by streaming the
+        bases from the file, across a pool of the specified number of
+        processes (by default, one per CPU) for large reference sets.
         """
         self._dataUrl = dataUrl
         fastaFile = self.getFastaFile()
-        for referenceName in fastaFile.references:
-            reference = HtslibReference(self, referenceName)
-            # TODO break this up into chunks and calculate the MD5
-            # in bits (say, 64K chunks?)
-            bases = fastaFile.fetch(referenceName)
-            md5checksum = hashlib.md5(bases).hexdigest()
+        referenceNames = fastaFile.references
+        lengths = fastaFile.lengths
+        if numProcesses is None:
+            numProcesses = multiprocessing.cpu_count()
+        numProcesses = min(numProcesses, len(referenceNames))
+        if numProcesses > 1 and sum(lengths) >= PARALLEL_MD5_MIN_LENGTH:
+            pool = multiprocessing.Pool(numProcesses)
+            try:
+                # Hash the longest references first to balance the load.
+                order = sorted(
+                    range(len(referenceNames)), key=lambda i: -lengths[i])
+                checksums = pool.map(
+                    _computeMd5ChecksumInProcess,
+                    [(dataUrl, referenceNames[i], lengths[i])
+                     for i in order], chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+            md5checksums = [None] * len(referenceNames)
+            for i, checksum in zip(order, checksums):
+                md5checksums[i] = checksum
+        else:
+            md5checksums = [
+                _computeMd5Checksum(fastaFile, referenceName, length)
+                for referenceName, length in zip(referenceNames, lengths)]
+        for referenceName, length, md5checksum in zip(
+                referenceNames, lengths, md5checksums):
+            reference = self.createReference(referenceName)
             reference.setMd5checksum(md5checksum)
-            reference.setLength(len(bases))
+            reference.setLength(length)
             self.addReference(reference)
 
     def populateFromRow(self, row):
@@ -464,6 +739,13 @@ class HtslibReferenceSet(datamodel.PysamDatamodelMixin, AbstractReferenceSet):
         """
         return self._dataUrl
 
+    def createReference(self, localId):
+        """
+        Returns a new reference in this reference set with the specified
+        local ID, of the class that reads this reference set's data file.
+        """
+        return HtslibReference(self, localId)
+
     def openFile(self, dataFile):
         return pysam.FastaFile(dataFile)
 
@@ -496,8 +778,51 @@ class HtslibReference(datamodel.PysamDatamodelMixin, AbstractReference):
 
     def getBases(self, start, end):
         self.checkQueryRange(start, end)
+        return basesTileCache.getBases(
+            self.getId(), self.getLength(), start, end, self._fetchBases)
+
+    def generateBases(self, start, end, chunkSize):
+        # Streaming a long sequence through the tile cache would evict
+        # the windows that other requests are reusing.
+        self.checkQueryRange(start, end)
+        for chunkStart in xrange(start, end, chunkSize):
+            yield self._fetchBases(
+                chunkStart, min(chunkStart + chunkSize, end))
+
+    def _fetchBases(self, start, end):
         fastaFile = self._parentContainer.getFastaFile()
         localId = self.getLocalId().encode()
         # TODO we should have some error checking here...
-        bases = fastaFile.fetch(localId, start, end)
-        return bases
+        return fastaFile.fetch(localId, start, end)
+
+
+##################################################################
+#
+# References stored in 2bit files.
+#
+##################################################################
+
+
+class TwoBitReferenceSet(HtslibReferenceSet):
+    """
+    A referenceSet whose bases are stored in a 2bit file. These are
+    written from a FASTA reference set by the repo manager's
+    pack-referenceset command, and are read through a memory map rather
+    than by decompressing BGZF blocks.
+    """
+    def openFile(self, dataFile):
+        return twoBit.TwoBitFile(dataFile)
+
+    def createReference(self, localId):
+        return TwoBitReference(self, localId)
+
+
+class TwoBitReference(HtslibReference):
+    """
+    A reference whose bases are stored in a 2bit file.
+    """
+    def getBases(self, start, end):
+        # Slicing the memory map is cheap, so the bases are not copied
+        # into the tile cache.
+        self.checkQueryRange(start, end)
+        return self._fetchBases(start, end)
@@ -7,13 +7,20 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import json
+import os
 import random
+import re
+import urllib
+
+import pysam
 
 import ga4gh.protocol as protocol
 import ga4gh.datamodel as datamodel
+import ga4gh.gff3Parser as gff3Parser
 import ga4gh.sqliteBackend as sqliteBackend
 import ga4gh.exceptions as exceptions
 import ga4gh.pb as pb
+import ga4gh.timing as timing
 
 # Note to self: There's the Feature ID as understood in a GFF3 file,
 # the Feature ID that is its server-assigned compoundId, and the
@@ -57,6 +64,68 @@ _featureColumns = [
     ('transcript_name', 'TEXT'),  # as found in GFF3 attributes
     ('attributes', 'TEXT')]  # JSON encoding of attributes dict
 
+# The columns of the sidecar databases of tabix indexed GFF3 files, which
+# hold the BGZF virtual offset of each record in place of the columns
+# read from the file.
+_sidecarColumns = [
+    ('id', 'INTEGER'),
+    ('parent_id', 'INTEGER'),
+    ('child_ids', 'TEXT'),
+    ('reference_name', 'TEXT'),
+    ('type', 'TEXT'),
+    ('start', 'INT'),
+    ('end', 'INT'),
+    ('virtual_offset', 'INT')]
+
+# The suffix appended to the path of a tabix indexed GFF3 file to give
+# the path of its sidecar database.
+SIDECAR_SUFFIX = ".features.db"
+
+# The maximum number of host parameters in a single SQLite statement.
+SQLITE_MAX_PARAMETERS = 999
+
+# The indexes on the FEATURE table, as (name, columns) pairs, each
+# serving one shape of query made by Gff3DbBackend.
+FEATURE_INDEXES = [
+    # Features overlapping a region, ordered by start.
+    ("idx_feature_region", "reference_name, start, end"),
+    # Features of some types overlapping a region, such as all genes.
+    ("idx_feature_type", "type, reference_name, start"),
+    # The children of a feature, and the descendants found from them.
+    ("idx_feature_parent", "parent_id, reference_name, start"),
+]
+
+_tableScanRe = re.compile(r"^SCAN (TABLE )?FEATURE\b", re.IGNORECASE)
+
+# The maximum depth of the feature trees returned by searches including
+# descendants, which guards against cycles in the parent links.
+MAX_FEATURE_TREE_DEPTH = 64
+
+
+def isTabixGff3File(dataUrl):
+    """
+    Returns True if the specified feature set data URL is a BGZF
+    compressed GFF3 file rather than a feature database.
+    """
+    return dataUrl.endswith(".gz")
+
+
+def getSidecarPath(dataUrl):
+    """
+    Returns the path of the sidecar database of the specified tabix
+    indexed GFF3 file.
+    """
+    return dataUrl + SIDECAR_SUFFIX
+
+
+def _featureSortKeySql(table):
+    """
+    Returns an SQL expression for a fixed width string that sorts the
+    features in the specified table by start, end and ID.
+    """
+    return "printf('%010d%010d%010d', {0}.start, {0}.end, {0}.id)".format(
+        table)
+
 
 class Gff3DbBackend(sqliteBackend.SqliteBackedDataSource):
     """
@@ -70,25 +139,24 @@ class Gff3DbBackend(sqliteBackend.SqliteBackedDataSource):
     requests one on each side of the join (position 0)
     """
 
+    # The order of the features overlapping a region.
+    _regionOrderSql = "ORDER BY reference_name, start, end ASC "
+
     def __init__(self, dbFile):
         super(Gff3DbBackend, self).__init__(dbFile)
         self.featureColumnNames = [f[0] for f in _featureColumns]
         self.featureColumnTypes = [f[1] for f in _featureColumns]
 
-    def countFeaturesSearchInDb(
-            self, referenceName=None, start=0, end=0,
-            parentId=None, featureTypes=None):
+    def _searchFeaturesCondition(
+            self, referenceName, start, end, parentId, featureTypes):
         """
-        Same parameters as searchFeaturesInDb,
-        except without the pagetoken/size.
+        Returns the SQL condition selecting the features matching the
+        specified search parameters, and the corresponding arguments.
         """
-        # TODO: Refactor out common bits of this and the below search query.
-        sql = ("SELECT COUNT(*) FROM FEATURE WHERE "
-               "reference_name = ? "
-               "AND end > ? "  # compare this to query start
-               "AND start < ? "  # and this to query end
-               )
-        # TODO: Optimize by refactoring out string concatenation
+        sql = (
+            "reference_name = ? "
+            "AND end > ? "  # compare this to query start
+            "AND start < ? ")  # and this to query end
         sql_args = (referenceName, start, end)
         if parentId is not None:
             sql += "AND parent_id = ? "
@@ -98,13 +166,83 @@ class Gff3DbBackend(sqliteBackend.SqliteBackedDataSource):
             sql += ", ".join(["?", ] * len(featureTypes))
             sql += ") "
             sql_args += tuple(featureTypes)
+        return sql, sql_args
+
+    def _descendantsTreeSql(
+            self, referenceName, start, end, parentId, featureTypes):
+        """
+        Returns the recursive common table expression "tree" holding the
+        features matching the specified search parameters together with
+        all of their descendants, and the corresponding arguments. Each
+        feature appears once, with the path of sort keys from the topmost
+        matching ancestor down to it: ordering by this path gives every
+        matching feature followed by its subtree, depth first, with the
+        children of each feature ordered by start, end and ID.
+        """
+        condition, sql_args = self._searchFeaturesCondition(
+            referenceName, start, end, parentId, featureTypes)
+        sql = (
+            "WITH RECURSIVE descendants(id, depth, path) AS ("
+            "SELECT id, 0, " + _featureSortKeySql("FEATURE") + " "
+            "FROM FEATURE WHERE " + condition +
+            "UNION ALL "
+            "SELECT FEATURE.id, descendants.depth + 1, "
+            "descendants.path || " + _featureSortKeySql("FEATURE") + " "
+            "FROM FEATURE JOIN descendants "
+            "ON FEATURE.parent_id = descendants.id "
+            "WHERE descendants.depth < ?), "
+            # A feature that also descends from another matching feature
+            # is placed in the subtree of the topmost one.
+            "tree AS (SELECT id, MAX(depth) AS depth, path "
+            "FROM descendants GROUP BY id) ")
+        sql_args += (MAX_FEATURE_TREE_DEPTH,)
+        return sql, sql_args
+
+    def countFeaturesSearchInDb(
+            self, referenceName=None, start=0, end=0,
+            parentId=None, featureTypes=None, includeDescendants=False):
+        """
+        Same parameters as searchFeaturesInDb,
+        except without the pagetoken/size.
+        """
+        if includeDescendants:
+            sql, sql_args = self._descendantsTreeSql(
+                referenceName, start, end, parentId, featureTypes)
+            sql += "SELECT COUNT(*) FROM tree"
+        else:
+            condition, sql_args = self._searchFeaturesCondition(
+                referenceName, start, end, parentId, featureTypes)
+            sql = "SELECT COUNT(*) FROM FEATURE WHERE " + condition
         query = self._dbconn.execute(sql, sql_args)
         return (query.fetchone())[0]
 
+    def _searchFeaturesSql(
+            self, pageToken, pageSize, referenceName, start, end,
+            parentId, featureTypes, includeDescendants):
+        """
+        Returns the SQL query made by searchFeaturesInDb for the
+        specified parameters, and the corresponding arguments.
+        """
+        if includeDescendants:
+            sql, sql_args = self._descendantsTreeSql(
+                referenceName, start, end, parentId, featureTypes)
+            sql += (
+                "SELECT FEATURE.* FROM tree "
+                "JOIN FEATURE ON FEATURE.id = tree.id "
+                "ORDER BY tree.path ")
+        else:
+            condition, sql_args = self._searchFeaturesCondition(
+                referenceName, start, end, parentId, featureTypes)
+            sql = (
+                "SELECT * FROM FEATURE WHERE " + condition +
+                self._regionOrderSql)
+        sql += sqliteBackend.limitsSql(pageToken, pageSize)
+        return sql, sql_args
+
     def searchFeaturesInDb(
             self, pageToken=0, pageSize=None,
             referenceName=None, start=0, end=0,
-            parentId=None, featureTypes=None):
+            parentId=None, featureTypes=None, includeDescendants=False):
         """
         Perform a full features query in database.
 
@@ -114,29 +252,64 @@ class Gff3DbBackend(sqliteBackend.SqliteBackedDataSource):
         :param start: int position on reference to start search
         :param end: int position on reference to end search >= start
         :param parentId: string restrict search by id of parent node.
+        :param includeDescendants: if True, each matching feature is
+            followed by all of its descendants, whether or not they
+            match the search, in depth first order.
         :return an array of dictionaries, representing the returned data.
         """
-        # TODO: Refactor out common bits of this and the above count query.
-        sql = (
-            "SELECT * FROM FEATURE WHERE "
-            "reference_name = ? "
-            "AND end > ? "  # compare this to query start
-            "AND start < ? ")  # and this to query end
-        # TODO: Optimize by refactoring out string concatenation
-        sql_args = (referenceName, start, end)
-        if parentId is not None:
-            sql += "AND parent_id = ? "
-            sql_args += (parentId,)
-        if featureTypes is not None and len(featureTypes) > 0:
-            sql += "AND type IN ("
-            sql += ", ".join(["?", ] * len(featureTypes))
-            sql += ") "
-            sql_args += tuple(featureTypes)
-        sql += "ORDER BY reference_name, start, end ASC "
-        sql += sqliteBackend.limitsSql(pageToken, pageSize)
+        sql, sql_args = self._searchFeaturesSql(
+            pageToken, pageSize, referenceName, start, end, parentId,
+            featureTypes, includeDescendants)
         query = self._dbconn.execute(sql, sql_args)
         return sqliteBackend.sqliteRows2dicts(query.fetchall())
 
+    def createIndexes(self):
+        """
+        Creates those of the FEATURE_INDEXES that the database lacks,
+        and gathers the statistics SQLite uses to choose between them.
+        """
+        for name, columns in FEATURE_INDEXES:
+            self._dbconn.execute(
+                "CREATE INDEX IF NOT EXISTS {} ON FEATURE({})".format(
+                    name, columns))
+        self._dbconn.execute("ANALYZE")
+        self._dbconn.commit()
+
+    def getQueryPlans(self):
+        """
+        Returns a list of (queryName, planDetails) pairs giving the plan
+        SQLite chooses for each shape of search query, where planDetails
+        is the list of steps reported by EXPLAIN QUERY PLAN.
+        """
+        queries = [
+            ("region", {}),
+            ("regionByType", {"featureTypes": ["gene"]}),
+            ("children", {"parentId": 1}),
+            ("descendants", {"parentId": 1, "includeDescendants": True}),
+            ("regionWithDescendants", {
+                "featureTypes": ["gene"], "includeDescendants": True}),
+        ]
+        plans = []
+        for queryName, kwargs in queries:
+            parameters = {
+                "pageToken": 0, "pageSize": 100, "referenceName": "chr1",
+                "start": 0, "end": 1000000, "parentId": None,
+                "featureTypes": None, "includeDescendants": False}
+            parameters.update(kwargs)
+            sql, sql_args = self._searchFeaturesSql(**parameters)
+            query = self._dbconn.execute("EXPLAIN QUERY PLAN " + sql, sql_args)
+            plans.append((queryName, [row[-1] for row in query.fetchall()]))
+        return plans
+
+    def getUnindexedQueries(self):
+        """
+        Returns the names of the search queries whose plans scan the
+        whole FEATURE table rather than using an index.
+        """
+        return [
+            queryName for queryName, planDetails in self.getQueryPlans()
+            if any(_tableScanRe.match(detail) for detail in planDetails)]
+
     def getFeatureById(self, featureId):
         """
         Fetch feature by featureID.
@@ -152,6 +325,40 @@ class Gff3DbBackend(sqliteBackend.SqliteBackedDataSource):
             return None
         return sqliteBackend.sqliteRow2Dict(ret)
 
+    def getFeaturesByIds(self, featureIds):
+        """
+        Fetch the features with the specified featureIDs.
+
+        :param featureIds: a list of FeatureIDs as found in GFF3 records
+        :return: list of dictionaries representing the feature objects
+            that were found, in no particular order.
+        """
+        features = []
+        featureIds = list(set(featureIds))
+        # Stay within SQLite's limit on the number of host parameters.
+        for index in range(0, len(featureIds), SQLITE_MAX_PARAMETERS):
+            batch = featureIds[index:index + SQLITE_MAX_PARAMETERS]
+            sql = "SELECT * FROM FEATURE WHERE id IN ({})".format(
+                ", ".join("?" * len(batch)))
+            query = self._dbconn.execute(sql, batch)
+            features.extend(sqliteBackend.sqliteRows2dicts(query.fetchall()))
+        return features
+
+
+class Gff3SidecarBackend(Gff3DbBackend):
+    """
+    The sidecar database of a tabix indexed GFF3 file, holding the IDs,
+    links, positions and BGZF virtual offsets of its records. The
+    features overlapping a region are in file order, which for a sorted
+    file is by start, and then as they appear in the file.
+    """
+    _regionOrderSql = "ORDER BY start, virtual_offset "
+
+    def __init__(self, dbFile):
+        super(Gff3SidecarBackend, self).__init__(dbFile)
+        self.featureColumnNames = [f[0] for f in _sidecarColumns]
+        self.featureColumnTypes = [f[1] for f in _sidecarColumns]
+
 
 class AbstractFeatureSet(datamodel.DatamodelObject):
     """
@@ -194,6 +401,16 @@ class AbstractFeatureSet(datamodel.DatamodelObject):
             gaFeatureSet.info[key].values.extend(self._info[key])
         return gaFeatureSet
 
+    def getFeaturesByIds(self, compoundIds):
+        """
+        Returns the protocol.Feature objects corresponding to the
+        specified compoundIds, in the same order.
+
+        :param compoundIds: a list of datamodel.FeatureCompoundId objects
+        :return: a list of Feature objects.
+        """
+        return [self.getFeature(compoundId) for compoundId in compoundIds]
+
     def getCompoundIdForFeatureId(self, featureId):
         """
         Returns server-style compound ID for an internal featureId.
@@ -214,8 +431,14 @@ class SimulatedFeatureSet(AbstractFeatureSet):
     """
     Simulated data backend for FeatureSet, used for internal testing.
     """
-    def __init__(self, parentContainer, localId, randomSeed=1):
+    maxFeatureLength = 10000
+
+    def __init__(
+            self, parentContainer, localId, randomSeed=1, numFeatures=10,
+            spreadOnReference=False):
         self._randomSeed = randomSeed
+        self._numFeatures = numFeatures
+        self._spreadOnReference = spreadOnReference
         super(SimulatedFeatureSet, self).__init__(parentContainer, localId)
 
     def _getRandomfeatureType(self, randomNumberGenerator):
@@ -260,6 +483,8 @@ class SimulatedFeatureSet(AbstractFeatureSet):
         """
         if compoundId is None:
             raise exceptions.ObjectWithIdNotFoundException(compoundId)
+        if self._spreadOnReference:
+            return self._getSpreadFeature(compoundId)
         randomNumberGenerator = random.Random()
         randomNumberGenerator.seed(self._randomSeed)
         feature = self._generateSimulatedFeature(randomNumberGenerator)
@@ -267,10 +492,80 @@ class SimulatedFeatureSet(AbstractFeatureSet):
         feature.parent_id = ""  # TODO: Test with nonempty parentIDs?
         return feature
 
+    def _generateSpreadFeature(self, reference, referenceIndex, index):
+        """
+        Returns the simulated feature with the specified index on the
+        specified reference, when features are spread along the reference.
+        """
+        randomNumberGenerator = random.Random()
+        randomNumberGenerator.seed(
+            (referenceIndex * self._numFeatures + index) * 2**32 +
+            self._randomSeed)
+        feature = self._generateSimulatedFeature(randomNumberGenerator)
+        feature.reference_name = reference.getLocalId()
+        feature.start = index * reference.getLength() // self._numFeatures
+        feature.end = min(
+            reference.getLength(), feature.start +
+            randomNumberGenerator.randint(1, self.maxFeatureLength))
+        feature.id = self.getCompoundIdForFeatureId(
+            referenceIndex * self._numFeatures + index)
+        feature.parent_id = ""
+        return feature
+
+    def _getSpreadFeature(self, compoundId):
+        try:
+            featureId = int(compoundId.featureId)
+        except ValueError:
+            raise exceptions.ObjectWithIdNotFoundException(compoundId)
+        referenceIndex, index = divmod(featureId, self._numFeatures)
+        references = self._referenceSet.getReferences()
+        if featureId < 0 or referenceIndex >= len(references):
+            raise exceptions.ObjectWithIdNotFoundException(compoundId)
+        return self._generateSpreadFeature(
+            references[referenceIndex], referenceIndex, index)
+
+    def _getSpreadFeatures(
+            self, referenceName, start, end, pageToken, featureTypes):
+        """
+        Yields the (feature, nextPageToken) pairs overlapping the specified
+        range when features are spread along the references. Page tokens
+        are the index of the next feature to consider on the reference.
+        """
+        references = self._referenceSet.getReferences()
+        referenceIndex = None
+        for i, reference in enumerate(references):
+            if reference.getLocalId() == referenceName:
+                referenceIndex = i
+                break
+        if referenceIndex is None or self._numFeatures == 0:
+            return
+        reference = references[referenceIndex]
+        length = reference.getLength()
+        first = (
+            max(0, start - self.maxFeatureLength) *
+            self._numFeatures // length)
+        if pageToken:
+            first = max(first, int(pageToken))
+        for index in xrange(first, self._numFeatures):
+            gaFeature = self._generateSpreadFeature(
+                reference, referenceIndex, index)
+            if gaFeature.start >= end:
+                break
+            match = (
+                gaFeature.end > start and (
+                    featureTypes is None or len(featureTypes) == 0 or
+                    gaFeature.feature_type.term in featureTypes))
+            if match:
+                nextPageToken = None
+                if index < self._numFeatures - 1:
+                    nextPageToken = str(index + 1)
+                yield gaFeature, nextPageToken
+
     def getFeatures(
             self, referenceName, start, end,
             pageToken, pageSize,
-            featureTypes=[], parentId=None, numFeatures=10):
+            featureTypes=[], parentId=None, numFeatures=None,
+            includeDescendants=False):
         """
         Returns a set number of simulated features.
 
@@ -282,10 +577,20 @@ class SimulatedFeatureSet(AbstractFeatureSet):
         :param featureTypes: optional list of ontology terms to limit query
         :param parentId: optional parentId to limit query.
         :param numFeatures: number of features to generate in the return.
-            10 is a reasonable (if arbitrary) default.
+            Defaults to the number of features in this FeatureSet.
+        :param includeDescendants: ignored, as simulated features have
+            no children.
         :return: Yields feature, nextPageToken pairs.
             nextPageToken is None if last feature was yielded.
         """
+        if self._spreadOnReference:
+            for pair in self._getSpreadFeatures(
+                    referenceName, int(start), int(end), pageToken,
+                    featureTypes):
+                yield pair
+            return
+        if numFeatures is None:
+            numFeatures = self._numFeatures
         randomNumberGenerator = random.Random()
         randomNumberGenerator.seed(self._randomSeed)
         if pageToken:
@@ -359,6 +664,16 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
         """
         return self._dbFilePath
 
+    def createIndexes(self):
+        """
+        Adds any missing indexes to the database of this FeatureSet, and
+        returns the names of the search queries that still scan the
+        whole table.
+        """
+        with self._db as dataSource:
+            dataSource.createIndexes()
+            return dataSource.getUnindexedQueries()
+
     def getFeature(self, compoundId):
         """
         Returns a protocol.Feature object corresponding to a compoundId
@@ -374,45 +689,87 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
         if featureReturned is None:
             raise exceptions.ObjectWithIdNotFoundException(compoundId)
         else:
-            gaFeature = self._gaFeatureForFeatureDbRecord(featureReturned)
+            gaFeature, = self._gaFeaturesForRecords([featureReturned])
             return gaFeature
 
-    def _gaFeatureForFeatureDbRecord(self, feature):
+    def getFeaturesByIds(self, compoundIds):
         """
-        :param feature: The DB Row representing a feature
-        :return: the corresponding GA4GH protocol.Feature object
+        Returns the protocol.Feature objects corresponding to the
+        specified compoundIds, in the same order, using a single query
+        for all of them.
+
+        :param compoundIds: a list of datamodel.FeatureCompoundId objects
+        :return: a list of Feature objects.
+        :raises: exceptions.ObjectWithIdNotFoundException if any of the
+            compoundIds is invalid.
+        """
+        featureIds = [long(compoundId.featureId) for compoundId in compoundIds]
+        with self._db as dataSource:
+            featuresReturned = dict(
+                (long(feature['id']), feature)
+                for feature in dataSource.getFeaturesByIds(featureIds))
+        for compoundId, featureId in zip(compoundIds, featureIds):
+            if featureId not in featuresReturned:
+                raise exceptions.ObjectWithIdNotFoundException(compoundId)
+        return self._gaFeaturesForRecords(
+            [featuresReturned[featureId] for featureId in featureIds])
+
+    def _gaFeature(
+            self, featureId, parentId, childIds, referenceName, start, end,
+            strand, featureType, attributes):
+        """
+        Returns the GA4GH protocol.Feature object with the specified
+        fields, where the IDs are those of the FEATURE table.
         """
         gaFeature = protocol.Feature()
-        gaFeature.id = self.getCompoundIdForFeatureId(feature['id'])
-        if feature.get('parent_id'):
-            gaFeature.parent_id = self.getCompoundIdForFeatureId(
-                    feature['parent_id'])
+        gaFeature.id = self.getCompoundIdForFeatureId(featureId)
+        if parentId:
+            gaFeature.parent_id = self.getCompoundIdForFeatureId(parentId)
         else:
             gaFeature.parent_id = ""
         gaFeature.feature_set_id = self.getId()
-        gaFeature.reference_name = feature['reference_name']
-        gaFeature.start = int(feature['start'])
-        gaFeature.end = int(feature['end'])
-        if feature.get('strand', '') == '-':
+        gaFeature.reference_name = referenceName
+        gaFeature.start = int(start)
+        gaFeature.end = int(end)
+        if strand == '-':
             gaFeature.strand = protocol.NEG_STRAND
         else:
             # default to positive strand
             gaFeature.strand = protocol.POS_STRAND
         gaFeature.child_ids.extend(map(
-                self.getCompoundIdForFeatureId,
-                json.loads(feature['child_ids'])))
+                self.getCompoundIdForFeatureId, childIds))
         gaFeature.feature_type.CopyFrom(
-            self._ontology.getGaTermByName(feature['type']))
-        attributes = json.loads(feature['attributes'])
+            self._ontology.getGaTermByName(featureType))
         # TODO: Identify which values are ExternalIdentifiers and OntologyTerms
         for key in attributes:
             for v in attributes[key]:
                 gaFeature.attributes.vals[key].values.add().string_value = v
         return gaFeature
 
+    def _gaFeatureForFeatureDbRecord(self, feature):
+        """
+        :param feature: The DB Row representing a feature
+        :return: the corresponding GA4GH protocol.Feature object
+        """
+        return self._gaFeature(
+            feature['id'], feature.get('parent_id'),
+            json.loads(feature['child_ids']), feature['reference_name'],
+            feature['start'], feature['end'], feature.get('strand', ''),
+            feature['type'], json.loads(feature['attributes']))
+
+    def _gaFeaturesForRecords(self, features):
+        """
+        Returns the GA4GH protocol.Feature objects for the specified DB
+        rows, in the same order.
+        """
+        return [
+            self._gaFeatureForFeatureDbRecord(feature)
+            for feature in features]
+
     def getFeatures(self, referenceName, start, end,
                     pageToken, pageSize,
-                    featureTypes=None, parentId=None):
+                    featureTypes=None, parentId=None,
+                    includeDescendants=False):
         """
         method passed to runSearchRequest to fulfill the request
         :param str referenceName: name of reference (ex: "chr1")
@@ -422,6 +779,8 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
         :param pageSize: none or castable to int
         :param featureTypes: array of str
         :param parentId: none or featureID of parent
+        :param includeDescendants: if True, follow each matching feature
+            with its whole subtree of descendants
         :return: yields a protocol.Feature at a time, together with
             the corresponding nextPageToken (which is null for the last
             feature served out).
@@ -437,12 +796,14 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
             featuresCount = dataSource.countFeaturesSearchInDb(
                 referenceName=referenceName,
                 start=start, end=end,
-                parentId=parentId, featureTypes=featureTypes)
+                parentId=parentId, featureTypes=featureTypes,
+                includeDescendants=includeDescendants)
             featuresReturned = dataSource.searchFeaturesInDb(
                 pageToken, pageSize,
                 referenceName=referenceName,
                 start=start, end=end,
-                parentId=parentId, featureTypes=featureTypes)
+                parentId=parentId, featureTypes=featureTypes,
+                includeDescendants=includeDescendants)
 
         # pagination logic: None if last feature was returned,
         # else 1 + row number being returned (starting at row 0).
@@ -450,8 +811,152 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
             nextPageToken = int(pageToken)
         else:
             nextPageToken = 0
-        for featureRecord in featuresReturned:
-            gaFeature = self._gaFeatureForFeatureDbRecord(featureRecord)
+        timer = timing.getRequestTimer()
+        previousPhase = timer.switchPhase(timing.CONVERT)
+        gaFeatures = self._gaFeaturesForRecords(featuresReturned)
+        timer.switchPhase(previousPhase)
+        for gaFeature in gaFeatures:
+            if nextPageToken < featuresCount - 1:
+                nextPageToken += 1
+            else:
+                nextPageToken = None
+            yield gaFeature, (
+                str(nextPageToken)
+                if nextPageToken is not None else None)
+
+
+class TabixGff3FeatureSet(Gff3DbFeatureSet, datamodel.PysamDatamodelMixin):
+    """
+    A FeatureSet served directly from a sorted, BGZF compressed and tabix
+    indexed GFF3 file, without a feature database. The features
+    overlapping a region are read from the file through its tabix index.
+    The small sidecar database written by gff3Db.writeGff3Sidecar gives
+    them their IDs and links, and locates the records of the features
+    fetched by ID or by parent.
+    """
+    def __init__(self, parentContainer, localId):
+        super(TabixGff3FeatureSet, self).__init__(parentContainer, localId)
+        self._parser = None
+
+    def _setDataUrl(self, dataUrl):
+        self._dbFilePath = dataUrl
+        self._db = Gff3SidecarBackend(getSidecarPath(dataUrl))
+        self._parser = gff3Parser.Gff3Parser(dataUrl)
+
+    def populateFromFile(self, dataUrl):
+        """
+        Populates the instance variables of this FeatureSet from the specified
+        data URL.
+        """
+        for path in [dataUrl + ".tbi", getSidecarPath(dataUrl)]:
+            if not os.path.exists(path):
+                raise exceptions.NotIndexedException(dataUrl)
+        self._setDataUrl(dataUrl)
+
+    def populateFromRow(self, row):
+        """
+        Populates the instance variables of this FeatureSet from the specified
+        DB row.
+        """
+        self._setDataUrl(row[b'dataUrl'])
+
+    def openFile(self, dataFile):
+        return pysam.TabixFile(dataFile)
+
+    def _gaFeatureForRecord(self, sidecarRecord, feature):
+        return self._gaFeature(
+            sidecarRecord['id'], sidecarRecord['parent_id'],
+            json.loads(sidecarRecord['child_ids']), feature.seqname,
+            feature.start, feature.end, feature.strand, feature.type,
+            feature.attributes)
+
+    def _gaFeaturesForRecords(self, sidecarRecords):
+        """
+        Returns the GA4GH protocol.Feature objects for the specified
+        sidecar rows, in the same order, reading their records from the
+        file in offset order.
+        """
+        features = {}
+        reader = gff3Parser.BgzfLineReader(self._dbFilePath)
+        try:
+            for sidecarRecord in sorted(
+                    sidecarRecords, key=lambda row: row['virtual_offset']):
+                line = reader.readLine(sidecarRecord['virtual_offset'])
+                features[sidecarRecord['id']] = self._parser.parseRecord(line)
+        finally:
+            reader.close()
+        return [
+            self._gaFeatureForRecord(
+                sidecarRecord, features[sidecarRecord['id']])
+            for sidecarRecord in sidecarRecords]
+
+    def _generateRegionFeatures(
+            self, referenceName, firstStart, start, end, featureTypes):
+        """
+        Generates the Features of the records overlapping the specified
+        region and of the specified types, in file order, starting with
+        those that start at firstStart. Only the matching records are
+        fully parsed.
+        """
+        featureTypes = set(featureTypes or [])
+        contig, fetchStart, fetchEnd = self.sanitizeVariantFileFetch(
+            referenceName, max(0, firstStart - 1), end)
+        tabixFile = self.getFileHandle(self._dbFilePath)
+        for line in tabixFile.fetch(contig, fetchStart, fetchEnd):
+            fields = line.split(b"\t", 5)
+            recordStart = int(fields[3])
+            if recordStart < firstStart or int(fields[4]) <= start:
+                continue
+            if recordStart >= end:
+                break
+            if (len(featureTypes) == 0 or
+                    urllib.unquote(fields[2]) in featureTypes):
+                yield self._parser.parseRecord(line)
+
+    def _getRegionFeatures(
+            self, referenceName, start, end, pageToken, pageSize,
+            featureTypes):
+        """
+        Yields the (feature, nextPageToken) pairs of a search of a region
+        without a parent or descendants, zipping the records read through
+        the tabix index with the sidecar rows giving their IDs. Page
+        tokens are the index of the next matching record, as for a
+        feature database; the fetch for a page starts at the start of its
+        first feature, rather than rescanning the records of the previous
+        pages.
+        """
+        with self._db as dataSource:
+            featuresCount = dataSource.countFeaturesSearchInDb(
+                referenceName=referenceName, start=start, end=end,
+                featureTypes=featureTypes)
+            sidecarRecords = dataSource.searchFeaturesInDb(
+                pageToken, pageSize, referenceName=referenceName,
+                start=start, end=end, featureTypes=featureTypes)
+            if len(sidecarRecords) == 0:
+                return
+            firstStart = sidecarRecords[0]['start']
+            # The matching records starting before the first of the page
+            # all precede it in the file.
+            numBefore = dataSource.countFeaturesSearchInDb(
+                referenceName=referenceName, start=start,
+                end=min(end, firstStart), featureTypes=featureTypes)
+        nextPageToken = int(pageToken) if pageToken else 0
+        features = self._generateRegionFeatures(
+            referenceName, firstStart, start, end, featureTypes)
+        # Skip the matching records starting with the first of the page
+        # that were served by the previous pages.
+        for _ in range(nextPageToken - numBefore):
+            next(features, None)
+        timer = timing.getRequestTimer()
+        for sidecarRecord in sidecarRecords:
+            feature = next(features, None)
+            if (feature is None or
+                    feature.start != sidecarRecord['start'] or
+                    feature.end != sidecarRecord['end']):
+                raise exceptions.SidecarMismatchException(self._dbFilePath)
+            previousPhase = timer.switchPhase(timing.CONVERT)
+            gaFeature = self._gaFeatureForRecord(sidecarRecord, feature)
+            timer.switchPhase(previousPhase)
             if nextPageToken < featuresCount - 1:
                 nextPageToken += 1
             else:
@@ -459,3 +964,24 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
             yield gaFeature, (
                 str(nextPageToken)
                 if nextPageToken is not None else None)
+
+    def getFeatures(self, referenceName, start, end,
+                    pageToken, pageSize,
+                    featureTypes=None, parentId=None,
+                    includeDescendants=False):
+        """
+        method passed to runSearchRequest to fulfill the request; see
+        Gff3DbFeatureSet.getFeatures. Searches of a region read the
+        records through the tabix index, while searches by parent or
+        including descendants find them through the sidecar database.
+        """
+        if parentId is not None or includeDescendants:
+            pairs = super(TabixGff3FeatureSet, self).getFeatures(
+                referenceName, start, end, pageToken, pageSize,
+                featureTypes, parentId, includeDescendants)
+        else:
+            pairs = self._getRegionFeatures(
+                referenceName, int(start), int(end), pageToken, pageSize,
+                featureTypes)
+        for pair in pairs:
+            yield pair
@@ -6,6 +6,8 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import array
+import collections
 import datetime
 import glob
 import hashlib
@@ -21,11 +23,18 @@ import ga4gh.protocol as protocol
 import ga4gh.exceptions as exceptions
 import ga4gh.datamodel as datamodel
 import ga4gh.pb as pb
+import ga4gh.summaryTiles as summaryTiles
+import ga4gh.timing as timing
 
 ANNOTATIONS_VEP_V82 = "VEP_v82"
 ANNOTATIONS_VEP_V77 = "VEP_v77"
 ANNOTATIONS_SNPEFF = "SNPEff"
 
+# Variants requested by ID whose positions are within this distance of
+# each other are read with a single fetch. Tabix indexes bin records in
+# 16KiB windows, so smaller gaps would not save any seeks.
+VARIANT_ID_CLUSTER_GAP = 16 * 1024
+
 
 def isUnspecified(str):
     """
@@ -238,6 +247,13 @@ class AbstractVariantSet(datamodel.DatamodelObject):
         """
         return self._metadata
 
+    def getSummaryTiles(self):
+        """
+        Returns the SummaryTiles of this VariantSet, or None if they
+        have not been computed.
+        """
+        return None
+
     def toProtocolElement(self):
         """
         Converts this VariantSet into its GA4GH protocol equivalent.
@@ -291,14 +307,50 @@ class AbstractVariantSet(datamodel.DatamodelObject):
             self.getCompoundId(), sampleName)
         return str(compoundId)
 
+    def getVariantsByIds(self, compoundIds):
+        """
+        Returns the variants with the specified VariantCompoundIds, in
+        the same order.
+        """
+        return [self.getVariant(compoundId) for compoundId in compoundIds]
+
+    def getRawVariants(self, referenceName, startPosition, endPosition,
+                       callSetIds=None):
+        """
+        Returns an iterator over the raw records of the specified variants,
+        from which searches find the variants of a page before converting
+        only those with convertRawVariant. The start of a raw record is
+        its start attribute, as for the GA Variant. By default the records
+        are the converted GA Variants themselves.
+        """
+        return self.getVariants(
+            referenceName, startPosition, endPosition, callSetIds)
+
+    def convertRawVariant(self, rawVariant, callSetIds=None):
+        """
+        Returns the GA Variant for the specified raw record, with the calls
+        for the specified list of callSetIds.
+        """
+        return rawVariant
+
     @classmethod
     def hashVariant(cls, gaVariant):
         """
         Produces an MD5 hash of the ga variant object to distinguish
         it from other variants at the same genomic coordinate.
         """
-        hash_str = gaVariant.reference_bases + \
-            str(tuple(gaVariant.alternate_bases))
+        return cls.hashAlleles(
+            gaVariant.reference_bases, gaVariant.alternate_bases)
+
+    @classmethod
+    def hashAlleles(cls, referenceBases, alternateBases):
+        """
+        Produces the MD5 hash of a variant with the specified reference
+        and alternate bases, which is the same as hashVariant for the
+        corresponding ga variant object.
+        """
+        hash_str = referenceBases + \
+            str(tuple(unicode(bases) for bases in alternateBases))
         return hashlib.md5(hash_str).hexdigest()
 
 
@@ -307,6 +359,10 @@ class SimulatedVariantSet(AbstractVariantSet):
     A variant set that doesn't derive from a data store.
     Used mostly for testing.
     """
+    # Limit the size of the simulated call set infos so that variant sets
+    # with thousands of call sets remain manageable.
+    maxCallSetInfoKeys = 10
+
     def __init__(
             self, parentContainer, referenceSet, localId, randomSeed=1,
             numCalls=1, variantDensity=1):
@@ -319,7 +375,7 @@ class SimulatedVariantSet(AbstractVariantSet):
             self.addCallSetFromName(callSetName)
             callSet = self.getCallSetByName(callSetName)
             # build up infos of increasing size
-            for j in range(i):
+            for j in range(min(i, self.maxCallSetInfoKeys)):
                 callSet._info["key_{}".format(j)] = "value_{}".format(j)
         self._variantDensity = variantDensity
         self._metadata = self._createMetaData()
@@ -370,6 +426,22 @@ class SimulatedVariantSet(AbstractVariantSet):
 
     def getVariants(self, referenceName, startPosition, endPosition,
                     callSetIds=None):
+        """
+        Returns an iterator over the specified variants, with the calls
+        for the specified list of callSetIds, or for every call set if it
+        is None. Raises a CallSetNotInVariantSetException if any of the
+        callSetIds is not in this variant set.
+        """
+        if callSetIds is not None:
+            for callSetId in callSetIds:
+                if callSetId not in self._callSetIdMap:
+                    raise exceptions.CallSetNotInVariantSetException(
+                        callSetId, self.getId())
+        return self._generateVariants(
+            referenceName, startPosition, endPosition, callSetIds)
+
+    def _generateVariants(self, referenceName, startPosition, endPosition,
+                          callSetIds):
         randomNumberGenerator = random.Random()
         randomNumberGenerator.seed(self._randomSeed)
         i = startPosition
@@ -377,15 +449,19 @@ class SimulatedVariantSet(AbstractVariantSet):
             if randomNumberGenerator.random() < self._variantDensity:
                 randomNumberGenerator.seed(self._randomSeed + i)
                 yield self.generateVariant(
-                    referenceName, i, randomNumberGenerator)
+                    referenceName, i, randomNumberGenerator, callSetIds)
             i += 1
 
-    def generateVariant(self, referenceName, position, randomNumberGenerator):
+    def generateVariant(self, referenceName, position, randomNumberGenerator,
+                        callSetIds=None):
         """
         Generate a random variant for the specified position using the
         specified random number generator. This generator should be seeded
         with a value that is unique to this position so that the same variant
         will always be produced regardless of the order it is generated in.
+        The variant has the calls for the specified list of callSetIds, or
+        for every call set if it is None; the genotypes of all call sets are
+        drawn either way, so that each call is the same in every search.
         """
         variant = self._createGaVariant()
         variant.reference_name = referenceName
@@ -397,15 +473,19 @@ class SimulatedVariantSet(AbstractVariantSet):
         alt = randomNumberGenerator.choice(
             [base for base in bases if base != ref])
         variant.alternate_bases.append(alt)
+        genotypes = {}
         for callSet in self.getCallSets():
-            call = variant.calls.add()
-            call.call_set_id = callSet.getId()
             # for now, the genotype is either [0,1], [1,1] or [1,0] with equal
             # probability; probably will want to do something more
             # sophisticated later.
-            randomChoice = randomNumberGenerator.choice(
+            genotypes[callSet.getId()] = randomNumberGenerator.choice(
                 [[0, 1], [1, 0], [1, 1]])
-            call.genotype.extend(randomChoice)
+        if callSetIds is None:
+            callSetIds = [callSet.getId() for callSet in self.getCallSets()]
+        for callSetId in callSetIds:
+            call = variant.calls.add()
+            call.call_set_id = callSetId
+            call.genotype.extend(genotypes[callSetId])
             # TODO What is a reasonable model for generating these likelihoods?
             # Are these log-scaled? Spec does not say.
             call.genotype_likelihood.extend([-100, -100, -100])
@@ -437,6 +517,8 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
         super(HtslibVariantSet, self).__init__(parentContainer, localId)
         self._chromFileMap = {}
         self._metadata = None
+        self._summaryTiles = None
+        self._summaryTilesLoaded = False
 
     def isAnnotated(self):
         """
@@ -502,6 +584,74 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
             indexFiles.append(vcfFile + ".tbi")
         self.populateFromFile(dataFiles, indexFiles)
 
+    def getSummaryTilesPath(self):
+        """
+        Returns the path of the summary tile file of this VariantSet,
+        which is named after the first of its data files in sorted order.
+        """
+        dataUrls = sorted(
+            dataUrl for dataUrl, _ in self.getDataUrlIndexPairs())
+        return summaryTiles.getSummaryTilesPath(dataUrls[0])
+
+    def getSummaryTiles(self):
+        """
+        Returns the SummaryTiles written by writeSummaryTiles, or None if
+        there are none.
+        """
+        if not self._summaryTilesLoaded:
+            try:
+                self._summaryTiles = summaryTiles.SummaryTiles(
+                    self.getSummaryTilesPath())
+            except (IOError, IndexError, summaryTiles.SummaryTilesException):
+                self._summaryTiles = None
+            self._summaryTilesLoaded = True
+        return self._summaryTiles
+
+    def _getSummaryBins(self, referenceName, binSize):
+        """
+        Returns the length of the specified reference, taken from the VCF
+        header or else from the end of its last variant, and the values
+        of summaryTiles.VARIANT_FIELDS over the bins of the specified
+        size covering it.
+        """
+        dataUrlIndexPair = self._chromFileMap[referenceName]
+        variantFile = self.getFileHandle(dataUrlIndexPair)
+        length = 0
+        contig = variantFile.header.contigs.get(referenceName.encode())
+        if contig is not None and contig.length is not None:
+            length = contig.length
+        variantCounts = array.array(b"I")
+        for record in self.getPysamVariants(referenceName, None, None):
+            binIndex = record.start // binSize
+            if binIndex >= len(variantCounts):
+                variantCounts.extend(
+                    [0] * (binIndex + 1 - len(variantCounts)))
+            variantCounts[binIndex] += 1
+            length = max(length, record.stop)
+        numBins = summaryTiles.getNumBins(length, binSize)
+        variantCounts.extend([0] * (numBins - len(variantCounts)))
+        return length, {"variantCount": variantCounts}
+
+    def writeSummaryTiles(
+            self, fileName=None,
+            baseBinSize=summaryTiles.DEFAULT_BASE_BIN_SIZE,
+            zoomFactor=summaryTiles.DEFAULT_ZOOM_FACTOR):
+        """
+        Writes the number of variants starting in each bin of every
+        reference of this VariantSet to a summary tile file of the
+        specified name, which defaults to the one read by
+        getSummaryTiles.
+        """
+        if fileName is None:
+            fileName = self.getSummaryTilesPath()
+        references = (
+            (referenceName,) + self._getSummaryBins(
+                referenceName, baseBinSize)
+            for referenceName in sorted(self._chromFileMap.keys()))
+        summaryTiles.writeSummaryTiles(
+            fileName, summaryTiles.VARIANT_FIELDS, references, baseBinSize,
+            zoomFactor)
+
     def getVcfHeaderReferenceSetName(self):
         """
         Returns the name of the reference set from the VCF header.
@@ -685,6 +835,17 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
         variant.id = self.getVariantId(variant)
         return variant
 
+    def hashPysamVariant(self, record):
+        """
+        Returns the hash of the specified pysam variant record, as
+        computed by hashVariant for the converted record, without
+        converting it.
+        """
+        alts = record.alts
+        if alts is None:
+            alts = ()
+        return self.hashAlleles(record.ref, alts)
+
     def getVariant(self, compoundId):
         if compoundId.reference_name in self._chromFileMap:
             varFileName = self._chromFileMap[compoundId.reference_name]
@@ -697,14 +858,58 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
         cursor = self.getFileHandle(varFileName).fetch(
             referenceName, startPosition, endPosition)
         for record in cursor:
-            variant = self.convertVariant(record, self._callSetIds)
+            # Only the matching record is converted; records overlapping
+            # the start, such as long deletions, are rejected by position.
             if (record.start == start and
-                    compoundId.md5 == self.hashVariant(variant)):
-                return variant
+                    compoundId.md5 == self.hashPysamVariant(record)):
+                return self.convertVariant(record, self._callSetIds)
             elif record.start > start:
                 raise exceptions.ObjectNotFoundException()
         raise exceptions.ObjectNotFoundException(compoundId)
 
+    def getVariantsByIds(self, compoundIds):
+        """
+        Returns the variants with the specified VariantCompoundIds, in
+        the same order. The IDs are grouped by reference, and the variants
+        on each reference are read with one fetch per cluster of nearby
+        positions rather than one fetch per ID.
+        """
+        positions = collections.defaultdict(set)
+        keys = []
+        for compoundId in compoundIds:
+            if compoundId.reference_name not in self._chromFileMap:
+                raise exceptions.ObjectNotFoundException(compoundId)
+            start = int(compoundId.start)
+            positions[compoundId.reference_name].add(start)
+            keys.append((compoundId.reference_name, start, compoundId.md5))
+        requestedKeys = set(keys)
+        variants = {}
+        for referenceName, startSet in positions.items():
+            starts = sorted(startSet)
+            clusters = [[starts[0], starts[0]]]
+            for start in starts[1:]:
+                if start - clusters[-1][1] > VARIANT_ID_CLUSTER_GAP:
+                    clusters.append([start, start])
+                else:
+                    clusters[-1][1] = start
+            for clusterStart, clusterEnd in clusters:
+                for record in self.getPysamVariants(
+                        referenceName, clusterStart, clusterEnd + 1):
+                    if record.start not in startSet:
+                        continue
+                    key = (
+                        referenceName, record.start,
+                        self.hashPysamVariant(record))
+                    if key in requestedKeys and key not in variants:
+                        variants[key] = self.convertVariant(
+                            record, self._callSetIds)
+        gaVariants = []
+        for compoundId, key in zip(compoundIds, keys):
+            if key not in variants:
+                raise exceptions.ObjectNotFoundException(compoundId)
+            gaVariants.append(variants[key])
+        return gaVariants
+
     def getPysamVariants(self, referenceName, startPosition, endPosition):
         """
         Returns an iterator over the pysam VCF records corresponding to the
@@ -720,22 +925,43 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
             for record in cursor:
                 yield record
 
-    def getVariants(self, referenceName, startPosition, endPosition,
-                    callSetIds=[]):
+    def getRawVariants(self, referenceName, startPosition, endPosition,
+                       callSetIds=None):
         """
-        Returns an iterator over the specified variants. The parameters
-        correspond to the attributes of a GASearchVariantsRequest object.
+        Returns an iterator over the pysam VCF records of the specified
+        variants, raising a CallSetNotInVariantSetException if any of the
+        specified callSetIds is not in this variant set.
         """
-        if callSetIds is None:
-            callSetIds = self._callSetIds
-        else:
+        if callSetIds is not None:
             for callSetId in callSetIds:
                 if callSetId not in self._callSetIds:
                     raise exceptions.CallSetNotInVariantSetException(
                         callSetId, self.getId())
-        for record in self.getPysamVariants(
-                referenceName, startPosition, endPosition):
-            yield self.convertVariant(record, callSetIds)
+        return self.getPysamVariants(referenceName, startPosition, endPosition)
+
+    def convertRawVariant(self, rawVariant, callSetIds=None):
+        """
+        Converts the specified pysam variant record into a GA4GH Variant
+        object, with the calls for the specified list of callSetIds, or
+        for all call sets if this is None.
+        """
+        if callSetIds is None:
+            callSetIds = self._callSetIds
+        timer = timing.getRequestTimer()
+        previousPhase = timer.switchPhase(timing.CONVERT)
+        variant = self.convertVariant(rawVariant, callSetIds)
+        timer.switchPhase(previousPhase)
+        return variant
+
+    def getVariants(self, referenceName, startPosition, endPosition,
+                    callSetIds=[]):
+        """
+        Returns an iterator over the specified variants. The parameters
+        correspond to the attributes of a GASearchVariantsRequest object.
+        """
+        for record in self.getRawVariants(
+                referenceName, startPosition, endPosition, callSetIds):
+            yield self.convertRawVariant(record, callSetIds)
 
     def getMetadataId(self, metadata):
         """
@@ -23,6 +23,68 @@ from ga4gh import protocol
 MODE_READ = 'r'
 MODE_WRITE = 'w'
 
+SIMULATED_PROFILES = {
+    # A single chromosome the size of chr20 with the 2504 samples of the
+    # 1000 Genomes phase 3 release, at roughly the same variant density.
+    "1kg-chr20": {
+        "numDatasets": 1,
+        "numReferenceSets": 1,
+        "numReferencesPerReferenceSet": 1,
+        "referenceLength": 63025520,
+        "numVariantSets": 1,
+        "numCalls": 2504,
+        "variantDensity": 0.03,
+        "numReadGroupSets": 0,
+        "numFeatureSets": 0,
+        "spreadOnReference": True,
+    },
+    # A 10Mb slice of a whole genome sequenced to 30x coverage, with
+    # reads of 55 bases on average.
+    "wgs-30x-slice": {
+        "numDatasets": 1,
+        "numReferenceSets": 1,
+        "numReferencesPerReferenceSet": 1,
+        "referenceLength": 10**7,
+        "numVariantSets": 1,
+        "numCalls": 1,
+        "variantDensity": 0.001,
+        "numReadGroupSets": 1,
+        "numReadGroupsPerReadGroupSet": 1,
+        "numAlignments": 30 * 10**7 // 55,
+        "numFeatureSets": 0,
+        "spreadOnReference": True,
+    },
+    # A GENCODE sized annotation of 2.4 million features over 24
+    # references.
+    "gencode": {
+        "numDatasets": 1,
+        "numReferenceSets": 1,
+        "numReferencesPerReferenceSet": 24,
+        "referenceLength": 10**8,
+        "numVariantSets": 0,
+        "numReadGroupSets": 0,
+        "numFeatureSets": 1,
+        "numFeatures": 10**5,
+        "spreadOnReference": True,
+    },
+}
+"""
+Named parameter sets for the SimulatedDataRepository, producing data
+of realistic size for load testing.
+"""
+
+
+def getSimulatedProfile(name):
+    """
+    Returns a dictionary of the SimulatedDataRepository keyword arguments
+    for the simulated profile with the specified name.
+    """
+    if name not in SIMULATED_PROFILES:
+        raise exceptions.ConfigurationException(
+            "Unknown simulated backend profile '{}'; must be one of {}".format(
+                name, ", ".join(sorted(SIMULATED_PROFILES.keys()))))
+    return dict(SIMULATED_PROFILES[name])
+
 
 class AbstractDataRepository(object):
     """
@@ -252,7 +314,8 @@ class SimulatedDataRepository(AbstractDataRepository):
             numVariantSets=1, numCalls=1, variantDensity=0.5,
             numReferenceSets=1, numReferencesPerReferenceSet=1,
             numReadGroupSets=1, numReadGroupsPerReadGroupSet=1,
-            numAlignments=2):
+            numAlignments=2, referenceLength=200, numFeatureSets=1,
+            numFeatures=10, spreadOnReference=False):
         super(SimulatedDataRepository, self).__init__()
 
         # References
@@ -260,7 +323,8 @@ class SimulatedDataRepository(AbstractDataRepository):
             localId = "referenceSet{}".format(i)
             seed = randomSeed + i
             referenceSet = references.SimulatedReferenceSet(
-                localId, seed, numReferencesPerReferenceSet)
+                localId, seed, numReferencesPerReferenceSet,
+                referenceLength)
             self.addReferenceSet(referenceSet)
 
         # Datasets
@@ -274,9 +338,18 @@ class SimulatedDataRepository(AbstractDataRepository):
                 numVariantSets=numVariantSets,
                 numReadGroupSets=numReadGroupSets,
                 numReadGroupsPerReadGroupSet=numReadGroupsPerReadGroupSet,
-                numAlignments=numAlignments)
+                numAlignments=numAlignments, numFeatureSets=numFeatureSets,
+                numFeatures=numFeatures, spreadOnReference=spreadOnReference)
             self.addDataset(dataset)
 
+    def startMd5Checksums(self):
+        """
+        Starts computing the MD5 checksums of the simulated references in
+        the background (see SimulatedReferenceSet.startMd5Checksums).
+        """
+        for referenceSet in self.getReferenceSets():
+            referenceSet.startMd5Checksums()
+
 
 class SqlDataRepository(AbstractDataRepository):
     """
@@ -580,7 +653,7 @@ class SqlDataRepository(AbstractDataRepository):
         cursor.execute("SELECT * FROM Reference;")
         for row in cursor:
             referenceSet = self.getReferenceSet(row[b'referenceSetId'])
-            reference = references.HtslibReference(referenceSet, row[b'name'])
+            reference = referenceSet.createReference(row[b'name'])
             reference.populateFromRow(row)
             assert reference.getId() == row[b"id"]
             referenceSet.addReference(reference)
@@ -629,11 +702,23 @@ class SqlDataRepository(AbstractDataRepository):
         for reference in referenceSet.getReferences():
             self.insertReference(reference)
 
+    def updateReferenceSetDataUrl(self, referenceSet, dataUrl):
+        """
+        Changes the data file of the specified referenceSet in this
+        repository to the specified URL.
+        """
+        sql = "UPDATE ReferenceSet SET dataUrl=? WHERE id=?"
+        cursor = self._dbConnection.cursor()
+        cursor.execute(sql, (dataUrl, referenceSet.getId()))
+
     def _readReferenceSetTable(self, cursor):
         cursor.row_factory = sqlite3.Row
         cursor.execute("SELECT * FROM ReferenceSet;")
         for row in cursor:
-            referenceSet = references.HtslibReferenceSet(row[b'name'])
+            if references.isTwoBitFile(row[b'dataUrl']):
+                referenceSet = references.TwoBitReferenceSet(row[b'name'])
+            else:
+                referenceSet = references.HtslibReferenceSet(row[b'name'])
             referenceSet.populateFromRow(row)
             assert referenceSet.getId() == row[b"id"]
             # Insert the referenceSet into the memory-based object model.
@@ -1059,8 +1144,12 @@ class SqlDataRepository(AbstractDataRepository):
         cursor.execute("SELECT * FROM FeatureSet;")
         for row in cursor:
             dataset = self.getDataset(row[b'datasetId'])
-            featureSet = sequenceAnnotations.Gff3DbFeatureSet(
-                dataset, row[b'name'])
+            if sequenceAnnotations.isTabixGff3File(row[b'dataUrl']):
+                featureSet = sequenceAnnotations.TabixGff3FeatureSet(
+                    dataset, row[b'name'])
+            else:
+                featureSet = sequenceAnnotations.Gff3DbFeatureSet(
+                    dataset, row[b'name'])
             featureSet.setReferenceSet(
                 self.getReferenceSet(row[b'referenceSetId']))
             featureSet.setOntology(self.getOntology(row[b'ontologyId']))
@@ -180,6 +180,26 @@ class BadReadsSearchRequestBothRefs(BadRequestException):
     message = "only one of referenceId and referenceName can be specified"
 
 
+class BadRegionsException(BadRequestException):
+    def __init__(self, message):
+        self.message = "Invalid regions in request: {}".format(message)
+
+
+class BadIdsException(BadRequestException):
+    def __init__(self, message):
+        self.message = "Invalid IDs in request: {}".format(message)
+
+
+class BadCoverageRequestException(BadRequestException):
+    def __init__(self, message):
+        self.message = "Invalid read coverage request: {}".format(message)
+
+
+class BadSummaryRequestException(BadRequestException):
+    def __init__(self, message):
+        self.message = "Invalid summary request: {}".format(message)
+
+
 class DatamodelValidationException(BadRequestException):
     """
     Some bad data was passed to us by the client that made no sense
@@ -303,6 +323,17 @@ class ReferenceRangeErrorException(RangeErrorException):
                 start, end, referenceId))
 
 
+class ByteRangeErrorException(RangeErrorException):
+    """
+    Exception raised when the byte range in the Range header of a
+    request for raw reference bases does not overlap the bases.
+    """
+    def __init__(self, byteRange, length):
+        self.message = (
+            "Range '{}' outside of the {} bases requested".format(
+                byteRange, length))
+
+
 class MethodNotAllowedException(RuntimeException):
     httpStatus = 405
     message = "Method not allowed"
@@ -314,6 +345,11 @@ class NotAuthenticatedException(RuntimeException):
         "Not authenticated. Use the key on the server index page.")
 
 
+class ProfilerRunningException(RuntimeException):
+    httpStatus = 409
+    message = "A profile is already being recorded"
+
+
 class NotImplementedException(RuntimeException):
     """
     Exception raised when a part of the API has not been implemented.
@@ -450,6 +486,16 @@ class FeatureSetNotSpecifiedException(BadRequestException):
         )
 
 
+class SummaryTilesNotFoundException(NotFoundException):
+    """
+    Indicates a summary request was made for an object whose summary
+    tiles have not been computed.
+    """
+    def __init__(self, objectId):
+        self.message = (
+            "No summary tiles have been computed for '{}'".format(objectId))
+
+
 class SequenceAnnotationNotFoundException(NotFoundException):
     def __init__(self, name):
         self.message = (
@@ -530,6 +576,17 @@ class NotIndexedException(MalformedException):
             " indexed.".format(fileName))
 
 
+class SidecarMismatchException(MalformedException):
+    """
+    The records of a tabix indexed GFF3 file do not match its sidecar
+    database, which must be rebuilt whenever the file changes.
+    """
+    def __init__(self, fileName):
+        self.message = (
+            "File {} does not match its sidecar database, which must"
+            " be rebuilt.".format(fileName))
+
+
 class OverlappingVcfException(MalformedException):
     """
     Exception thrown when two VCF files within a VariantSet directory
@@ -9,6 +9,11 @@ from __future__ import unicode_literals
 
 import os
 import datetime
+import hmac
+import json
+import signal
+import tempfile
+import time
 import socket
 import urlparse
 import functools
@@ -25,14 +30,19 @@ import requests
 import ga4gh
 import ga4gh.backend as backend
 import ga4gh.datamodel as datamodel
+import ga4gh.datamodel.references as references
 import ga4gh.protocol as protocol
 import ga4gh.exceptions as exceptions
 import ga4gh.datarepo as datarepo
+import ga4gh.metrics as metrics
+import ga4gh.profiler as profiler
+import ga4gh.timing as timing
 import logging
 from logging import StreamHandler
 
 
 MIMETYPE = "application/json"
+REFERENCE_BASES_MIMETYPES = ["text/plain", "application/octet-stream"]
 SEARCH_ENDPOINT_METHODS = ['POST', 'OPTIONS']
 SECRET_KEY_LENGTH = 24
 
@@ -123,6 +133,13 @@ class ServerStatus(object):
         """
         return ga4gh.__version__
 
+    def getRequestTimings(self):
+        """
+        Returns the list of per-endpoint request timing summaries
+        recorded since startup.
+        """
+        return app.requestTimingStatistics.getSummaries()
+
     def getUrls(self):
         """
         Returns the list of (httpMethod, URL) tuples that this server
@@ -205,9 +222,17 @@ def configure(configFile=None, baseConfig="ProductionConfig",
     # Setup file handle cache max size
     datamodel.fileHandleCache.setMaxCacheSize(
         app.config["FILE_HANDLE_CACHE_MAX_SIZE"])
+    references.basesTileCache.setMaxBytes(
+        app.config["REFERENCE_TILE_CACHE_MAX_BYTES"])
     # Setup CORS
     cors.CORS(app, allow_headers='Content-Type')
     app.serverStatus = ServerStatus()
+    app.requestTimingStatistics = timing.EndpointTimingStatistics()
+    app.metrics = metrics.MetricsRegistry(app.config["METRICS_DIRECTORY"])
+    app.metrics.addCollector(metrics.collectFileHandleCacheMetrics)
+    app.metrics.addCollector(metrics.collectSqliteMetrics)
+    app.metrics.addCollector(metrics.collectBasesTileCacheMetrics)
+    configureProfiler()
     # Allocate the backend
     # We use URLs to specify the backend. Currently we have file:// URLs (or
     # URLs with no scheme) for the SqlDataRepository, and special empty:// and
@@ -228,13 +253,23 @@ def configure(configFile=None, baseConfig="ProductionConfig",
             "SIMULATED_BACKEND_NUM_ALIGNMENTS_PER_READ_GROUP"]
         numReadGroupsPerReadGroupSet = app.config[
             "SIMULATED_BACKEND_NUM_READ_GROUPS_PER_READ_GROUP_SET"]
-        dataRepository = datarepo.SimulatedDataRepository(
-            randomSeed=randomSeed, numCalls=numCalls,
-            variantDensity=variantDensity, numVariantSets=numVariantSets,
-            numReferenceSets=numReferenceSets,
-            numReferencesPerReferenceSet=numReferencesPerReferenceSet,
-            numReadGroupsPerReadGroupSet=numReadGroupsPerReadGroupSet,
-            numAlignments=numAlignmentsPerReadGroup)
+        profile = app.config["SIMULATED_BACKEND_PROFILE"]
+        if profile is not None:
+            # A named profile overrides the individual size options.
+            dataRepository = datarepo.SimulatedDataRepository(
+                randomSeed=randomSeed,
+                **datarepo.getSimulatedProfile(profile))
+            # The references of the profiles are long enough that their
+            # checksums take minutes to compute.
+            dataRepository.startMd5Checksums()
+        else:
+            dataRepository = datarepo.SimulatedDataRepository(
+                randomSeed=randomSeed, numCalls=numCalls,
+                variantDensity=variantDensity, numVariantSets=numVariantSets,
+                numReferenceSets=numReferenceSets,
+                numReferencesPerReferenceSet=numReferencesPerReferenceSet,
+                numReadGroupsPerReadGroupSet=numReadGroupsPerReadGroupSet,
+                numAlignments=numAlignmentsPerReadGroup)
     elif dataSource.scheme == "empty":
         dataRepository = datarepo.EmptyDataRepository()
     elif dataSource.scheme == "file":
@@ -249,6 +284,10 @@ def configure(configFile=None, baseConfig="ProductionConfig",
     theBackend.setResponseValidation(app.config["RESPONSE_VALIDATION"])
     theBackend.setDefaultPageSize(app.config["DEFAULT_PAGE_SIZE"])
     theBackend.setMaxResponseLength(app.config["MAX_RESPONSE_LENGTH"])
+    theBackend.setRegionSearchThreads(app.config["REGION_SEARCH_THREADS"])
+    theBackend.setMaxRegions(app.config["REGION_SEARCH_MAX_REGIONS"])
+    theBackend.setMaxBatchGetIds(app.config["BATCH_GET_MAX_IDS"])
+    theBackend.setMaxCoverageBins(app.config["COVERAGE_MAX_BINS"])
     app.backend = theBackend
     app.secret_key = os.urandom(SECRET_KEY_LENGTH)
     app.oidcClient = None
@@ -298,6 +337,29 @@ def configure(configFile=None, baseConfig="ProductionConfig",
             app.oidcClient.store_registration_info(response)
 
 
+def configureProfiler():
+    """
+    Creates the sampling profiler, and installs the signal handler
+    that starts it if configured to do so. The handler only asks for a
+    profile, which the next request starts (see startRequestMetrics),
+    as only the threads serving requests are sampled.
+    """
+    outputDirectory = app.config["PROFILER_OUTPUT_DIRECTORY"]
+    if outputDirectory is None:
+        outputDirectory = tempfile.gettempdir()
+    app.profiler = profiler.SamplingProfiler(
+        outputDirectory, app.config["PROFILER_INTERVAL"])
+    if app.config["PROFILER_SIGNAL"]:
+        def handleProfilerSignal(signalNumber, frame):
+            app.profiler.requestStart(app.config["PROFILER_DURATION"])
+        try:
+            signal.signal(signal.SIGUSR2, handleProfilerSignal)
+        except ValueError:
+            # Signal handlers can only be installed in the main thread.
+            app.logger.warning(
+                "Cannot install the SIGUSR2 profiler signal handler")
+
+
 def getFlaskResponse(responseString, httpStatus=200):
     """
     Returns a Flask response object for the specified data and HTTP status.
@@ -305,6 +367,28 @@ def getFlaskResponse(responseString, httpStatus=200):
     return flask.Response(responseString, status=httpStatus, mimetype=MIMETYPE)
 
 
+def getTimedFlaskResponse(endpoint, *args):
+    """
+    Calls the specified backend endpoint with the specified arguments
+    and returns a Flask response for the result. The time spent in
+    each phase of the request is recorded against the current Flask
+    endpoint, and reported in a Server-Timing header if configured.
+    """
+    timer = timing.startRequestTimer()
+    # Anything not claimed by the backend before it starts parsing or
+    # fetching is the lookup of the objects named by the request.
+    timer.switchPhase(timing.RESOLVE)
+    try:
+        responseStr = endpoint(*args)
+    finally:
+        timing.endRequestTimer()
+    app.requestTimingStatistics.record(flask.request.endpoint, timer)
+    response = getFlaskResponse(responseStr)
+    if app.config["SERVER_TIMING_HEADER"]:
+        response.headers["Server-Timing"] = timer.getServerTimingHeader()
+    return response
+
+
 def handleHttpPost(request, endpoint):
     """
     Handles the specified HTTP POST request, which maps to the specified
@@ -312,16 +396,14 @@ def handleHttpPost(request, endpoint):
     """
     if request.mimetype != MIMETYPE:
         raise exceptions.UnsupportedMediaTypeException()
-    responseStr = endpoint(request.get_data())
-    return getFlaskResponse(responseStr)
+    return getTimedFlaskResponse(endpoint, request.get_data())
 
 
 def handleList(id_, endpoint, request):
     """
     Handles the specified HTTP GET request, mapping to a list request
     """
-    responseStr = endpoint(id_, request.args)
-    return getFlaskResponse(responseStr)
+    return getTimedFlaskResponse(endpoint, id_, request.args)
 
 
 def handleHttpGet(id_, endpoint):
@@ -329,8 +411,38 @@ def handleHttpGet(id_, endpoint):
     Handles the specified HTTP GET request, which maps to the specified
     protocol handler endpoint and protocol request class
     """
-    responseStr = endpoint(id_)
-    return getFlaskResponse(responseStr)
+    return getTimedFlaskResponse(endpoint, id_)
+
+
+def handleReferenceBasesStream(id_, request, mimetype):
+    """
+    Handles the specified HTTP GET request for the bases of a reference
+    as unformatted text of the specified mimetype, which is streamed
+    rather than split into pages. A single byte range in the Range
+    header selects part of the bases given by the start and end
+    arguments.
+    """
+    reference, start, end = app.backend.getReferenceBasesWindow(
+        id_, request.args)
+    length = end - start
+    status = 200
+    headers = {"Accept-Ranges": "bytes"}
+    if request.range is not None:
+        byteRange = request.range.range_for_length(length)
+        if byteRange is not None:
+            status = 206
+            headers["Content-Range"] = request.range.make_content_range(
+                length).to_header()
+            start, end = start + byteRange[0], start + byteRange[1]
+        elif len(request.range.ranges) == 1:
+            raise exceptions.ByteRangeErrorException(
+                request.range.to_header(), length)
+        # Multiple ranges are not supported, so all the bases are sent.
+    headers["Content-Length"] = str(end - start)
+    chunks = app.backend.generateReferenceBases(reference, start, end)
+    return flask.Response(
+        flask.stream_with_context(chunks), status=status, headers=headers,
+        mimetype=mimetype)
 
 
 def handleHttpOptions():
@@ -353,6 +465,9 @@ def handleException(exception):
         with app.test_request_context():
             app.log_exception(exception)
         serverException = exceptions.getServerError(exception)
+    if flask.has_request_context():
+        # Picked up by recordRequestMetrics.
+        flask.g.errorCode = serverException.getErrorCode()
     error = serverException.toProtocolElement()
     responseStr = protocol.toJson(error)
 
@@ -381,6 +496,55 @@ def startLogin():
     return flask.redirect(result.url)
 
 
+def getMetricsRoute():
+    """
+    Returns the URL rule matched by the current request, which is used
+    to label its metrics.
+    """
+    rule = flask.request.url_rule
+    if rule is None:
+        return "unmatched"
+    return rule.rule
+
+
+@app.before_request
+def startRequestMetrics():
+    """
+    Notes the time the current request started for the metrics, and
+    the endpoint it is serving for the profiler, starting any profile
+    asked for by a signal.
+    """
+    flask.g.requestStartTime = time.time()
+    app.profiler.setThreadEndpoint(flask.request.endpoint or "unmatched")
+    app.profiler.startRequested()
+
+
+@app.teardown_request
+def endRequestProfiling(exception):
+    """
+    Stops attributing profiler samples of this thread to the endpoint.
+    """
+    app.profiler.clearThreadEndpoint()
+
+
+@app.after_request
+def recordRequestMetrics(response):
+    """
+    Records the route, status, duration and response size of the
+    current request, and any server exception it raised, in the metrics.
+    """
+    route = getMetricsRoute()
+    startTime = getattr(flask.g, "requestStartTime", None)
+    if startTime is not None:
+        app.metrics.recordRequest(
+            route, flask.request.method, response.status_code,
+            time.time() - startTime, response.content_length or 0)
+    errorCode = getattr(flask.g, "errorCode", None)
+    if errorCode is not None:
+        app.metrics.recordError(route, errorCode)
+    return response
+
+
 @app.before_request
 def checkAuthentication():
     """
@@ -480,6 +644,42 @@ def index():
     return flask.render_template('index.html', info=app.serverStatus)
 
 
+@app.route('/metrics')
+def getMetrics():
+    return flask.Response(
+        app.metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/admin/profile', methods=['POST'])
+def adminProfile():
+    """
+    Starts recording a sampling profile for the number of seconds given
+    by the 'seconds' argument. The request must give the configured
+    PROFILER_ADMIN_KEY as the 'adminKey' field of its form encoded body.
+    A key in the query string is ignored, as query strings are written
+    to access logs.
+    """
+    adminKey = app.config["PROFILER_ADMIN_KEY"]
+    if adminKey is None:
+        raise exceptions.PathNotFoundException()
+    requestKey = flask.request.form.get("adminKey", "")
+    if not hmac.compare_digest(
+            requestKey.encode("utf-8"), adminKey.encode("utf-8")):
+        raise exceptions.NotAuthenticatedException()
+    seconds = flask.request.values.get(
+        "seconds", app.config["PROFILER_DURATION"])
+    try:
+        seconds = int(seconds)
+    except ValueError:
+        raise exceptions.BadRequestIntegerException("seconds", seconds)
+    seconds = max(1, min(seconds, profiler.MAX_DURATION))
+    outputFile = app.profiler.start(seconds)
+    if outputFile is None:
+        raise exceptions.ProfilerRunningException()
+    responseStr = json.dumps({"outputFile": outputFile, "seconds": seconds})
+    return getFlaskResponse(responseStr)
+
+
 @app.route('/favicon.ico')
 @app.route('/robots.txt')
 def robots():
@@ -501,6 +701,10 @@ def getReferenceSet(id):
 
 @DisplayedRoute('/references/<id>/bases')
 def listReferenceBases(id):
+    mimetype = flask.request.accept_mimetypes.best_match(
+        [MIMETYPE] + REFERENCE_BASES_MIMETYPES, MIMETYPE)
+    if mimetype != MIMETYPE and flask.request.method == "GET":
+        return handleReferenceBasesStream(id, flask.request, mimetype)
     return handleFlaskListRequest(
         id, flask.request, app.backend.runListReferenceBases)
 
@@ -511,6 +715,12 @@ def searchCallSets():
         flask.request, app.backend.runSearchCallSets)
 
 
+@DisplayedRoute('/callsets:batchGet', postMethod=True)
+def batchGetCallSets():
+    return handleFlaskPostRequest(
+        flask.request, app.backend.runBatchGetCallSets)
+
+
 @DisplayedRoute('/readgroupsets/search', postMethod=True)
 def searchReadGroupSets():
     return handleFlaskPostRequest(
@@ -523,6 +733,18 @@ def searchReads():
         flask.request, app.backend.runSearchReads)
 
 
+@DisplayedRoute('/reads:coverage', postMethod=True)
+def readsCoverage():
+    return handleFlaskPostRequest(
+        flask.request, app.backend.runReadsCoverage)
+
+
+@DisplayedRoute('/reads:summary', postMethod=True)
+def readsSummary():
+    return handleFlaskPostRequest(
+        flask.request, app.backend.runReadsSummary)
+
+
 @DisplayedRoute('/referencesets/search', postMethod=True)
 def searchReferenceSets():
     return handleFlaskPostRequest(
@@ -547,6 +769,24 @@ def searchVariants():
         flask.request, app.backend.runSearchVariants)
 
 
+@DisplayedRoute('/variants:searchRegions', postMethod=True)
+def searchVariantRegions():
+    return handleFlaskPostRequest(
+        flask.request, app.backend.runSearchVariantRegions)
+
+
+@DisplayedRoute('/variants:summary', postMethod=True)
+def variantsSummary():
+    return handleFlaskPostRequest(
+        flask.request, app.backend.runVariantsSummary)
+
+
+@DisplayedRoute('/variants:batchGet', postMethod=True)
+def batchGetVariants():
+    return handleFlaskPostRequest(
+        flask.request, app.backend.runBatchGetVariants)
+
+
 @DisplayedRoute('/variantannotationsets/search', postMethod=True)
 def searchVariantAnnotationSets():
     return handleFlaskPostRequest(
@@ -577,6 +817,12 @@ def searchFeatures():
         flask.request, app.backend.runSearchFeatures)
 
 
+@DisplayedRoute('/features:batchGet', postMethod=True)
+def batchGetFeatures():
+    return handleFlaskPostRequest(
+        flask.request, app.backend.runBatchGetFeatures)
+
+
 @DisplayedRoute('/biosamples/search', postMethod=True)
 def searchBioSamples():
     return handleFlaskPostRequest(
@@ -0,0 +1,265 @@
+"""
+Writer for the SQLite feature databases served by Gff3DbFeatureSet.
+
+The FEATURE table holds one row per GFF3 record, with three columns
+prepended to the GFF3 columns: the ID of the feature, the ID of its
+first parent ('' if it has none) and a JSON array of the IDs of its
+children. Feature IDs are dense and assigned in genomic order, so
+rebuilding a database from the same file gives the same IDs. Records
+are streamed from the GFF3 file into temporary tables and the links
+between them are resolved by SQLite, so memory use does not depend on
+the size of the file.
+
+The sidecar databases served with a tabix indexed GFF3 file by
+TabixGff3FeatureSet hold the same IDs and links, but only the columns
+needed to find features, and the BGZF virtual offset of each record in
+place of the rest of its columns.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import os
+import sqlite3
+
+import ga4gh.datamodel.sequenceAnnotations as sequenceAnnotations
+import ga4gh.gff3Parser as gff3Parser
+
+# The number of rows buffered for each executemany call.
+INSERT_BATCH_SIZE = 10000
+
+_featureTableSql = (
+    "CREATE TABLE FEATURE( "
+    "id INTEGER PRIMARY KEY NOT NULL, "
+    "parent_id INTEGER, "
+    "child_ids TEXT, "
+    "reference_name TEXT, "
+    "source TEXT, "
+    "type TEXT, "
+    "start INT, "
+    "end INT, "
+    "score REAL, "
+    "strand TEXT, "
+    "name TEXT,"
+    "gene_name TEXT,"
+    "transcript_name TEXT,"
+    "attributes TEXT);")
+
+_sidecarTableSql = (
+    "CREATE TABLE FEATURE( "
+    "id INTEGER PRIMARY KEY NOT NULL, "
+    "parent_id INTEGER, "
+    "child_ids TEXT, "
+    "reference_name TEXT, "
+    "type TEXT, "
+    "start INT, "
+    "end INT, "
+    "virtual_offset INT);")
+
+# The records in file order, and the parent names of each record with
+# their rank in its Parent attribute.
+_stagingTablesSql = [
+    "CREATE TEMP TABLE gff3_record( "
+    "id INTEGER PRIMARY KEY NOT NULL, "
+    "reference_name TEXT, "
+    "source TEXT, "
+    "type TEXT, "
+    "start INT, "
+    "end INT, "
+    "score REAL, "
+    "strand TEXT, "
+    "name TEXT, "
+    "gene_name TEXT, "
+    "transcript_name TEXT, "
+    "attributes TEXT, "
+    "virtual_offset INT)",
+    "CREATE TEMP TABLE gff3_parent_name( "
+    "child_id INTEGER, "
+    "rank INTEGER, "
+    "parent_name TEXT)",
+]
+
+# The feature IDs number the records from 1 in genomic order, the same
+# order as gff3Parser.Gff3Set.assignUniqueIds, so that the rows of the
+# FEATURE table are clustered by position and the IDs are the same each
+# time a file is loaded. Every part of a disjoint parent is a parent of
+# the child.
+_linkSql = [
+    "CREATE TEMP TABLE gff3_feature_id( "
+    "id INTEGER PRIMARY KEY NOT NULL, "
+    "record_id INTEGER)",
+    "INSERT INTO gff3_feature_id(record_id) "
+    "SELECT id FROM gff3_record "
+    "ORDER BY reference_name, start, end DESC, type, id",
+    "CREATE INDEX temp.gff3_feature_id_record ON gff3_feature_id(record_id)",
+    "CREATE INDEX temp.gff3_record_name ON gff3_record(name)",
+    "CREATE TEMP TABLE gff3_link AS "
+    "SELECT c.id AS child_id, p.rank AS rank, f.id AS parent_id "
+    "FROM gff3_parent_name p "
+    "JOIN gff3_record r ON r.name = p.parent_name "
+    "JOIN gff3_feature_id c ON c.record_id = p.child_id "
+    "JOIN gff3_feature_id f ON f.record_id = r.id",
+    "CREATE INDEX temp.gff3_link_child ON gff3_link(child_id, rank)",
+    "CREATE INDEX temp.gff3_link_parent ON gff3_link(parent_id, child_id)",
+]
+
+_missingParentSql = (
+    "SELECT parent_name FROM gff3_parent_name p "
+    "WHERE NOT EXISTS ("
+    "SELECT 1 FROM gff3_record r WHERE r.name = p.parent_name) "
+    "LIMIT 1")
+
+# Only the first parent is stored, as in the Parent attribute order. The
+# columns of the record that follow the links are formatted in.
+_insertFeaturesSql = (
+    "INSERT INTO FEATURE "
+    "SELECT f.id, "
+    "COALESCE(("
+    "SELECT parent_id FROM gff3_link l WHERE l.child_id = f.id "
+    "ORDER BY rank, parent_id LIMIT 1), ''), "
+    "'[' || COALESCE(("
+    "SELECT group_concat(child_id) FROM ("
+    "SELECT DISTINCT child_id FROM gff3_link l "
+    "WHERE l.parent_id = f.id ORDER BY child_id)), '') || ']', "
+    "{} "
+    "FROM gff3_feature_id f JOIN gff3_record r ON r.id = f.record_id "
+    "ORDER BY f.id")
+
+_featureColumnsSql = (
+    "r.reference_name, r.source, r.type, r.start, r.end, r.score, "
+    "r.strand, r.name, r.gene_name, r.transcript_name, r.attributes")
+
+_sidecarColumnsSql = (
+    "r.reference_name, r.type, r.start, r.end, r.virtual_offset")
+
+
+def _dbSerialize(pyData):
+    return json.dumps(pyData, separators=(',', ':'))
+
+
+def _recordValues(featureId, virtualOffset, feature):
+    return (
+        featureId,
+        feature.seqname,
+        feature.source,
+        feature.type,
+        feature.start,
+        feature.end,
+        feature.score,
+        feature.strand,
+        feature.featureName,
+        feature.attributes.get("gene_name", [None])[0],
+        feature.attributes.get("transcript_name", [None])[0],
+        _dbSerialize(feature.attributes),
+        virtualOffset)
+
+
+def _stageRecords(dbconn, records, batchSize):
+    """
+    Streams the specified (virtualOffset, Feature) pairs into the staging
+    tables, numbering them from 1 in file order.
+    """
+    recordSql = "INSERT INTO gff3_record VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)"
+    parentNameSql = "INSERT INTO gff3_parent_name VALUES (?,?,?)"
+    recordValues = []
+    parentNames = []
+    for featureId, (virtualOffset, feature) in enumerate(records, 1):
+        recordValues.append(_recordValues(featureId, virtualOffset, feature))
+        for rank, parentName in enumerate(
+                feature.attributes.get("Parent", [])):
+            parentNames.append((featureId, rank, parentName))
+        if len(recordValues) >= batchSize:
+            dbconn.executemany(recordSql, recordValues)
+            dbconn.executemany(parentNameSql, parentNames)
+            recordValues = []
+            parentNames = []
+    dbconn.executemany(recordSql, recordValues)
+    dbconn.executemany(parentNameSql, parentNames)
+
+
+def _writeFeatures(dbconn, parser, records, batchSize, tableSql, columnsSql):
+    dbconn.execute(tableSql)
+    for sql in _stagingTablesSql:
+        dbconn.execute(sql)
+    _stageRecords(dbconn, records, batchSize)
+    for sql in _linkSql:
+        dbconn.execute(sql)
+    missingParent = dbconn.execute(_missingParentSql).fetchone()
+    if missingParent is not None:
+        raise gff3Parser.GFF3Exception(
+            "Parent feature does not exist: {}".format(missingParent[0]),
+            parser.fileName)
+    dbconn.execute(_insertFeaturesSql.format(columnsSql))
+
+
+def _writeDb(dbFileName, parser, records, batchSize, tableSql, columnsSql):
+    """
+    Writes the specified records to a new database of the specified name
+    in a single transaction without journaling or syncing, removing the
+    database if this fails. Raises an OSError if the file already exists,
+    so that an existing file is never overwritten or removed.
+    """
+    # Create the file exclusively, so that only a file created here is
+    # removed on failure; SQLite treats the empty file as a new database.
+    os.close(os.open(dbFileName, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+    dbconn = None
+    written = False
+    try:
+        # Autocommit mode, so that the transaction is managed explicitly.
+        dbconn = sqlite3.connect(dbFileName, isolation_level=None)
+        dbconn.execute("PRAGMA journal_mode=OFF")
+        dbconn.execute("PRAGMA synchronous=OFF")
+        dbconn.execute("PRAGMA temp_store=FILE")
+        dbconn.execute("BEGIN")
+        _writeFeatures(
+            dbconn, parser, records, batchSize, tableSql, columnsSql)
+        dbconn.execute("COMMIT")
+        written = True
+    finally:
+        if dbconn is not None:
+            dbconn.close()
+        if not written:
+            os.unlink(dbFileName)
+
+
+def writeGff3Db(
+        gff3FileName, dbFileName, batchSize=INSERT_BATCH_SIZE,
+        numProcesses=1):
+    """
+    Writes the records of the specified GFF3 file to a new feature
+    database of the specified name, and creates its indexes. Large files
+    are parsed by a pool of the specified number of processes (see
+    gff3Parser.Gff3Parser.generateFeatures). The
+    database is built in a single transaction without journaling or
+    syncing, so it is removed if the build fails. Raises an OSError if
+    the database file already exists, and a GFF3Exception if the GFF3
+    file is malformed or a record names a parent that does not exist.
+    """
+    parser = gff3Parser.Gff3Parser(gff3FileName)
+    records = (
+        (None, feature) for feature in parser.generateFeatures(numProcesses))
+    _writeDb(
+        dbFileName, parser, records, batchSize, _featureTableSql,
+        _featureColumnsSql)
+    with sequenceAnnotations.Gff3DbBackend(dbFileName) as dataSource:
+        dataSource.createIndexes()
+
+
+def writeGff3Sidecar(
+        gff3FileName, sidecarFileName, batchSize=INSERT_BATCH_SIZE):
+    """
+    Writes the sidecar database of the specified BGZF compressed GFF3
+    file, sorted and indexed with tabix, to a new database of the
+    specified name, and creates its indexes. The feature IDs are the same
+    as those writeGff3Db gives the records of the file. Raises an OSError
+    if the database file already exists, and a GFF3Exception if the GFF3
+    file is malformed, is not compressed in the BGZF format, or a record
+    names a parent that does not exist.
+    """
+    parser = gff3Parser.Gff3Parser(gff3FileName)
+    _writeDb(
+        sidecarFileName, parser, parser.generateFeaturesWithOffsets(),
+        batchSize, _sidecarTableSql, _sidecarColumnsSql)
+    with sequenceAnnotations.Gff3SidecarBackend(sidecarFileName) as dataSource:
+        dataSource.createIndexes()
@@ -9,14 +9,30 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import urllib
-import copy
+import bisect
 import re
 import gzip
 import bz2
 import collections
+import gc
+import itertools
+import marshal
+import multiprocessing
+import os
+import struct
+import zlib
 
 GFF3_HEADER = "##gff-version 3"
 
+# Files smaller than this are parsed in a single process.
+PARALLEL_PARSE_MIN_SIZE = 16 * 1024 * 1024
+
+# The number of bytes of the file, as stored, parsed by each task of a
+# parallel parse.
+PARALLEL_PARTITION_SIZE = 8 * 1024 * 1024
+
+_READ_SIZE = 1024 * 1024
+
 
 class GFF3Exception(Exception):
     """
@@ -28,6 +44,8 @@ class GFF3Exception(Exception):
         :param fileName: GFF3 file being processed
         :param lineNumber: line in GFF3 file, can be int or string
         """
+        self.description = message
+        self.lineNumber = lineNumber
         if fileName is not None:
             if lineNumber is not None:
                 message = "{}:{}: {}".format(fileName, lineNumber, message)
@@ -57,10 +75,29 @@ def _encodeAttr(v):
         return v
 
 
+def _unquote(v):
+    """
+    Decode a URL encoded attribute value, avoiding the copy made by
+    urllib.unquote for the values that have no escapes.
+    """
+    if "%" in v:
+        return urllib.unquote(v)
+    return v
+
+
 class Feature(object):
     """
-    Feature as parsed from a GFF3.
+    Feature as parsed from a GFF3. Features use slots rather than a
+    per-instance dict, and their links to their parents and children are
+    held as the indices of those features in the features list of the
+    Gff3Set containing them, so that large files can be parsed into a
+    compact object tree.
     """
+    __slots__ = [
+        "seqname", "source", "type", "start", "end", "score", "strand",
+        "frame", "attributes", "gff3Set", "index", "parentIndices",
+        "childIndices", "_uniqueId"]
+
     def __init__(self, seqname, source, type, start, end, score, strand,
                  frame, attributes):
         """
@@ -76,6 +113,8 @@ class Feature(object):
         :param frame: corresponds to the "phase" column in GFF3
         :param attributes: a dict of lists/tuples. Missing attributes,
             coded in a GFF3 file as ".", are represented here as None.
+            The Feature takes ownership of the dict, which must not be
+            modified by the caller afterwards.
         :return:
         """
         self.seqname = seqname
@@ -86,9 +125,46 @@ class Feature(object):
         self.score = score
         self.strand = strand
         self.frame = frame
-        self.attributes = copy.deepcopy(attributes)
-        self.parents = set()
-        self.children = set()
+        self.attributes = attributes
+        self.gff3Set = None
+        self.index = None
+        # None until the first link is made, as most features have no
+        # children.
+        self.parentIndices = None
+        self.childIndices = None
+        self._uniqueId = None
+
+    def _getFeatures(self, indices):
+        if indices is None:
+            return set()
+        features = self.gff3Set.features
+        return set(features[index] for index in indices)
+
+    @property
+    def parents(self):
+        """
+        The set of the parent Features of this feature.
+        """
+        return self._getFeatures(self.parentIndices)
+
+    @property
+    def children(self):
+        """
+        The set of the child Features of this feature.
+        """
+        return self._getFeatures(self.childIndices)
+
+    def addParent(self, parent):
+        """
+        Links this feature with the specified parent, which must be in the
+        same Gff3Set.
+        """
+        if self.parentIndices is None:
+            self.parentIndices = []
+        self.parentIndices.append(parent.index)
+        if parent.childIndices is None:
+            parent.childIndices = []
+        parent.childIndices.append(self.index)
 
     @staticmethod
     def _dotIfNone(val):
@@ -137,9 +213,12 @@ class Feature(object):
     def uniqueId(self):
         """
         Integer ID for this feature, guaranteed unique within a GFF3Set
-        being parsed, suitable for use as a DB primary key.
+        being parsed, suitable for use as a DB primary key. The IDs
+        number the features of the set from 1 in genomic order (see
+        Gff3Set.assignUniqueIds), so they are the same each time a file
+        is parsed. None until the set has been linked.
         """
-        return id(self)
+        return self._uniqueId
 
 
 class Gff3Set(object):
@@ -149,6 +228,9 @@ class Gff3Set(object):
     def __init__(self, fileName=None):
         self.fileName = fileName
         self.roots = set()     # root nodes (those with out parents)
+        # all features, in the order added; features refer to each other
+        # by their index in this list
+        self.features = []
         # index of features by id. GFF3 allows disjoint features with
         # the same id.  None is used to store features without ids
         self.byFeatureName = collections.defaultdict(list)
@@ -159,6 +241,9 @@ class Gff3Set(object):
 
         :param feature: Feature object being added.
         """
+        feature.gff3Set = self
+        feature.index = len(self.features)
+        self.features.append(feature)
         self.byFeatureName[feature.featureName].append(feature)
 
     def _linkFeature(self, feature):
@@ -169,7 +254,8 @@ class Gff3Set(object):
         if parentNames is None:
             self.roots.add(feature)
         else:
-            for parentName in parentNames:
+            # A parent named more than once is only linked once.
+            for parentName in collections.OrderedDict.fromkeys(parentNames):
                 self._linkToParent(feature, parentName)
 
     def _linkToParent(self, feature, parentName):
@@ -183,17 +269,34 @@ class Gff3Set(object):
                 self.fileName)
         # parent maybe disjoint
         for parentPart in parentParts:
-            feature.parents.add(parentPart)
-            parentPart.children.add(feature)
+            feature.addParent(parentPart)
 
     def linkChildFeaturesToParents(self):
         """
         finish loading the set, constructing the tree
         """
-        # features maybe disjoint
-        for featureParts in self.byFeatureName.itervalues():
-            for feature in featureParts:
-                self._linkFeature(feature)
+        for feature in self.features:
+            self._linkFeature(feature)
+        self.assignUniqueIds()
+
+    @staticmethod
+    def _uniqueIdSortKey(feature):
+        """
+        Sort order for assigning unique IDs: the genomic order of
+        _recSortKey, disambiguated by the order in the file.
+        """
+        return (
+            feature.seqname, feature.start, -feature.end, feature.type,
+            feature.index)
+
+    def assignUniqueIds(self):
+        """
+        Numbers the features from 1 in genomic order, so that features
+        close together on the genome have close IDs.
+        """
+        for uniqueId, feature in enumerate(
+                sorted(self.features, key=self._uniqueIdSortKey), 1):
+            feature._uniqueId = uniqueId
 
     @staticmethod
     def _recSortKey(r):
@@ -222,6 +325,274 @@ class Gff3Set(object):
             self._writeRec(fh, root)
 
 
+def _isBgzfFile(fileName):
+    """
+    Returns True if the specified file is compressed in the blocked gzip
+    format used by samtools and tabix, whose blocks can be decompressed
+    independently.
+    """
+    with open(fileName, "rb") as fh:
+        header = fh.read(16)
+    return (
+        len(header) == 16 and header[:4] == b"\x1f\x8b\x08\x04" and
+        header[12:14] == b"BC")
+
+
+def _readBgzfHeader(fh):
+    """
+    Reads the header of the BGZF block at the current position of the
+    specified file, returning the size of the block in the file and the
+    size of the header, or None at the end of the file.
+    """
+    header = fh.read(12)
+    if len(header) < 12:
+        return None
+    extraLength, = struct.unpack(b"<H", header[10:12])
+    extra = fh.read(extraLength)
+    position = 0
+    while position + 4 <= extraLength:
+        subfieldLength, = struct.unpack(
+            b"<H", extra[position + 2:position + 4])
+        if extra[position:position + 2] == b"BC":
+            blockSize, = struct.unpack(
+                b"<H", extra[position + 4:position + 6])
+            return blockSize + 1, 12 + extraLength
+        position += 4 + subfieldLength
+    raise GFF3Exception("Not a BGZF block", fh.name)
+
+
+def _readBgzfBlock(fh):
+    """
+    Reads the BGZF block at the current position of the specified file,
+    returning the size of the block in the file and its decompressed
+    data, or (0, None) at the end of the file.
+    """
+    sizes = _readBgzfHeader(fh)
+    if sizes is None:
+        return 0, None
+    blockSize, headerSize = sizes
+    # The compressed data is followed by its CRC32 and uncompressed size.
+    compressed = fh.read(blockSize - headerSize)
+    return blockSize, zlib.decompress(compressed[:-8], -zlib.MAX_WBITS)
+
+
+def _getBgzfBlockOffsets(fileName):
+    """
+    Returns the offsets of the blocks of the specified BGZF file, read
+    from their headers without decompressing them.
+    """
+    offsets = []
+    with open(fileName, "rb") as fh:
+        offset = 0
+        sizes = _readBgzfHeader(fh)
+        while sizes is not None:
+            offsets.append(offset)
+            offset += sizes[0]
+            fh.seek(offset)
+            sizes = _readBgzfHeader(fh)
+    return offsets
+
+
+def _generatePlainChunks(fh, start, end):
+    """
+    Generates (data, owned) pairs reading the specified file from start
+    to its end, where owned is True for the data before end.
+    """
+    fh.seek(start)
+    position = start
+    while position < end:
+        data = fh.read(min(_READ_SIZE, end - position))
+        if len(data) == 0:
+            return
+        position += len(data)
+        yield data, True
+    while True:
+        data = fh.read(_READ_SIZE)
+        if len(data) == 0:
+            return
+        yield data, False
+
+
+def _generateBgzfChunks(fh, start, end):
+    """
+    Generates (data, owned) pairs decompressing the blocks of the
+    specified BGZF file from the block at start to its end, where owned
+    is True for the blocks before end.
+    """
+    fh.seek(start)
+    position = start
+    while True:
+        blockSize, data = _readBgzfBlock(fh)
+        if data is None:
+            return
+        yield data, position < end
+        position += blockSize
+
+
+def _generatePartitionLines(chunks, isFirst):
+    """
+    Generates the lines of a partition of a file from the specified
+    (data, owned) chunks, without their newlines. A partition owns the
+    lines starting in its data, apart from the line containing its first
+    byte, which belongs to the previous partition. So all but the first
+    partition skip their data up to the first newline, and all partitions
+    read on past their data to the first newline after it.
+    """
+    pending = ""
+    skipping = not isFirst
+    for data, owned in chunks:
+        if skipping:
+            if not owned:
+                return
+            newline = data.find(b"\n")
+            if newline < 0:
+                continue
+            data = data[newline + 1:]
+            skipping = False
+        if owned:
+            lines = (pending + data).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                yield line
+        else:
+            newline = data.find(b"\n")
+            if newline < 0:
+                pending += data
+            else:
+                yield pending + data[:newline]
+                return
+    if len(pending) > 0:
+        yield pending
+
+
+def generateBgzfLines(fileName):
+    """
+    Generates (virtualOffset, line) pairs for the lines of the specified
+    BGZF file, without their newlines, where virtualOffset is the BGZF
+    virtual offset of the start of the line: the offset of its block in
+    the file shifted left by 16 bits, plus its offset in the decompressed
+    block.
+    """
+    pending = b""
+    pendingOffset = None
+    blockOffset = 0
+    with open(fileName, "rb") as fh:
+        while True:
+            blockSize, data = _readBgzfBlock(fh)
+            if data is None:
+                break
+            position = 0
+            while position < len(data):
+                if pendingOffset is None:
+                    pendingOffset = (blockOffset << 16) | position
+                newline = data.find(b"\n", position)
+                if newline < 0:
+                    pending += data[position:]
+                    break
+                yield pendingOffset, pending + data[position:newline]
+                pending = b""
+                pendingOffset = None
+                position = newline + 1
+            blockOffset += blockSize
+    if pendingOffset is not None:
+        yield pendingOffset, pending
+
+
+class BgzfLineReader(object):
+    """
+    Reads the lines of a BGZF file at the virtual offsets generated by
+    generateBgzfLines. The last block read is kept, so reading lines in
+    offset order decompresses each block once.
+    """
+    def __init__(self, fileName):
+        self._fh = open(fileName, "rb")
+        self._blockOffset = None
+        self._blockSize = None
+        self._data = None
+
+    def _readBlock(self, blockOffset):
+        if blockOffset != self._blockOffset:
+            self._fh.seek(blockOffset)
+            self._blockSize, self._data = _readBgzfBlock(self._fh)
+            self._blockOffset = blockOffset
+        return self._data
+
+    def readLine(self, virtualOffset):
+        """
+        Returns the line starting at the specified virtual offset,
+        without its newline.
+        """
+        blockOffset = virtualOffset >> 16
+        position = virtualOffset & 0xffff
+        parts = []
+        data = self._readBlock(blockOffset)
+        while data is not None:
+            newline = data.find(b"\n", position)
+            if newline >= 0:
+                parts.append(data[position:newline])
+                break
+            parts.append(data[position:])
+            data = self._readBlock(self._blockOffset + self._blockSize)
+            position = 0
+        return b"".join(parts)
+
+    def close(self):
+        self._fh.close()
+
+
+def _callWithoutGc(function, *args):
+    """
+    Calls the specified function with the cyclic garbage collector
+    disabled, which otherwise repeatedly traverses the many containers
+    created when parsing.
+    """
+    gcEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        return function(*args)
+    finally:
+        if gcEnabled:
+            gc.enable()
+
+
+def _parsePartitionInProcess(args):
+    """
+    Process pool entry point parsing a partition of a GFF3 file. Returns
+    the marshalled tuple of the values of the Feature fields of each
+    record, the number of lines read, and the description and line
+    number, relative to the start of the partition, of the first error
+    found, if any. Marshalling the values is much faster than pickling
+    them, and leaves the pool a single string to pickle.
+    """
+    return marshal.dumps(_callWithoutGc(_parsePartition, *args))
+
+
+def _parsePartition(fileName, isBgzf, start, end, isFirst):
+    parser = Gff3Parser(fileName)
+    # Only the first line of the first partition is the header.
+    lineOffset = 0 if isFirst else 1
+    parser.lineNumber = lineOffset
+    featureValues = []
+    with open(fileName, "rb") as fh:
+        if isBgzf:
+            chunks = _generateBgzfChunks(fh, start, end)
+        else:
+            chunks = _generatePlainChunks(fh, start, end)
+        try:
+            for line in _generatePartitionLines(chunks, isFirst):
+                parser.lineNumber += 1
+                feature = parser._parseLine(line)
+                if feature is not None:
+                    featureValues.append((
+                        feature.seqname, feature.source, feature.type,
+                        feature.start, feature.end, feature.score,
+                        feature.strand, feature.frame, feature.attributes))
+        except GFF3Exception as exception:
+            error = (exception.description, parser.lineNumber - lineOffset)
+            return None, None, error
+    return featureValues, parser.lineNumber - lineOffset, None
+
+
 class Gff3Parser(object):
     """
     Parses a GFF3 file into a Gff3Set. Performs basic validation,
@@ -235,6 +606,14 @@ class Gff3Parser(object):
         """
         self.fileName = fileName
         self.lineNumber = 0
+        # The single copies of the strings that recur in most records.
+        self._internedStrings = {}
+
+    def _intern(self, string):
+        """
+        Returns the single copy of the specified string held by the parser.
+        """
+        return self._internedStrings.setdefault(string, string)
 
     def _open(self):
         """
@@ -260,11 +639,13 @@ class Gff3Parser(object):
             raise GFF3Exception(
                 "can't parse attribute/value: '" + attrStr +
                 "'", self.fileName, self.lineNumber)
-        name = urllib.unquote(m.group(1))
+        # Attribute names are shared by most records, so a single copy of
+        # each is kept.
+        name = self._intern(urllib.unquote(m.group(1)))
         val = m.group(2)
         # Split by comma to separate then unquote.
         # Commas in values must be url encoded.
-        return (name, [urllib.unquote(v) for v in val.split(',')])
+        return (name, [_unquote(v) for v in val.split(',')])
 
     SPLIT_ATTR_COL_RE = re.compile("; *")
 
@@ -284,9 +665,9 @@ class Gff3Parser(object):
 
     GFF3_NUM_COLS = 9
 
-    def _parseRecord(self, gff3Set, line):
+    def parseRecord(self, line):
         """
-        Parse one record.
+        Parse one record, returning the corresponding Feature.
         """
         row = line.split("\t")
         if len(row) != self.GFF3_NUM_COLS:
@@ -295,13 +676,13 @@ class Gff3Parser(object):
                     self.GFF3_NUM_COLS, len(row)),
                 self.fileName, self.lineNumber)
         feature = Feature(
-            urllib.unquote(row[0]),
-            urllib.unquote(row[1]),
-            urllib.unquote(row[2]),
+            self._intern(urllib.unquote(row[0])),
+            self._intern(urllib.unquote(row[1])),
+            self._intern(urllib.unquote(row[2])),
             int(row[3]), int(row[4]),
             row[5], row[6], row[7],
             self._parseAttrs(row[8]))
-        gff3Set.add(feature)
+        return feature
 
     # spaces or comment line
     IGNORED_LINE_RE = re.compile("(^[ ]*$)|(^[ ]*#.*$)")
@@ -317,23 +698,128 @@ class Gff3Parser(object):
                 "First line is not GFF3 header ({}), got: {}".format(
                     GFF3_HEADER, line), self.fileName, self.lineNumber)
 
-    def _parseLine(self, gff3Set, line):
+    def _parseLine(self, line):
+        """
+        Parse one line, returning the corresponding Feature, or None if
+        the line is the header, a comment or blank.
+        """
         if self.lineNumber == 1:
             self._checkHeader(line)
         elif not self._isIgnoredLine(line):
-            self._parseRecord(gff3Set, line)
-
-    def parse(self):
-        """
-        Run the parse and return the resulting Gff3Set object.
-        """
+            return self.parseRecord(line)
+        return None
+
+    def _getPartitions(self):
+        """
+        Returns the (fileName, isBgzf, start, end, isFirst) arguments of
+        _parsePartitionInProcess for the partitions of the file, or None
+        if the file cannot be split. Plain files are split at any byte
+        and BGZF files at block boundaries.
+        """
+        if self.fileName.endswith(".bz2"):
+            return None
+        isBgzf = _isBgzfFile(self.fileName)
+        if self.fileName.endswith(".gz") and not isBgzf:
+            return None
+        fileSize = os.path.getsize(self.fileName)
+        numPartitions = max(1, -(-fileSize // PARALLEL_PARTITION_SIZE))
+        starts = [
+            fileSize * index // numPartitions
+            for index in range(numPartitions)]
+        if isBgzf:
+            blockOffsets = _getBgzfBlockOffsets(self.fileName)
+            starts = sorted(set(
+                blockOffsets[bisect.bisect_right(blockOffsets, start) - 1]
+                for start in starts))
+        ends = starts[1:] + [fileSize]
+        return [
+            (self.fileName, isBgzf, start, end, index == 0)
+            for index, (start, end) in enumerate(zip(starts, ends))]
+
+    def _generateFeaturesInParallel(self, partitions, numProcesses):
+        """
+        Generates the Features of the specified partitions of the file in
+        file order, parsing up to twice as many partitions as processes
+        ahead of the Features generated.
+        """
+        pool = multiprocessing.Pool(numProcesses)
+        try:
+            partitions = iter(partitions)
+            results = collections.deque(
+                pool.apply_async(_parsePartitionInProcess, (partition,))
+                for partition in itertools.islice(
+                    partitions, 2 * numProcesses))
+            while len(results) > 0:
+                featureValues, numLines, error = _callWithoutGc(
+                    marshal.loads, results.popleft().get())
+                for partition in itertools.islice(partitions, 1):
+                    results.append(pool.apply_async(
+                        _parsePartitionInProcess, (partition,)))
+                if error is not None:
+                    description, lineNumber = error
+                    self.lineNumber += lineNumber
+                    raise GFF3Exception(
+                        description, self.fileName, self.lineNumber)
+                for values in featureValues:
+                    yield Feature(
+                        self._intern(values[0]), self._intern(values[1]),
+                        self._intern(values[2]), *values[3:])
+                self.lineNumber += numLines
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def generateFeatures(self, numProcesses=1):
+        """
+        Generates the Features of the file in file order, one at a time.
+        The Features are not linked to their parents or children, so
+        memory use does not depend on the size of the file. Files of at
+        least PARALLEL_PARSE_MIN_SIZE bytes that are not compressed, or
+        compressed in the BGZF format, are split into partitions that are
+        parsed by a pool of the specified number of processes.
+        """
+        if (numProcesses > 1 and
+                os.path.getsize(self.fileName) >= PARALLEL_PARSE_MIN_SIZE):
+            partitions = self._getPartitions()
+            if partitions is not None:
+                for feature in self._generateFeaturesInParallel(
+                        partitions, numProcesses):
+                    yield feature
+                return
         fh = self._open()
         try:
-            gff3Set = Gff3Set(self.fileName)
             for line in fh:
                 self.lineNumber += 1
-                self._parseLine(gff3Set, line[0:-1])
+                feature = self._parseLine(line[0:-1])
+                if feature is not None:
+                    yield feature
         finally:
             fh.close()
+
+    def generateFeaturesWithOffsets(self):
+        """
+        Generates (virtualOffset, Feature) pairs for the records of a BGZF
+        compressed file in file order, where virtualOffset is that of the
+        start of the record (see generateBgzfLines).
+        """
+        if not _isBgzfFile(self.fileName):
+            raise GFF3Exception("Not a BGZF file", self.fileName)
+        for virtualOffset, line in generateBgzfLines(self.fileName):
+            self.lineNumber += 1
+            feature = self._parseLine(line)
+            if feature is not None:
+                yield virtualOffset, feature
+
+    def parse(self, numProcesses=1):
+        """
+        Run the parse and return the resulting Gff3Set object. The file
+        may be parsed by a pool of the specified number of processes (see
+        generateFeatures); the links between the features are made once
+        all of them have been parsed, so a feature and its parent can be
+        in different partitions.
+        """
+        gff3Set = Gff3Set(self.fileName)
+        for feature in self.generateFeatures(numProcesses):
+            gff3Set.add(feature)
         gff3Set.linkChildFeaturesToParents()
         return gff3Set
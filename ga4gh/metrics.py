@@ -0,0 +1,380 @@
+"""
+Prometheus style operational metrics for the GA4GH server.
+
+Each server process collects its metrics in memory. When a metrics
+directory is configured, each process also writes a snapshot of its
+metrics to its own file in that directory at most once per flush
+interval, and the snapshots of all processes are merged when the
+metrics are rendered. This keeps the totals right when the server runs
+as several processes, for example under mod_wsgi. The directory should
+be emptied whenever the server is restarted.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import errno
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+import ga4gh.datamodel as datamodel
+import ga4gh.datamodel.references as references
+import ga4gh.sqliteBackend as sqliteBackend
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+LATENCY_BUCKETS = [
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+"""
+Upper bounds of the request latency histogram buckets, in seconds.
+"""
+
+SIZE_BUCKETS = [4 ** i for i in range(4, 12)]
+"""
+Upper bounds of the response size histogram buckets, from 256 bytes
+to 4MiB.
+"""
+
+METRICS = [
+    ("ga4gh_requests_total", COUNTER,
+     "Number of HTTP requests by route, method and status."),
+    ("ga4gh_request_duration_seconds", HISTOGRAM,
+     "Time taken to handle HTTP requests by route."),
+    ("ga4gh_response_size_bytes", HISTOGRAM,
+     "Size of HTTP response bodies by route."),
+    ("ga4gh_errors_total", COUNTER,
+     "Number of GA4GH server exceptions by route and error code."),
+    ("ga4gh_file_handle_cache_size", GAUGE,
+     "Number of file handles held open by the file handle cache."),
+    ("ga4gh_file_handle_cache_max_size", GAUGE,
+     "Maximum number of file handles held by the file handle cache."),
+    ("ga4gh_file_handle_cache_hits_total", COUNTER,
+     "Number of file handle requests served from the cache."),
+    ("ga4gh_file_handle_cache_misses_total", COUNTER,
+     "Number of file handle requests that opened a file."),
+    ("ga4gh_file_handle_cache_evictions_total", COUNTER,
+     "Number of file handles closed to make room in the cache."),
+    ("ga4gh_bases_tile_cache_bytes", GAUGE,
+     "Number of reference bases held by the bases tile cache."),
+    ("ga4gh_bases_tile_cache_max_bytes", GAUGE,
+     "Maximum number of reference bases held by the bases tile cache."),
+    ("ga4gh_bases_tile_cache_hits_total", COUNTER,
+     "Number of reference bases tiles served from the cache."),
+    ("ga4gh_bases_tile_cache_misses_total", COUNTER,
+     "Number of reference bases tiles read from FASTA files."),
+    ("ga4gh_bases_tile_cache_evictions_total", COUNTER,
+     "Number of tiles removed to make room in the bases tile cache."),
+    ("ga4gh_sqlite_connections_opened_total", COUNTER,
+     "Number of connections opened to SQLite feature databases."),
+    ("ga4gh_sqlite_connections_open", GAUGE,
+     "Number of connections to SQLite feature databases currently open."),
+]
+"""
+The (name, type, help) of every metric exported by the server.
+"""
+
+_metricTypes = dict((name, type_) for name, type_, _ in METRICS)
+
+_histogramBuckets = {
+    "ga4gh_request_duration_seconds": LATENCY_BUCKETS,
+    "ga4gh_response_size_bytes": SIZE_BUCKETS,
+}
+
+
+def collectFileHandleCacheMetrics():
+    """
+    Returns the (name, labels, value) tuples describing the file
+    handle cache of this process.
+    """
+    statistics = datamodel.fileHandleCache.getStatistics()
+    return [
+        ("ga4gh_file_handle_cache_size", {}, statistics["size"]),
+        ("ga4gh_file_handle_cache_max_size", {}, statistics["maxSize"]),
+        ("ga4gh_file_handle_cache_hits_total", {}, statistics["hits"]),
+        ("ga4gh_file_handle_cache_misses_total", {}, statistics["misses"]),
+        ("ga4gh_file_handle_cache_evictions_total", {},
+         statistics["evictions"]),
+    ]
+
+
+def collectBasesTileCacheMetrics():
+    """
+    Returns the (name, labels, value) tuples describing the reference
+    bases tile cache of this process.
+    """
+    statistics = references.basesTileCache.getStatistics()
+    return [
+        ("ga4gh_bases_tile_cache_bytes", {}, statistics["bytes"]),
+        ("ga4gh_bases_tile_cache_max_bytes", {}, statistics["maxBytes"]),
+        ("ga4gh_bases_tile_cache_hits_total", {}, statistics["hits"]),
+        ("ga4gh_bases_tile_cache_misses_total", {}, statistics["misses"]),
+        ("ga4gh_bases_tile_cache_evictions_total", {},
+         statistics["evictions"]),
+    ]
+
+
+def collectSqliteMetrics():
+    """
+    Returns the (name, labels, value) tuples describing the SQLite
+    connections of this process.
+    """
+    statistics = sqliteBackend.getConnectionStatistics()
+    return [
+        ("ga4gh_sqlite_connections_opened_total", {},
+         statistics["opened"]),
+        ("ga4gh_sqlite_connections_open", {}, statistics["open"]),
+    ]
+
+
+def _getKey(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _isProcessAlive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        return error.errno == errno.EPERM
+    return True
+
+
+def _formatValue(value):
+    if isinstance(value, (int, long)):
+        return str(value)
+    return repr(float(value))
+
+
+def _formatLabels(labels):
+    if len(labels) == 0:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = "{0}".format(value).replace("\\", "\\\\").replace(
+            "\"", "\\\"").replace("\n", "\\n")
+        pairs.append("{0}=\"{1}\"".format(key, value))
+    return "{" + ",".join(pairs) + "}"
+
+
+class MetricsRegistry(object):
+    """
+    Holds the metrics of this process, and renders the metrics of all
+    the server processes sharing a metrics directory in the Prometheus
+    text exposition format.
+    """
+    def __init__(self, directory=None, flushInterval=1.0):
+        self._lock = threading.Lock()
+        self._directory = directory
+        self._flushInterval = flushInterval
+        self._collectors = []
+        self._reset()
+
+    def _reset(self):
+        # Called again after a fork, so that the child does not report
+        # the counts already reported by its parent.
+        self._pid = os.getpid()
+        self._counters = {}
+        self._histograms = {}
+        self._lastFlushTime = 0
+        self._fileName = None
+        if self._directory is not None:
+            self._fileName = os.path.join(
+                self._directory, "metrics-{0}-{1}.json".format(
+                    self._pid, uuid.uuid4().hex))
+
+    def _checkPid(self):
+        if os.getpid() != self._pid:
+            self._reset()
+
+    def addCollector(self, collector):
+        """
+        Adds a function returning a list of (name, labels, value) tuples
+        that is called whenever the metrics of this process are
+        gathered. Counters returned by collectors are totals for the
+        process, not increments.
+        """
+        self._collectors.append(collector)
+
+    def incrementCounter(self, name, labels, value=1):
+        """
+        Adds the specified value to the counter with the specified name
+        and labels.
+        """
+        key = _getKey(name, labels)
+        with self._lock:
+            self._checkPid()
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        """
+        Adds the specified value to the histogram with the specified
+        name and labels.
+        """
+        key = _getKey(name, labels)
+        buckets = _histogramBuckets[name]
+        with self._lock:
+            self._checkPid()
+            if key not in self._histograms:
+                self._histograms[key] = [[0] * (len(buckets) + 1), 0, 0]
+            bucketCounts, _, _ = histogram = self._histograms[key]
+            index = 0
+            while index < len(buckets) and value > buckets[index]:
+                index += 1
+            bucketCounts[index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def recordRequest(self, route, method, status, seconds, numBytes):
+        """
+        Records a completed HTTP request to the specified route.
+        """
+        self.incrementCounter(
+            "ga4gh_requests_total",
+            {"route": route, "method": method, "status": status})
+        self.observe(
+            "ga4gh_request_duration_seconds", {"route": route}, seconds)
+        self.observe("ga4gh_response_size_bytes", {"route": route}, numBytes)
+        if (self._directory is not None and
+                time.time() - self._lastFlushTime >= self._flushInterval):
+            self.flush()
+
+    def recordError(self, route, errorCode):
+        """
+        Records a server exception with the specified error code raised
+        while handling a request to the specified route.
+        """
+        self.incrementCounter(
+            "ga4gh_errors_total", {"route": route, "code": errorCode})
+
+    def getSnapshot(self):
+        """
+        Returns a JSON serialisable dictionary holding the current
+        metrics of this process.
+        """
+        with self._lock:
+            self._checkPid()
+            counters = dict(self._counters)
+            histograms = dict(
+                (key, [list(value[0]), value[1], value[2]])
+                for key, value in self._histograms.items())
+        gauges = {}
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                key = _getKey(name, labels)
+                if _metricTypes[name] == COUNTER:
+                    counters[key] = value
+                else:
+                    gauges[key] = value
+        return {
+            "pid": self._pid,
+            "counters": [[name, labels, value]
+                         for (name, labels), value in counters.items()],
+            "gauges": [[name, labels, value]
+                       for (name, labels), value in gauges.items()],
+            "histograms": [[name, labels, value]
+                           for (name, labels), value in histograms.items()],
+        }
+
+    def flush(self):
+        """
+        Writes the snapshot of this process to its file in the metrics
+        directory. The file is replaced atomically, so that readers
+        never see a partial snapshot.
+        """
+        snapshot = self.getSnapshot()
+        fileDescriptor, tempFileName = tempfile.mkstemp(
+            dir=self._directory, prefix=".tmp-", suffix=".json")
+        with os.fdopen(fileDescriptor, "w") as tempFile:
+            json.dump(snapshot, tempFile)
+        os.rename(tempFileName, self._fileName)
+        self._lastFlushTime = time.time()
+
+    def _getSnapshots(self):
+        if self._directory is None:
+            return [self.getSnapshot()]
+        self.flush()
+        snapshots = []
+        pattern = os.path.join(self._directory, "metrics-*.json")
+        for fileName in glob.glob(pattern):
+            try:
+                with open(fileName) as snapshotFile:
+                    snapshots.append(json.load(snapshotFile))
+            except (IOError, ValueError):
+                # The file was removed, or belongs to something else.
+                pass
+        return snapshots
+
+    def collect(self):
+        """
+        Returns the merged counters, gauges and histograms of all the
+        processes sharing the metrics directory, as dictionaries keyed
+        by (name, labels) tuples. Counters and histograms of processes
+        that have exited are kept, but their gauges are dropped.
+        """
+        counters = {}
+        gauges = {}
+        histograms = {}
+        for snapshot in self._getSnapshots():
+            for name, labels, value in snapshot["counters"]:
+                key = name, tuple(tuple(label) for label in labels)
+                counters[key] = counters.get(key, 0) + value
+            if _isProcessAlive(snapshot["pid"]):
+                for name, labels, value in snapshot["gauges"]:
+                    key = name, tuple(tuple(label) for label in labels)
+                    gauges[key] = gauges.get(key, 0) + value
+            for name, labels, value in snapshot["histograms"]:
+                key = name, tuple(tuple(label) for label in labels)
+                if key not in histograms:
+                    histograms[key] = [[0] * len(value[0]), 0, 0]
+                histogram = histograms[key]
+                for index, count in enumerate(value[0]):
+                    histogram[0][index] += count
+                histogram[1] += value[1]
+                histogram[2] += value[2]
+        return counters, gauges, histograms
+
+    def render(self):
+        """
+        Returns the merged metrics in the Prometheus text exposition
+        format.
+        """
+        counters, gauges, histograms = self.collect()
+        lines = []
+        for name, type_, help_ in METRICS:
+            lines.append("# HELP {0} {1}".format(name, help_))
+            lines.append("# TYPE {0} {1}".format(name, type_))
+            if type_ == HISTOGRAM:
+                buckets = _histogramBuckets[name]
+                keys = sorted(key for key in histograms if key[0] == name)
+                for key in keys:
+                    labels = key[1]
+                    bucketCounts, total, count = histograms[key]
+                    cumulativeCount = 0
+                    bounds = [_formatValue(float(b)) for b in buckets]
+                    for bound, bucketCount in zip(
+                            bounds + ["+Inf"], bucketCounts):
+                        cumulativeCount += bucketCount
+                        lines.append("{0}_bucket{1} {2}".format(
+                            name, _formatLabels(labels + (("le", bound),)),
+                            cumulativeCount))
+                    lines.append("{0}_sum{1} {2}".format(
+                        name, _formatLabels(labels), _formatValue(total)))
+                    lines.append("{0}_count{1} {2}".format(
+                        name, _formatLabels(labels), count))
+            else:
+                values = counters if type_ == COUNTER else gauges
+                keys = sorted(key for key in values if key[0] == name)
+                for key in keys:
+                    lines.append("{0}{1} {2}".format(
+                        name, _formatLabels(key[1]),
+                        _formatValue(values[key])))
+        return "\n".join(lines) + "\n"
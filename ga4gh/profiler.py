@@ -0,0 +1,145 @@
+"""
+A sampling profiler that can be switched on for a while in a running
+server.
+
+While a profile is being recorded, a background thread periodically
+takes the stacks of the threads that are handling requests, and counts
+them against the endpoint each thread is serving. The counts are
+written in the collapsed stack format read by flamegraph tools, one
+"endpoint;outermost frame;...;innermost frame count" line per stack.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import datetime
+import os
+import sys
+import threading
+import time
+
+
+MAX_DURATION = 600
+"""
+The longest profile that may be recorded, in seconds.
+"""
+
+
+class SamplingProfiler(object):
+    """
+    Samples the stacks of the threads handling requests for a given
+    number of seconds and writes them to a collapsed stack file.
+    """
+    def __init__(self, outputDirectory, interval=0.01):
+        self._outputDirectory = outputDirectory
+        self._interval = interval
+        self._threadEndpoints = {}
+        self._frameLabels = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._requestedDuration = None
+
+    def setThreadEndpoint(self, endpoint):
+        """
+        Notes that the current thread is serving the specified endpoint.
+        """
+        self._threadEndpoints[threading.current_thread().ident] = endpoint
+
+    def clearThreadEndpoint(self):
+        """
+        Notes that the current thread has finished serving its endpoint.
+        """
+        self._threadEndpoints.pop(threading.current_thread().ident, None)
+
+    def isRunning(self):
+        """
+        Returns True if a profile is being recorded.
+        """
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def start(self, duration):
+        """
+        Starts recording a profile for the specified number of seconds
+        in a background thread, and returns the path of the file it
+        will be written to. Returns None if a profile is already being
+        recorded.
+        """
+        with self._lock:
+            if self.isRunning():
+                return None
+            fileName = "profile-{0}-{1}.collapsed".format(
+                os.getpid(),
+                datetime.datetime.now().strftime("%Y%m%d-%H%M%S"))
+            outputFile = os.path.join(self._outputDirectory, fileName)
+            self._thread = threading.Thread(
+                target=self._run, args=(duration, outputFile),
+                name="SamplingProfiler")
+            self._thread.daemon = True
+            self._thread.start()
+            return outputFile
+
+    def requestStart(self, duration):
+        """
+        Asks for a profile of the specified number of seconds to be
+        started by the next call to startRequested. Unlike start, this
+        takes no lock, so it is safe to call from a signal handler, which
+        may interrupt the main thread while it is inside start.
+        """
+        self._requestedDuration = duration
+
+    def startRequested(self):
+        """
+        Starts the profile asked for by requestStart, if there is one,
+        and returns the path of the file it will be written to, or None.
+        """
+        duration = self._requestedDuration
+        if duration is None:
+            return None
+        self._requestedDuration = None
+        return self.start(duration)
+
+    def join(self):
+        """
+        Waits for the profile being recorded, if any, to be written.
+        """
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _getFrameLabel(self, code):
+        label = self._frameLabels.get(code)
+        if label is None:
+            label = "{0} ({1}:{2})".format(
+                code.co_name, code.co_filename, code.co_firstlineno)
+            label = label.replace(";", ":")
+            self._frameLabels[code] = label
+        return label
+
+    def sample(self, counts):
+        """
+        Adds one sample of the stack of each thread serving an endpoint
+        to the specified Counter of collapsed stacks.
+        """
+        frames = sys._current_frames()
+        for threadId, endpoint in self._threadEndpoints.items():
+            frame = frames.get(threadId)
+            labels = []
+            while frame is not None:
+                labels.append(self._getFrameLabel(frame.f_code))
+                frame = frame.f_back
+            if len(labels) > 0:
+                labels.append(endpoint)
+                labels.reverse()
+                counts[";".join(labels)] += 1
+
+    def _run(self, duration, outputFile):
+        counts = collections.Counter()
+        endTime = time.time() + duration
+        while time.time() < endTime:
+            self.sample(counts)
+            time.sleep(self._interval)
+        with open(outputFile, "w") as collapsedFile:
+            for stack, count in sorted(counts.items()):
+                print("{0} {1}".format(stack, count), file=collapsedFile)
@@ -31,8 +31,43 @@ class BaseConfig(object):
     SIMULATED_BACKEND_NUM_REFERENCES_PER_REFERENCE_SET = 1
     SIMULATED_BACKEND_NUM_ALIGNMENTS_PER_READ_GROUP = 2
     SIMULATED_BACKEND_NUM_READ_GROUPS_PER_READ_GROUP_SET = 2
+    # One of the named profiles in datarepo.SIMULATED_PROFILES; if set,
+    # this overrides the size options above.
+    SIMULATED_BACKEND_PROFILE = None
 
     FILE_HANDLE_CACHE_MAX_SIZE = 50
+    # The number of bytes of reference bases cached in 16KiB tiles;
+    # 0 disables the cache.
+    REFERENCE_TILE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+    # The number of threads each server process uses to search the
+    # regions of a /variants:searchRegions request concurrently, and the
+    # maximum number of regions in such a request.
+    REGION_SEARCH_THREADS = 4
+    REGION_SEARCH_MAX_REGIONS = 1000
+
+    # The maximum number of IDs in a :batchGet request.
+    BATCH_GET_MAX_IDS = 1000
+
+    # The maximum number of bins in a /reads:coverage request.
+    COVERAGE_MAX_BINS = 10000
+
+    # Report the per-phase timing of each request in a Server-Timing
+    # response header. This exposes server internals to clients, so it
+    # is only enabled by default for development.
+    SERVER_TIMING_HEADER = False
+
+    # Directory shared by all server processes for aggregating the
+    # /metrics endpoint; if None, each process reports only its own.
+    METRICS_DIRECTORY = None
+
+    # Options for the sampling profiler. The /admin/profile route is
+    # only available when PROFILER_ADMIN_KEY is set.
+    PROFILER_ADMIN_KEY = None
+    PROFILER_SIGNAL = False
+    PROFILER_DURATION = 30
+    PROFILER_INTERVAL = 0.01
+    PROFILER_OUTPUT_DIRECTORY = None
 
     LANDING_MESSAGE_HTML = "landing_message.html"
 
@@ -43,6 +78,7 @@ class DevelopmentConfig(BaseConfig):
     """
     DATA_SOURCE = "ga4gh-example-data/repo.db"
     DEBUG = True
+    SERVER_TIMING_HEADER = True
 
 
 class LocalOidConfig(DevelopmentConfig):
@@ -10,6 +10,18 @@ from __future__ import unicode_literals
 import sqlite3
 
 
+_connectionStatistics = {"opened": 0, "open": 0}
+
+
+def getConnectionStatistics():
+    """
+    Returns a dictionary holding the number of connections opened by
+    SqliteBackedDataSource instances in this process, and the number
+    currently open.
+    """
+    return dict(_connectionStatistics)
+
+
 def sqliteRows2dicts(sqliteRows):
     """
     Unpacks sqlite rows as returned by fetchall
@@ -106,7 +118,10 @@ class SqliteBackedDataSource(object):
         # row_factory setting is magic pixie dust to retrieve rows
         # as dictionaries. sqliteRows2dict relies on this.
         self._dbconn.row_factory = sqlite3.Row
+        _connectionStatistics["opened"] += 1
+        _connectionStatistics["open"] += 1
         return self
 
     def __exit__(self, type, value, traceback):
         self._dbconn.close()
+        _connectionStatistics["open"] -= 1
@@ -0,0 +1,378 @@
+"""
+Reader and writer for the summary tile files of read group sets and
+variant sets.
+
+A summary tile file holds, for each reference, a fixed set of summary
+fields (such as the number of reads or variants starting in a bin) over
+bins at several zoom levels. The bins of level 0 are baseBinSize bases
+wide, and those of each following level are zoomFactor times wider.
+The levels of each reference stop at the first whose single bin covers
+it, and that bin stands for the reference at any coarser level. The
+values of each field at each level are stored as a flat little endian
+array, so the value of any bin is found by arithmetic on its index.
+Files are read through mmap, and are written next to the data file of
+the object they summarise (see getSummaryTilesPath).
+
+The file starts with a header (magic, version, baseBinSize, zoomFactor,
+numLevels, numFields and numReferences, as uint32s), followed by the
+name and typecode of each field, and the name, length and data offset
+(uint64) of each reference.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import array
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+SUMMARY_TILES_MAGIC = b"GSUM"
+
+SUMMARY_TILES_VERSION = 2
+
+SUMMARY_TILES_SUFFIX = ".summary"
+
+DEFAULT_BASE_BIN_SIZE = 1024
+
+DEFAULT_ZOOM_FACTOR = 4
+
+# The ways in which the values of a field over zoomFactor bins are
+# combined into the value of the bin that covers them at the next level.
+AGGREGATE_SUM = "sum"
+AGGREGATE_MAX = "max"
+
+_aggregateFunctions = {AGGREGATE_SUM: sum, AGGREGATE_MAX: max}
+
+_headerStruct = struct.Struct(b"<4sIIIIII")
+
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class SummaryTilesException(Exception):
+    """
+    Exception associated with summary tile data.
+    """
+    def __init__(self, message, fileName=None):
+        if fileName is not None:
+            message = "{}: {}".format(fileName, message)
+        super(SummaryTilesException, self).__init__(message)
+
+
+class SummaryField(object):
+    """
+    A field of a summary tile file: its name, the array typecode of its
+    values, and the way values are aggregated between levels.
+    """
+    def __init__(self, name, typecode, aggregate):
+        self.name = name
+        self.typecode = typecode
+        self.aggregate = aggregate
+
+
+# The number of mapped reads starting in each bin, the number of their
+# bases aligned to it, and the maximum depth of those bases over it.
+# The base counts of the coarser levels soon exceed 32 bits, and the
+# array module has no 64 bit integer typecode in Python 2, so they are
+# stored as doubles, which hold integers up to 2 ** 53 exactly.
+READ_FIELDS = [
+    SummaryField("readCount", "I", AGGREGATE_SUM),
+    SummaryField("baseCount", "d", AGGREGATE_SUM),
+    SummaryField("maxDepth", "I", AGGREGATE_MAX),
+]
+
+# The number of variant records starting in each bin.
+VARIANT_FIELDS = [
+    SummaryField("variantCount", "I", AGGREGATE_SUM),
+]
+
+
+def getSummaryTilesPath(dataUrl):
+    """
+    Returns the path of the summary tile file of the specified data file.
+    """
+    return dataUrl + SUMMARY_TILES_SUFFIX
+
+
+def getNumBins(length, binSize):
+    """
+    Returns the number of bins of the specified size needed to cover a
+    reference of the specified length.
+    """
+    return (length + binSize - 1) // binSize
+
+
+def _getNumLevels(length, baseBinSize, zoomFactor):
+    """
+    Returns the number of levels stored for a reference of the specified
+    length: those up to the first whose single bin covers it.
+    """
+    numLevels = 1
+    binSize = baseBinSize
+    while binSize < length:
+        binSize *= zoomFactor
+        numLevels += 1
+    return numLevels
+
+
+class _ReferenceRecord(object):
+    """
+    The length of a reference in a summary tile file, and the offsets of
+    the values of each field at each level.
+    """
+    def __init__(self, length, dataOffset, baseBinSize, zoomFactor,
+                 itemSizes):
+        self.length = length
+        self.numBins = []
+        self.fieldOffsets = []
+        offset = dataOffset
+        for level in range(_getNumLevels(length, baseBinSize, zoomFactor)):
+            binSize = baseBinSize * zoomFactor ** level
+            numBins = getNumBins(length, binSize)
+            offsets = []
+            for itemSize in itemSizes:
+                offsets.append(offset)
+                offset += numBins * itemSize
+            self.numBins.append(numBins)
+            self.fieldOffsets.append(offsets)
+
+
+class SummaryTiles(object):
+    """
+    Read only access to the bins of a summary tile file.
+    """
+    def __init__(self, fileName):
+        self._fileName = fileName
+        with open(fileName, "rb") as tilesFile:
+            self._mmap = mmap.mmap(
+                tilesFile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse()
+        except struct.error:
+            self._mmap.close()
+            raise SummaryTilesException(
+                "Truncated summary tile file", fileName)
+
+    def _parse(self):
+        (magic, version, self._baseBinSize, self._zoomFactor, numLevels,
+            numFields, numReferences) = _headerStruct.unpack_from(self._mmap)
+        if magic != SUMMARY_TILES_MAGIC:
+            raise SummaryTilesException(
+                "Not a summary tile file", self._fileName)
+        if version != SUMMARY_TILES_VERSION:
+            raise SummaryTilesException(
+                "Unsupported summary tile version {}".format(version),
+                self._fileName)
+        self._levelBinSizes = [
+            self._baseBinSize * self._zoomFactor ** level
+            for level in range(numLevels)]
+        position = _headerStruct.size
+        self._fieldNames = []
+        self._typecodes = []
+        for _ in range(numFields):
+            name, position = self._unpackName(position)
+            self._fieldNames.append(name)
+            self._typecodes.append(str(self._mmap[position]))
+            position += 1
+        itemSizes = [
+            array.array(typecode).itemsize for typecode in self._typecodes]
+        self._references = {}
+        self._referenceNames = []
+        for _ in range(numReferences):
+            name, position = self._unpackName(position)
+            length, dataOffset = struct.unpack_from(
+                b"<IQ", self._mmap, position)
+            position += 12
+            self._referenceNames.append(name)
+            self._references[name] = _ReferenceRecord(
+                length, dataOffset, self._baseBinSize, self._zoomFactor,
+                itemSizes)
+
+    def _unpackName(self, position):
+        nameLength = ord(self._mmap[position])
+        name = self._mmap[position + 1:position + 1 + nameLength]
+        return name.decode("utf-8"), position + 1 + nameLength
+
+    def getFieldNames(self):
+        """
+        Returns the names of the fields in this file.
+        """
+        return list(self._fieldNames)
+
+    def getReferenceNames(self):
+        """
+        Returns the names of the references in this file.
+        """
+        return list(self._referenceNames)
+
+    def getReferenceLength(self, referenceName):
+        """
+        Returns the length of the specified reference, raising a KeyError
+        if it is not in this file.
+        """
+        return self._references[referenceName].length
+
+    def getNumLevels(self):
+        """
+        Returns the number of zoom levels in this file.
+        """
+        return len(self._levelBinSizes)
+
+    def getBinSize(self, level):
+        """
+        Returns the width of the bins at the specified level.
+        """
+        return self._levelBinSizes[level]
+
+    def getLevel(self, binSize):
+        """
+        Returns the coarsest level whose bins are no wider than the
+        specified size, or 0 if the bins of every level are wider.
+        """
+        level = 0
+        while (level + 1 < len(self._levelBinSizes) and
+                self._levelBinSizes[level + 1] <= binSize):
+            level += 1
+        return level
+
+    def getBins(self, referenceName, level, fieldName, firstBin, endBin):
+        """
+        Returns an array of the values of the specified field in the bins
+        from firstBin up to but not including endBin of the specified
+        reference at the specified level. Raises a KeyError if the
+        reference or field is not in this file.
+        """
+        record = self._references[referenceName]
+        if fieldName not in self._fieldNames:
+            raise KeyError(fieldName)
+        fieldIndex = self._fieldNames.index(fieldName)
+        typecode = self._typecodes[fieldIndex]
+        values = array.array(str(typecode))
+        level = min(level, len(record.numBins) - 1)
+        endBin = min(endBin, record.numBins[level])
+        if firstBin >= endBin:
+            return values
+        offset = record.fieldOffsets[level][fieldIndex]
+        values.fromstring(self._mmap[
+            offset + firstBin * values.itemsize:
+            offset + endBin * values.itemsize])
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values
+
+    def close(self):
+        """
+        Unmaps the file.
+        """
+        self._mmap.close()
+
+
+def _aggregate(values, zoomFactor, field):
+    function = _aggregateFunctions[field.aggregate]
+    return array.array(str(field.typecode), (
+        function(values[index:index + zoomFactor])
+        for index in range(0, len(values), zoomFactor)))
+
+
+def _packName(name, fileName):
+    name = name.encode("utf-8")
+    if len(name) > 255:
+        raise SummaryTilesException(
+            "Name '{}' is too long".format(name), fileName)
+    return struct.pack(b"<B", len(name)) + name
+
+
+def writeSummaryTiles(
+        fileName, fields, references, baseBinSize=DEFAULT_BASE_BIN_SIZE,
+        zoomFactor=DEFAULT_ZOOM_FACTOR):
+    """
+    Writes a summary tile file of the specified name holding the
+    specified list of SummaryFields. The references are an iterable of
+    (name, length, values) tuples, where values maps the name of each
+    field to a sequence of its values over the bins of baseBinSize bases
+    covering the reference. The values at the coarser levels are
+    aggregated from these. Each reference's values are written to a
+    temporary file as they are computed, so only those of one reference
+    are held in memory at a time. The file is written under a temporary
+    name and then renamed over any existing file, so servers that have
+    the existing file mapped keep reading it intact.
+    """
+    if baseBinSize <= 0 or zoomFactor < 2:
+        raise SummaryTilesException(
+            "Invalid bin size {} or zoom factor {}".format(
+                baseBinSize, zoomFactor), fileName)
+    referenceRecords = []
+    numLevels = 1
+    directory = os.path.dirname(os.path.abspath(fileName))
+    with tempfile.TemporaryFile(dir=directory) as dataFile:
+        for name, length, values in references:
+            referenceRecords.append((name, length, dataFile.tell()))
+            levelValues = [
+                array.array(str(field.typecode), values[field.name])
+                for field in fields]
+            for fieldValues in levelValues:
+                if len(fieldValues) != getNumBins(length, baseBinSize):
+                    raise SummaryTilesException(
+                        "Wrong number of bins for {}".format(name), fileName)
+            referenceNumLevels = _getNumLevels(
+                length, baseBinSize, zoomFactor)
+            numLevels = max(numLevels, referenceNumLevels)
+            for level in range(referenceNumLevels):
+                if level > 0:
+                    levelValues = [
+                        _aggregate(fieldValues, zoomFactor, field)
+                        for fieldValues, field in zip(levelValues, fields)]
+                for fieldValues in levelValues:
+                    _writeValues(fieldValues, dataFile)
+        dataLength = dataFile.tell()
+        header = [_headerStruct.pack(
+            SUMMARY_TILES_MAGIC, SUMMARY_TILES_VERSION, baseBinSize,
+            zoomFactor, numLevels, len(fields), len(referenceRecords))]
+        for field in fields:
+            header.append(_packName(field.name, fileName))
+            header.append(field.typecode.encode())
+        headerLength = sum(map(len, header)) + sum(
+            len(_packName(name, fileName)) + 12
+            for name, _, _ in referenceRecords)
+        for name, length, dataOffset in referenceRecords:
+            header.append(_packName(name, fileName))
+            header.append(struct.pack(
+                b"<IQ", length, headerLength + dataOffset))
+        # Truncating a mapped file would make reads of the mapping fail
+        # with SIGBUS, so the file is replaced instead.
+        tilesFile = tempfile.NamedTemporaryFile(
+            dir=directory, prefix=os.path.basename(fileName) + ".",
+            suffix=".tmp", delete=False)
+        try:
+            with tilesFile:
+                for data in header:
+                    tilesFile.write(data)
+                dataFile.seek(0)
+                _copyBytes(dataFile, tilesFile, dataLength)
+            os.chmod(tilesFile.name, 0o666 & ~_getUmask())
+            os.rename(tilesFile.name, fileName)
+        except:
+            os.unlink(tilesFile.name)
+            raise
+
+
+def _getUmask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def _writeValues(values, outputFile):
+    if sys.byteorder != "little":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    values.tofile(outputFile)
+
+
+def _copyBytes(source, destination, length):
+    while length > 0:
+        data = source.read(min(length, _COPY_CHUNK_SIZE))
+        destination.write(data)
+        length -= len(data)
@@ -0,0 +1,249 @@
+"""
+Lightweight per-request timing instrumentation.
+
+Each request handled by the frontend gets a RequestTimer, which is
+stored in thread local storage so that the backend and datamodel can
+attribute the time they spend to one of a fixed set of phases without
+having the timer passed through every call. Only one phase is active
+at any time, so the phase durations add up to the total time spent
+in the instrumented code.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import threading
+import time
+
+
+PARSE = "parse"
+RESOLVE = "resolve"
+FETCH = "fetch"
+CONVERT = "convert"
+BUILD = "build"
+SERIALISE = "serialise"
+
+PHASES = [PARSE, RESOLVE, FETCH, CONVERT, BUILD, SERIALISE]
+"""
+The phases a request is split into, in the order they usually happen:
+parsing the JSON request, resolving IDs to datamodel objects, fetching
+records from storage (pysam/sqlite), converting them to protocol
+objects, adding them to the response and serialising the response.
+"""
+
+
+class RequestTimer(object):
+    """
+    Accumulates the time spent in each phase of a single request, along
+    with the number of objects and bytes returned.
+    """
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._phaseTimes = dict((phase, 0.0) for phase in PHASES)
+        self._currentPhase = None
+        self._phaseStartTime = None
+        self._startTime = clock()
+        self._endTime = None
+        self._numObjects = 0
+        self._numBytes = 0
+
+    def switchPhase(self, phase):
+        """
+        Charges the time since the last switch to the current phase and
+        makes the specified phase current. Returns the previous phase,
+        so that nested code can restore it when it is done. Passing
+        None pauses timing.
+        """
+        now = self._clock()
+        previousPhase = self._currentPhase
+        if previousPhase is not None:
+            self._phaseTimes[previousPhase] += now - self._phaseStartTime
+        self._currentPhase = phase
+        self._phaseStartTime = now
+        return previousPhase
+
+    def stop(self):
+        """
+        Ends the current phase and fixes the total time of the request.
+        """
+        self.switchPhase(None)
+        self._endTime = self._clock()
+
+    def addObjects(self, numObjects):
+        """
+        Adds the specified number of returned objects to this request.
+        """
+        self._numObjects += numObjects
+
+    def addBytes(self, numBytes):
+        """
+        Adds the specified number of response bytes to this request.
+        """
+        self._numBytes += numBytes
+
+    def getPhaseTime(self, phase):
+        """
+        Returns the number of seconds spent in the specified phase.
+        """
+        return self._phaseTimes[phase]
+
+    def getTotalTime(self):
+        """
+        Returns the number of seconds between the creation of this timer
+        and the call to stop, or now if the timer is still running.
+        """
+        endTime = self._endTime
+        if endTime is None:
+            endTime = self._clock()
+        return endTime - self._startTime
+
+    def getNumObjects(self):
+        """
+        Returns the number of objects returned by this request.
+        """
+        return self._numObjects
+
+    def getNumBytes(self):
+        """
+        Returns the number of response bytes produced by this request.
+        """
+        return self._numBytes
+
+    def getServerTimingHeader(self):
+        """
+        Returns the value of a Server-Timing HTTP header describing this
+        request. Durations are in milliseconds, and phases that were not
+        entered are left out.
+        """
+        metrics = [
+            "{0};dur={1:.3f}".format(phase, self._phaseTimes[phase] * 1000)
+            for phase in PHASES if self._phaseTimes[phase] > 0]
+        metrics.append("total;dur={0:.3f}".format(
+            self.getTotalTime() * 1000))
+        return ", ".join(metrics)
+
+
+class NullRequestTimer(RequestTimer):
+    """
+    A RequestTimer that records nothing, used when code is run outside
+    of a timed request.
+    """
+    def __init__(self):
+        super(NullRequestTimer, self).__init__(clock=lambda: 0.0)
+
+    def switchPhase(self, phase):
+        return None
+
+    def stop(self):
+        pass
+
+    def addObjects(self, numObjects):
+        pass
+
+    def addBytes(self, numBytes):
+        pass
+
+
+_nullRequestTimer = NullRequestTimer()
+_threadLocal = threading.local()
+
+
+def startRequestTimer():
+    """
+    Creates a new RequestTimer and makes it the current timer for this
+    thread.
+    """
+    timer = RequestTimer()
+    _threadLocal.timer = timer
+    return timer
+
+
+def getRequestTimer():
+    """
+    Returns the current RequestTimer for this thread, or a timer that
+    records nothing if no request is being timed.
+    """
+    timer = getattr(_threadLocal, "timer", None)
+    if timer is None:
+        timer = _nullRequestTimer
+    return timer
+
+
+def endRequestTimer():
+    """
+    Stops the current RequestTimer for this thread and returns it.
+    """
+    timer = getRequestTimer()
+    timer.stop()
+    _threadLocal.timer = None
+    return timer
+
+
+class EndpointTimingStatistics(object):
+    """
+    Aggregates the RequestTimers of completed requests per endpoint.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, timer):
+        """
+        Adds the timings of the specified RequestTimer to the totals
+        for the specified endpoint.
+        """
+        with self._lock:
+            if endpoint not in self._endpoints:
+                self._endpoints[endpoint] = {
+                    "requests": 0,
+                    "objects": 0,
+                    "bytes": 0,
+                    "totalSeconds": 0.0,
+                    "maxSeconds": 0.0,
+                    "phaseSeconds": dict((phase, 0.0) for phase in PHASES),
+                }
+            totals = self._endpoints[endpoint]
+            totalTime = timer.getTotalTime()
+            totals["requests"] += 1
+            totals["objects"] += timer.getNumObjects()
+            totals["bytes"] += timer.getNumBytes()
+            totals["totalSeconds"] += totalTime
+            totals["maxSeconds"] = max(totals["maxSeconds"], totalTime)
+            for phase in PHASES:
+                totals["phaseSeconds"][phase] += timer.getPhaseTime(phase)
+
+    def getEndpoints(self):
+        """
+        Returns the sorted list of endpoints that have been recorded.
+        """
+        with self._lock:
+            return sorted(self._endpoints.keys())
+
+    def getSummary(self, endpoint):
+        """
+        Returns a dictionary summarising the requests to the specified
+        endpoint. Times are means over all requests, in milliseconds.
+        """
+        with self._lock:
+            totals = self._endpoints[endpoint]
+            numRequests = totals["requests"]
+            summary = {
+                "endpoint": endpoint,
+                "requests": numRequests,
+                "objects": totals["objects"],
+                "bytes": totals["bytes"],
+                "meanMilliseconds":
+                    totals["totalSeconds"] * 1000 / numRequests,
+                "maxMilliseconds": totals["maxSeconds"] * 1000,
+            }
+            for phase in PHASES:
+                summary[phase + "Milliseconds"] = (
+                    totals["phaseSeconds"][phase] * 1000 / numRequests)
+            return summary
+
+    def getSummaries(self):
+        """
+        Returns the list of summaries for all recorded endpoints.
+        """
+        return [
+            self.getSummary(endpoint) for endpoint in self.getEndpoints()]
@@ -0,0 +1,297 @@
+"""
+Reader and writer for sequence files in the UCSC 2bit format.
+
+Bases are packed four to a byte (T=0, C=1, A=2, G=3, first base in the
+most significant bits), and runs of Ns and of lower case (masked) bases
+are recorded as lists of blocks. Files are read through mmap, so the
+packed sequence is shared through the page cache by all the processes
+reading the same file.
+
+See: https://genome.ucsc.edu/FAQ/FAQformat.html#format7
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import array
+import binascii
+import bisect
+import mmap
+import os
+import re
+import string
+import struct
+import sys
+import tempfile
+
+TWO_BIT_SIGNATURE = 0x1A412743
+
+_WRITE_CHUNK_SIZE = 1024 * 1024  # A multiple of 4 bases
+
+_packTranslation = string.maketrans(b"TCAGNtcagn", b"0123001230")
+
+# The translation tables from a packed byte to each of its four bases.
+_unpackTranslations = [
+    b"".join(b"TCAG"[(byte >> shift) & 3] for byte in range(256))
+    for shift in (6, 4, 2, 0)]
+
+_unsupportedBaseRe = re.compile(b"[^ACGTNacgtn]")
+_nBlockRe = re.compile(b"[Nn]+")
+_maskBlockRe = re.compile(b"[a-z]+")
+
+
+class TwoBitException(Exception):
+    """
+    Exception associated with 2bit data.
+    """
+    def __init__(self, message, fileName=None):
+        if fileName is not None:
+            message = "{}: {}".format(fileName, message)
+        super(TwoBitException, self).__init__(message)
+
+
+class _SequenceRecord(object):
+    """
+    The location of the packed bases of a sequence in a 2bit file, and
+    its N and mask blocks.
+    """
+    def __init__(self, length, nBlocks, maskBlocks, dnaOffset):
+        self.length = length
+        self.nBlockStarts, self.nBlockSizes = nBlocks
+        self.maskBlockStarts, self.maskBlockSizes = maskBlocks
+        self.dnaOffset = dnaOffset
+
+
+def _overlappingBlocks(starts, sizes, start, end):
+    """
+    Returns the (start, end) pairs of the blocks overlapping the
+    specified interval, clipped to it.
+    """
+    index = max(0, bisect.bisect_right(starts, start) - 1)
+    while index < len(starts) and starts[index] < end:
+        blockStart = max(starts[index], start)
+        blockEnd = min(starts[index] + sizes[index], end)
+        if blockStart < blockEnd:
+            yield blockStart, blockEnd
+        index += 1
+
+
+class TwoBitFile(object):
+    """
+    Read only access to the sequences in a 2bit file. This provides the
+    subset of the pysam.FastaFile interface used by the server: the
+    references and lengths attributes, and the fetch and close methods.
+    """
+    def __init__(self, fileName):
+        self._fileName = fileName
+        with open(fileName, "rb") as twoBitFile:
+            self._mmap = mmap.mmap(
+                twoBitFile.fileno(), 0, access=mmap.ACCESS_READ)
+        self._byteOrder = "<"
+        signature, = struct.unpack_from(b"<I", self._mmap, 0)
+        if signature != TWO_BIT_SIGNATURE:
+            self._byteOrder = ">"
+            signature, = struct.unpack_from(b">I", self._mmap, 0)
+            if signature != TWO_BIT_SIGNATURE:
+                raise TwoBitException("Not a 2bit file", fileName)
+        version, numSequences, _ = self._unpack("III", 4)
+        if version != 0:
+            raise TwoBitException(
+                "Unsupported 2bit version {}".format(version), fileName)
+        self._offsets = {}
+        references = []
+        position = 16
+        for _ in range(numSequences):
+            nameLength = ord(self._mmap[position])
+            name = self._mmap[position + 1:position + 1 + nameLength]
+            offset, = self._unpack("I", position + 1 + nameLength)
+            position += nameLength + 5
+            references.append(name)
+            self._offsets[name] = offset
+        self._records = {}
+        self.references = tuple(references)
+        self.lengths = tuple(
+            self._unpack("I", self._offsets[name])[0] for name in references)
+
+    def _unpack(self, format_, offset):
+        return struct.unpack_from(
+            str(self._byteOrder + format_), self._mmap, offset)
+
+    def _readBlocks(self, offset):
+        count, = self._unpack("I", offset)
+        offset += 4
+        blocks = []
+        for _ in range(2):
+            values = array.array(b"I")
+            values.fromstring(self._mmap[offset:offset + 4 * count])
+            if (self._byteOrder == "<") != (sys.byteorder == "little"):
+                values.byteswap()
+            blocks.append(values)
+            offset += 4 * count
+        return blocks, offset
+
+    def _getRecord(self, reference):
+        record = self._records.get(reference)
+        if record is None:
+            if reference not in self._offsets:
+                raise KeyError(reference)
+            offset = self._offsets[reference]
+            length, = self._unpack("I", offset)
+            nBlocks, offset = self._readBlocks(offset + 4)
+            maskBlocks, offset = self._readBlocks(offset)
+            # Skip the reserved word.
+            record = _SequenceRecord(length, nBlocks, maskBlocks, offset + 4)
+            self._records[reference] = record
+        return record
+
+    def fetch(self, reference, start=None, end=None):
+        """
+        Returns the bases of the specified reference from start to end,
+        which default to the whole sequence.
+        """
+        record = self._getRecord(reference)
+        if start is None:
+            start = 0
+        if end is None or end > record.length:
+            end = record.length
+        if start >= end:
+            return b""
+        firstByte = start // 4
+        packed = self._mmap[
+            record.dnaOffset + firstByte:record.dnaOffset + (end + 3) // 4]
+        offset = firstByte * 4
+        bases = _unpackBases(packed)[start - offset:end - offset]
+        nBlocks = list(_overlappingBlocks(
+            record.nBlockStarts, record.nBlockSizes, start, end))
+        maskBlocks = list(_overlappingBlocks(
+            record.maskBlockStarts, record.maskBlockSizes, start, end))
+        if len(nBlocks) == 0 and len(maskBlocks) == 0:
+            return bases
+        bases = bytearray(bases)
+        for blockStart, blockEnd in nBlocks:
+            bases[blockStart - start:blockEnd - start] = (
+                b"N" * (blockEnd - blockStart))
+        for blockStart, blockEnd in maskBlocks:
+            bases[blockStart - start:blockEnd - start] = bases[
+                blockStart - start:blockEnd - start].lower()
+        return bytes(bases)
+
+    def close(self):
+        """
+        Unmaps the file.
+        """
+        self._mmap.close()
+
+
+def _addBlock(starts, sizes, start, end):
+    # Runs that continue from the previous chunk extend its last block.
+    if len(starts) > 0 and starts[-1] + sizes[-1] == start:
+        sizes[-1] += end - start
+    else:
+        starts.append(start)
+        sizes.append(end - start)
+
+
+def _unpackBases(packed):
+    """
+    Returns the four bases of each byte of the specified packed string.
+    """
+    # Translate the whole string once for each position of a base within
+    # its byte, and interleave the results, so that no Python code runs
+    # per byte.
+    bases = bytearray(4 * len(packed))
+    for index, translation in enumerate(_unpackTranslations):
+        bases[index::4] = packed.translate(translation)
+    return bytes(bases)
+
+
+def _packBases(bases):
+    """
+    Returns the 2bit packing of the specified bases, padded with Ts to a
+    multiple of four.
+    """
+    digits = bases.translate(_packTranslation)
+    digits += b"0" * (-len(digits) % 4)
+    # Reading the digits as a base 4 number packs them four to a byte.
+    hexDigits = b"{:x}".format(int(digits, 4)).zfill(len(digits) // 2)
+    return binascii.unhexlify(hexDigits)
+
+
+def writeTwoBitFile(fastaFile, fileName):
+    """
+    Writes the sequences of the specified pysam.FastaFile (or any object
+    with the same interface) to a 2bit file of the specified name. The
+    sequences are read in chunks, so memory use does not depend on the
+    length of the sequences. Raises a TwoBitException if a sequence
+    contains bases other than A, C, G, T or N, which 2bit files cannot
+    represent.
+    """
+    sequences = []
+    directory = os.path.dirname(os.path.abspath(fileName))
+    with tempfile.TemporaryFile(dir=directory) as packedFile:
+        for reference, length in zip(fastaFile.references, fastaFile.lengths):
+            nBlocks = array.array(b"I"), array.array(b"I")
+            maskBlocks = array.array(b"I"), array.array(b"I")
+            packedStart = packedFile.tell()
+            for chunkStart in range(0, length, _WRITE_CHUNK_SIZE):
+                chunkEnd = min(chunkStart + _WRITE_CHUNK_SIZE, length)
+                bases = fastaFile.fetch(
+                    reference=reference, start=chunkStart, end=chunkEnd)
+                match = _unsupportedBaseRe.search(bases)
+                if match is not None:
+                    raise TwoBitException(
+                        "Cannot store base '{}' at {}:{}".format(
+                            match.group(), reference,
+                            chunkStart + match.start()), fileName)
+                for blockRe, blocks in [
+                        (_nBlockRe, nBlocks), (_maskBlockRe, maskBlocks)]:
+                    for match in blockRe.finditer(bases):
+                        _addBlock(
+                            blocks[0], blocks[1], chunkStart + match.start(),
+                            chunkStart + match.end())
+                packedFile.write(_packBases(bases))
+            sequences.append((
+                reference, length, nBlocks, maskBlocks, packedStart,
+                packedFile.tell() - packedStart))
+        offset = 16 + sum(
+            len(sequence[0].encode("utf-8")) + 5 for sequence in sequences)
+        offsets = []
+        for _, _, nBlocks, maskBlocks, _, packedLength in sequences:
+            offsets.append(offset)
+            offset += 16 + 8 * (len(nBlocks[0]) + len(maskBlocks[0]))
+            offset += packedLength
+        if offset >= 2 ** 32:
+            raise TwoBitException(
+                "The sequences are too long for a 2bit file", fileName)
+        with open(fileName, "wb") as twoBitFile:
+            twoBitFile.write(struct.pack(
+                b"<IIII", TWO_BIT_SIGNATURE, 0, len(sequences), 0))
+            for sequence, sequenceOffset in zip(sequences, offsets):
+                name = sequence[0].encode("utf-8")
+                if len(name) > 255:
+                    raise TwoBitException(
+                        "Sequence name '{}' is too long".format(name),
+                        fileName)
+                twoBitFile.write(struct.pack(b"<B", len(name)))
+                twoBitFile.write(name)
+                twoBitFile.write(struct.pack(b"<I", sequenceOffset))
+            for (_, length, nBlocks, maskBlocks, packedStart,
+                    packedLength) in sequences:
+                twoBitFile.write(struct.pack(b"<I", length))
+                for blocks in [nBlocks, maskBlocks]:
+                    twoBitFile.write(struct.pack(b"<I", len(blocks[0])))
+                    for values in blocks:
+                        if sys.byteorder != "little":
+                            values.byteswap()
+                        values.tofile(twoBitFile)
+                # Reserved.
+                twoBitFile.write(struct.pack(b"<I", 0))
+                packedFile.seek(packedStart)
+                _copyBytes(packedFile, twoBitFile, packedLength)
+
+
+def _copyBytes(source, destination, length):
+    while length > 0:
+        data = source.read(min(length, _WRITE_CHUNK_SIZE))
+        destination.write(data)
+        length -= len(data)
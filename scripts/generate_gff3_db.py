@@ -11,119 +11,52 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import argparse
+import multiprocessing
 import os
 import sys
-import json
-import sqlite3
 
 import utils
 utils.ga4ghImportGlue()
-import ga4gh.gff3Parser as gff3  # NOQA
-
-# TODO: Shift this to use the Gff3DbBackend class.
-
-# The columns of the FEATURE table correspond to the columns of a GFF3,
-# with three additional columns prepended representing the ID of this feature,
-# the ID of its parent (if any), and a whitespace separated array
-# of its child IDs.
-
-_dbTableSQL = (
-    "CREATE TABLE FEATURE( "
-    "id INTEGER PRIMARY KEY NOT NULL, "
-    "parent_id INTEGER, "
-    "child_ids TEXT, "
-    "reference_name TEXT, "
-    "source TEXT, "
-    "type TEXT, "
-    "start INT, "
-    "end INT, "
-    "score REAL, "
-    "strand TEXT, "
-    "name TEXT,"
-    "gene_name TEXT,"
-    "transcript_name TEXT,"
-    "attributes TEXT);")
-
-
-def _db_serialize(pyData):
-    return json.dumps(pyData, separators=(',', ':'))
+import ga4gh.gff3Db as gff3Db  # NOQA
+import ga4gh.datamodel.sequenceAnnotations as sequenceAnnotations  # NOQA
 
 
 class Gff32Db(object):
     """
-    Represents a unit of work for this script: Parse a GFF3 file
-    using an external GFF3 parser, and create a corresponding SQLite DB file
-    by iterating through the resulting parsed dictionary object
-    (gff3Data.byfeatureName).
+    Represents a unit of work for this script: Stream the records of a
+    GFF3 file into a corresponding SQLite DB file, resolve the links
+    between them, and index the result.
     """
-    def __init__(self, inputFile, outputFile):
+    def __init__(self, inputFile, outputFile, batchSize, numProcesses):
         """
         :param inputFile: source GFF3 filename (can be a full path)
         :param outputFile: destination sqlite filename (ditto)
+        :param batchSize: number of rows inserted by each executemany call
+        :param numProcesses: number of processes parsing the GFF3 file
         """
         self.gff3File = inputFile
         self.dbFile = outputFile
-        self.valueList = []
-        self.batchSize = 100
+        self.batchSize = batchSize
+        self.numProcesses = numProcesses
         if os.path.exists(outputFile):
             print("DB output file already exists, please remove or rename.",
                   file=sys.stderr)
             exit()
 
-    def _batchInsertValues(self, values, dbcur, dbconn):
-        self.valueList.append(values)
-        if len(self.valueList) >= self.batchSize:
-            self._insertValues(dbcur, dbconn)
-
-    def _insertValues(self, dbcur, dbconn):
-        if len(self.valueList) > 0:
-            sql = "INSERT INTO feature VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)"
-            dbcur.executemany(sql, self.valueList)
-            dbconn.commit()
-            self.valueList = []
-
     def run(self):
-        print("Running GFF3 parser...", file=sys.stderr)
-        gff3Data = gff3.Gff3Parser(self.gff3File).parse()
-
         print("Generating database...", file=sys.stderr)
-        dbconn = sqlite3.connect(self.dbFile)
-        dbcur = dbconn.cursor()
-        dbcur.execute(_dbTableSQL)  # create table
-        dbcur.execute("PRAGMA journal_mode=WAL")
-        dbconn.commit()
-
-        for i, featureName in enumerate(gff3Data.byFeatureName.keys()):
-            for feature in gff3Data.byFeatureName[featureName]:
-                # Ignores any parent IDs besides the first one.
-                parentIds = [parent.uniqueId for parent in feature.parents]
-                parentId = parentIds[0] if len(parentIds) > 0 else ''
-                # FIXME: No current code to ensure childIDs in correct order.
-                childIds = [child.uniqueId for child in feature.children]
-                values = (
-                    feature.uniqueId,
-                    parentId,
-                    _db_serialize(childIds),
-                    feature.seqname,
-                    feature.source,
-                    feature.type,
-                    feature.start,
-                    feature.end,
-                    feature.score,
-                    feature.strand,
-                    feature.featureName,
-                    feature.attributes.get("gene_name", [None])[0],
-                    feature.attributes.get("transcript_name", [None])[0],
-                    _db_serialize(feature.attributes))
-                self._batchInsertValues(values, dbcur, dbconn)
-        self._insertValues(dbcur, dbconn)
-        dbcur.execute((
-            "create INDEX idx1 "
-            "on feature(start, end, reference_name)"))
-        dbcur.execute("PRAGMA INDEX_LIST('feature')")
-
-        dbcur.close()
-        dbconn.close()
+        gff3Db.writeGff3Db(
+            self.gff3File, self.dbFile, self.batchSize, self.numProcesses)
+        with sequenceAnnotations.Gff3DbBackend(self.dbFile) as dataSource:
+            for queryName, planDetails in dataSource.getQueryPlans():
+                print("Query plan for {}:".format(queryName), file=sys.stderr)
+                for detail in planDetails:
+                    print("\t{}".format(detail), file=sys.stderr)
+            unindexedQueries = dataSource.getUnindexedQueries()
+        if len(unindexedQueries) > 0:
+            print(
+                "Warning: the {} queries do not use an index".format(
+                    ", ".join(unindexedQueries)), file=sys.stderr)
         print("Done.", file=sys.stderr)
 
 
@@ -139,9 +72,20 @@ def main():
         "--inputFile", "-i",
         help="Path to input GFF3 file.",
         default='.')
+    parser.add_argument(
+        "--batchSize", "-b", type=int, default=gff3Db.INSERT_BATCH_SIZE,
+        help="The number of rows inserted at a time.")
+    parser.add_argument(
+        "--numProcesses", "-n", type=int, default=None,
+        help="The number of processes parsing large uncompressed or BGZF "
+        "compressed GFF3 files; defaults to one per CPU.")
     parser.add_argument('--verbose', '-v', action='count', default=0)
     args = parser.parse_args()
-    g2d = Gff32Db(args.inputFile, args.outputFile)
+    numProcesses = args.numProcesses
+    if numProcesses is None:
+        numProcesses = multiprocessing.cpu_count()
+    g2d = Gff32Db(
+        args.inputFile, args.outputFile, args.batchSize, numProcesses)
     g2d.run()
 
 
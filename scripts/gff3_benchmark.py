@@ -0,0 +1,171 @@
+"""
+Benchmark for GFF3 parsing and feature database generation.
+
+Parses a GFF3 file, or a synthetic one of a given number of lines, and
+reports the throughput and peak resident memory of each mode as JSON, so
+that results can be compared across commits. Each mode runs in its own
+process, so that the peak memory of one does not hide that of another.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import utils
+utils.ga4ghImportGlue()
+import ga4gh.gff3Db as gff3Db  # noqa
+import ga4gh.gff3Parser as gff3Parser  # noqa
+
+MODES = ["parse", "stream", "db"]
+
+
+def writeSyntheticGff3(fileName, numLines, numReferences=5):
+    """
+    Writes a GFF3 file of about the specified number of lines, made of
+    genes with two transcripts of four exons each, spread over the
+    specified number of references.
+    """
+    linesPerGene = 11
+    genesPerReference = max(1, numLines // (linesPerGene * numReferences))
+    with open(fileName, "w") as gff3File:
+        gff3File.write(gff3Parser.GFF3_HEADER + "\n")
+        for referenceIndex in range(numReferences):
+            seqname = "chr{}".format(referenceIndex + 1)
+            for geneIndex in range(genesPerReference):
+                start = geneIndex * 6000 + 1
+                end = start + 5000
+                geneId = "gene{}.{}".format(referenceIndex, geneIndex)
+                gff3File.write(
+                    "{}\tHAVANA\tgene\t{}\t{}\t.\t+\t.\tID={};"
+                    "gene_name=G{};gene_type=protein_coding\n".format(
+                        seqname, start, end, geneId, geneIndex))
+                for transcriptIndex in range(2):
+                    transcriptId = "{}.{}".format(geneId, transcriptIndex)
+                    gff3File.write(
+                        "{}\tHAVANA\ttranscript\t{}\t{}\t.\t+\t.\tID={};"
+                        "Parent={};gene_name=G{};transcript_name=T{}\n".format(
+                            seqname, start, end, transcriptId, geneId,
+                            geneIndex, transcriptIndex))
+                    for exonIndex in range(4):
+                        exonStart = start + exonIndex * 1000
+                        gff3File.write(
+                            "{}\tHAVANA\texon\t{}\t{}\t.\t+\t.\tID={}.{};"
+                            "Parent={};exon_number={}\n".format(
+                                seqname, exonStart, exonStart + 200,
+                                transcriptId, exonIndex, transcriptId,
+                                exonIndex + 1))
+
+
+def _runMode(mode, gff3FileName, directory, numProcesses):
+    parser = gff3Parser.Gff3Parser(gff3FileName)
+    if mode == "parse":
+        return len(parser.parse(numProcesses).features)
+    elif mode == "stream":
+        return sum(1 for _ in parser.generateFeatures(numProcesses))
+    else:
+        dbFileName = os.path.join(directory, "features.db")
+        gff3Db.writeGff3Db(
+            gff3FileName, dbFileName, numProcesses=numProcesses)
+        os.unlink(dbFileName)
+        return None
+
+
+def _measureMode(mode, gff3FileName, directory, numProcesses, queue):
+    startTime = time.time()
+    numFeatures = _runMode(mode, gff3FileName, directory, numProcesses)
+    seconds = time.time() - startTime
+    # ru_maxrss is in kilobytes on Linux.
+    peakRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    queue.put((seconds, numFeatures, peakRss))
+
+
+def measure(mode, gff3FileName, directory, numProcesses):
+    """
+    Runs the specified mode in a new process and returns the elapsed
+    seconds, the number of features parsed (None for the db mode) and
+    the peak resident memory of the process in bytes. The peak memory
+    does not include that of the pool processes of a parallel parse.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_measureMode,
+        args=(mode, gff3FileName, directory, numProcesses, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def countLines(fileName):
+    with open(fileName) as textFile:
+        return sum(1 for _ in textFile)
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(
+        description="GA4GH GFF3 parsing benchmark")
+    parser.add_argument(
+        "--inputFile", "-i", default=None,
+        help="The GFF3 file to parse; defaults to a synthetic file")
+    parser.add_argument(
+        "--numLines", type=int, default=2000000,
+        help="The number of lines of the synthetic GFF3 file "
+             "(default: %(default)s)")
+    parser.add_argument(
+        "--modes", default=",".join(MODES),
+        help="Comma separated list of the modes to run: parse builds the "
+             "linked Gff3Set, stream only generates the features and db "
+             "writes a feature database (default: %(default)s)")
+    parser.add_argument(
+        "--numProcesses", type=int, default=1,
+        help="The number of processes parsing the file "
+             "(default: %(default)s)")
+    parser.add_argument(
+        "--outputFile", "-o", default=None,
+        help="The file to write JSON results to; defaults to stdout")
+    return parser.parse_args()
+
+
+def main():
+    args = parseArgs()
+    modes = args.modes.split(",")
+    for mode in modes:
+        if mode not in MODES:
+            raise ValueError("Unknown mode '{}'".format(mode))
+    directory = tempfile.mkdtemp(prefix="ga4gh_gff3_benchmark")
+    try:
+        gff3FileName = args.inputFile
+        if gff3FileName is None:
+            gff3FileName = os.path.join(directory, "synthetic.gff3")
+            writeSyntheticGff3(gff3FileName, args.numLines)
+        numLines = countLines(gff3FileName)
+        results = {}
+        for mode in modes:
+            seconds, numFeatures, peakRss = measure(
+                mode, gff3FileName, directory, args.numProcesses)
+            results[mode] = {
+                "seconds": seconds,
+                "features": numFeatures,
+                "linesPerSecond": numLines / seconds,
+                "peakRssBytes": peakRss,
+            }
+            print("{}: {:.1f}s, {:.0f} lines/s, peak RSS {} MB".format(
+                mode, seconds, numLines / seconds, peakRss // 2 ** 20),
+                file=sys.stderr)
+    finally:
+        shutil.rmtree(directory)
+    utils.writeBenchmarkResults(
+        results, args.outputFile, inputFile=args.inputFile,
+        lines=numLines, numProcesses=args.numProcesses)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,49 @@
 """
-Stand-alone benchmark for the GA4GH reference implementation.
+Benchmark suite for the GA4GH reference implementation.
+
+Runs a set of search, get and list requests directly against the backend
+for a simulated or SQL data repository, and reports latency percentiles
+and throughput for each as JSON, so that results can be compared across
+commits.
 """
 from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import re
-import time
-import pstats
 import argparse
 import cProfile
-
-import guppy
+import json
+import pstats
+import random
+import sys
+import time
+import urlparse
 
 import utils
 utils.ga4ghImportGlue()
 import ga4gh.backend as backend  # noqa
-import ga4gh.protocol as protocol  # noqa
+import ga4gh.datamodel.references as references  # noqa
+import ga4gh.datamodel.variants as variants  # noqa
 import ga4gh.datarepo as datarepo  # noqa
+import ga4gh.protocol as protocol  # noqa
 
 
 class HeapProfilerBackend(backend.Backend):
-    def __init__(self, registryDb):
-        repo = datarepo.SqlDataRepository(registryDb)
-        repo.open(datarepo.MODE_READ)
-        super(HeapProfilerBackend, self).__init__(repo)
+    def __init__(self, dataRepository):
+        super(HeapProfilerBackend, self).__init__(dataRepository)
+        import guppy
         self.profiler = guppy.hpy()
 
     def startProfile(self):
         self.profiler.setrelheap()
 
     def endProfile(self):
-        print(self.profiler.heap())
+        print(self.profiler.heap(), file=sys.stderr)
 
 
 class CpuProfilerBackend(backend.Backend):
-    def __init__(self, registryDb):
-        repo = datarepo.SqlDataRepository(registryDb)
-        repo.open(datarepo.MODE_READ)
-        super(CpuProfilerBackend, self).__init__(repo)
+    def __init__(self, dataRepository):
+        super(CpuProfilerBackend, self).__init__(dataRepository)
         self.profiler = cProfile.Profile()
 
     def startProfile(self):
@@ -48,134 +53,536 @@ class CpuProfilerBackend(backend.Backend):
         self.profiler.disable()
 
 
-def _heavyQuery(variantSetId, callSetIds):
+class Sample(object):
+    """
+    The measurements for a single request made to the backend.
+    """
+    def __init__(self, elapsedTime, numObjects, numBytes):
+        self.elapsedTime = elapsedTime
+        self.numObjects = numObjects
+        self.numBytes = numBytes
+
+
+class Benchmark(object):
+    """
+    Superclass of benchmarks. A benchmark makes one or more requests
+    (pages) to the backend each time it is run.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def _timeRequest(self, method, *args):
+        startTime = time.time()
+        responseString = method(*args)
+        elapsedTime = time.time() - startTime
+        return responseString, elapsedTime
+
+    def run(self, theBackend, pageLimit):
+        """
+        Runs this benchmark against the specified backend, following up to
+        pageLimit pages, and returns the list of Samples for each request.
+        """
+        raise NotImplementedError()
+
+
+class SearchBenchmark(Benchmark):
     """
-    Very heavy query: calls for the specified list of callSetIds
-    on chromosome 2 (11 pages, 90 seconds to fetch the entire thing
-    on a high-end desktop machine)
+    A benchmark of a search request, following the next page tokens.
     """
-    request = protocol.SearchVariantsRequest()
-    request.reference_name = '2'
-    request.variant_set_id = variantSetId
-    for callSetId in callSetIds:
-        request.call_set_ids.add(callSetId)
-    request.page_size = 100
-    request.end = 100000
-    return request
+    def __init__(self, name, methodName, request, responseClass):
+        super(SearchBenchmark, self).__init__(name)
+        self.methodName = methodName
+        self.request = request
+        self.responseClass = responseClass
+
+    def run(self, theBackend, pageLimit):
+        samples = []
+        method = getattr(theBackend, self.methodName)
+        request = protocol.fromJson(
+            protocol.toJson(self.request), type(self.request))
+        valueListName = protocol.getValueListName(self.responseClass)
+        while len(samples) < pageLimit:
+            responseString, elapsedTime = self._timeRequest(
+                method, protocol.toJson(request))
+            response = protocol.fromJson(responseString, self.responseClass)
+            samples.append(Sample(
+                elapsedTime, len(getattr(response, valueListName)),
+                len(responseString)))
+            if not response.next_page_token:
+                break
+            request.page_token = response.next_page_token
+        return samples
 
 
-def timeOneSearch(queryString):
+class GetBenchmark(Benchmark):
     """
-    Returns (search result as JSON string, time elapsed during search)
+    A benchmark of a get request for a single object by ID.
     """
-    startTime = time.clock()
-    resultString = backend.runSearchVariants(queryString)
-    endTime = time.clock()
-    elapsedTime = endTime - startTime
-    return resultString, elapsedTime
+    def __init__(self, name, methodName, id_):
+        super(GetBenchmark, self).__init__(name)
+        self.methodName = methodName
+        self.id_ = id_
 
+    def run(self, theBackend, pageLimit):
+        responseString, elapsedTime = self._timeRequest(
+            getattr(theBackend, self.methodName), self.id_)
+        return [Sample(elapsedTime, 1, len(responseString))]
 
-def extractNextPageToken(resultString):
+
+class GetByIdsBenchmark(Benchmark):
     """
-    Calling GASearchVariantsResponse.fromJsonString() can be slower
-    than doing the variant search in the first place; instead we use
-    a regexp to extract the next page token.
+    A benchmark of get requests for a list of objects, made one ID at a
+    time, as done by clients resolving the IDs referenced by other
+    objects.
     """
-    m = re.search('(?<=nextPageToken": )(?:")?([0-9]*?:[0-9]*)|null',
-                  resultString)
-    if m is not None:
-        return m.group(1)
-    return None
+    def __init__(self, name, methodName, ids):
+        super(GetByIdsBenchmark, self).__init__(name)
+        self.methodName = methodName
+        self.ids = ids
+
+    def run(self, theBackend, pageLimit):
+        samples = []
+        method = getattr(theBackend, self.methodName)
+        for id_ in self.ids:
+            responseString, elapsedTime = self._timeRequest(method, id_)
+            samples.append(Sample(elapsedTime, 1, len(responseString)))
+        return samples
 
 
-def benchmarkOneQuery(request, repeatLimit=3, pageLimit=3):
+class BatchGetBenchmark(Benchmark):
     """
-    Repeat the query several times; perhaps don't go through *all* the
-    pages.  Returns minimum time to run backend.searchVariants() to execute
-    the query (as far as pageLimit allows), *not* including JSON
-    processing to prepare queries or parse responses.
+    A benchmark of a batch get request for a list of objects.
     """
-    times = []
-    queryString = protocol.toJson(request)
-    for i in range(0, repeatLimit):
-        resultString, elapsedTime = timeOneSearch(queryString)
-        accruedTime = elapsedTime
-        pageCount = 1
-        token = extractNextPageToken(resultString)
-        # Iterate to go beyond the first page of results.
-        while token is not None and pageCount < pageLimit:
-            pageRequest = request
-            pageRequest.page_token = token
-            pageRequestString = protocol.toJson(pageRequest)
-            resultString, elapsedTime = timeOneSearch(pageRequestString)
-            accruedTime += elapsedTime
-            pageCount = pageCount + 1
-            token = extractNextPageToken(resultString)
-        times.append(accruedTime)
+    def __init__(self, name, methodName, ids):
+        super(BatchGetBenchmark, self).__init__(name)
+        self.methodName = methodName
+        self.ids = ids
 
-    # TODO: more sophisticated statistics. Sometimes we want min(),
-    # sometimes mean = sum() / len(), sometimes other measures,
-    # perhaps exclude outliers...
+    def run(self, theBackend, pageLimit):
+        responseString, elapsedTime = self._timeRequest(
+            getattr(theBackend, self.methodName),
+            json.dumps({"ids": self.ids}))
+        return [Sample(elapsedTime, len(self.ids), len(responseString))]
 
-    # If we compute average we should throw out at least the first one.
-    # return sum(times[2:])/len(times[2:])
-    return min(times)
 
-if __name__ == '__main__':
+class ListReferenceBasesBenchmark(Benchmark):
+    """
+    A benchmark of a list reference bases request. Each base returned is
+    counted as an object.
+    """
+    def __init__(self, name, referenceId, start, end):
+        super(ListReferenceBasesBenchmark, self).__init__(name)
+        self.referenceId = referenceId
+        self.start = start
+        self.end = end
+
+    def run(self, theBackend, pageLimit):
+        samples = []
+        requestArgs = {'start': self.start, 'end': self.end}
+        while len(samples) < pageLimit:
+            responseString, elapsedTime = self._timeRequest(
+                theBackend.runListReferenceBases, self.referenceId,
+                requestArgs)
+            response = protocol.fromJson(
+                responseString, protocol.ListReferenceBasesResponse)
+            samples.append(Sample(
+                elapsedTime, len(response.sequence), len(responseString)))
+            if not response.next_page_token:
+                break
+            requestArgs['pageToken'] = response.next_page_token
+        return samples
+
+
+class RandomReferenceBasesBenchmark(Benchmark):
+    """
+    A benchmark of list reference bases requests for small windows at
+    random positions in a region, as made by genome browsers and
+    aligners. The same windows are requested each time it is run, so
+    that repeated runs exercise the bases tile cache.
+    """
+    def __init__(
+            self, name, referenceId, start, end, windowLength,
+            numRequests, randomSeed):
+        super(RandomReferenceBasesBenchmark, self).__init__(name)
+        self.referenceId = referenceId
+        self.start = start
+        self.end = end
+        self.windowLength = windowLength
+        self.numRequests = numRequests
+        self.randomSeed = randomSeed
+
+    def run(self, theBackend, pageLimit):
+        samples = []
+        randomNumberGenerator = random.Random(self.randomSeed)
+        lastStart = max(self.start, self.end - self.windowLength)
+        for _ in range(self.numRequests):
+            windowStart = randomNumberGenerator.randint(self.start, lastStart)
+            requestArgs = {
+                'start': windowStart,
+                'end': min(windowStart + self.windowLength, self.end)}
+            responseString, elapsedTime = self._timeRequest(
+                theBackend.runListReferenceBases, self.referenceId,
+                requestArgs)
+            response = protocol.fromJson(
+                responseString, protocol.ListReferenceBasesResponse)
+            samples.append(Sample(
+                elapsedTime, len(response.sequence), len(responseString)))
+        return samples
+
+
+def percentile(sortedValues, percent):
+    """
+    Returns the specified percentile of the specified sorted list of
+    values using the nearest rank method.
+    """
+    rank = max(0, int(round(percent / 100 * len(sortedValues))) - 1)
+    return sortedValues[min(rank, len(sortedValues) - 1)]
+
+
+def summarise(samples):
+    """
+    Returns a dictionary summarising the specified list of Samples.
+    """
+    times = sorted(sample.elapsedTime for sample in samples)
+    totalTime = sum(times)
+    numObjects = sum(sample.numObjects for sample in samples)
+    numBytes = sum(sample.numBytes for sample in samples)
+    return {
+        "requests": len(samples),
+        "objects": numObjects,
+        "bytes": numBytes,
+        "totalSeconds": totalTime,
+        "p50Seconds": percentile(times, 50),
+        "p95Seconds": percentile(times, 95),
+        "p99Seconds": percentile(times, 99),
+        "objectsPerSecond": numObjects / totalTime if totalTime > 0 else None,
+        "bytesPerSecond": numBytes / totalTime if totalTime > 0 else None,
+    }
+
+
+def _getRegionReference(referenceSet, referenceName):
+    """
+    Returns the reference in the specified reference set with the
+    specified name, or the first reference if there is none.
+    """
+    for reference in referenceSet.getReferences():
+        if reference.getLocalId() == referenceName:
+            return reference
+    return referenceSet.getReferenceByIndex(0)
+
+
+def _getVariantReferenceName(variantSet, referenceName, defaultReference):
+    """
+    Returns the name of the reference to query in the specified variant
+    set; if the requested reference has no data in a file based variant set
+    the first reference with data is used instead.
+    """
+    if isinstance(variantSet, variants.HtslibVariantSet):
+        referenceNames = sorted(
+            variantSet.getReferenceToDataUrlIndexMap().keys())
+        if referenceName not in referenceNames:
+            referenceName = referenceNames[0]
+    elif referenceName is None:
+        referenceName = defaultReference.getLocalId()
+    return referenceName
+
+
+def _firstPage(theBackend, benchmark):
+    """
+    Returns the list of objects in the first page returned by the
+    specified search benchmark.
+    """
+    responseString = getattr(theBackend, benchmark.methodName)(
+        protocol.toJson(benchmark.request))
+    response = protocol.fromJson(responseString, benchmark.responseClass)
+    return list(getattr(response, protocol.getValueListName(
+        benchmark.responseClass)))
+
+
+def _firstObject(theBackend, benchmark):
+    """
+    Returns the first object returned by the specified search benchmark,
+    or None if the search is empty.
+    """
+    values = _firstPage(theBackend, benchmark)
+    return values[0] if len(values) > 0 else None
+
+
+def createBenchmarks(theBackend, args):
+    """
+    Returns the list of benchmarks for the specified backend, using the
+    first dataset providing each type of object. The region queried is
+    taken from the command line arguments.
+    """
+    repo = theBackend.getDataRepository()
+    benchmarks = []
+
+    def addSearch(name, methodName, request, responseClass):
+        request.page_size = args.pageSize
+        benchmark = SearchBenchmark(name, methodName, request, responseClass)
+        benchmarks.append(benchmark)
+        return benchmark
+
+    def addGet(name, methodName, id_):
+        benchmarks.append(GetBenchmark(name, methodName, id_))
+
+    addGet("getDataset", "runGetDataset", repo.getDatasetByIndex(0).getId())
+    referenceSet = repo.getReferenceSetByIndex(0)
+    addGet("getReferenceSet", "runGetReferenceSet", referenceSet.getId())
+    reference = _getRegionReference(referenceSet, args.referenceName)
+    addGet("getReference", "runGetReference", reference.getId())
+    end = min(args.start + args.regionLength, reference.getLength())
+    benchmarks.append(ListReferenceBasesBenchmark(
+        "listReferenceBases", reference.getId(), args.start, end))
+    benchmarks.append(RandomReferenceBasesBenchmark(
+        "randomReferenceBases", reference.getId(), args.start, end,
+        args.windowLength, args.pageSize, args.randomSeed))
+
+    variantSets = [
+        variantSet for dataset in repo.getDatasets()
+        for variantSet in dataset.getVariantSets()]
+    if args.variantSetName is not None:
+        variantSets = [
+            variantSet for variantSet in variantSets
+            if variantSet.getLocalId() == args.variantSetName]
+    if len(variantSets) > 0:
+        variantSet = variantSets[0]
+        referenceName = _getVariantReferenceName(
+            variantSet, args.referenceName, reference)
+        addGet("getVariantSet", "runGetVariantSet", variantSet.getId())
+        callSetIds = [callSet.getId() for callSet in variantSet.getCallSets()]
+        if len(callSetIds) > 0:
+            addGet("getCallSet", "runGetCallSet", callSetIds[0])
+        for label, numCallSets in [
+                ("0", 0), ("10", 10), ("All", len(callSetIds))]:
+            request = protocol.SearchVariantsRequest()
+            request.variant_set_id = variantSet.getId()
+            request.reference_name = referenceName
+            request.start = args.start
+            request.end = args.start + args.regionLength
+            request.call_set_ids.extend(callSetIds[:numCallSets])
+            benchmark = addSearch(
+                "searchVariants{}CallSets".format(label),
+                "runSearchVariants", request, protocol.SearchVariantsResponse)
+        # The variants are fetched with all their calls, so with a
+        # variant set of thousands of samples these show the cost of
+        # locating and converting each variant.
+        variantIds = [
+            variant.id for variant in _firstPage(theBackend, benchmark)]
+        if len(variantIds) > 0:
+            addGet("getVariant", "runGetVariant", variantIds[0])
+            benchmarks.append(GetByIdsBenchmark(
+                "getVariantsById", "runGetVariant", variantIds))
+            benchmarks.append(BatchGetBenchmark(
+                "batchGetVariants", "runBatchGetVariants", variantIds))
+    variantAnnotationSets = [
+        variantAnnotationSet for annotatedVariantSet in variantSets
+        for variantAnnotationSet in
+        annotatedVariantSet.getVariantAnnotationSets()]
+    if len(variantAnnotationSets) > 0:
+        variantAnnotationSet = variantAnnotationSets[0]
+        referenceName = _getVariantReferenceName(
+            variantAnnotationSet.getVariantSet(), args.referenceName,
+            reference)
+        addGet(
+            "getVariantAnnotationSet", "runGetVariantAnnotationSet",
+            variantAnnotationSet.getId())
+        request = protocol.SearchVariantAnnotationsRequest()
+        request.variant_annotation_set_id = variantAnnotationSet.getId()
+        request.reference_name = referenceName
+        request.start = args.start
+        request.end = args.start + args.regionLength
+        addSearch(
+            "searchVariantAnnotations", "runSearchVariantAnnotations",
+            request, protocol.SearchVariantAnnotationsResponse)
+
+    readGroupSets = [
+        readGroupSet for dataset in repo.getDatasets()
+        for readGroupSet in dataset.getReadGroupSets()]
+    if len(readGroupSets) > 0:
+        readGroupSet = readGroupSets[0]
+        readGroup = readGroupSet.getReadGroups()[0]
+        addGet(
+            "getReadGroupSet", "runGetReadGroupSet", readGroupSet.getId())
+        addGet("getReadGroup", "runGetReadGroup", readGroup.getId())
+        readReference = _getRegionReference(
+            readGroupSet.getReferenceSet(), args.referenceName)
+        request = protocol.SearchReadsRequest()
+        request.read_group_ids.append(readGroup.getId())
+        request.reference_id = readReference.getId()
+        request.start = args.start
+        request.end = args.start + args.regionLength
+        addSearch(
+            "searchReads", "runSearchReads", request,
+            protocol.SearchReadsResponse)
+
+    featureSets = [
+        featureSet for dataset in repo.getDatasets()
+        for featureSet in dataset.getFeatureSets()]
+    if len(featureSets) > 0:
+        featureSet = featureSets[0]
+        addGet("getFeatureSet", "runGetFeatureSet", featureSet.getId())
+        featureReference = _getRegionReference(
+            featureSet.getReferenceSet(), args.referenceName)
+        request = protocol.SearchFeaturesRequest()
+        request.feature_set_id = featureSet.getId()
+        request.reference_name = (
+            args.featureReferenceName or featureReference.getLocalId())
+        request.start = args.start
+        request.end = args.start + args.regionLength
+        benchmark = addSearch(
+            "searchFeatures", "runSearchFeatures", request,
+            protocol.SearchFeaturesResponse)
+        feature = _firstObject(theBackend, benchmark)
+        if feature is not None:
+            addGet("getFeature", "runGetFeature", feature.id)
+
+    for dataset in repo.getDatasets():
+        if dataset.getNumBioSamples() > 0:
+            addGet(
+                "getBioSample", "runGetBioSample",
+                dataset.getBioSampleByIndex(0).getId())
+            break
+    for dataset in repo.getDatasets():
+        if dataset.getNumIndividuals() > 0:
+            addGet(
+                "getIndividual", "runGetIndividual",
+                dataset.getIndividualByIndex(0).getId())
+            break
+    if args.benchmarks is not None:
+        names = set(args.benchmarks.split(","))
+        benchmarks = [
+            selected for selected in benchmarks if selected.name in names]
+    return benchmarks
+
+
+def createDataRepository(args):
+    """
+    Returns the data repository described by the data source URL in the
+    specified arguments, following the same conventions as the server's
+    DATA_SOURCE configuration value.
+    """
+    dataSource = urlparse.urlparse(args.dataSource, "file")
+    if dataSource.scheme == "simulated":
+        kwargs = {}
+        if args.simulatedProfile is not None:
+            kwargs = datarepo.getSimulatedProfile(args.simulatedProfile)
+        repo = datarepo.SimulatedDataRepository(
+            randomSeed=args.randomSeed, **kwargs)
+    else:
+        repo = datarepo.SqlDataRepository(
+            dataSource.netloc + dataSource.path)
+        repo.open(datarepo.MODE_READ)
+    return repo
+
+
+def runBenchmarks(theBackend, benchmarks, repeatLimit, pageLimit):
+    """
+    Runs each of the specified benchmarks repeatLimit times and returns a
+    dictionary mapping benchmark names to their summaries.
+    """
+    results = {}
+    for benchmark in benchmarks:
+        samples = []
+        for _ in range(repeatLimit):
+            samples.extend(benchmark.run(theBackend, pageLimit))
+        results[benchmark.name] = summarise(samples)
+        print("{}: p50 {:.6f}s, {} objects".format(
+            benchmark.name, results[benchmark.name]["p50Seconds"],
+            results[benchmark.name]["objects"]), file=sys.stderr)
+    return results
+
+
+def parseArgs():
     parser = argparse.ArgumentParser(
         description="GA4GH reference server benchmark")
     parser.add_argument(
-        'variantSetId',
-        help="The variant set ID to run the query against")
+        "--dataSource", default="ga4gh-example-data/repo.db",
+        help="The repo DB file to benchmark against, or simulated:// "
+             "for simulated data (default: %(default)s)")
+    parser.add_argument(
+        "--simulatedProfile", default=None,
+        choices=sorted(datarepo.SIMULATED_PROFILES.keys()),
+        help="The size profile to use for simulated data")
+    parser.add_argument(
+        "--randomSeed", type=int, default=0,
+        help="The random seed for simulated data (default: %(default)s)")
     parser.add_argument(
         '--profile', default='none',
         choices=['none', 'heap', 'cpu'],
         help='"heap" runs a heap profiler once inside the backend, '
              '"cpu" runs a cpu profiler.')
     parser.add_argument(
-        '--repeatLimit', type=int, default=3, metavar='N',
+        '--repeatLimit', type=int, default=10, metavar='N',
         help='how many times to run each test case (default: %(default)s)')
     parser.add_argument(
         '--pageLimit', type=int, default=3, metavar='N',
         help='how many pages (max) to load '
              'from each test case (default: %(default)s)')
     parser.add_argument(
-        "--callSetIds", "-c", default=[],
-        help="""Return variant calls which belong to call sets
-            with these IDs. Pass in IDs as a comma separated list (no spaces),
-            or '*' (with the single quotes!) to indicate 'all call sets'.
-            Omit this option to indicate 'no call sets'.
-            """)
-
-    args = parser.parse_args()
+        '--pageSize', type=int, default=100, metavar='N',
+        help='the page size of search requests (default: %(default)s)')
+    parser.add_argument(
+        "--referenceName", default=None,
+        help="The reference to query; defaults to the first reference "
+             "with data")
+    parser.add_argument(
+        "--variantSetName", default=None,
+        help="The name of the variant set to query, such as one with "
+             "thousands of samples; defaults to the first variant set")
+    parser.add_argument(
+        "--featureReferenceName", default=None,
+        help="The reference to query for features, if different")
+    parser.add_argument(
+        "--start", type=int, default=0,
+        help="The start of the region queried (default: %(default)s)")
+    parser.add_argument(
+        "--regionLength", type=int, default=100000,
+        help="The length of the region queried (default: %(default)s)")
+    parser.add_argument(
+        "--windowLength", type=int, default=200,
+        help="The length of the windows requested by the "
+             "randomReferenceBases benchmark (default: %(default)s)")
+    parser.add_argument(
+        "--tileCacheMaxBytes", type=int, default=64 * 1024 * 1024,
+        help="The size of the reference bases tile cache; 0 disables it "
+             "(default: %(default)s)")
+    parser.add_argument(
+        "--benchmarks", default=None,
+        help="Comma separated list of the benchmarks to run; defaults "
+             "to all")
+    parser.add_argument(
+        "--outputFile", "-o", default=None,
+        help="The file to write JSON results to; defaults to stdout")
+    return parser.parse_args()
 
-    registryDb = "ga4gh-example-data/repo.db"
 
+def main():
+    args = parseArgs()
+    references.basesTileCache.setMaxBytes(args.tileCacheMaxBytes)
+    repo = createDataRepository(args)
     if args.profile == 'heap':
-        backendClass = HeapProfilerBackend
-        backend = backendClass(registryDb)
+        theBackend = HeapProfilerBackend(repo)
         args.repeatLimit = 1
         args.pageLimit = 1
     elif args.profile == 'cpu':
-        backendClass = CpuProfilerBackend
-        backend = backendClass(registryDb)
+        theBackend = CpuProfilerBackend(repo)
     else:
-        repo = datarepo.SqlDataRepository(registryDb)
-        repo.open(datarepo.MODE_READ)
-        backend = backend.Backend(repo)
-    # Get our list of callSetids
-    callSetIds = args.callSetIds
-    if callSetIds != []:
-        callSetIds = None
-        if args.callSetIds != "*":
-            callSetIds = args.callSetIds.split(",")
-
-    minTime = benchmarkOneQuery(
-        _heavyQuery(args.variantSetId, callSetIds), args.repeatLimit,
-        args.pageLimit)
-    print(minTime)
+        theBackend = backend.Backend(repo)
+    benchmarks = createBenchmarks(theBackend, args)
+    results = runBenchmarks(
+        theBackend, benchmarks, args.repeatLimit, args.pageLimit)
+    utils.writeBenchmarkResults(
+        results, args.outputFile, dataSource=args.dataSource,
+        simulatedProfile=args.simulatedProfile,
+        repeatLimit=args.repeatLimit, pageLimit=args.pageLimit,
+        pageSize=args.pageSize)
 
     if args.profile == 'cpu':
-        stats = pstats.Stats(backend.profiler)
+        stats = pstats.Stats(theBackend.profiler, stream=sys.stderr)
         stats.sort_stats('time')
         stats.print_stats(.25)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,9 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import argparse
+import datetime
 import functools
+import json
 import os
 import shlex
 import subprocess
@@ -186,6 +188,40 @@ def getYamlDocument(filePath):
         return doc
 
 
+def getGitRevision():
+    """
+    Returns the git revision of the working tree, or None if it cannot
+    be determined.
+    """
+    try:
+        with open(os.devnull, "w") as devnull:
+            return subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def writeBenchmarkResults(results, outputFileName=None, **parameters):
+    """
+    Writes the specified benchmark results as JSON, along with the git
+    revision, the current time and the specified parameters of the run,
+    so that results can be compared across commits. The JSON is written
+    to the file of the specified name, or to stdout if it is None.
+    """
+    output = dict(parameters)
+    output.update({
+        "gitRevision": getGitRevision(),
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "results": results,
+    })
+    outputString = json.dumps(output, indent=2, sort_keys=True)
+    if outputFileName is None:
+        print(outputString)
+    else:
+        with open(outputFileName, "w") as outputFile:
+            outputFile.write(outputString + "\n")
+
+
 class AlignmentFileConstants(object):
     """
     A container class for constants dealing with alignment files
@@ -5,7 +5,9 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import array
 import collections
+import itertools
 import os
 
 import ga4gh.backend as backend
@@ -240,6 +242,36 @@ class ReadGroupSetTest(datadriven.DataDrivenTest):
             self.assertEqual(
                 gaReadGroup.stats.unaligned_read_count, -1)
 
+    def testComputeReadGroupStats(self):
+        # test that the stats counted at ingest match those of every read
+        readGroupSet = self.getDataModelInstance(
+            self._gaObject.getLocalId(), self._dataPath)
+        readGroupSet.computeReadGroupStats()
+        expectedStats = collections.defaultdict(lambda: [0, 0, 0])
+        samFile = pysam.AlignmentFile(self._dataPath)
+        for read in samFile.fetch(until_eof=True):
+            readGroupName = reads.HtslibReadGroupSet.defaultReadGroupName
+            if read.has_tag(b'RG'):
+                readGroupName = read.get_tag(b'RG')
+            for name in set([readGroupName, None]):
+                stats = expectedStats[name]
+                stats[1 if read.is_unmapped else 0] += 1
+                stats[2] += read.query_length
+        samFile.close()
+        gaStats = readGroupSet.toProtocolElement().stats
+        self.assertEqual(
+            [gaStats.aligned_read_count, gaStats.unaligned_read_count,
+             gaStats.base_count],
+            expectedStats[None])
+        for readGroup in readGroupSet.getReadGroups():
+            gaStats = readGroup.toProtocolElement().stats
+            self.assertEqual(
+                [gaStats.aligned_read_count, gaStats.unaligned_read_count,
+                 gaStats.base_count],
+                expectedStats[readGroup.getLocalId()])
+            self.assertEqual(
+                readGroup.getNumBases(), gaStats.base_count)
+
     def testValidateObjects(self):
         # test that validation works on read groups and reads
         readGroupSet = self._gaObject
@@ -300,6 +332,200 @@ class ReadGroupSetTest(datadriven.DataDrivenTest):
                 self.assertGetReadAlignmentsRangeResult(
                     readGroup, reference, begin, begin, 0)
 
+    def testRawReadAlignmentStarts(self):
+        readGroupSet = self._gaObject
+        for readGroup in readGroupSet.getReadGroups():
+            for reference in self._referenceSet.getReferences():
+                for rawReadAlignment in readGroup.getRawReadAlignments(
+                        reference):
+                    gaAlignment = readGroup.convertRawReadAlignment(
+                        rawReadAlignment)
+                    self.assertEqual(
+                        readGroup.getRawReadAlignmentStart(rawReadAlignment),
+                        reads.getReadAlignmentStart(gaAlignment))
+
+    def testGetCoverage(self):
+        readGroupSet = self._gaObject
+        binSize = 17
+        for reference in self._referenceSet.getReferences():
+            referenceName = reference.getLocalId().encode()
+            samReads = [
+                read for read in self._samFile.fetch(referenceName)
+                if not read.is_unmapped]
+            if len(samReads) == 0:
+                continue
+            start = samReads[0].reference_start + 5
+            end = start + 1000
+            self.assertEqual(
+                readGroupSet.getCoverage(reference, start, end, binSize),
+                self._getExpectedCoverage(samReads, start, end, binSize))
+            for readGroup in readGroupSet.getReadGroups():
+                readGroupReads = samReads
+                if readGroup.getLocalId() != readGroupSet.defaultReadGroupName:
+                    readGroupReads = [
+                        read for read in samReads
+                        if dict(read.tags).get('RG') == readGroup.getLocalId()]
+                self.assertEqual(
+                    readGroup.getCoverage(reference, start, end, binSize),
+                    self._getExpectedCoverage(
+                        readGroupReads, start, end, binSize))
+
+    def _getExpectedCoverage(self, samReads, start, end, binSize):
+        # Alignment and sequence (mis)matches, and deletions and skips.
+        aligned = [0, 7, 8]
+        skipped = [2, 3]
+        numBins = (end - start + binSize - 1) // binSize
+        readCounts = [0] * numBins
+        baseCounts = [0] * numBins
+        for read in samReads:
+            if start <= read.reference_start < end:
+                readCounts[(read.reference_start - start) // binSize] += 1
+            position = read.reference_start
+            for operation, length in read.cigartuples:
+                for _ in range(length):
+                    if operation in aligned and start <= position < end:
+                        baseCounts[(position - start) // binSize] += 1
+                    if operation in aligned or operation in skipped:
+                        position += 1
+        return readCounts, baseCounts
+
+    def testGetSummaryBins(self):
+        readGroupSet = self._gaObject
+        binSize = 64
+        for referenceName, length in zip(
+                self._samFile.references, self._samFile.lengths):
+            samReads = [
+                read for read in self._samFile.fetch(referenceName)
+                if not read.is_unmapped]
+            if len(samReads) == 0:
+                continue
+            # Only the bins around the reads are compared.
+            end = max(read.reference_end for read in samReads)
+            numBins = (end + binSize - 1) // binSize
+            values = readGroupSet._getSummaryBins(
+                referenceName, length, binSize)
+            readCounts, baseCounts = self._getExpectedCoverage(
+                samReads, 0, end, binSize)
+            self.assertEqual(
+                list(values["readCount"][:numBins]), readCounts)
+            self.assertEqual(
+                list(values["baseCount"][:numBins]), baseCounts)
+            self.assertEqual(
+                list(values["maxDepth"][:numBins]),
+                self._getExpectedMaxDepths(samReads, end, binSize))
+            self.assertEqual(sum(values["readCount"]), len(samReads))
+
+    def _getExpectedMaxDepths(self, samReads, end, binSize):
+        depths = collections.Counter()
+        for read in samReads:
+            for blockStart, blockEnd in read.get_blocks():
+                for position in range(blockStart, blockEnd):
+                    depths[position] += 1
+        return [
+            max(depths[position] for position in range(
+                binStart, min(end, binStart + binSize)))
+            for binStart in range(0, end, binSize)]
+
+    def testEstimateReadCounts(self):
+        readGroupSet = self._gaObject
+        for reference in self._referenceSet.getReferences():
+            referenceName = reference.getLocalId().encode()
+            length = self._samFile.lengths[
+                self._samFile.gettid(referenceName)]
+            numMappedReads = sum(
+                1 for read in self._samFile.fetch(referenceName)
+                if not read.is_unmapped)
+            estimates = readGroupSet.estimateReadCounts(
+                reference, 0, length, length // 3 + 1)
+            self.assertEqual(len(estimates), 3)
+            self.assertAlmostEqual(sum(estimates), numMappedReads)
+            for readGroup in readGroupSet.getReadGroups():
+                estimates = readGroup.estimateReadCounts(
+                    reference, 0, length, length // 3 + 1)
+                if len(readGroupSet.getReadGroups()) > 1:
+                    self.assertIsNone(estimates)
+                else:
+                    self.assertAlmostEqual(sum(estimates), numMappedReads)
+
+    def testConvertReadAlignmentTags(self):
+        # test that only the requested tags are included in the info
+        readGroupSet = self._gaObject
+        for readGroup in readGroupSet.getReadGroups():
+            for reference in self._referenceSet.getReferences():
+                for rawReadAlignment in readGroup.getRawReadAlignments(
+                        reference):
+                    read = rawReadAlignment[0]
+                    expected = {
+                        key: [str(value)] for key, value in read.tags
+                        if key in ("MD", "NM")}
+                    gaAlignment = readGroup.convertRawReadAlignment(
+                        rawReadAlignment, [b"MD", b"NM", b"ZZ"])
+                    self.assertEqual(
+                        self.getDictFromMessageMap(gaAlignment.info),
+                        expected)
+                    gaAlignment = readGroup.convertRawReadAlignment(
+                        rawReadAlignment, [])
+                    self.assertEqual(len(gaAlignment.info), 0)
+
+    def testConvertReadAlignmentTagTypes(self):
+        # test the encoding of the values of each type of tag
+        read = pysam.AlignedSegment()
+        read.query_name = b"read"
+        read.flag = reads.SamFlags.READ_UNMAPPED
+        read.reference_id = -1
+        read.next_reference_id = -1
+        read.query_sequence = b"ACGT"
+        read.tags = [
+            (b"MD", b"2A1"), (b"NM", 1), (b"XF", 1.5),
+            (b"XB", array.array(b"h", [1, -2, 300])),
+            (b"XC", array.array(b"f", [0.5, 2.25]))]
+        readGroupSet = self._gaObject
+        gaAlignment = readGroupSet.convertReadAlignment(
+            read, readGroupSet, "readGroupId")
+        self.assertEqual(self.getDictFromMessageMap(gaAlignment.info), {
+            "MD": ["2A1"], "NM": ["1"], "XF": ["1.5"], "XB": ["1,-2,300"],
+            "XC": ["0.5,2.25"]})
+        gaAlignment = readGroupSet.convertReadAlignment(
+            read, readGroupSet, "readGroupId", [b"XB"])
+        self.assertEqual(self.getDictFromMessageMap(gaAlignment.info), {
+            "XB": ["1,-2,300"]})
+
+    def testPagesConvertOnlyReturnedReads(self):
+        readGroupSet = self._gaObject
+        for readGroup in readGroupSet.getReadGroups():
+            conversions = []
+            convertReadAlignment = readGroup.convertReadAlignment
+
+            def countingConvertReadAlignment(*args):
+                conversions.append(args[0])
+                return convertReadAlignment(*args)
+            readGroup.convertReadAlignment = countingConvertReadAlignment
+            for reference in self._referenceSet.getReferences():
+                self.assertPagesConvertOnlyReturnedReads(
+                    readGroup, reference, conversions)
+
+    def assertPagesConvertOnlyReturnedReads(
+            self, readGroup, reference, conversions):
+        request = protocol.SearchReadsRequest()
+        request.start = 0
+        request.end = 2**30
+        expected = [
+            gaAlignment for gaAlignment, _ in backend.ReadsIntervalIterator(
+                request, readGroup, reference)]
+        # Resume from the page token after every few reads.
+        pageSize = 3
+        del conversions[:]
+        gaAlignments = []
+        while True:
+            pairs = list(itertools.islice(backend.ReadsIntervalIterator(
+                request, readGroup, reference), pageSize))
+            gaAlignments.extend(gaAlignment for gaAlignment, _ in pairs)
+            if len(pairs) < pageSize or pairs[-1][1] is None:
+                break
+            request.page_token = pairs[-1][1]
+        self.assertEqual(gaAlignments, expected)
+        self.assertEqual(len(conversions), len(gaAlignments))
+
     def assertGetReadAlignmentsRangeResult(
             self, readGroup, reference, start, end, result):
         alignments = list(readGroup.getReadAlignments(reference, start, end))
@@ -312,6 +538,11 @@ class ReadGroupSetTest(datadriven.DataDrivenTest):
             self.assertAlignmentsEqual(
                 gaAlignment, pysamAlignment, readGroupInfo)
 
+    def getTagValueString(self, value):
+        if isinstance(value, array.array):
+            return ",".join(str(item) for item in value)
+        return str(value)
+
     def getDictFromMessageMap(self, messageMap):
         return dict([
             (k, [protocol.getValueFromValue(x) for x in v.values])
@@ -364,7 +595,8 @@ class ReadGroupSetTest(datadriven.DataDrivenTest):
         self.assertEqual(gaAlignment.id, str(compoundId))
         self.assertEqual(
             self.getDictFromMessageMap(gaAlignment.info),
-            {key: [str(value)] for key, value in pysamAlignment.tags})
+            {key: [self.getTagValueString(value)]
+             for key, value in pysamAlignment.tags})
         if reads.SamFlags.isFlagSet(
                 pysamAlignment.flag, reads.SamFlags.MATE_UNMAPPED):
             self.assertEqual(0, gaAlignment.next_mate_position.ByteSize())
@@ -5,11 +5,14 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import itertools
+
 import ga4gh.datarepo as datarepo
 import ga4gh.datamodel as datamodel
 import ga4gh.datamodel.datasets as datasets
 import ga4gh.datamodel.references as references
 import ga4gh.datamodel.sequenceAnnotations as sequenceAnnotations
+import ga4gh.exceptions as exceptions
 import ga4gh.protocol as protocol
 import tests.datadriven as datadriven
 import tests.paths as paths
@@ -158,6 +161,25 @@ class FeatureSetTests(datadriven.DataDrivenTest):
             feature.strand,
             self._testData["sampleStrand"])
 
+    def testGetFeaturesByIds(self):
+        expectedFeatures = [
+            feature for feature, _ in self._gaObject.getFeatures(
+                self._testData["referenceName"],
+                self._testData["region"][0],
+                self._testData["region"][1],
+                None, 1000)]
+        expectedFeatures = expectedFeatures[::-1] + expectedFeatures[-1:]
+        compoundIds = [
+            datamodel.FeatureCompoundId.parse(feature.id)
+            for feature in expectedFeatures]
+        features = self._gaObject.getFeaturesByIds(compoundIds)
+        self.assertEqual(features, expectedFeatures)
+        badCompoundId = datamodel.FeatureCompoundId.parse(str(compoundIds[0]))
+        badCompoundId.featureId = "123456789"
+        self.assertRaises(
+            exceptions.ObjectWithIdNotFoundException,
+            self._gaObject.getFeaturesByIds, compoundIds + [badCompoundId])
+
     def testFetchAllFeaturesInRegion(self):
         features = []
         nextPageTokens = []
@@ -183,6 +205,66 @@ class FeatureSetTests(datadriven.DataDrivenTest):
         self.assertEqual(len(features),
                          self._testData["featuresWithOntology"])
 
+    def _getLocalId(self, feature):
+        return long(datamodel.FeatureCompoundId.parse(feature.id).featureId)
+
+    def _getSortedSubtrees(self, features):
+        # Each feature followed by its descendants, depth first, with
+        # siblings ordered by start, end and ID.
+        subtrees = []
+        for feature in sorted(features, key=lambda feature: (
+                feature.start, feature.end, self._getLocalId(feature))):
+            subtrees.append(feature)
+            children = [
+                child for child, _ in self._gaObject.getFeatures(
+                    self._testData["referenceName"],
+                    self._testData["region"][0],
+                    self._testData["region"][1],
+                    None, 1000, parentId=str(self._getLocalId(feature)))]
+            subtrees.extend(self._getSortedSubtrees(children))
+        return subtrees
+
+    def _getFeaturesIncludingDescendants(self, pageSize, **kwargs):
+        features = []
+        pageToken = None
+        while True:
+            page = list(itertools.islice(self._gaObject.getFeatures(
+                self._testData["referenceName"],
+                self._testData["region"][0],
+                self._testData["region"][1],
+                pageToken, pageSize, includeDescendants=True, **kwargs),
+                pageSize))
+            features.extend(feature for feature, _ in page)
+            if len(page) == 0 or page[-1][1] is None:
+                return features
+            pageToken = page[-1][1]
+
+    def testFetchFeaturesIncludingDescendants(self):
+        featureTypes = self._testData["ontologyRestriction"]
+        roots = [
+            feature for feature, _ in self._gaObject.getFeatures(
+                self._testData["referenceName"],
+                self._testData["region"][0],
+                self._testData["region"][1],
+                None, 1000, featureTypes=featureTypes)]
+        expectedFeatures = self._getSortedSubtrees(roots)
+        for pageSize in [1, 7, 1000]:
+            features = self._getFeaturesIncludingDescendants(
+                pageSize, featureTypes=featureTypes)
+            self.assertEqual(features, expectedFeatures)
+
+    def testFetchAllFeaturesIncludingDescendants(self):
+        # Features descending from other matching features only appear
+        # once, in the subtree of their topmost matching ancestor.
+        features = self._getFeaturesIncludingDescendants(1000)
+        self.assertEqual(len(features), self._testData["totalFeatures"])
+        seenIds = set()
+        for feature in features:
+            self.assertNotIn(feature.id, seenIds)
+            if feature.parent_id in [gaFeature.id for gaFeature in features]:
+                self.assertIn(feature.parent_id, seenIds)
+            seenIds.add(feature.id)
+
     def testFetchFeaturesRestrictedByParent(self):
         parentId = ""
         if self._testData["sampleParentId"] is not None:
@@ -8,9 +8,12 @@ from __future__ import unicode_literals
 import os
 import glob
 import hashlib
+import itertools
+import multiprocessing.pool
 
 import vcf
 
+import ga4gh.backend as backend
 import ga4gh.datamodel as datamodel
 import ga4gh.datamodel.datasets as datasets
 import ga4gh.datamodel.references as references
@@ -229,6 +232,69 @@ class VariantSetTest(datadriven.DataDrivenTest):
         for sampleIds in utils.powerset(self.vcfSamples, maxSets=10):
             self._verifyVariantsCallSetIds(list(sampleIds))
 
+    def testGetVariantsByIds(self):
+        end = datamodel.PysamDatamodelMixin.vcfMax
+        callSetIds = [
+            callSet.getId() for callSet in self._gaObject.getCallSets()]
+        expectedVariants = []
+        for referenceName in sorted(self._reference_names):
+            expectedVariants.extend(self._gaObject.getVariants(
+                referenceName, 0, end, callSetIds))
+        # Request the variants in reverse, with the first one repeated.
+        expectedVariants = expectedVariants[::-1] + expectedVariants[-1:]
+        compoundIds = [
+            datamodel.VariantCompoundId.parse(variant.id)
+            for variant in expectedVariants]
+        gaVariants = self._gaObject.getVariantsByIds(compoundIds)
+        self.assertEqual(gaVariants, expectedVariants)
+        badCompoundId = datamodel.VariantCompoundId.parse(str(compoundIds[0]))
+        badCompoundId.md5 = "0" * 32
+        self.assertRaises(
+            exceptions.ObjectNotFoundException,
+            self._gaObject.getVariantsByIds, compoundIds + [badCompoundId])
+
+    def testSearchRegions(self):
+        # Split each reference into windows, and search them together
+        # with the start of the first reference repeated at the end.
+        end = datamodel.PysamDatamodelMixin.vcfMax
+        callSetIds = [
+            callSet.getId() for callSet in self._gaObject.getCallSets()[:2]]
+        regionRequests = []
+        expectedVariants = []
+        for referenceName in sorted(self._reference_names):
+            variants = list(self._gaObject.getVariants(referenceName, 0, end))
+            starts = sorted(set(variant.start for variant in variants))
+            bounds = [0] + starts[1::3] + [end]
+            for start, end_ in zip(bounds, bounds[1:]) + [(0, bounds[1])]:
+                request = protocol.SearchVariantsRequest()
+                request.reference_name = referenceName
+                request.start, request.end = start, end_
+                request.call_set_ids.extend(callSetIds)
+                regionRequests.append(request)
+                expectedVariants.extend(self._gaObject.getVariants(
+                    referenceName, start, end_, callSetIds))
+        threadPool = multiprocessing.pool.ThreadPool(3)
+        try:
+            for pageSize in [10, len(expectedVariants) + 1]:
+                request = protocol.SearchVariantsRequest()
+                request.page_size = pageSize
+                gaVariants = []
+                while True:
+                    iterator = backend.VariantRegionsIterator(
+                        request, regionRequests, self._gaObject, threadPool,
+                        3)
+                    page = list(itertools.islice(iterator, pageSize))
+                    gaVariants.extend(variant for variant, _ in page)
+                    if len(page) == 0 or page[-1][1] is None:
+                        break
+                    request.page_token = page[-1][1]
+                self.assertEqual(
+                    [variant.id for variant in gaVariants],
+                    [variant.id for variant in expectedVariants])
+        finally:
+            threadPool.close()
+            threadPool.join()
+
     def testVariantsValid(self):
         end = datamodel.PysamDatamodelMixin.vcfMax
         for reference_name in self._reference_names:
@@ -467,6 +533,48 @@ class VariantSetTest(datadriven.DataDrivenTest):
                 with self.assertRaises(exceptions.ObjectNotFoundException):
                     variantSet.getVariant(compoundId)
 
+    def testHashPysamVariant(self):
+        variantSet = self._gaObject
+        end = datamodel.PysamDatamodelMixin.vcfMax
+        for referenceName in self._reference_names:
+            for record in variantSet.getPysamVariants(referenceName, 0, end):
+                variant = variantSet.convertVariant(record, [])
+                self.assertEqual(
+                    variantSet.hashPysamVariant(record),
+                    variantSet.hashVariant(variant))
+
+    def testPagesConvertOnlyReturnedVariants(self):
+        variantSet = self._gaObject
+        conversions = []
+        convertVariant = variantSet.convertVariant
+
+        def countingConvertVariant(record, callSetIds):
+            conversions.append(record)
+            return convertVariant(record, callSetIds)
+        variantSet.convertVariant = countingConvertVariant
+        callSetIds = [
+            callSet.getId() for callSet in variantSet.getCallSets()[:2]]
+        for referenceName in self._reference_names:
+            request = protocol.SearchVariantsRequest()
+            request.reference_name = referenceName
+            request.end = datamodel.PysamDatamodelMixin.vcfMax
+            request.call_set_ids.extend(callSetIds)
+            expectedVariants = list(variantSet.getVariants(
+                referenceName, 0, request.end, callSetIds))
+            # Resume from the page token after every few variants.
+            pageSize = 3
+            del conversions[:]
+            gaVariants = []
+            while True:
+                page = list(itertools.islice(backend.VariantsIntervalIterator(
+                    request, variantSet), pageSize))
+                gaVariants.extend(variant for variant, _ in page)
+                if len(page) < pageSize or page[-1][1] is None:
+                    break
+                request.page_token = page[-1][1]
+            self.assertEqual(gaVariants, expectedVariants)
+            self.assertEqual(len(conversions), len(gaVariants))
+
     def _hashVariant(self, record):
         if record.ALT[0] is None:
             alts = tuple()
@@ -7,13 +7,21 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import glob
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
 import ga4gh.exceptions as exceptions
 import ga4gh.backend as backend
 import ga4gh.datarepo as datarepo
 import ga4gh.datamodel.datasets as datasets
+import ga4gh.datamodel.reads as reads
 import ga4gh.datamodel.references as references
+import ga4gh.datamodel.variants as variants
+import ga4gh.protocol as protocol
 
 import tests.paths as paths
 
@@ -177,6 +185,227 @@ class TestSqlRepoTestData(unittest.TestCase):
             self.assertEqual(self._dataRepo.getReferenceSetByName(name), rs)
 
 
+class TestReadsCoverage(unittest.TestCase):
+    """
+    Tests the read coverage requests on the read group sets of the SQL
+    repo in the tests/data directory.
+    """
+    def setUp(self):
+        dataRepo = datarepo.SqlDataRepository(paths.testDataRepo)
+        dataRepo.open(datarepo.MODE_READ)
+        self._backend = backend.Backend(dataRepo)
+        dataset = dataRepo.getDatasetByIndex(0)
+        self._readGroupSet = dataset.getReadGroupSetByName("HG00096")
+        self._reference = \
+            self._readGroupSet.getReferenceSet().getReferenceByName("1")
+        self._length = 249250621
+
+    def _runCoverage(self, **fields):
+        request = {
+            "readGroupIds": self._readGroupSet.getReadGroupIds(),
+            "referenceId": self._reference.getId(),
+            "end": self._length,
+        }
+        request.update(fields)
+        return json.loads(self._backend.runReadsCoverage(json.dumps(request)))
+
+    def testExactCoverage(self):
+        readCounts, baseCounts = self._readGroupSet.getCoverage(
+            self._reference, 0, self._length, 10 ** 7)
+        for threads in [1, 4]:
+            self._backend.setRegionSearchThreads(threads)
+            response = self._runCoverage(binSize=10 ** 7, exact=True)
+            self.assertFalse(response["estimated"])
+            self.assertEqual(response["end"], self._length)
+            self.assertEqual(response["readCounts"], readCounts)
+            self.assertEqual(len(response["meanDepths"]), 25)
+            self.assertAlmostEqual(
+                sum(response["meanDepths"]) * 10 ** 7, sum(baseCounts))
+        self.assertEqual(sum(readCounts), self._readGroupSet.getStats(
+            ).aligned_read_count)
+
+    def testEstimatedCoverage(self):
+        response = self._runCoverage(binSize=10 ** 7)
+        self.assertTrue(response["estimated"])
+        self.assertNotIn("meanDepths", response)
+        self.assertEqual(len(response["readCounts"]), 25)
+        self.assertEqual(
+            sum(response["readCounts"]),
+            self._readGroupSet.getStats().aligned_read_count)
+        # Small bins and single read groups of a set are never estimated.
+        response = self._runCoverage(binSize=1000, end=10 ** 6)
+        self.assertFalse(response["estimated"])
+        readGroupId = self._readGroupSet.getReadGroupIds()[0]
+        response = self._runCoverage(
+            binSize=10 ** 7, readGroupIds=[readGroupId])
+        self.assertFalse(response["estimated"])
+
+    def testBadRequests(self):
+        self._backend.setMaxCoverageBins(10)
+        for fields in [
+                {"binSize": 0}, {"binSize": "x"}, {"binSize": 1.5},
+                {"binSize": 10 ** 7}, {"binSize": 10 ** 8, "exact": 1}]:
+            self.assertRaises(
+                exceptions.BadCoverageRequestException,
+                self._runCoverage, **fields)
+        self.assertRaises(
+            exceptions.InvalidJsonException,
+            self._backend.runReadsCoverage, json.dumps({"x": 1}))
+        self.assertRaises(
+            exceptions.ReferenceRangeErrorException,
+            self._runCoverage, binSize=10, start=20, end=10)
+
+
+class TestSearchReadsTags(unittest.TestCase):
+    """
+    Tests the projection of the tags of reads in searches of the SQL
+    repo in the tests/data directory.
+    """
+    def setUp(self):
+        dataRepo = datarepo.SqlDataRepository(paths.testDataRepo)
+        dataRepo.open(datarepo.MODE_READ)
+        self._backend = backend.Backend(dataRepo)
+        dataset = dataRepo.getDatasetByIndex(0)
+        self._readGroupSet = dataset.getReadGroupSetByName("HG00096")
+        self._reference = \
+            self._readGroupSet.getReferenceSet().getReferenceByName("1")
+
+    def _searchReads(self, **fields):
+        request = {
+            "readGroupIds": self._readGroupSet.getReadGroupIds(),
+            "referenceId": self._reference.getId(),
+            "end": 249250621,
+        }
+        request.update(fields)
+        response = protocol.fromJson(
+            self._backend.runSearchReads(json.dumps(request)),
+            protocol.SearchReadsResponse)
+        return response.alignments
+
+    def testTags(self):
+        alignments = self._searchReads()
+        self.assertGreater(len(alignments), 0)
+        for alignment, projected in zip(
+                alignments, self._searchReads(tags=["MD", "RG", "ZZ"])):
+            self.assertEqual(alignment.id, projected.id)
+            self.assertEqual(sorted(projected.info), ["MD", "RG"])
+            for key in projected.info:
+                self.assertEqual(projected.info[key], alignment.info[key])
+        for alignment in self._searchReads(tags=[]):
+            self.assertEqual(len(alignment.info), 0)
+
+    def testBadTags(self):
+        for tags in ["MD", ["MDX"], [1], {"MD": 1}]:
+            self.assertRaises(
+                exceptions.InvalidJsonException, self._searchReads,
+                tags=tags)
+
+
+class TestSummaries(unittest.TestCase):
+    """
+    Tests the summary requests on copies of a BAM file and a directory of
+    VCF files, with summary tiles written next to them.
+    """
+    def setUp(self):
+        self._tempDir = tempfile.mkdtemp(prefix="ga4gh_summary_test")
+        bamFile = os.path.join(self._tempDir, "reads.bam")
+        shutil.copyfile(paths.bamPath, bamFile)
+        shutil.copyfile(paths.bamIndexPath, bamFile + ".bai")
+        for fileName in glob.glob(os.path.join(paths.vcfDirPath, "*.vcf.gz*")):
+            shutil.copy(fileName, self._tempDir)
+        dataRepo = datarepo.AbstractDataRepository()
+        dataset = datasets.Dataset("dataset")
+        dataRepo.addDataset(dataset)
+        self._readGroupSet = reads.HtslibReadGroupSet(dataset, "rgs")
+        self._readGroupSet.populateFromFile(bamFile)
+        dataset.addReadGroupSet(self._readGroupSet)
+        self._variantSet = variants.HtslibVariantSet(dataset, "vs")
+        self._variantSet.populateFromDirectory(self._tempDir)
+        dataset.addVariantSet(self._variantSet)
+        self._backend = backend.Backend(dataRepo)
+
+    def tearDown(self):
+        shutil.rmtree(self._tempDir)
+
+    def _runReadsSummary(self, **fields):
+        request = {
+            "readGroupSetId": self._readGroupSet.getId(),
+            "referenceName": "chr17",
+        }
+        request.update(fields)
+        return json.loads(self._backend.runReadsSummary(json.dumps(request)))
+
+    def testNoSummaryTiles(self):
+        self.assertRaises(
+            exceptions.SummaryTilesNotFoundException,
+            self._runReadsSummary, binSize=16)
+
+    def testReadsSummary(self):
+        self._readGroupSet.writeSummaryTiles(baseBinSize=16)
+        referenceSet = references.AbstractReferenceSet("referenceSet")
+        reference = references.AbstractReference(referenceSet, "chr17")
+        length = 599
+        readCounts, baseCounts = self._readGroupSet.getCoverage(
+            reference, 0, length, 64)
+        response = self._runReadsSummary(binSize=100)
+        self.assertEqual(response["binSize"], 64)
+        self.assertEqual(response["start"], 0)
+        self.assertEqual(response["end"], length)
+        self.assertEqual(response["readCounts"], readCounts)
+        self.assertEqual(len(response["meanDepths"]), len(baseCounts))
+        self.assertAlmostEqual(
+            sum(response["meanDepths"][:-1]) * 64 +
+            response["meanDepths"][-1] * (length - 576), sum(baseCounts))
+        self.assertEqual(len(response["maxDepths"]), len(baseCounts))
+        self.assertTrue(all(
+            maxDepth >= meanDepth for maxDepth, meanDepth in zip(
+                response["maxDepths"], response["meanDepths"])))
+        # The returned bins cover the requested region.
+        response = self._runReadsSummary(binSize=16, start=100, end=130)
+        self.assertEqual(response["start"], 96)
+        self.assertEqual(response["end"], 144)
+        self.assertEqual(len(response["readCounts"]), 3)
+        # Coarser bins are returned rather than too many.
+        self._backend.setMaxCoverageBins(5)
+        response = self._runReadsSummary(binSize=16)
+        self.assertEqual(response["binSize"], 256)
+        self.assertEqual(sum(response["readCounts"]), sum(readCounts))
+
+    def testVariantsSummary(self):
+        self._variantSet.writeSummaryTiles()
+        request = {"variantSetId": self._variantSet.getId(),
+                   "referenceName": "1", "binSize": 10 ** 9}
+        response = json.loads(
+            self._backend.runVariantsSummary(json.dumps(request)))
+        numVariants = sum(
+            1 for _ in self._variantSet.getPysamVariants("1", None, None))
+        self.assertEqual(response["variantCounts"], [numVariants])
+        self.assertEqual(response["start"], 0)
+
+    def testBadRequests(self):
+        self._readGroupSet.writeSummaryTiles(baseBinSize=16)
+        for fields in [
+                {"binSize": 0}, {"binSize": "x"}, {"binSize": 1.5},
+                {"binSize": 10, "start": -1}, {"binSize": 10, "end": True},
+                {"binSize": 10, "referenceName": 17},
+                {"binSize": 10, "other": 1}]:
+            self.assertRaises(
+                exceptions.BadSummaryRequestException,
+                self._runReadsSummary, **fields)
+        self.assertRaises(
+            exceptions.InvalidJsonException,
+            self._backend.runReadsSummary, json.dumps({"binSize": 1}))
+        self.assertRaises(
+            exceptions.ReferenceNameNotFoundException,
+            self._runReadsSummary, binSize=10, referenceName="chr1")
+        self.assertRaises(
+            exceptions.ReferenceRangeErrorException,
+            self._runReadsSummary, binSize=10, start=20, end=10)
+        self.assertRaises(
+            exceptions.ReferenceRangeErrorException,
+            self._runReadsSummary, binSize=10, start=600)
+
+
 class TestTopLevelObjectGenerator(unittest.TestCase):
     """
     Tests the generator used for top level objects
@@ -12,6 +12,7 @@ import shlex
 
 import ga4gh.cli as cli
 import ga4gh.protocol as protocol
+import ga4gh.summaryTiles as summaryTiles
 import google.protobuf.descriptor as descriptor
 import google.protobuf.internal.python_message as python_message
 
@@ -426,6 +427,18 @@ class TestRepoManagerCli(unittest.TestCase):
         self.assertEquals(args.runner, "removeReadGroupSet")
         self.assertEquals(args.force, True)
 
+    def testSummariseReadGroupSet(self):
+        readGroupSetName = "readGroupSetName"
+        cliInput = "summarise-readgroupset {} {} {} --summaryBinSize 64"
+        cliInput = cliInput.format(
+            self.registryPath, self.datasetName, readGroupSetName)
+        args = self.parser.parse_args(cliInput.split())
+        self.assertEquals(args.registryPath, self.registryPath)
+        self.assertEquals(args.datasetName, self.datasetName)
+        self.assertEquals(args.readGroupSetName, readGroupSetName)
+        self.assertEquals(args.summaryBinSize, 64)
+        self.assertEquals(args.runner, "summariseReadGroupSet")
+
     def testAddVariantSet(self):
         cliInput = "add-variantset {} {} {} ".format(
             self.registryPath, self.datasetName, self.filePath)
@@ -462,6 +475,18 @@ class TestRepoManagerCli(unittest.TestCase):
         self.assertEquals(args.runner, "removeVariantSet")
         self.assertEquals(args.force, False)
 
+    def testSummariseVariantSet(self):
+        variantSetName = "variantSetName"
+        cliInput = "summarise-variantset {} {} {}".format(
+            self.registryPath, self.datasetName, variantSetName)
+        args = self.parser.parse_args(cliInput.split())
+        self.assertEquals(args.registryPath, self.registryPath)
+        self.assertEquals(args.datasetName, self.datasetName)
+        self.assertEquals(args.variantSetName, variantSetName)
+        self.assertEquals(
+            args.summaryBinSize, summaryTiles.DEFAULT_BASE_BIN_SIZE)
+        self.assertEquals(args.runner, "summariseVariantSet")
+
     def testAddOntology(self):
         cliInput = "add-ontology {} {}".format(
             self.registryPath, self.filePath)
@@ -293,6 +293,18 @@ class DummyResponse(object):
         self.status_code = 200
 
 
+class DummyStreamResponse(object):
+    """
+    Stand in for a streamed requests Response object.
+    """
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.status_code = 200
+
+    def iter_content(self, chunkSize):
+        return self._chunks
+
+
 class DummyRequestsSession(object):
     """
     Takes the place of a requests session so that we can check that all
@@ -326,7 +338,7 @@ class DummyRequestsSession(object):
         assert contentType in self.headers
         assert self.headers[contentType] == "application/json"
 
-    def get(self, url, params):
+    def get(self, url, params, headers=None, stream=False):
         # TODO add some more checks for params to see if Key is set,
         # and we're not sending any extra stuff.
         self.checkSessionParameters()
@@ -334,6 +346,13 @@ class DummyRequestsSession(object):
         suffix = url[len(self._urlPrefix):]
         basesSuffix = "/bases"
         splits = suffix.split("/")
+        if stream:
+            assert headers == {"Accept": "text/plain"}
+            assert suffix.endswith(basesSuffix)
+            reference, start, end = self._backend.getReferenceBasesWindow(
+                splits[2], params)
+            return DummyStreamResponse(
+                self._backend.generateReferenceBases(reference, start, end))
         if suffix.endswith(basesSuffix):
             # ListReferenceBases is an oddball and needs to be treated
             # separately.
@@ -437,6 +456,18 @@ class ExhaustiveListingsMixin(object):
                     0, datamodelReference.getLength())
                 self.assertEqual(bases, otherBases)
 
+    def testAllReferenceBasesStreams(self):
+        for referenceSet in self.dataRepo.getReferenceSets():
+            for reference in referenceSet.getReferences():
+                length = reference.getLength()
+                bases = reference.getBases(0, length)
+                self.assertEqual(
+                    "".join(self.client.generateReferenceBases(
+                        reference.getId())), bases)
+                self.assertEqual(
+                    "".join(self.client.generateReferenceBases(
+                        reference.getId(), 1, length - 1)), bases[1:-1])
+
     def testAllVariantSets(self):
         for dataset in self.client.searchDatasets():
             variantSets = list(self.client.searchVariantSets(dataset.id))
@@ -453,13 +484,18 @@ class ExhaustiveListingsMixin(object):
                 start = 0
                 end = 20
                 referenceName = "fixme"
+                # Variants fetched by ID hold every call, so request them
+                # all in the search.
+                callSetIds = [
+                    callSet.getId()
+                    for callSet in datamodelVariantSet.getCallSets()]
                 variants = list(self.client.searchVariants(
                     datamodelVariantSet.getId(), start=start, end=end,
-                    referenceName=referenceName))
+                    referenceName=referenceName, callSetIds=callSetIds))
                 datamodelVariants = [
                     DatamodelObjectWrapper(variant) for variant in
                     datamodelVariantSet.getVariants(
-                        referenceName, start, end)]
+                        referenceName, start, end, callSetIds)]
                 self.verifyObjectList(
                     variants, datamodelVariants, self.client.getVariant)
 
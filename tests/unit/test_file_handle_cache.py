@@ -9,6 +9,7 @@ from __future__ import unicode_literals
 import os
 import shutil
 import tempfile
+import threading
 import unittest
 import uuid
 
@@ -64,3 +65,39 @@ class TestFileHandleCache(datamodel.PysamFileHandleCache, unittest.TestCase):
 
     def tearDown(self):
         shutil.rmtree(self._tempdir)
+
+
+class TestPrivateFileHandles(unittest.TestCase):
+    """
+    Tests that file handles opened within PrivateFileHandles are not
+    shared with other threads, and are closed on exit.
+    """
+    class FileDatamodelObject(datamodel.PysamDatamodelMixin):
+        def openFile(self, dataFile):
+            return open(dataFile)
+
+    def setUp(self):
+        fd, self._dataFile = tempfile.mkstemp(prefix="ga4gh_file_cache")
+        os.close(fd)
+        self._datamodelObject = self.FileDatamodelObject()
+
+    def tearDown(self):
+        os.unlink(self._dataFile)
+
+    def testPrivateFileHandles(self):
+        sharedHandle = self._datamodelObject.getFileHandle(self._dataFile)
+        with datamodel.PrivateFileHandles():
+            handle = self._datamodelObject.getFileHandle(self._dataFile)
+            self.assertIsNot(handle, sharedHandle)
+            self.assertIs(
+                self._datamodelObject.getFileHandle(self._dataFile), handle)
+            otherHandles = []
+            thread = threading.Thread(target=lambda: otherHandles.append(
+                self._datamodelObject.getFileHandle(self._dataFile)))
+            thread.start()
+            thread.join()
+            self.assertIs(otherHandles[0], sharedHandle)
+        self.assertTrue(handle.closed)
+        self.assertFalse(sharedHandle.closed)
+        self.assertIs(
+            self._datamodelObject.getFileHandle(self._dataFile), sharedHandle)
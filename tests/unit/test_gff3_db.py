@@ -0,0 +1,142 @@
+"""
+Unit tests for writing feature databases from GFF3 files.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import ga4gh.datamodel.sequenceAnnotations as sequenceAnnotations
+import ga4gh.gff3Db as gff3Db
+import ga4gh.gff3Parser as gff3Parser
+
+_testDataDir = "tests/data/datasets/dataset1/sequenceAnnotations/"
+
+
+def _featureKey(seqname, start, end, type_, name):
+    return (seqname, start, end, type_, name)
+
+
+class TestWriteGff3Db(unittest.TestCase):
+    """
+    Tests that the streamed feature databases link the same features
+    as the in-memory Gff3Set.
+    """
+    def setUp(self):
+        self._directory = tempfile.mkdtemp(prefix="ga4gh_gff3db")
+        self._dbFile = os.path.join(self._directory, "features.db")
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _getParsedLinks(self, gff3File):
+        gff3Set = gff3Parser.Gff3Parser(gff3File).parse()
+        links = set()
+        for features in gff3Set.byFeatureName.values():
+            for feature in features:
+                links.add((
+                    _featureKey(
+                        feature.seqname, feature.start, feature.end,
+                        feature.type, feature.featureName),
+                    frozenset(
+                        parent.featureName for parent in feature.parents),
+                    frozenset(_featureKey(
+                        child.seqname, child.start, child.end, child.type,
+                        child.featureName) for child in feature.children)))
+        return links
+
+    def _getDbLinks(self):
+        dbconn = sqlite3.connect(self._dbFile)
+        rows = dbconn.execute(
+            "SELECT id, parent_id, child_ids, reference_name, start, end, "
+            "type, name FROM FEATURE").fetchall()
+        dbconn.close()
+        keys = dict((row[0], _featureKey(*row[3:])) for row in rows)
+        links = set()
+        for row in rows:
+            parentNames = frozenset()
+            if row[1] != '':
+                parentNames = frozenset([keys[row[1]][-1]])
+            links.add((
+                keys[row[0]], parentNames,
+                frozenset(keys[childId] for childId in json.loads(row[2]))))
+        return links, len(rows)
+
+    def testLinksMatchParser(self):
+        for fileName in [
+                "gencodeV21Set1.gff3", "discontinuous.gff3",
+                "sacCerTest.gff3", "specialCasesTest.gff3"]:
+            gff3File = _testDataDir + fileName
+            numFeatures = sum(
+                1 for _ in gff3Parser.Gff3Parser(gff3File).generateFeatures())
+            # A tiny batch so that the records span many batches.
+            gff3Db.writeGff3Db(gff3File, self._dbFile, batchSize=7)
+            dbLinks, numRows = self._getDbLinks()
+            self.assertEqual(numRows, numFeatures)
+            # The database stores only the first parent of each feature,
+            # so features with several parents are not compared.
+            parsedLinks = set(
+                link for link in self._getParsedLinks(gff3File)
+                if len(link[1]) <= 1)
+            self.assertTrue(parsedLinks.issubset(dbLinks))
+            os.unlink(self._dbFile)
+
+    def testFeatureIdsMatchParser(self):
+        gff3File = _testDataDir + "discontinuous.gff3"
+        gff3Set = gff3Parser.Gff3Parser(gff3File).parse()
+        parsedKeys = dict(
+            (feature.uniqueId, _featureKey(
+                feature.seqname, feature.start, feature.end, feature.type,
+                feature.featureName))
+            for feature in gff3Set.features)
+        dumps = []
+        for _ in range(2):
+            gff3Db.writeGff3Db(gff3File, self._dbFile)
+            dbconn = sqlite3.connect(self._dbFile)
+            rows = dbconn.execute(
+                "SELECT * FROM FEATURE ORDER BY id").fetchall()
+            dbconn.close()
+            os.unlink(self._dbFile)
+            dbKeys = dict((row[0], _featureKey(
+                row[3], row[6], row[7], row[5], row[10])) for row in rows)
+            self.assertEqual(dbKeys, parsedKeys)
+            dumps.append(rows)
+        self.assertEqual(dumps[0], dumps[1])
+
+    def testIndexesCreated(self):
+        gff3Db.writeGff3Db(
+            _testDataDir + "gencodeV21Set1.gff3", self._dbFile)
+        dbconn = sqlite3.connect(self._dbFile)
+        indexNames = set(row[0] for row in dbconn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"))
+        dbconn.close()
+        self.assertEqual(
+            indexNames,
+            set(name for name, _ in sequenceAnnotations.FEATURE_INDEXES))
+
+    def testMissingParent(self):
+        gff3File = os.path.join(self._directory, "missingParent.gff3")
+        with open(gff3File, "w") as gff3Out:
+            gff3Out.write(
+                "##gff-version 3\n"
+                "chr1\ttest\tgene\t1\t100\t.\t+\t.\tID=gene1\n"
+                "chr1\ttest\tmRNA\t1\t100\t.\t+\t.\tID=mRNA1;Parent=gene2\n")
+        self.assertRaises(
+            gff3Parser.GFF3Exception, gff3Db.writeGff3Db, gff3File,
+            self._dbFile)
+        self.assertFalse(os.path.exists(self._dbFile))
+
+    def testExistingFileKept(self):
+        with open(self._dbFile, "w") as dbFile:
+            dbFile.write("existing")
+        self.assertRaises(
+            OSError, gff3Db.writeGff3Db,
+            _testDataDir + "gencodeV21Set1.gff3", self._dbFile)
+        with open(self._dbFile) as dbFile:
+            self.assertEqual(dbFile.read(), "existing")
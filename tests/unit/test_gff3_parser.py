@@ -5,9 +5,16 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import ga4gh.gff3Parser as gff3
+import gzip
+import os
+import shutil
+import tempfile
 import unittest
 
+import pysam
+
+import ga4gh.gff3Parser as gff3
+
 _testDataDir = "tests/data/datasets/dataset1/sequenceAnnotations/"
 
 
@@ -55,6 +62,34 @@ class TestGff3ParserOnTypicalFile(unittest.TestCase):
             len(badFeat), 0,
             "invalid feature ID returned valid object")
 
+    def testLinksAreConsistent(self):
+        features = self.gff3Data.features
+        for index, feature in enumerate(features):
+            self.assertEqual(feature.index, index)
+            for child in feature.children:
+                self.assertIn(feature, child.parents)
+            for parent in feature.parents:
+                self.assertIn(feature, parent.children)
+            self.assertEqual(
+                len(feature.children), len(feature.childIndices or []))
+
+    def testUniqueIdsAreDenseAndStable(self):
+        features = self.gff3Data.features
+        uniqueIds = [feature.uniqueId for feature in features]
+        self.assertEqual(sorted(uniqueIds), range(1, len(features) + 1))
+        reparsed = gff3.Gff3Parser(self.gff3Parser.fileName).parse()
+        self.assertEqual(
+            [feature.uniqueId for feature in reparsed.features], uniqueIds)
+        byUniqueId = sorted(features, key=lambda feature: feature.uniqueId)
+        for feature, nextFeature in zip(byUniqueId, byUniqueId[1:]):
+            self.assertLessEqual(
+                (feature.seqname, feature.start),
+                (nextFeature.seqname, nextFeature.start))
+
+    def testFeaturesHaveNoDict(self):
+        for feature in self.gff3Data.features:
+            self.assertFalse(hasattr(feature, "__dict__"))
+
     def testAllChildrenFeaturesArePresentInSet(self):
         for featList in self.gff3Data.byFeatureName.values():
             for feat in featList:
@@ -101,3 +136,139 @@ class TestGff3ParserOnSpecialCasesFile(TestGff3ParserOnTypicalFile):
         testDataFile = _testDataDir + "specialCasesTest.gff3"
         self.gff3Parser = gff3.Gff3Parser(testDataFile)
         self.gff3Data = self.gff3Parser.parse()
+
+
+class TestGff3ParserInParallel(unittest.TestCase):
+    """
+    Tests that parsing partitions of a file in a process pool gives the
+    same features and links as parsing it in one process.
+    """
+    def setUp(self):
+        self._directory = tempfile.mkdtemp(prefix="ga4gh_gff3")
+        self._minSize = gff3.PARALLEL_PARSE_MIN_SIZE
+        self._partitionSize = gff3.PARALLEL_PARTITION_SIZE
+        gff3.PARALLEL_PARSE_MIN_SIZE = 0
+        # Use tiny partitions so that records span partitions.
+        gff3.PARALLEL_PARTITION_SIZE = 1000
+
+    def tearDown(self):
+        gff3.PARALLEL_PARSE_MIN_SIZE = self._minSize
+        gff3.PARALLEL_PARTITION_SIZE = self._partitionSize
+        shutil.rmtree(self._directory)
+
+    def _getFeatures(self, gff3Set):
+        return [
+            (feature.seqname, feature.start, feature.end, feature.type,
+             feature.attributes, feature.uniqueId,
+             sorted(child.uniqueId for child in feature.children))
+            for feature in gff3Set.features]
+
+    def _verifyParallelParse(self, fileName, serialFileName):
+        serialSet = gff3.Gff3Parser(serialFileName).parse()
+        parallelSet = gff3.Gff3Parser(fileName).parse(numProcesses=2)
+        self.assertEqual(
+            self._getFeatures(parallelSet), self._getFeatures(serialSet))
+
+    def testPlainFiles(self):
+        for fileName in [
+                "gencodeV21Set1.gff3", "discontinuous.gff3",
+                "sacCerTest.gff3", "specialCasesTest.gff3"]:
+            self.assertGreater(
+                len(gff3.Gff3Parser(_testDataDir + fileName)._getPartitions()),
+                1)
+            self._verifyParallelParse(
+                _testDataDir + fileName, _testDataDir + fileName)
+
+    def testBgzfFile(self):
+        fileName = _testDataDir + "gencodeV21Set1.gff3"
+        bgzfFileName = os.path.join(self._directory, "test.gff3.gz")
+        pysam.tabix_compress(fileName, bgzfFileName)
+        self.assertGreater(
+            len(gff3.Gff3Parser(bgzfFileName)._getPartitions()), 1)
+        self._verifyParallelParse(bgzfFileName, fileName)
+
+    def testGzipFileNotSplit(self):
+        fileName = _testDataDir + "sacCerTest.gff3"
+        gzipFileName = os.path.join(self._directory, "test.gff3.gz")
+        with open(fileName) as inputFile:
+            gzipFile = gzip.open(gzipFileName, "wb")
+            gzipFile.write(inputFile.read())
+            gzipFile.close()
+        self.assertIsNone(gff3.Gff3Parser(gzipFileName)._getPartitions())
+        self._verifyParallelParse(gzipFileName, fileName)
+
+    def testErrorLineNumber(self):
+        fileName = os.path.join(self._directory, "bad.gff3")
+        with open(_testDataDir + "gencodeV21Set1.gff3") as inputFile:
+            lines = inputFile.readlines()
+        lines.insert(400, "chr1\tbad\n")
+        with open(fileName, "w") as outputFile:
+            outputFile.writelines(lines)
+        for numProcesses in [1, 2]:
+            with self.assertRaises(gff3.GFF3Exception) as context:
+                gff3.Gff3Parser(fileName).parse(numProcesses)
+            self.assertEqual(context.exception.lineNumber, 401)
+
+    def testPartitionLines(self):
+        data = "line1\nline2 is long\nline3\n\nline5\n"
+        for chunkSize in range(1, len(data) + 1):
+            chunks = [
+                data[start:start + chunkSize]
+                for start in range(0, len(data), chunkSize)]
+            for partitionSize in range(1, len(chunks) + 1):
+                lines = []
+                for start in range(0, len(chunks), partitionSize):
+                    owned = [
+                        (chunk, start <= index < start + partitionSize)
+                        for index, chunk in enumerate(chunks)
+                        if index >= start]
+                    lines.extend(gff3._generatePartitionLines(
+                        iter(owned), start == 0))
+                self.assertEqual(lines, data.split("\n")[:-1])
+
+
+class TestBgzfLines(unittest.TestCase):
+    """
+    Tests reading the lines of BGZF files at their virtual offsets.
+    """
+    def setUp(self):
+        self._directory = tempfile.mkdtemp(prefix="ga4gh_gff3")
+        self._fileName = _testDataDir + "gencodeV21Set1.gff3"
+        self._bgzfFileName = os.path.join(self._directory, "test.gff3.gz")
+        pysam.tabix_compress(self._fileName, self._bgzfFileName)
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def testLinesAtOffsets(self):
+        with open(self._fileName) as inputFile:
+            expectedLines = inputFile.read().split("\n")[:-1]
+        offsetLines = list(gff3.generateBgzfLines(self._bgzfFileName))
+        self.assertEqual([line for _, line in offsetLines], expectedLines)
+        offsets = [offset for offset, _ in offsetLines]
+        self.assertEqual(offsets, sorted(set(offsets)))
+        # The file spans several blocks, so that some lines span blocks.
+        self.assertGreater(len(set(offset >> 16 for offset in offsets)), 1)
+        reader = gff3.BgzfLineReader(self._bgzfFileName)
+        for offset, line in reversed(offsetLines):
+            self.assertEqual(reader.readLine(offset), line)
+        reader.close()
+
+    def testFeaturesWithOffsets(self):
+        parser = gff3.Gff3Parser(self._bgzfFileName)
+        reader = gff3.BgzfLineReader(self._bgzfFileName)
+        features = list(gff3.Gff3Parser(self._fileName).generateFeatures())
+        featuresWithOffsets = list(parser.generateFeaturesWithOffsets())
+        self.assertEqual(len(featuresWithOffsets), len(features))
+        for (offset, feature), expected in zip(
+                featuresWithOffsets, features):
+            self.assertEqual(str(feature), str(expected))
+            self.assertEqual(
+                str(parser.parseRecord(reader.readLine(offset))),
+                str(expected))
+        reader.close()
+
+    def testNotBgzfFile(self):
+        parser = gff3.Gff3Parser(self._fileName)
+        with self.assertRaises(gff3.GFF3Exception):
+            list(parser.generateFeaturesWithOffsets())
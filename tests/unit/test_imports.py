@@ -156,7 +156,8 @@ class ImportGraphLayerChecker(object):
         'frontend': ['ga4gh/frontend.py', 'ga4gh/repo_manager.py'],
         'backend': ['ga4gh/backend.py', 'ga4gh/datarepo.py'],
         'exceptions': ['ga4gh/exceptions.py'],
-        'datamodel': ['ga4gh/datamodel/bio_metadata.py',
+        'datamodel': ['ga4gh/bamIndex.py',
+                      'ga4gh/datamodel/bio_metadata.py',
                       'ga4gh/datamodel/reads.py',
                       'ga4gh/datamodel/references.py',
                       'ga4gh/datamodel/variants.py',
@@ -164,10 +165,15 @@ class ImportGraphLayerChecker(object):
                       'ga4gh/datamodel/ontologies.py',
                       'ga4gh/datamodel/obo_parser.py',
                       'ga4gh/datamodel/sequenceAnnotations.py',
+                      'ga4gh/gff3Db.py',
                       'ga4gh/gff3Parser.py',
-                      'ga4gh/sqliteBackend.py'],
+                      'ga4gh/sqliteBackend.py',
+                      'ga4gh/summaryTiles.py',
+                      'ga4gh/twoBit.py'],
         'libraries': ['ga4gh/converters.py',
-                      'ga4gh/configtest.py'],
+                      'ga4gh/configtest.py',
+                      'ga4gh/metrics.py',
+                      'ga4gh/profiler.py'],
         'protocol': ['ga4gh/protocol.py',
                      'ga4gh/pb.py',
                      'ga4gh/_protocol_version.py',
@@ -188,6 +194,7 @@ class ImportGraphLayerChecker(object):
                      'ga4gh/sequence_annotations_pb2.py',
                      'ga4gh/sequence_annotation_service_pb2.py'],
         'config': ['ga4gh/serverconfig.py'],
+        'timing': ['ga4gh/timing.py'],
     }
 
     # each moduleGroupName has one and only one entry here
@@ -198,6 +205,7 @@ class ImportGraphLayerChecker(object):
         ['backend'],
         ['libraries'],
         ['datamodel'],
+        ['timing'],
         ['exceptions'],
         ['config'],
         ['protocol'],
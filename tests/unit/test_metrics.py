@@ -0,0 +1,123 @@
+"""
+Tests for the Prometheus style metrics
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import ga4gh.metrics as metrics
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """
+    Tests the recording and rendering of metrics in a single process.
+    """
+    def setUp(self):
+        self.registry = metrics.MetricsRegistry()
+
+    def testRequestCounts(self):
+        for _ in range(3):
+            self.registry.recordRequest("/reads/search", "POST", 200, 0.2, 10)
+        self.registry.recordRequest("/reads/search", "POST", 404, 0.1, 10)
+        counters, _, _ = self.registry.collect()
+        key = ("ga4gh_requests_total", (
+            ("method", "POST"), ("route", "/reads/search"), ("status", 200)))
+        self.assertEqual(counters[key], 3)
+
+    def testHistogram(self):
+        route = "/variants/search"
+        for seconds in [0.001, 0.3, 0.3, 100]:
+            self.registry.recordRequest(route, "POST", 200, seconds, 1000)
+        text = self.registry.render()
+        prefix = 'ga4gh_request_duration_seconds_bucket{route="' + route
+        self.assertIn(prefix + '",le="0.005"} 1\n', text)
+        self.assertIn(prefix + '",le="0.25"} 1\n', text)
+        self.assertIn(prefix + '",le="0.5"} 3\n', text)
+        self.assertIn(prefix + '",le="10.0"} 3\n', text)
+        self.assertIn(prefix + '",le="+Inf"} 4\n', text)
+        self.assertIn(
+            'ga4gh_request_duration_seconds_count{route="' + route +
+            '"} 4\n', text)
+        self.assertIn(
+            'ga4gh_response_size_bytes_sum{route="' + route + '"} 4000\n',
+            text)
+
+    def testErrors(self):
+        self.registry.recordError("/reads/search", 1234)
+        self.registry.recordError("/reads/search", 1234)
+        self.assertIn(
+            'ga4gh_errors_total{code="1234",route="/reads/search"} 2\n',
+            self.registry.render())
+
+    def testCollectors(self):
+        self.registry.addCollector(metrics.collectFileHandleCacheMetrics)
+        self.registry.addCollector(metrics.collectSqliteMetrics)
+        self.registry.addCollector(metrics.collectBasesTileCacheMetrics)
+        text = self.registry.render()
+        for name, type_, _ in metrics.METRICS:
+            self.assertIn("# TYPE {0} {1}\n".format(name, type_), text)
+        self.assertIn("\nga4gh_file_handle_cache_max_size ", text)
+        self.assertIn("\nga4gh_sqlite_connections_open ", text)
+        self.assertIn("\nga4gh_bases_tile_cache_max_bytes ", text)
+
+    def testLabelEscaping(self):
+        self.registry.recordError('a"b\\c\nd', 1)
+        self.assertIn(
+            'ga4gh_errors_total{code="1",route="a\\"b\\\\c\\nd"} 1\n',
+            self.registry.render())
+
+
+class TestMultiProcessMetrics(unittest.TestCase):
+    """
+    Tests the merging of metrics written to a shared directory.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="ga4gh_metrics")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testMerge(self):
+        # Two registries stand in for two processes sharing the directory.
+        registries = [
+            metrics.MetricsRegistry(self.directory) for _ in range(2)]
+        for registry in registries:
+            registry.addCollector(
+                lambda: [("ga4gh_sqlite_connections_open", {}, 2)])
+            registry.recordRequest("/datasets/search", "POST", 200, 0.01, 5)
+            registry.recordError("/datasets/search", 7)
+        registries[1].flush()
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        text = registries[0].render()
+        self.assertIn(
+            'ga4gh_requests_total{method="POST",route="/datasets/search",'
+            'status="200"} 2\n', text)
+        self.assertIn(
+            'ga4gh_errors_total{code="7",route="/datasets/search"} 2\n',
+            text)
+        self.assertIn(
+            'ga4gh_request_duration_seconds_count{'
+            'route="/datasets/search"} 2\n', text)
+        self.assertIn("ga4gh_sqlite_connections_open 4\n", text)
+
+    def testGaugesOfExitedProcessesDropped(self):
+        # A snapshot left behind by a process that has exited.
+        snapshot = {
+            "pid": 2 ** 22 + 1,
+            "counters": [
+                ["ga4gh_sqlite_connections_opened_total", [], 5]],
+            "gauges": [["ga4gh_sqlite_connections_open", [], 2]],
+            "histograms": [],
+        }
+        fileName = os.path.join(self.directory, "metrics-exited.json")
+        with open(fileName, "w") as snapshotFile:
+            json.dump(snapshot, snapshotFile)
+        text = metrics.MetricsRegistry(self.directory).render()
+        self.assertNotIn("\nga4gh_sqlite_connections_open ", text)
+        self.assertIn("ga4gh_sqlite_connections_opened_total 5\n", text)
@@ -0,0 +1,106 @@
+"""
+Tests for the sampling profiler
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import ga4gh.profiler as profiler
+
+
+def _busyFunction(event):
+    event.wait()
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    """
+    Tests the sampling of threads serving endpoints.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="ga4gh_profiler")
+        self.profiler = profiler.SamplingProfiler(
+            self.directory, interval=0.001)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _startServingThread(self, endpoint):
+        event = threading.Event()
+        started = threading.Event()
+
+        def serve():
+            self.profiler.setThreadEndpoint(endpoint)
+            started.set()
+            _busyFunction(event)
+            self.profiler.clearThreadEndpoint()
+        thread = threading.Thread(target=serve)
+        thread.start()
+        started.wait()
+        return thread, event
+
+    def testSample(self):
+        thread, event = self._startServingThread("searchReads")
+        try:
+            counts = collections.Counter()
+            self.profiler.sample(counts)
+            self.profiler.sample(counts)
+        finally:
+            event.set()
+            thread.join()
+        self.assertEqual(sum(counts.values()), 2)
+        for stack in counts:
+            frames = stack.split(";")
+            self.assertEqual(frames[0], "searchReads")
+            self.assertTrue(frames[1].startswith("__bootstrap ("))
+            self.assertTrue(any(
+                frame.startswith("serve (") for frame in frames))
+        # Threads that are not serving an endpoint are not sampled.
+        counts = collections.Counter()
+        self.profiler.sample(counts)
+        self.assertEqual(len(counts), 0)
+
+    def testStart(self):
+        thread, event = self._startServingThread("getVariant")
+        try:
+            outputFile = self.profiler.start(0.05)
+            self.assertTrue(self.profiler.isRunning())
+            self.assertIsNone(self.profiler.start(0.05))
+            self.profiler.join()
+        finally:
+            event.set()
+            thread.join()
+        self.assertFalse(self.profiler.isRunning())
+        self.assertEqual(os.path.dirname(outputFile), self.directory)
+        with open(outputFile) as collapsedFile:
+            lines = collapsedFile.readlines()
+        self.assertGreater(len(lines), 0)
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertTrue(stack.startswith("getVariant;"))
+            self.assertGreater(int(count), 0)
+
+    def testRequestStart(self):
+        self.assertIsNone(self.profiler.startRequested())
+        self.profiler.requestStart(0.01)
+        self.assertFalse(self.profiler.isRunning())
+        outputFile = self.profiler.startRequested()
+        self.assertIsNotNone(outputFile)
+        # A request is only acted on once.
+        self.assertIsNone(self.profiler.startRequested())
+        self.profiler.join()
+        self.assertTrue(os.path.exists(outputFile))
+
+    def testRequestStartInsideStart(self):
+        # A signal handler can run while the main thread holds the lock
+        # in start; asking for a profile then must not block.
+        with self.profiler._lock:
+            self.profiler.requestStart(0.01)
+        self.assertIsNotNone(self.profiler.startRequested())
+        self.profiler.join()
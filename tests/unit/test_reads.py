@@ -6,10 +6,18 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import glob
+import os
+import struct
+import tempfile
 import unittest
 
+import pysam
+
+import ga4gh.bamIndex as bamIndex
 import ga4gh.datamodel.reads as reads
 import ga4gh.protocol as protocol
+import tests.paths as paths
 
 
 class TestParseMalformedBamHeader(unittest.TestCase):
@@ -247,3 +255,100 @@ class TestSamFlags(unittest.TestCase):
             self.flag, reads.SamFlags.FIRST_IN_PAIR))
         self.assertTrue(reads.SamFlags.isFlagSet(
             self.flag, reads.SamFlags.FAILED_QUALITY_CHECK))
+
+
+class TestBamIndex(unittest.TestCase):
+    """
+    Tests the reading of BAI indexes against the BAM files of the test
+    data.
+    """
+    def setUp(self):
+        self.bamFiles = glob.glob(os.path.join(
+            paths.testDataDir, "datasets/dataset1/reads/*.bam"))
+
+    def testReadCounts(self):
+        for bamFile in self.bamFiles:
+            index = bamIndex.BamIndex(bamFile + ".bai")
+            samFile = pysam.AlignmentFile(bamFile)
+            self.assertEqual(index.getNumReferences(), samFile.nreferences)
+            numMappedReads = 0
+            for referenceIndex in range(samFile.nreferences):
+                mapped, _ = index.getReadCounts(referenceIndex)
+                numMappedReads += mapped
+                length = samFile.lengths[referenceIndex]
+                estimates = index.estimateReadCounts(
+                    referenceIndex, length, 0, length, length // 10 + 1)
+                self.assertEqual(len(estimates), 10)
+                self.assertAlmostEqual(sum(estimates), mapped)
+            self.assertEqual(numMappedReads, samFile.mapped)
+
+    def testEstimatedRegion(self):
+        # The estimates for a region match those of the same bins of the
+        # whole reference.
+        index = bamIndex.BamIndex(self.bamFiles[0] + ".bai")
+        samFile = pysam.AlignmentFile(self.bamFiles[0])
+        read = next(samFile.fetch())
+        length = samFile.lengths[read.reference_id]
+        estimates = index.estimateReadCounts(
+            read.reference_id, length, 0, length, 1000)
+        firstBin = max(0, read.reference_start // 1000 - 20)
+        regionEstimates = index.estimateReadCounts(
+            read.reference_id, length, firstBin * 1000,
+            (firstBin + 40) * 1000, 1000)
+        self.assertGreater(sum(regionEstimates), 0)
+        for regionEstimate, estimate in zip(
+                regionEstimates, estimates[firstBin:firstBin + 40]):
+            self.assertAlmostEqual(regionEstimate, estimate)
+
+    def _writeBamIndex(self, indexFile, linearIndex, endOffset, numReads):
+        # A BAI index of a single reference, holding only the pseudo-bin
+        # and the linear index.
+        indexFile.write(bamIndex.BAI_MAGIC + struct.pack(
+            b"<iiIi4Qi", 1, 1, bamIndex.PSEUDO_BIN, 2, linearIndex[0],
+            endOffset, numReads, 0, len(linearIndex)))
+        indexFile.write(struct.pack(
+            b"<{}Q".format(len(linearIndex)), *linearIndex))
+        indexFile.flush()
+
+    def _estimateWindowReadCounts(self, linearIndex, endOffset, numReads):
+        window = bamIndex.LINEAR_INDEX_WINDOW
+        length = len(linearIndex) * window
+        with tempfile.NamedTemporaryFile() as indexFile:
+            self._writeBamIndex(indexFile, linearIndex, endOffset, numReads)
+            index = bamIndex.BamIndex(indexFile.name)
+        return index.estimateReadCounts(0, length, 0, length, window)
+
+    def testWindowsInOneBlock(self):
+        # The reads of windows within a single BGZF block are shared in
+        # proportion to their uncompressed size.
+        block = 100 << 16
+        linearIndex = [block + i * 1000 for i in range(10)]
+        estimates = self._estimateWindowReadCounts(
+            linearIndex, block + 10000, 50)
+        for estimate in estimates:
+            self.assertAlmostEqual(estimate, 5)
+
+    def testWindowsAcrossBlocks(self):
+        # Windows of the same size, one of which crosses from a block of
+        # 5000 compressed bytes to the next, get similar estimates.
+        blockA, blockB = 100 << 16, 5100 << 16
+        linearIndex = [
+            blockA, blockA + 20000, blockA + 40000, blockB, blockB + 20000]
+        estimates = self._estimateWindowReadCounts(
+            linearIndex, blockB + 40000, 50)
+        self.assertAlmostEqual(sum(estimates), 50)
+        for estimate in estimates:
+            self.assertGreater(estimate, 8)
+            self.assertLess(estimate, 13)
+
+    def testNotBamIndex(self):
+        with tempfile.NamedTemporaryFile() as indexFile:
+            indexFile.write(b"TBI\1")
+            indexFile.flush()
+            self.assertRaises(
+                bamIndex.BamIndexException, bamIndex.BamIndex, indexFile.name)
+        with tempfile.NamedTemporaryFile() as indexFile:
+            indexFile.write(bamIndex.BAI_MAGIC + b"\1\0\0\0\5")
+            indexFile.flush()
+            self.assertRaises(
+                bamIndex.BamIndexException, bamIndex.BamIndex, indexFile.name)
@@ -6,12 +6,21 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import hashlib
+import os
+import random
+import shutil
+import tempfile
 import unittest
 
+import pysam
+
 import ga4gh.backend as backend
 import ga4gh.datamodel.references as references
 import ga4gh.exceptions as exceptions
 import ga4gh.datarepo as datarepo
+import ga4gh.twoBit as twoBit
+import tests.paths as paths
 
 
 class TestAbstractReferenceSet(unittest.TestCase):
@@ -91,3 +100,223 @@ class TestAbstractReference(unittest.TestCase):
             self.assertRaises(
                 exceptions.ReferenceRangeErrorException,
                 self._reference.checkQueryRange, badRange[0], badRange[1])
+
+
+class TestHtslibReferenceSetPopulate(unittest.TestCase):
+    """
+    Tests the streaming computation of reference checksums and lengths.
+    """
+    def setUp(self):
+        self._chunkSize = references.MD5_CHUNK_SIZE
+        self._minLength = references.PARALLEL_MD5_MIN_LENGTH
+        # Use a tiny chunk so that the references span many chunks.
+        references.MD5_CHUNK_SIZE = 7
+
+    def tearDown(self):
+        references.MD5_CHUNK_SIZE = self._chunkSize
+        references.PARALLEL_MD5_MIN_LENGTH = self._minLength
+
+    def _verifyReferenceSet(self, dataUrl, numProcesses):
+        referenceSet = references.HtslibReferenceSet("test")
+        referenceSet.populateFromFile(dataUrl, numProcesses=numProcesses)
+        fastaFile = pysam.FastaFile(dataUrl)
+        self.assertEqual(
+            [reference.getLocalId()
+             for reference in referenceSet.getReferences()],
+            list(fastaFile.references))
+        for reference in referenceSet.getReferences():
+            bases = fastaFile.fetch(reference.getLocalId())
+            self.assertEqual(reference.getLength(), len(bases))
+            self.assertEqual(
+                reference.getMd5Checksum(), hashlib.md5(bases).hexdigest())
+        fastaFile.close()
+
+    def testSingleProcess(self):
+        for dataUrl in [paths.faPath, paths.faPath2, paths.faPath3]:
+            self._verifyReferenceSet(dataUrl, 1)
+
+    def testProcessPool(self):
+        references.PARALLEL_MD5_MIN_LENGTH = 0
+        self._verifyReferenceSet(paths.faPath3, 2)
+
+
+class TestTwoBitFile(unittest.TestCase):
+    """
+    Tests that sequences read back from 2bit files match the FASTA
+    files they were written from.
+    """
+    def setUp(self):
+        self._directory = tempfile.mkdtemp(prefix="ga4gh_twobit")
+        self._chunkSize = twoBit._WRITE_CHUNK_SIZE
+
+    def tearDown(self):
+        twoBit._WRITE_CHUNK_SIZE = self._chunkSize
+        shutil.rmtree(self._directory)
+
+    def _writeTwoBitFile(self, fastaFile):
+        twoBitPath = os.path.join(self._directory, "test.2bit")
+        twoBit.writeTwoBitFile(fastaFile, twoBitPath)
+        return twoBit.TwoBitFile(twoBitPath)
+
+    def _verifyWindows(self, fastaFile, twoBitFile):
+        randomGenerator = random.Random(1)
+        self.assertEqual(twoBitFile.references, fastaFile.references)
+        self.assertEqual(twoBitFile.lengths, fastaFile.lengths)
+        for name, length in zip(fastaFile.references, fastaFile.lengths):
+            self.assertEqual(twoBitFile.fetch(name), fastaFile.fetch(name))
+            for _ in range(100):
+                start = randomGenerator.randint(0, length)
+                end = randomGenerator.randint(start, length)
+                self.assertEqual(
+                    twoBitFile.fetch(name, start, end),
+                    fastaFile.fetch(name, start, end))
+
+    def testFastaFiles(self):
+        for dataUrl in [paths.faPath, paths.faPath2, paths.faPath3]:
+            fastaFile = pysam.FastaFile(dataUrl)
+            twoBitFile = self._writeTwoBitFile(fastaFile)
+            self._verifyWindows(fastaFile, twoBitFile)
+            twoBitFile.close()
+            fastaFile.close()
+
+    def testMaskedAndUnknownBases(self):
+        # Use a tiny chunk so that N and mask runs span chunks.
+        twoBit._WRITE_CHUNK_SIZE = 8
+        randomGenerator = random.Random(2)
+        bases = "".join(
+            randomGenerator.choice("ACGTNNacgtnn") * randomGenerator.randint(
+                1, 20) for _ in range(200))
+        fastaPath = os.path.join(self._directory, "test.fa")
+        with open(fastaPath, "w") as fastaFile:
+            fastaFile.write(">masked\n{}\n>short\nAC\n".format(bases))
+        fastaFile = pysam.FastaFile(fastaPath)
+        twoBitFile = self._writeTwoBitFile(fastaFile)
+        self._verifyWindows(fastaFile, twoBitFile)
+        self.assertEqual(twoBitFile.fetch("masked"), bases)
+        twoBitFile.close()
+        fastaFile.close()
+
+    def testUnpackAllBytes(self):
+        packed = bytes(bytearray(range(256)))
+        bases = twoBit._unpackBases(packed)
+        self.assertEqual(len(bases), 4 * 256)
+        for byte in range(256):
+            expected = "".join(
+                "TCAG"[(byte >> shift) & 3] for shift in (6, 4, 2, 0))
+            self.assertEqual(bases[4 * byte:4 * byte + 4], expected)
+        self.assertEqual(twoBit._packBases(bases), packed)
+        self.assertEqual(twoBit._unpackBases(b""), b"")
+
+    def testUnsupportedBases(self):
+        fastaPath = os.path.join(self._directory, "test.fa")
+        with open(fastaPath, "w") as fastaFile:
+            fastaFile.write(">iupac\nACGTRYACGT\n")
+        fastaFile = pysam.FastaFile(fastaPath)
+        self.assertRaises(
+            twoBit.TwoBitException, self._writeTwoBitFile, fastaFile)
+        fastaFile.close()
+
+    def testNotTwoBitFile(self):
+        self.assertRaises(
+            twoBit.TwoBitException, twoBit.TwoBitFile, paths.faPath)
+
+    def testTwoBitReferenceSet(self):
+        twoBitPath = os.path.join(self._directory, "test.2bit")
+        fastaFile = pysam.FastaFile(paths.faPath3)
+        twoBit.writeTwoBitFile(fastaFile, twoBitPath)
+        referenceSet = references.TwoBitReferenceSet("test")
+        referenceSet.populateFromFile(twoBitPath)
+        htslibReferenceSet = references.HtslibReferenceSet("test")
+        htslibReferenceSet.populateFromFile(paths.faPath3)
+        for reference in referenceSet.getReferences():
+            self.assertIsInstance(reference, references.TwoBitReference)
+            htslibReference = htslibReferenceSet.getReferenceByName(
+                reference.getLocalId())
+            self.assertEqual(
+                reference.getMd5Checksum(), htslibReference.getMd5Checksum())
+            length = reference.getLength()
+            self.assertEqual(
+                reference.getBases(0, length),
+                fastaFile.fetch(reference.getLocalId()))
+        fastaFile.close()
+
+
+class TestBasesTileCache(unittest.TestCase):
+    """
+    Tests the assembly of windows of bases from cached tiles.
+    """
+    def setUp(self):
+        self._bases = "".join("ACGT"[(i * 7) % 4] for i in range(1000))
+        self._fetches = []
+        self._cache = references.BasesTileCache(tileSize=100, maxBytes=300)
+
+    def _fetch(self, start, end):
+        self._fetches.append((start, end))
+        return self._bases[start:end]
+
+    def _getBases(self, start, end):
+        return self._cache.getBases(
+            "key", len(self._bases), start, end, self._fetch)
+
+    def testWindows(self):
+        windows = [
+            (0, 1), (0, 100), (99, 101), (150, 250), (950, 1000),
+            (0, 1000), (500, 500), (123, 789)]
+        for start, end in windows:
+            self.assertEqual(
+                self._getBases(start, end), self._bases[start:end])
+
+    def testMissingRunsFetchedTogether(self):
+        self._getBases(150, 450)
+        self.assertEqual(self._fetches, [(100, 500)])
+        self._fetches = []
+        self._getBases(250, 450)
+        self.assertEqual(self._fetches, [])
+        self._getBases(950, 1000)
+        self.assertEqual(self._fetches, [(900, 1000)])
+
+    def testEviction(self):
+        for tileIndex in range(4):
+            self._getBases(tileIndex * 100, tileIndex * 100 + 1)
+        statistics = self._cache.getStatistics()
+        self.assertEqual(statistics["tiles"], 3)
+        self.assertEqual(statistics["bytes"], 300)
+        self.assertEqual(statistics["misses"], 4)
+        self.assertEqual(statistics["evictions"], 1)
+        # The first tile was least recently used, so it was evicted.
+        self._fetches = []
+        self._getBases(100, 101)
+        self._getBases(0, 1)
+        self.assertEqual(self._fetches, [(0, 100)])
+        self.assertEqual(self._cache.getStatistics()["hits"], 1)
+
+    def testDisabled(self):
+        self._cache.setMaxBytes(0)
+        self.assertEqual(self._getBases(10, 20), self._bases[10:20])
+        self.assertEqual(self._getBases(10, 20), self._bases[10:20])
+        self.assertEqual(self._fetches, [(10, 20), (10, 20)])
+        self.assertEqual(self._cache.getStatistics()["bytes"], 0)
+
+
+class TestGenerateBases(unittest.TestCase):
+    """
+    Tests the streaming of reference bases in chunks.
+    """
+    def testHtslibReference(self):
+        referenceSet = references.HtslibReferenceSet("test")
+        referenceSet.populateFromFile(paths.faPath3)
+        fastaFile = pysam.FastaFile(paths.faPath3)
+        statistics = references.basesTileCache.getStatistics()
+        for reference in referenceSet.getReferences():
+            length = reference.getLength()
+            bases = fastaFile.fetch(reference.getLocalId())
+            for start, end, chunkSize in [
+                    (0, length, 7), (3, length - 1, 1000), (5, 6, 1)]:
+                chunks = list(reference.generateBases(start, end, chunkSize))
+                self.assertEqual("".join(chunks), bases[start:end])
+                self.assertTrue(all(
+                    0 < len(chunk) <= chunkSize for chunk in chunks))
+        # Streamed bases do not pass through the tile cache.
+        self.assertEqual(
+            references.basesTileCache.getStatistics(), statistics)
+        fastaFile.close()
@@ -11,10 +11,16 @@ import shutil
 import tempfile
 import unittest
 
+import pysam
+
 import ga4gh.exceptions as exceptions
 import ga4gh.datarepo as datarepo
 import ga4gh.cli as cli
 import ga4gh.datamodel as datamodel
+import ga4gh.datamodel.references as references
+import ga4gh.datamodel.sequenceAnnotations as sequenceAnnotations
+import ga4gh.gff3Db as gff3Db
+import ga4gh.summaryTiles as summaryTiles
 import tests.paths as paths
 
 
@@ -206,6 +212,153 @@ class TestRemoveFeatureSet(AbstractRepoManagerTest):
             self.getFeatureSet()
 
 
+class TestIndexFeatureSet(AbstractRepoManagerTest):
+
+    def setUp(self):
+        super(TestIndexFeatureSet, self).setUp()
+        self.init()
+        self.addDataset()
+        self.addOntology()
+        self.addReferenceSet()
+        self._directory = tempfile.mkdtemp(prefix="ga4gh_repoman_test")
+        featuresPath = os.path.join(
+            self._directory, os.path.basename(paths.featuresPath))
+        shutil.copy(paths.featuresPath, featuresPath)
+        self._featureSetName = paths.featureSetName
+        self.runCommand((
+            "add-featureset {} {} {} --referenceSetName={} "
+            "--ontologyName={}").format(
+            self._repoPath, self._datasetName, featuresPath,
+            self._referenceSetName, self._ontologyName))
+        self._featuresPath = featuresPath
+
+    def tearDown(self):
+        super(TestIndexFeatureSet, self).tearDown()
+        shutil.rmtree(self._directory)
+
+    def testIndexFeatureSet(self):
+        dataSource = sequenceAnnotations.Gff3DbBackend(self._featuresPath)
+        with dataSource:
+            self.assertGreater(len(dataSource.getUnindexedQueries()), 0)
+        self.runCommand("index-featureset {} {} {}".format(
+            self._repoPath, self._datasetName, self._featureSetName))
+        with dataSource:
+            self.assertEqual(dataSource.getUnindexedQueries(), [])
+        # Indexing again leaves the existing indexes in place.
+        self.runCommand("index-featureset {} {} {}".format(
+            self._repoPath, self._datasetName, self._featureSetName))
+        features = list(self.getFeatureSet().getFeatures(
+            "chr1", 0, 2**32, None, 1000))
+        self.assertGreater(len(features), 0)
+
+
+class TestAddTabixFeatureSet(AbstractRepoManagerTest):
+
+    def setUp(self):
+        super(TestAddTabixFeatureSet, self).setUp()
+        self.init()
+        self.addDataset()
+        self.addOntology()
+        self.addReferenceSet()
+        self._directory = tempfile.mkdtemp(prefix="ga4gh_repoman_test")
+        # Tabix needs the records sorted by reference and start.
+        gff3Path = os.path.join(self._directory, "features.gff3")
+        with open(paths.featuresPath[:-3] + ".gff3") as inputFile:
+            lines = inputFile.read().split("\n")[:-1]
+        records = sorted(
+            (line for line in lines[1:] if not line.startswith("#")),
+            key=lambda line: (
+                line.split("\t")[0], int(line.split("\t")[3])))
+        with open(gff3Path, "w") as outputFile:
+            outputFile.write("\n".join([lines[0]] + records) + "\n")
+        self._gff3Path = gff3Path
+        self._featuresPath = gff3Path + ".gz"
+        pysam.tabix_compress(gff3Path, self._featuresPath)
+        self._featureSetName = "features"
+        self.runCommand((
+            "add-featureset {} {} {} --referenceSetName={} "
+            "--ontologyName={}").format(
+            self._repoPath, self._datasetName, self._featuresPath,
+            self._referenceSetName, self._ontologyName))
+
+    def tearDown(self):
+        super(TestAddTabixFeatureSet, self).tearDown()
+        shutil.rmtree(self._directory)
+
+    def _getDbFeatureSet(self, featureSet):
+        # A feature database of the same file, with the same IDs.
+        dbPath = os.path.join(self._directory, "features.db")
+        gff3Db.writeGff3Db(self._gff3Path, dbPath)
+        dbFeatureSet = sequenceAnnotations.Gff3DbFeatureSet(
+            featureSet.getParentContainer(), featureSet.getLocalId())
+        dbFeatureSet.setOntology(featureSet.getOntology())
+        dbFeatureSet.setReferenceSet(featureSet.getReferenceSet())
+        dbFeatureSet.populateFromFile(dbPath)
+        return dbFeatureSet
+
+    def _getAllFeatures(self, featureSet, **kwargs):
+        features = []
+        pageToken = None
+        while True:
+            pairs = list(featureSet.getFeatures(
+                pageToken=pageToken, pageSize=5, **kwargs))[:5]
+            features.extend(feature for feature, _ in pairs)
+            if len(pairs) == 0 or pairs[-1][1] is None:
+                return features
+            pageToken = pairs[-1][1]
+
+    def testIndexesWritten(self):
+        featureSet = self.getFeatureSet()
+        self.assertIsInstance(
+            featureSet, sequenceAnnotations.TabixGff3FeatureSet)
+        self.assertTrue(os.path.exists(self._featuresPath + ".tbi"))
+        self.assertTrue(os.path.exists(
+            sequenceAnnotations.getSidecarPath(self._featuresPath)))
+
+    def testFeaturesMatchDb(self):
+        featureSet = self.getFeatureSet()
+        dbFeatureSet = self._getDbFeatureSet(featureSet)
+        dbFeatures = self._getAllFeatures(
+            dbFeatureSet, referenceName="chr1", start=0, end=2**30)
+        compoundIds = [
+            datamodel.FeatureCompoundId.parse(feature.id)
+            for feature in dbFeatures]
+        self.assertGreater(len(compoundIds), 0)
+        self.assertEqual(
+            featureSet.getFeaturesByIds(compoundIds), dbFeatures)
+        self.assertEqual(
+            featureSet.getFeature(compoundIds[-1]), dbFeatures[-1])
+        searches = [
+            {"start": 0, "end": 2**30},
+            {"start": 13000, "end": 70000},
+            {"start": 0, "end": 2**30, "featureTypes": ["gene"]},
+            {"start": 0, "end": 2**30, "parentId": compoundIds[0].featureId},
+            {"start": 0, "end": 2**30, "featureTypes": ["gene"],
+             "includeDescendants": True},
+        ]
+        for search in searches:
+            features = self._getAllFeatures(
+                featureSet, referenceName="chr1", **search)
+            expectedFeatures = self._getAllFeatures(
+                dbFeatureSet, referenceName="chr1", **search)
+            if search.get("includeDescendants"):
+                self.assertEqual(features, expectedFeatures)
+            else:
+                # Features starting at the same position are in file
+                # order rather than by end.
+                self.assertEqual(
+                    sorted(feature.id for feature in features),
+                    sorted(feature.id for feature in expectedFeatures))
+                self.assertEqual(
+                    len(set(feature.id for feature in features)),
+                    len(features))
+
+    def testUnknownReference(self):
+        featureSet = self.getFeatureSet()
+        self.assertEqual(
+            list(featureSet.getFeatures("chrNone", 0, 2**30, None, 5)), [])
+
+
 class TestAddDataset(AbstractRepoManagerTest):
 
     def setUp(self):
@@ -270,6 +423,53 @@ class TestAddReferenceSet(AbstractRepoManagerTest):
             exceptions.DuplicateNameException, self.runCommand, cmd)
 
 
+class TestPackReferenceSet(AbstractRepoManagerTest):
+
+    def setUp(self):
+        super(TestPackReferenceSet, self).setUp()
+        self.init()
+        self.addReferenceSet()
+        fd, self._twoBitPath = tempfile.mkstemp(
+            prefix="ga4gh_repoman_test", suffix=".2bit")
+        os.close(fd)
+
+    def tearDown(self):
+        super(TestPackReferenceSet, self).tearDown()
+        os.unlink(self._twoBitPath)
+
+    def testPack(self):
+        repo = self.readRepo()
+        fastaReferenceSet = repo.getReferenceSetByName(
+            self._referenceSetName)
+        self.runCommand("pack-referenceset {} {} --outputFile={}".format(
+            self._repoPath, self._referenceSetName, self._twoBitPath))
+        repo = self.readRepo()
+        referenceSet = repo.getReferenceSetByName(self._referenceSetName)
+        self.assertIsInstance(referenceSet, references.TwoBitReferenceSet)
+        self.assertEqual(referenceSet.getDataUrl(), self._twoBitPath)
+        self.assertEqual(
+            referenceSet.getMd5Checksum(),
+            fastaReferenceSet.getMd5Checksum())
+        for reference in referenceSet.getReferences():
+            fastaReference = fastaReferenceSet.getReference(
+                reference.getId())
+            length = reference.getLength()
+            self.assertEqual(
+                reference.getBases(0, length),
+                fastaReference.getBases(0, length))
+        # A packed reference set cannot be packed again.
+        self.assertRaises(
+            exceptions.RepoManagerException, self.runCommand,
+            "pack-referenceset {} {}".format(
+                self._repoPath, self._referenceSetName))
+
+    def testBadExtension(self):
+        self.assertRaises(
+            exceptions.RepoManagerException, self.runCommand,
+            "pack-referenceset {} {} --outputFile={}.fa".format(
+                self._repoPath, self._referenceSetName, self._twoBitPath))
+
+
 class TestAddOntology(AbstractRepoManagerTest):
 
     def setUp(self):
@@ -508,6 +708,38 @@ class TestAddReadGroupSet(AbstractRepoManagerTest):
         self.runCommand(cmd)
         self.verifyReadGroupSet(name, bamFile, bamFile + ".bai")
 
+    def testReadGroupStats(self):
+        bamFile = paths.bamPath
+        cmd = (
+            "add-readgroupset {} {} {} --referenceSetName={} "
+            "--name=rgs --numProcesses=1").format(
+            self._repoPath, self._datasetName, bamFile,
+            self._referenceSetName)
+        self.runCommand(cmd)
+        expectedStats = {}
+        samFile = pysam.AlignmentFile(bamFile)
+        for read in samFile.fetch(until_eof=True):
+            readGroupId = None
+            if read.has_tag(b'RG'):
+                readGroupId = read.get_tag(b'RG')
+            stats = expectedStats.setdefault(readGroupId, [0, 0, 0])
+            stats[1 if read.is_unmapped else 0] += 1
+            stats[2] += read.query_length
+        samFile.close()
+        repo = self.readRepo()
+        dataset = repo.getDatasetByName(self._datasetName)
+        readGroupSet = dataset.getReadGroupSetByName("rgs")
+        self.assertGreater(len(readGroupSet.getReadGroups()), 0)
+        for readGroup in readGroupSet.getReadGroups():
+            stats = readGroup.toProtocolElement().stats
+            self.assertEqual(
+                [stats.aligned_read_count, stats.unaligned_read_count,
+                 stats.base_count],
+                expectedStats.get(readGroup.getLocalId(), [0, 0, 0]))
+        self.assertEqual(
+            readGroupSet.getNumBases(),
+            sum(stats[2] for stats in expectedStats.values()))
+
     def testAddReadGroupSetWithSameName(self):
         # Default name
         bamFile = paths.bamPath
@@ -713,6 +945,118 @@ class TestAddAnnotatedVariantSet(AbstractRepoManagerTest):
             exceptions.OntologyNameNotFoundException, self.runCommand, cmd)
 
 
+class TestAddSummaryTiles(AbstractRepoManagerTest):
+
+    def setUp(self):
+        super(TestAddSummaryTiles, self).setUp()
+        self.init()
+        self.addDataset()
+        self.addReferenceSet()
+        self._tempDir = tempfile.mkdtemp(prefix="ga4gh_repoman_test")
+
+    def tearDown(self):
+        super(TestAddSummaryTiles, self).tearDown()
+        shutil.rmtree(self._tempDir)
+
+    def _addReadGroupSet(self):
+        bamFile = os.path.join(self._tempDir, "reads.bam")
+        shutil.copyfile(paths.bamPath, bamFile)
+        shutil.copyfile(paths.bamIndexPath, bamFile + ".bai")
+        return bamFile
+
+    def testReadGroupSet(self):
+        bamFile = self._addReadGroupSet()
+        cmd = (
+            "add-readgroupset {} {} {} -R {} --summaryTiles "
+            "--summaryBinSize 16").format(
+            self._repoPath, self._datasetName, bamFile,
+            self._referenceSetName)
+        self.runCommand(cmd)
+        self.assertTrue(os.path.exists(bamFile + ".summary"))
+        repo = self.readRepo()
+        dataset = repo.getDatasetByName(self._datasetName)
+        readGroupSet = dataset.getReadGroupSetByName("reads")
+        tiles = readGroupSet.getSummaryTiles()
+        self.assertEqual(tiles.getBinSize(0), 16)
+        self.assertEqual(
+            sum(tiles.getBins("chr17", 0, "readCount", 0, 100)),
+            readGroupSet.getNumAlignedReads())
+
+    def testVariantSet(self):
+        for fileName in glob.glob(os.path.join(paths.vcfDirPath, "*.vcf.gz*")):
+            shutil.copy(fileName, self._tempDir)
+        cmd = "add-variantset {} {} {} -R {} -n vs -s".format(
+            self._repoPath, self._datasetName, self._tempDir,
+            self._referenceSetName)
+        self.runCommand(cmd)
+        repo = self.readRepo()
+        dataset = repo.getDatasetByName(self._datasetName)
+        variantSet = dataset.getVariantSetByName("vs")
+        tiles = variantSet.getSummaryTiles()
+        self.assertEqual(tiles.getReferenceNames(), ["1", "2", "3"])
+        self.assertEqual(
+            sum(tiles.getBins("2", tiles.getNumLevels() - 1,
+                "variantCount", 0, 1)), 100)
+
+    def testDuplicateNameKeepsTiles(self):
+        bamFile = self._addReadGroupSet()
+        self.runCommand(
+            "add-readgroupset {} {} {} -R {} --summaryTiles "
+            "--summaryBinSize 16".format(
+                self._repoPath, self._datasetName, bamFile,
+                self._referenceSetName))
+        # Adding the same file again under the same name fails, and must
+        # leave the tiles that are being served alone.
+        cmd = (
+            "add-readgroupset {} {} {} -R {} --summaryTiles "
+            "--summaryBinSize 32").format(
+            self._repoPath, self._datasetName, bamFile,
+            self._referenceSetName)
+        self.assertRaises(
+            exceptions.DuplicateNameException, self.runCommand, cmd)
+        tiles = summaryTiles.SummaryTiles(bamFile + ".summary")
+        self.assertEqual(tiles.getBinSize(0), 16)
+        tiles.close()
+
+    def testSummariseReadGroupSet(self):
+        bamFile = self._addReadGroupSet()
+        self.runCommand("add-readgroupset {} {} {} -R {}".format(
+            self._repoPath, self._datasetName, bamFile,
+            self._referenceSetName))
+        self.assertFalse(os.path.exists(bamFile + ".summary"))
+        for binSize in [32, 64]:
+            self.runCommand(
+                "summarise-readgroupset {} {} reads "
+                "--summaryBinSize {}".format(
+                    self._repoPath, self._datasetName, binSize))
+            tiles = summaryTiles.SummaryTiles(bamFile + ".summary")
+            self.assertEqual(tiles.getBinSize(0), binSize)
+            tiles.close()
+
+    def testSummariseVariantSet(self):
+        for fileName in glob.glob(os.path.join(paths.vcfDirPath, "*.vcf.gz*")):
+            shutil.copy(fileName, self._tempDir)
+        self.runCommand("add-variantset {} {} {} -R {} -n vs".format(
+            self._repoPath, self._datasetName, self._tempDir,
+            self._referenceSetName))
+        self.runCommand("summarise-variantset {} {} vs".format(
+            self._repoPath, self._datasetName))
+        repo = self.readRepo()
+        variantSet = repo.getDatasetByName(
+            self._datasetName).getVariantSetByName("vs")
+        tiles = variantSet.getSummaryTiles()
+        self.assertEqual(tiles.getReferenceNames(), ["1", "2", "3"])
+
+    def testRemoteFile(self):
+        cmd = (
+            "add-readgroupset {} {} http://example.com/example.bam -I {} "
+            "-R {} --summaryTiles").format(
+            self._repoPath, self._datasetName, paths.bamIndexPath,
+            self._referenceSetName)
+        self.assertRaises(
+            exceptions.RepoManagerException, self.runCommand, cmd)
+
+
 class TestDuplicateNameDelete(AbstractRepoManagerTest):
     """
     If two objects exist with the same name in different datasets,
@@ -7,6 +7,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
 import unittest
 import logging
 import random
@@ -480,6 +481,9 @@ class TestSimulatedStack(unittest.TestCase):
         request.reference_name = referenceName
         request.start = start
         request.end = 2**16
+        # Variants fetched by ID have the calls of every call set.
+        request.call_set_ids.extend(
+            callSet.getId() for callSet in self.variantSet.getCallSets())
         path = '/variants/search'
         responseData = self.sendSearchRequest(
             path, request, protocol.SearchVariantsResponse)
@@ -579,6 +583,175 @@ class TestSimulatedStack(unittest.TestCase):
         # TODO: Add more useful test scenarios, including some covering
         # pagination behavior.
 
+    def testVariantsSearchCallSets(self):
+        # Only the calls of the requested call sets are returned, so the
+        # responses for none, some and all of them differ in size.
+        path = '/variants/search'
+        callSetIds = [
+            callSet.getId() for callSet in self.variantSet.getCallSets()]
+        self.assertGreater(len(callSetIds), 1)
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = self.variantSet.getId()
+        request.reference_name = '1'
+        request.end = 2 ** 10
+        request.page_size = 10
+        sizes = []
+        allCalls = None
+        for numCallSets in [len(callSetIds), 1, 0]:
+            del request.call_set_ids[:]
+            request.call_set_ids.extend(callSetIds[:numCallSets])
+            response = self.sendJsonPostRequest(path, protocol.toJson(request))
+            self.assertEqual(response.status_code, 200)
+            sizes.append(len(response.data))
+            responseData = protocol.fromJson(
+                response.data, protocol.SearchVariantsResponse)
+            self.assertGreater(len(responseData.variants), 0)
+            if allCalls is None:
+                allCalls = [variant.calls for variant in responseData.variants]
+            for variant, calls in zip(responseData.variants, allCalls):
+                self.assertEqual(
+                    list(variant.calls), list(calls[:numCallSets]))
+        self.assertGreater(sizes[0], sizes[1])
+        self.assertGreater(sizes[1], sizes[2])
+        request.call_set_ids.append("notACallSet")
+        response = self.sendJsonPostRequest(path, protocol.toJson(request))
+        self.assertEqual(response.status_code, 404)
+
+    def testVariantRegionsSearch(self):
+        # Fetch the expected variants for each region in one page.
+        self.backend.setMaxResponseLength(2 ** 20)
+        callSetIds = [
+            callSet.getId() for callSet in self.variantSet.getCallSets()[:2]]
+        regions = [("1", 0, 2 ** 10), ("2", 100, 200), ("1", 50, 60)]
+        expectedVariants = []
+        for referenceName, start, end in regions:
+            request = protocol.SearchVariantsRequest()
+            request.variant_set_id = self.variantSet.getId()
+            request.reference_name = referenceName
+            request.start, request.end = start, end
+            request.call_set_ids.extend(callSetIds)
+            request.page_size = 10000
+            responseData = self.sendSearchRequest(
+                '/variants/search', request, protocol.SearchVariantsResponse)
+            expectedVariants.extend(responseData.variants)
+        self.assertGreater(len(expectedVariants), 0)
+        path = '/variants:searchRegions'
+        for pageSize in [1, 7, 10000]:
+            requestDict = {
+                "variantSetId": self.variantSet.getId(),
+                "callSetIds": callSetIds,
+                "regions": [
+                    {"referenceName": referenceName, "start": start,
+                     "end": end}
+                    for referenceName, start, end in regions],
+                "pageSize": pageSize}
+            variants = []
+            while True:
+                response = self.sendJsonPostRequest(
+                    path, json.dumps(requestDict))
+                self.assertEqual(response.status_code, 200)
+                responseData = protocol.fromJson(
+                    response.data, protocol.SearchVariantsResponse)
+                self.assertLessEqual(len(responseData.variants), pageSize)
+                variants.extend(responseData.variants)
+                if responseData.next_page_token == "":
+                    break
+                requestDict["pageToken"] = responseData.next_page_token
+            self.assertEqual(variants, expectedVariants)
+
+    def testVariantRegionsSearchErrors(self):
+        path = '/variants:searchRegions'
+        region = {"referenceName": "1", "start": 0, "end": 100}
+        badRequests = [
+            {}, {"regions": []}, {"regions": region},
+            {"regions": [{"start": 0, "end": 100}]},
+            {"regions": [dict(region, referenceId="x")]},
+            {"regions": [dict(region, start="x")]},
+            {"regions": [region], "pageToken": "1"},
+            {"regions": [region], "pageToken": "x:0:0"},
+            {"regions": [region] * 1001}]
+        for requestDict in badRequests:
+            requestDict["variantSetId"] = self.variantSet.getId()
+            response = self.sendJsonPostRequest(path, json.dumps(requestDict))
+            self.assertEqual(response.status_code, 400)
+        response = self.sendJsonPostRequest(path, "[")
+        self.assertEqual(response.status_code, 400)
+
+    def testBatchGetVariants(self):
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = self.variantSet.getId()
+        request.reference_name = '1'
+        request.start = 0
+        request.end = 2**16
+        request.call_set_ids.extend(
+            callSet.getId() for callSet in self.variantSet.getCallSets())
+        responseData = self.sendSearchRequest(
+            '/variants/search', request, protocol.SearchVariantsResponse)
+        variants = list(responseData.variants[:10])
+        self.assertGreater(len(variants), 1)
+        # The variants come back in the order requested, repeats included.
+        expectedVariants = variants[::-1] + variants[:1]
+        ids = [variant.id for variant in expectedVariants]
+        response = self.sendJsonPostRequest(
+            '/variants:batchGet', json.dumps({"ids": ids}))
+        self.assertEqual(response.status_code, 200)
+        responseData = protocol.fromJson(
+            response.data, protocol.SearchVariantsResponse)
+        self.assertEqual(list(responseData.variants), expectedVariants)
+
+    def testBatchGetCallSets(self):
+        callSets = self.variantSet.getCallSets()
+        ids = [callSet.getId() for callSet in reversed(callSets)]
+        response = self.sendJsonPostRequest(
+            '/callsets:batchGet', json.dumps({"ids": ids}))
+        self.assertEqual(response.status_code, 200)
+        responseData = protocol.fromJson(
+            response.data, protocol.SearchCallSetsResponse)
+        self.assertEqual(len(responseData.call_sets), len(callSets))
+        for gaCallSet, callSet in zip(
+                responseData.call_sets, reversed(callSets)):
+            self.verifyCallSetsEqual(gaCallSet, callSet)
+
+    def testBatchGetFeatures(self):
+        featureSet = self.dataRepo.getDatasets()[0].getFeatureSets()[0]
+        request = protocol.SearchFeaturesRequest()
+        request.feature_set_id = featureSet.getId()
+        request.reference_name = "chr1"
+        request.start = 0
+        request.end = 2**16
+        responseData = self.sendSearchRequest(
+            '/features/search', request, protocol.SearchFeaturesResponse)
+        features = list(responseData.features[:10])
+        ids = [feature.id for feature in reversed(features)]
+        response = self.sendJsonPostRequest(
+            '/features:batchGet', json.dumps({"ids": ids}))
+        self.assertEqual(response.status_code, 200)
+        responseData = protocol.fromJson(
+            response.data, protocol.SearchFeaturesResponse)
+        self.assertEqual(len(responseData.features), len(features))
+        for gaFeature, feature in zip(
+                responseData.features, reversed(features)):
+            self.verifyFeaturesEquivalent(gaFeature, feature)
+
+    def testBatchGetErrors(self):
+        callSetId = self.variantSet.getCallSets()[0].getId()
+        for path in [
+                '/variants:batchGet', '/features:batchGet',
+                '/callsets:batchGet']:
+            for requestString in [
+                    "[", "[]", "{}", json.dumps({"ids": []}),
+                    json.dumps({"ids": callSetId}),
+                    json.dumps({"ids": [callSetId] * 1001})]:
+                response = self.sendJsonPostRequest(path, requestString)
+                self.assertEqual(response.status_code, 400)
+            for badId in self.getBadIds():
+                response = self.sendJsonPostRequest(
+                    path, json.dumps({"ids": [badId]}))
+                self.assertEqual(response.status_code, 404)
+        response = self.sendJsonPostRequest(
+            '/callsets:batchGet', json.dumps({"ids": [callSetId, "x"]}))
+        self.assertEqual(response.status_code, 404)
+
     def testVariantAnnotationSetsSearch(self):
         self.assertIsNotNone(self.variantAnnotationSet)
 
@@ -823,6 +996,28 @@ class TestSimulatedStack(unittest.TestCase):
             self.assertEqual(feature.feature_set_id, featureSet.getId())
             self.assertEqual(feature.reference_name, referenceName)
 
+    def testFeaturesSearchIncludingDescendants(self):
+        featureSet = self.dataRepo.getDatasets()[0].getFeatureSets()[0]
+        request = protocol.SearchFeaturesRequest()
+        request.reference_name = 'chr1'
+        request.feature_set_id = featureSet.getId()
+        request.start = 0
+        request.end = 2 ** 16
+        path = '/features/search'
+        expectedResponse = self.sendSearchRequest(
+            path, request, protocol.SearchFeaturesResponse)
+        # Simulated features have no children, so this changes nothing.
+        requestDict = json.loads(protocol.toJson(request))
+        requestDict["includeDescendants"] = True
+        response = self.sendJsonPostRequest(path, json.dumps(requestDict))
+        self.assertEqual(response.status_code, 200)
+        responseData = protocol.fromJson(
+            response.data, protocol.SearchFeaturesResponse)
+        self.assertEqual(responseData, expectedResponse)
+        requestDict["includeDescendants"] = "yes"
+        response = self.sendJsonPostRequest(path, json.dumps(requestDict))
+        self.assertEqual(response.status_code, 400)
+
     def testListReferenceBases(self):
         for referenceSet in self.dataRepo.getReferenceSets():
             for reference in referenceSet.getReferences():
@@ -863,6 +1058,49 @@ class TestSimulatedStack(unittest.TestCase):
                 path, query_string=protocol.toJsonDict(args))
             self.assertEqual(response.status_code, 416)
 
+    def testListReferenceBasesStream(self):
+        path = '/references/{}/bases'.format(self.reference.getId())
+        length = self.reference.getLength()
+        sequence = self.reference.getBases(0, length)
+        for mimetype in ["text/plain", "application/octet-stream"]:
+            response = self.app.get(path, headers={"Accept": mimetype})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, mimetype)
+            self.assertEqual(response.headers["Accept-Ranges"], "bytes")
+            self.assertEqual(response.data, sequence)
+        # The range of bytes is within the window given by start and end.
+        start, end = 10, length - 10
+        ranges = [
+            ("bytes=0-9", 0, 10), ("bytes=5-", 5, end - start),
+            ("bytes=-7", end - start - 7, end - start),
+            ("bytes=3-1000000", 3, end - start)]
+        for byteRange, rangeStart, rangeEnd in ranges:
+            response = self.app.get(
+                path, query_string={"start": start, "end": end},
+                headers={"Accept": "text/plain", "Range": byteRange})
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(
+                response.data,
+                sequence[start + rangeStart:start + rangeEnd])
+            self.assertEqual(
+                response.headers["Content-Range"], "bytes {}-{}/{}".format(
+                    rangeStart, rangeEnd - 1, end - start))
+        # Multiple ranges are ignored.
+        response = self.app.get(
+            path, headers={"Accept": "text/plain", "Range": "bytes=0-1,4-5"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, sequence)
+        response = self.app.get(
+            path, headers={"Accept": "text/plain", "Range": "bytes=500000-"})
+        self.assertEqual(response.status_code, 416)
+        response = self.app.get(
+            path, query_string={"start": 0, "end": length + 1},
+            headers={"Accept": "text/plain"})
+        self.assertEqual(response.status_code, 416)
+        # JSON is preferred when the client accepts anything.
+        response = self.app.get(path, headers={"Accept": "*/*"})
+        self.assertEqual(response.mimetype, "application/json")
+
     def testListReferenceBasesPaging(self):
         id_ = self.reference.getId()
         length = self.reference.getLength()
@@ -912,6 +1150,25 @@ class TestSimulatedStack(unittest.TestCase):
                             self.assertEqual(
                                 alignment.read_group_id, readGroup.getId())
 
+    def testReadsTags(self):
+        path = '/reads/search'
+        request = protocol.SearchReadsRequest()
+        request.read_group_ids.append(self.readGroup.getId())
+        request.reference_id = self.reference.getId()
+        expectedResponse = self.sendSearchRequest(
+            path, request, protocol.SearchReadsResponse)
+        # Simulated reads have no tags, so this changes nothing.
+        requestDict = json.loads(protocol.toJson(request))
+        requestDict["tags"] = []
+        response = self.sendJsonPostRequest(path, json.dumps(requestDict))
+        self.assertEqual(response.status_code, 200)
+        responseData = protocol.fromJson(
+            response.data, protocol.SearchReadsResponse)
+        self.assertEqual(responseData, expectedResponse)
+        requestDict["tags"] = "MD"
+        response = self.sendJsonPostRequest(path, json.dumps(requestDict))
+        self.assertEqual(response.status_code, 400)
+
     def testUnsupportedReadOperations(self):
         path = '/reads/search'
 
@@ -928,6 +1185,35 @@ class TestSimulatedStack(unittest.TestCase):
         response = self.sendJsonPostRequest(path, protocol.toJson(request))
         self.assertEqual(400, response.status_code)
 
+    def testReadsCoverage(self):
+        # Simulated reads have no coverage, but the request is parsed
+        # and resolved before that is found.
+        path = '/reads:coverage'
+        request = {
+            "readGroupIds": [self.readGroup.getId()],
+            "referenceId": self.reference.getId(),
+            "binSize": 10}
+        response = self.sendJsonPostRequest(path, json.dumps(request))
+        self.assertObjectNotSupported(response)
+        del request["binSize"]
+        response = self.sendJsonPostRequest(path, json.dumps(request))
+        self.assertEqual(400, response.status_code)
+
+    def testSummaries(self):
+        # Simulated read group sets and variant sets have no summary tiles.
+        for path, request in [
+                ('/reads:summary', {
+                    "readGroupSetId": self.readGroupSet.getId()}),
+                ('/variants:summary', {
+                    "variantSetId": self.variantSet.getId()})]:
+            request["referenceName"] = "1"
+            request["binSize"] = 10
+            response = self.sendJsonPostRequest(path, json.dumps(request))
+            self.assertEqual(404, response.status_code)
+            del request["binSize"]
+            response = self.sendJsonPostRequest(path, json.dumps(request))
+            self.assertEqual(400, response.status_code)
+
     def testReadsMultipleReadGroupSets(self):
         path = '/reads/search'
         readGroupIds = [
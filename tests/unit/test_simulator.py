@@ -7,12 +7,16 @@ from __future__ import unicode_literals
 
 import unittest
 import datetime
+import hashlib
 
 import ga4gh.datamodel as datamodel
 import ga4gh.datamodel.datasets as datasets
 import ga4gh.datamodel.reads as reads
 import ga4gh.datamodel.references as references
+import ga4gh.datamodel.sequenceAnnotations as sequenceAnnotations
 import ga4gh.datamodel.variants as variants
+import ga4gh.datarepo as datarepo
+import ga4gh.exceptions as exceptions
 
 
 class TestSimulatedVariantSet(unittest.TestCase):
@@ -28,7 +32,9 @@ class TestSimulatedVariantSet(unittest.TestCase):
         self.referenceName = 'ref'
         self.startPosition = 100
         self.endPosition = 103
-        self.callSetIds = ['unused']
+        self.callSetIds = [
+            callSet.getId()
+            for callSet in self.simulatedVariantSet.getCallSets()]
         self.bases = ["A", "C", "G", "T"]
 
     def _getSimulatedVariantSet(self):
@@ -169,3 +175,150 @@ class TestSimulatedReadGroupSet(unittest.TestCase):
         for readGroup in simulatedReadGroupSet.getReadGroups():
             alignments = list(readGroup.getReadAlignments())
             self.assertGreater(len(alignments), 0)
+
+    def testSpreadReadsOverlapQuery(self):
+        dataset = datasets.Dataset('dataset1')
+        referenceSet = references.SimulatedReferenceSet(
+            "srs1", referenceLength=10000)
+        reference = referenceSet.getReferenceByIndex(0)
+        numAlignments = 1000
+        readGroupSet = reads.SimulatedReadGroupSet(
+            dataset, "readGroupSetId", referenceSet,
+            numAlignments=numAlignments, spreadOnReference=True)
+        readGroup = readGroupSet.getReadGroups()[0]
+        allAlignments = list(readGroup.getReadAlignments(reference))
+        self.assertEqual(len(allAlignments), numAlignments)
+        self.assertEqual(
+            len(set(alignment.id for alignment in allAlignments)),
+            numAlignments)
+        start, end = 5000, 5100
+        alignments = list(readGroup.getReadAlignments(reference, start, end))
+        expected = [
+            alignment for alignment in allAlignments
+            if alignment.alignment.position.position < end and
+            alignment.alignment.position.position +
+            len(alignment.aligned_sequence) > start]
+        self.assertGreater(len(alignments), 0)
+        self.assertEqual(alignments, expected)
+        for alignment in alignments:
+            self.assertEqual(
+                alignment.alignment.position.reference_name,
+                reference.getLocalId())
+
+
+class TestSimulatedReference(unittest.TestCase):
+    """
+    Test properties of the lazily generated SimulatedReference
+    """
+    def setUp(self):
+        self.length = 3 * references.SimulatedReference.blockSize + 17
+        referenceSet = references.SimulatedReferenceSet("srs1")
+        self.reference = references.SimulatedReference(
+            referenceSet, "ref", randomSeed=5, length=self.length)
+
+    def testBasesConsistentAcrossBlocks(self):
+        bases = self.reference.getBases(0, self.length)
+        self.assertEqual(len(bases), self.length)
+        self.assertEqual(set(bases), set("ACGT"))
+        blockSize = references.SimulatedReference.blockSize
+        for start, end in [
+                (0, 1), (blockSize - 5, blockSize + 5),
+                (blockSize, 2 * blockSize), (self.length - 20, self.length)]:
+            self.assertEqual(
+                self.reference.getBases(start, end), bases[start:end])
+
+    def testMd5Checksum(self):
+        bases = self.reference.getBases(0, self.length)
+        self.assertEqual(
+            self.reference.getMd5Checksum(), hashlib.md5(bases).hexdigest())
+
+    def testBackgroundMd5Checksums(self):
+        referenceSet = references.SimulatedReferenceSet(
+            "srs2", numReferences=3, referenceLength=self.length)
+        referenceSet.startMd5Checksums()
+        # Whichever of the thread and this one gets there first, the
+        # checksums are those of the bases.
+        for reference in referenceSet.getReferences():
+            self.assertEqual(
+                reference.getMd5Checksum(),
+                hashlib.md5(reference.getBases(0, self.length)).hexdigest())
+
+    def testMd5ChecksumAfterFork(self):
+        # A lock held in the parent process when it forked must not block
+        # the child.
+        with self.reference._md5Lock:
+            self.reference._md5Pid = -1
+            self.assertEqual(
+                self.reference.getMd5Checksum(),
+                hashlib.md5(
+                    self.reference.getBases(0, self.length)).hexdigest())
+
+    def testDeterministic(self):
+        referenceSet = references.SimulatedReferenceSet("srs2")
+        other = references.SimulatedReference(
+            referenceSet, "ref", randomSeed=5, length=self.length)
+        self.assertEqual(
+            other.getBases(1000, 2000), self.reference.getBases(1000, 2000))
+        self.assertEqual(
+            other.getMd5Checksum(), self.reference.getMd5Checksum())
+
+
+class TestSimulatedFeatureSet(unittest.TestCase):
+    """
+    Test properties of a SimulatedFeatureSet spread on its references
+    """
+    def setUp(self):
+        dataset = datasets.Dataset('dataset1')
+        self.referenceSet = references.SimulatedReferenceSet(
+            "srs1", numReferences=2, referenceLength=100000)
+        self.numFeatures = 500
+        self.featureSet = sequenceAnnotations.SimulatedFeatureSet(
+            dataset, "fs1", numFeatures=self.numFeatures,
+            spreadOnReference=True)
+        self.featureSet.setReferenceSet(self.referenceSet)
+
+    def testFeaturesOverlapQuery(self):
+        referenceName = self.referenceSet.getReferenceByIndex(1).getLocalId()
+        start, end = 40000, 45000
+        features = [
+            feature for feature, _ in self.featureSet.getFeatures(
+                referenceName, start, end, None, None)]
+        self.assertGreater(len(features), 0)
+        for feature in features:
+            self.assertEqual(feature.reference_name, referenceName)
+            self.assertLess(feature.start, end)
+            self.assertGreater(feature.end, start)
+
+    def testPageTokenResumes(self):
+        referenceName = self.referenceSet.getReferenceByIndex(0).getLocalId()
+        pairs = list(self.featureSet.getFeatures(
+            referenceName, 0, 100000, None, None))
+        self.assertEqual(len(pairs), self.numFeatures)
+        self.assertIsNone(pairs[-1][1])
+        feature, pageToken = pairs[9]
+        resumed = list(self.featureSet.getFeatures(
+            referenceName, 0, 100000, pageToken, None))
+        self.assertEqual(resumed, pairs[10:])
+
+    def testGetFeature(self):
+        referenceName = self.referenceSet.getReferenceByIndex(1).getLocalId()
+        for feature, _ in self.featureSet.getFeatures(
+                referenceName, 1000, 5000, None, None):
+            compoundId = datamodel.FeatureCompoundId.parse(feature.id)
+            self.assertEqual(self.featureSet.getFeature(compoundId), feature)
+
+
+class TestSimulatedProfiles(unittest.TestCase):
+    """
+    Test the named SimulatedDataRepository profiles
+    """
+    def testProfilesConstruct(self):
+        for name in datarepo.SIMULATED_PROFILES:
+            repo = datarepo.SimulatedDataRepository(
+                **datarepo.getSimulatedProfile(name))
+            self.assertGreater(repo.getNumDatasets(), 0)
+
+    def testUnknownProfile(self):
+        self.assertRaises(
+            exceptions.ConfigurationException,
+            datarepo.getSimulatedProfile, "no-such-profile")
@@ -0,0 +1,168 @@
+"""
+Tests for the summary tile file reader and writer
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import stat
+import struct
+import tempfile
+import unittest
+
+import ga4gh.summaryTiles as summaryTiles
+
+
+class TestSummaryTiles(unittest.TestCase):
+    """
+    Tests writing and reading summary tiles of synthetic values.
+    """
+    def setUp(self):
+        fd, self._fileName = tempfile.mkstemp(
+            prefix="ga4gh_summary_test",
+            suffix=summaryTiles.SUMMARY_TILES_SUFFIX)
+        os.close(fd)
+        self._fields = summaryTiles.READ_FIELDS
+        self._references = [
+            ("long", 1000, {
+                "readCount": [i % 7 for i in range(100)],
+                "baseCount": [i * 1.5 for i in range(100)],
+                "maxDepth": [i % 13 for i in range(100)],
+            }),
+            ("short", 25, {
+                "readCount": [1, 2, 3],
+                "baseCount": [10, 20, 30],
+                "maxDepth": [4, 6, 5],
+            }),
+            ("empty", 0, {
+                "readCount": [], "baseCount": [], "maxDepth": []}),
+        ]
+
+    def tearDown(self):
+        os.unlink(self._fileName)
+
+    def _writeTiles(self):
+        summaryTiles.writeSummaryTiles(
+            self._fileName, self._fields, self._references, baseBinSize=10,
+            zoomFactor=4)
+        return summaryTiles.SummaryTiles(self._fileName)
+
+    def testLevels(self):
+        tiles = self._writeTiles()
+        self.assertEqual(tiles.getFieldNames(), [
+            field.name for field in self._fields])
+        self.assertEqual(tiles.getReferenceNames(), ["long", "short", "empty"])
+        self.assertEqual(tiles.getReferenceLength("long"), 1000)
+        # Bins of 10, 40, 160, 640 and 2560 bases cover the longest.
+        self.assertEqual(tiles.getNumLevels(), 5)
+        self.assertEqual(
+            [tiles.getBinSize(level) for level in range(5)],
+            [10, 40, 160, 640, 2560])
+        self.assertEqual(tiles.getLevel(1), 0)
+        self.assertEqual(tiles.getLevel(39), 0)
+        self.assertEqual(tiles.getLevel(40), 1)
+        self.assertEqual(tiles.getLevel(10 ** 6), 4)
+        tiles.close()
+
+    def testValues(self):
+        tiles = self._writeTiles()
+        name, length, values = self._references[0]
+        for level in range(tiles.getNumLevels()):
+            width = 4 ** level
+            numBins = summaryTiles.getNumBins(100, width)
+            readCounts = tiles.getBins(name, level, "readCount", 0, numBins)
+            baseCounts = tiles.getBins(name, level, "baseCount", 0, numBins)
+            maxDepths = tiles.getBins(name, level, "maxDepth", 0, numBins)
+            self.assertEqual(len(readCounts), numBins)
+            for binIndex in range(numBins):
+                self.assertEqual(
+                    readCounts[binIndex], sum(values["readCount"][
+                        binIndex * width:(binIndex + 1) * width]))
+                self.assertEqual(
+                    baseCounts[binIndex], sum(values["baseCount"][
+                        binIndex * width:(binIndex + 1) * width]))
+                self.assertEqual(
+                    maxDepths[binIndex], max(values["maxDepth"][
+                        binIndex * width:(binIndex + 1) * width]))
+        # Slices are clipped to the bins of the reference.
+        self.assertEqual(
+            list(tiles.getBins(name, 0, "readCount", 95, 200)),
+            values["readCount"][95:])
+        self.assertEqual(len(tiles.getBins(name, 0, "readCount", 200, 300)), 0)
+        tiles.close()
+
+    def testLargeBaseCounts(self):
+        # Sums well beyond 32 bits, which must be stored exactly at every
+        # level.
+        baseCounts = [2 ** 40 + i for i in range(100)]
+        self._references[0][2]["baseCount"] = baseCounts
+        tiles = self._writeTiles()
+        for level in range(tiles.getNumLevels()):
+            numBins = summaryTiles.getNumBins(100, 4 ** level)
+            values = tiles.getBins("long", level, "baseCount", 0, numBins)
+            self.assertEqual(sum(int(value) for value in values),
+                             sum(baseCounts))
+        self.assertEqual(
+            int(tiles.getBins("long", 4, "baseCount", 0, 1)[0]),
+            sum(baseCounts))
+        tiles.close()
+
+    def testShortReferences(self):
+        tiles = self._writeTiles()
+        self.assertEqual(list(tiles.getBins("short", 0, "maxDepth", 0, 3)),
+                         [4, 6, 5])
+        # The single bin covering the reference stands for it at the
+        # levels above its own.
+        for level in range(1, tiles.getNumLevels()):
+            self.assertEqual(
+                list(tiles.getBins("short", level, "readCount", 0, 1)), [6])
+            self.assertEqual(
+                list(tiles.getBins("short", level, "maxDepth", 0, 1)), [6])
+        self.assertEqual(len(tiles.getBins("empty", 2, "readCount", 0, 1)), 0)
+        self.assertRaises(
+            KeyError, tiles.getBins, "missing", 0, "readCount", 0, 1)
+        self.assertRaises(
+            KeyError, tiles.getBins, "short", 0, "variantCount", 0, 1)
+        tiles.close()
+
+    def testRewriteMappedFile(self):
+        tiles = self._writeTiles()
+        expected = list(tiles.getBins("long", 0, "readCount", 0, 100))
+        # A shorter file written over one that is mapped must not change
+        # or truncate the mapping.
+        self._references = self._references[1:]
+        newTiles = self._writeTiles()
+        self.assertEqual(
+            list(tiles.getBins("long", 0, "readCount", 0, 100)), expected)
+        self.assertEqual(newTiles.getReferenceNames(), ["short", "empty"])
+        tiles.close()
+        newTiles.close()
+        self.assertEqual(
+            os.listdir(os.path.dirname(self._fileName)).count(
+                os.path.basename(self._fileName)), 1)
+        self.assertFalse(any(
+            name.startswith(os.path.basename(self._fileName) + ".")
+            for name in os.listdir(os.path.dirname(self._fileName))))
+        self.assertTrue(os.stat(self._fileName).st_mode & stat.S_IRUSR)
+
+    def testBadFiles(self):
+        self._references[1][2]["readCount"].append(1)
+        self.assertRaises(
+            summaryTiles.SummaryTilesException, summaryTiles.writeSummaryTiles,
+            self._fileName, self._fields, self._references)
+        with open(self._fileName, "wb") as tilesFile:
+            tilesFile.write(b"GSUM")
+        self.assertRaises(
+            summaryTiles.SummaryTilesException, summaryTiles.SummaryTiles,
+            self._fileName)
+        with open(self._fileName, "wb") as tilesFile:
+            tilesFile.write(b"GSUM" + struct.pack(b"<I", 1) + b"\0" * 100)
+        self.assertRaises(
+            summaryTiles.SummaryTilesException, summaryTiles.SummaryTiles,
+            self._fileName)
+        with open(self._fileName, "wb") as tilesFile:
+            tilesFile.write(b"\0" * 100)
+        self.assertRaises(
+            summaryTiles.SummaryTilesException, summaryTiles.SummaryTiles,
+            self._fileName)
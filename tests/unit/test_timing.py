@@ -0,0 +1,128 @@
+"""
+Tests for the per-request timing instrumentation
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+import ga4gh.timing as timing
+
+
+class FakeClock(object):
+    """
+    A clock that only moves when told to.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRequestTimer(unittest.TestCase):
+    """
+    Tests the accumulation of phase times in a RequestTimer.
+    """
+    def setUp(self):
+        self.clock = FakeClock()
+        self.timer = timing.RequestTimer(clock=self.clock)
+
+    def testPhasesAccumulate(self):
+        self.timer.switchPhase(timing.PARSE)
+        self.clock.now = 1
+        self.timer.switchPhase(timing.FETCH)
+        self.clock.now = 3
+        self.timer.switchPhase(timing.BUILD)
+        self.clock.now = 4
+        self.timer.switchPhase(timing.FETCH)
+        self.clock.now = 6
+        self.timer.stop()
+        self.clock.now = 100
+        self.assertEqual(self.timer.getPhaseTime(timing.PARSE), 1)
+        self.assertEqual(self.timer.getPhaseTime(timing.FETCH), 4)
+        self.assertEqual(self.timer.getPhaseTime(timing.BUILD), 1)
+        self.assertEqual(self.timer.getPhaseTime(timing.SERIALISE), 0)
+        self.assertEqual(self.timer.getTotalTime(), 6)
+
+    def testNestedPhaseIsRestored(self):
+        self.timer.switchPhase(timing.FETCH)
+        self.clock.now = 1
+        previousPhase = self.timer.switchPhase(timing.CONVERT)
+        self.assertEqual(previousPhase, timing.FETCH)
+        self.clock.now = 3
+        self.timer.switchPhase(previousPhase)
+        self.clock.now = 4
+        self.timer.stop()
+        self.assertEqual(self.timer.getPhaseTime(timing.FETCH), 2)
+        self.assertEqual(self.timer.getPhaseTime(timing.CONVERT), 2)
+
+    def testServerTimingHeader(self):
+        self.timer.switchPhase(timing.PARSE)
+        self.clock.now = 0.0015
+        self.timer.switchPhase(timing.SERIALISE)
+        self.clock.now = 0.002
+        self.timer.stop()
+        self.assertEqual(
+            self.timer.getServerTimingHeader(),
+            "parse;dur=1.500, serialise;dur=0.500, total;dur=2.000")
+
+    def testCounts(self):
+        self.timer.addObjects(3)
+        self.timer.addObjects(2)
+        self.timer.addBytes(100)
+        self.assertEqual(self.timer.getNumObjects(), 5)
+        self.assertEqual(self.timer.getNumBytes(), 100)
+
+
+class TestCurrentRequestTimer(unittest.TestCase):
+    """
+    Tests the thread local current timer.
+    """
+    def testNoTimerRecordsNothing(self):
+        timer = timing.getRequestTimer()
+        self.assertIsInstance(timer, timing.NullRequestTimer)
+        self.assertIsNone(timer.switchPhase(timing.CONVERT))
+        timer.addObjects(1)
+        self.assertEqual(timer.getNumObjects(), 0)
+        self.assertEqual(timer.getPhaseTime(timing.CONVERT), 0)
+
+    def testStartAndEnd(self):
+        timer = timing.startRequestTimer()
+        self.assertIs(timing.getRequestTimer(), timer)
+        self.assertIs(timing.endRequestTimer(), timer)
+        self.assertIsInstance(
+            timing.getRequestTimer(), timing.NullRequestTimer)
+
+
+class TestEndpointTimingStatistics(unittest.TestCase):
+    """
+    Tests the aggregation of request timers per endpoint.
+    """
+    def _getTimer(self, fetchTime, numObjects):
+        clock = FakeClock()
+        timer = timing.RequestTimer(clock=clock)
+        timer.switchPhase(timing.FETCH)
+        clock.now = fetchTime
+        timer.stop()
+        timer.addObjects(numObjects)
+        timer.addBytes(10 * numObjects)
+        return timer
+
+    def testSummaries(self):
+        statistics = timing.EndpointTimingStatistics()
+        self.assertEqual(statistics.getSummaries(), [])
+        statistics.record("searchVariants", self._getTimer(0.002, 1))
+        statistics.record("searchVariants", self._getTimer(0.004, 3))
+        statistics.record("getVariant", self._getTimer(0.001, 1))
+        self.assertEqual(
+            statistics.getEndpoints(), ["getVariant", "searchVariants"])
+        summary = statistics.getSummary("searchVariants")
+        self.assertEqual(summary["requests"], 2)
+        self.assertEqual(summary["objects"], 4)
+        self.assertEqual(summary["bytes"], 40)
+        self.assertAlmostEqual(summary["meanMilliseconds"], 3)
+        self.assertAlmostEqual(summary["maxMilliseconds"], 4)
+        self.assertAlmostEqual(summary["fetchMilliseconds"], 3)
+        self.assertEqual(summary["parseMilliseconds"], 0)
@@ -5,6 +5,8 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
+import os
 import unittest
 import logging
 
@@ -375,6 +377,68 @@ class TestFrontend(unittest.TestCase):
             responseData.alignments[0].id,
             self.readAlignmentId)
 
+    def testServerTiming(self):
+        response = self.sendVariantsSearch()
+        self.assertEqual(200, response.status_code)
+        self.assertNotIn("Server-Timing", response.headers)
+        frontend.app.config["SERVER_TIMING_HEADER"] = True
+        try:
+            response = self.sendVariantsSearch()
+        finally:
+            frontend.app.config["SERVER_TIMING_HEADER"] = False
+        self.assertEqual(200, response.status_code)
+        metrics = [
+            metric.split(";")[0]
+            for metric in response.headers["Server-Timing"].split(", ")]
+        for phase in ["parse", "fetch", "build", "serialise", "total"]:
+            self.assertIn(phase, metrics)
+        summary = frontend.app.requestTimingStatistics.getSummary(
+            "searchVariants")
+        self.assertGreater(summary["requests"], 0)
+        self.assertGreater(summary["bytes"], 0)
+
+    def testMetrics(self):
+        self.sendVariantsSearch()
+        self.sendGetRequest('/datasets/{}'.format("noSuchDataset"))
+        response = self.app.get('/metrics')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("text/plain", response.mimetype)
+        self.assertIn(
+            'ga4gh_requests_total{method="POST",route="/variants/search",'
+            'status="200"}', response.data)
+        self.assertIn(
+            'ga4gh_response_size_bytes_count{route="/variants/search"}',
+            response.data)
+        self.assertIn(
+            'ga4gh_errors_total{code="', response.data)
+        self.assertIn('route="/datasets/<no(search):id>"}', response.data)
+
+    def testAdminProfile(self):
+        path = '/admin/profile'
+        self.assertEqual(404, self.app.post(path).status_code)
+        frontend.app.config["PROFILER_ADMIN_KEY"] = "secret"
+        try:
+            response = self.app.post(path, data={"adminKey": "wrong"})
+            self.assertEqual(403, response.status_code)
+            response = self.app.post(
+                path + "?adminKey=secret&seconds=1")
+            self.assertEqual(403, response.status_code)
+            response = self.app.post(
+                path, data={"adminKey": "secret", "seconds": "x"})
+            self.assertEqual(400, response.status_code)
+            response = self.app.post(
+                path, data={"adminKey": "secret", "seconds": "1"})
+            self.assertEqual(200, response.status_code)
+            outputFile = json.loads(response.data)["outputFile"]
+            response = self.app.post(
+                path, data={"adminKey": "secret", "seconds": "1"})
+            self.assertEqual(409, response.status_code)
+            frontend.app.profiler.join()
+            self.assertTrue(os.path.exists(outputFile))
+            os.unlink(outputFile)
+        finally:
+            frontend.app.config["PROFILER_ADMIN_KEY"] = None
+
     def testDatasetsSearch(self):
         response = self.sendDatasetsSearch()
         responseData = protocol.fromJson(